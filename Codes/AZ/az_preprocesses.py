@@ -1,11 +1,10 @@
 import os
-import re
 import sys
-import datetime
 import numpy as np
 from glob import glob
 from osgeo import gdal
 import rasterio as rio
+from affine import Affine
 from rasterio.merge import merge
 from rasterio.enums import Resampling
 
@@ -14,8 +13,14 @@ from os.path import dirname, abspath
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
 from Codes.utils.system_ops import makedirs
+from Codes.utils.time_ops import doy_to_month, get_period_months, aggregate_monthly_rasters, \
+    aggregate_monthly_rasters_batch, gap_fill_monthly_rasters
 from Codes.utils.raster_ops import read_raster_arr_object, write_array_to_raster, \
-    clip_resample_reproject_raster, sum_rasters, mean_rasters
+    clip_resample_reproject_raster, translate_to_vrt, read_gdal_dataset_arr
+from Codes.utils.datacube_ops import get_month_index, build_prefix_sum_cube, sum_prefix_cube_window, \
+    get_prefix_cube_variable
+from Codes.utils.stats_ops import calc_raster_moments
+from Codes.utils.catalog_ops import find_rasters, list_catalog_keys
 
 
 no_data_value = -9999
@@ -270,16 +275,13 @@ def sum_GridMET_precip_yearly_data(year_list, input_gridmet_monthly_dir, output_
     :return: None.
     """
     if not skip_processing:
-        makedirs([output_dir_yearly])
+        print(f'summing GRIDMET precip data for years {list(year_list)}...')
 
-        for yr in year_list:  # first loop for years_list
-            print(f'summing GRIDMET precip data for year {yr}...')
-            gridmet_datasets = glob(os.path.join(input_gridmet_monthly_dir, f'*{yr}*.tif'))
-
-            # Summing raster for each year
-            summed_output_for_year = os.path.join(output_dir_yearly, f'GRIDMET_Precip_{yr}.tif')
-            sum_rasters(raster_list=gridmet_datasets, raster_dir=None, output_raster=summed_output_for_year,
-                        ref_raster=gridmet_datasets[0])
+        # Summing raster for each year
+        aggregate_monthly_rasters(input_dir=input_gridmet_monthly_dir,
+                                  period_dict={'calendar_year': get_period_months('calendar_year', year_list)},
+                                  output_dir_dict={('calendar_year', 'sum'): output_dir_yearly},
+                                  output_name='GRIDMET_Precip')
 
     else:
         pass
@@ -301,56 +303,22 @@ def sum_GridMET_RET_yearly_data(input_RET_monthly_dir, output_dir_RET_yearly, ou
     :return: None.
     """
     if not skip_processing:
-        makedirs([output_dir_RET_yearly, output_dir_RET_growing_season])
-
-        for year in year_list:  # first loop for years_list
-            # # for total years_list
-            print(f'summing GridMET RET data for year {year}...')
-            openet_datasets = glob(os.path.join(input_RET_monthly_dir, f'*{year}*.tif'))
+        print(f'summing GridMET RET data for years {list(year_list)} and their growing seasons...')
 
-            # Summing raster for each growing season
-            summed_output_for_year = os.path.join(output_dir_RET_yearly, f'GRIDMET_RET_{year}.tif')
-            sum_rasters(raster_list=openet_datasets, raster_dir=None, output_raster=summed_output_for_year,
-                        ref_raster=openet_datasets[0])
+        # summing raster for each year and each year's growing season (April to October) in a single pass
+        period_dict = {'calendar_year': get_period_months('calendar_year', year_list),
+                       'growing_season': get_period_months('months', year_list, months=range(4, 11))}
 
-            # # for growing seasons
-            print(f'summing GridMET RET data for year {year} growing seasons...')
-            openet_datasets = glob(os.path.join(input_RET_monthly_dir, f'*{year}_[4-9]*.tif')) + \
-                              glob(os.path.join(input_RET_monthly_dir, f'*{year}_10*.tif'))
-
-            # Summing raster for each growing season
-            summed_output_for_grow_season = os.path.join(output_dir_RET_growing_season, f'GRIDMET_RET_{year}.tif')
-            sum_rasters(raster_list=openet_datasets, raster_dir=None, output_raster=summed_output_for_grow_season,
-                        ref_raster=openet_datasets[0])
+        aggregate_monthly_rasters(input_dir=input_RET_monthly_dir, period_dict=period_dict,
+                                  output_dir_dict={('calendar_year', 'sum'): output_dir_RET_yearly,
+                                                   ('growing_season', 'sum'): output_dir_RET_growing_season},
+                                  output_name='GRIDMET_RET')
 
     else:
         pass
 
 
-def convert_prism_data_to_tif(input_dir, output_dir, keyword='prism_tmax'):
-    """
-    Convert prism rainfall/temperature datasets from .bil format to GeoTiff format.
-
-    Download PRISM datasets directly from  'https://prism.oregonstate.edu/recent/'
-
-    :param input_dir: Directory path of prism data in .bil format.
-    :param output_dir: Directory path of converted (.tif) prism data.
-    :param keyword: keyword to add before processed datasets.
-
-    :return: None.
-    """
-    makedirs([output_dir])
-    prism_datasets = glob(os.path.join(input_dir, '*.bil'))
-
-    for data in prism_datasets:
-        year_month = os.path.basename(data).split('_')[-2]
-        output_name = keyword + '_' + year_month + '.tif'
-        output_file = os.path.join(output_dir, output_name)
-        gdal.Translate(destName=output_file, srcDS=data, format='GTiff', outputType=gdal.GDT_Float32,
-                       outputSRS='EPSG:4269')
-
-
-def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, output_dir_prism_yearly=None,
+def process_prism_data(prism_bil_dir, output_dir_prism_monthly, output_dir_prism_yearly=None,
                        year_list=tuple(range(1984, 2021)),
                        keyword='prism_tmax',
                        AZ_shape=AZ_shape,
@@ -360,7 +328,6 @@ def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, o
     summed for all months in a year.
 
     :param prism_bil_dir: Directory file path of downloaded prism datasets in .bil format.
-    :param prism_tif_dir: Directory file path of prism datasets converted to tif format.
     :param output_dir_prism_monthly: File path of directory to save monthly prism precipitation/temperature data for
                                      at Western US extent.
     :param output_dir_prism_yearly: File path of directory to save summed/mean prism precipitation/temperature data for
@@ -382,16 +349,14 @@ def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, o
         else:
             makedirs([output_dir_prism_monthly])
 
-        convert_prism_data_to_tif(input_dir=prism_bil_dir, output_dir=prism_tif_dir, keyword=keyword)
-
         #########
         # # Code-block for saving monthly data for the Western US
         #########
         # Clipping Prism monthly datasets for Western US
-        monthly_prism_tifs = glob(os.path.join(prism_tif_dir, '*.tif'))  # monthly prism datasets
-        for data in monthly_prism_tifs:
-            month = os.path.basename(data).split('.')[0][-2:]
-            year = os.path.basename(data).split('.')[0].split('_')[2][:4]
+        monthly_prism_bils = glob(os.path.join(prism_bil_dir, '*.bil'))  # monthly prism datasets
+        for data in monthly_prism_bils:
+            year_month = os.path.basename(data).split('_')[-2]
+            year, month = year_month[:4], year_month[-2:]
 
             if month.startswith('0'):  # don't want to keep 0 in month for consistency will all datasets
                 month = month[-1]
@@ -406,7 +371,10 @@ def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, o
             # the prism datasets are at 4km native resolution and directly clipping and resampling them from 4km
             # resolution creates misalignment of pixels from reference raster. So, first we are resampling CONUS
             # scale original datasets to 2km resolutions and then clipping them at reference raster extent
-            clip_resample_reproject_raster(input_raster=data,
+            # the .bil dataset is opened as a float32 VRT in NAD83 (same as converting it to tif), so it is warped
+            # without writing a tif copy
+            prism_vrt = translate_to_vrt(data, crs='EPSG:4269', output_datatype=gdal.GDT_Float32)
+            clip_resample_reproject_raster(input_raster=prism_vrt,
                                            input_shape=AZ_shape,
                                            raster_name=monthly_raster_name, keyword=' ',
                                            output_raster_dir=output_dir_prism_monthly,
@@ -434,19 +402,13 @@ def sum_cropET_water_yr(years_list, input_cropET_monthly_dir, output_dir_water_y
     :return: None.
     """
     if not skip_processing:
-        makedirs([output_dir_water_yr])
+        print(f'summing monthly cropET for water years {list(years_list)}...')
 
-        for yr in years_list:
-            print(f'summing monthly cropET for water year {yr}...')
-
-            # summing rainfed/irrigated crop ET for water year (previous year's October to current year's september)
-            et_data_prev_years = glob(os.path.join(input_cropET_monthly_dir, f'*{yr - 1}_1[0-2].*tif'))
-            et_data_current_years = glob(os.path.join(input_cropET_monthly_dir, f'*{yr}_[1-9].*tif'))
-            et_water_yr_list = et_data_prev_years + et_data_current_years
-
-            sum_rasters(raster_list=et_water_yr_list, raster_dir=None,
-                        output_raster=os.path.join(output_dir_water_yr, f'{save_keyword}_{yr}.tif'),
-                        ref_raster=et_water_yr_list[0])
+        # summing rainfed/irrigated crop ET for water year (previous year's October to current year's september)
+        aggregate_monthly_rasters(input_dir=input_cropET_monthly_dir,
+                                  period_dict={'water_year': get_period_months('water_year', years_list)},
+                                  output_dir_dict={('water_year', 'sum'): output_dir_water_yr},
+                                  output_name=save_keyword)
     else:
         pass
 
@@ -514,57 +476,38 @@ def extract_month_from_GrowSeason_data(GS_data_dir, skip_processing=False):
     :return: None.
     """
 
-    def doy_to_month(year, doy):
-        """
-        Convert a day of year (DOY) to a month in a given year.
-
-        :return: Month of the corresponding date.
-        """
-        if np.isnan(doy):  # Check if the DOY is NaN
-            return np.nan
-
-        # January 1st of the given year + timedelta of the DoY to extract month
-        month = (datetime.datetime(year, 1, 1) + datetime.timedelta(int(doy) - 1)).month
-
-        return month
-
     if not skip_processing:
         print('Processing growing season data...')
 
         # collecting GEE exported data files and making new directories for processing
         GS_data_files = glob(os.path.join(GS_data_dir, 'ee_exports', '*.tif'))
-        interim_dir = os.path.join(GS_data_dir, 'interim')
-        makedirs([interim_dir])
 
         # looping through each dataset, extracting start and end of the growing season months, saving as an array
         for data in GS_data_files:
             raster_name = os.path.basename(data)
             year = int(raster_name.split('_')[1].split('.')[0])
 
-            # clipping and resampling the growing season data with the Arizona reference raster
+            # clipping and resampling the growing season data with the Arizona reference raster (kept in memory)
             interim_raster = clip_resample_reproject_raster(input_raster=data,
                                                             input_shape=AZ_shape,
                                                             raster_name=raster_name,
-                                                            output_raster_dir=interim_dir,
+                                                            output_raster_dir=None,
                                                             clip=False, resample=False, clip_and_resample=True,
                                                             targetaligned=True, resample_algorithm='near',
                                                             use_ref_width_height=False, ref_raster=None,
                                                             crs='EPSG:26912',
-                                                            resolution=model_res)
-
-            # reading the start and end DoY of the growing season
-            startDOY_arr, ras_file = read_raster_arr_object(interim_raster, band=1)
-            endDOY_arr = read_raster_arr_object(interim_raster, band=2, get_file=False)
+                                                            resolution=model_res, in_memory=True)
 
-            # vectorizing the doy_to_month() function to apply on a numpy array
-            vectorized_doy_to_date = np.vectorize(doy_to_month)
+            # reading the start and end DoY of the growing season (stacked as 2 bands)
+            DOY_arr = np.stack((read_gdal_dataset_arr(interim_raster, band=1),
+                                read_gdal_dataset_arr(interim_raster, band=2)), axis=0)
+            interim_crs = interim_raster.GetProjection()
+            interim_transform = Affine.from_gdal(*interim_raster.GetGeoTransform())
+            del interim_raster
 
-            # converting the start and end DoY to corresponding month
-            start_months = vectorized_doy_to_date(year, startDOY_arr)
-            end_months = vectorized_doy_to_date(year, endDOY_arr)
-
-            # stacking the arrays together (single tif with 2 bands)
-            GS_month_arr = np.stack((start_months, end_months), axis=0)
+            # converting the start and end DoY to corresponding month with the DOY to month lookup table
+            # (single tif with 2 bands)
+            GS_month_arr = doy_to_month(DOY_arr, year, nodata=no_data_value)
 
             # saving the array
             output_raster = os.path.join(GS_data_dir, raster_name)
@@ -576,19 +519,25 @@ def extract_month_from_GrowSeason_data(GS_data_dir, skip_processing=False):
                     width=GS_month_arr.shape[2],
                     dtype=np.float32,
                     count=GS_month_arr.shape[0],
-                    crs=ras_file.crs,
-                    transform=ras_file.transform,
+                    crs=interim_crs,
+                    transform=interim_transform,
                     nodata=-9999
             ) as dst:
                 dst.write(GS_month_arr)
 
 
 def dynamic_gs_sum_ET(year_list, growing_season_dir, monthly_input_dir,
-                      gs_output_dir, sum_keyword, skip_processing=False):
+                      gs_output_dir, sum_keyword, prefix_cube_dir, skip_processing=False):
     """
     Dynamically (spatio-temporally) sums effective precipitation and irrigated crop ET monthly rasters for
     the growing seasons.
 
+    The growing season sum is the difference of the prefix-sum cube's values at the end month and at the month before
+    the start month, so nan is handled differently than in the earlier month-mask sum. A pixel is nan if its growing
+    season start/end month is nan (the month-mask sum gave 0). Only the months inside a pixel's growing season window
+    count: a nan (or missing) month inside the window makes the pixel nan, while a nan month outside the window no
+    longer does.
+
     :param year_list: List of years_list to process the data for.
     :param growing_season_dir: Directory path for growing season datasets.
     :param monthly_input_dir:  Directory path for monthly effective precipitation/irrigated crop ET datasets.
@@ -596,6 +545,9 @@ def dynamic_gs_sum_ET(year_list, growing_season_dir, monthly_input_dir,
                            datasets.
     :param sum_keyword: Keyword str to add before the summed raster.
                        Should be 'effective_precip' or 'Irrigated_cropET' or 'OpenET_ensemble'
+    :param prefix_cube_dir: Directory path of the (scratch) datacube to build the prefix-sum (cumulative monthly sum)
+                            cube in. The cube is reused in later runs while the monthly rasters are unchanged. Cubes
+                            of different monthly raster directories can share the datacube.
     :param skip_processing: Set to True if want to skip processing this step.
 
     :return:
@@ -605,35 +557,22 @@ def dynamic_gs_sum_ET(year_list, growing_season_dir, monthly_input_dir,
 
         makedirs([gs_output_dir])
 
-        # The regex r'_([0-9]{1,2})\.tif' extracts the month (1 or 2 digits; e.g., '_1.tif', '_12.tif')
-        # from the filenames using the first group ([0-9]{1,2}).
-        # The extracted month is then (inside the for loop in the sorting block) converted to an integer with int(group(1))
-        # for proper sorting by month.
-        month_pattern = re.compile(r'_([0-9]{1,2})\.tif')
+        # building the prefix-sum cube of the monthly datasets once. The sum of the growing season months of a pixel
+        # is then the difference of the cube's values at the end month and at the month before the start month
+        cube_variable = get_prefix_cube_variable(sum_keyword, monthly_input_dir)
+        build_prefix_sum_cube(prefix_cube_dir, variable=cube_variable, raster_dir=monthly_input_dir,
+                              start_month=(min(year_list), 1), end_month=(max(year_list), 12))
 
         for year in year_list:
-
-            # gathering and sorting the peff datasets by month (from 1 to 12)
-            datasets = glob(os.path.join(monthly_input_dir, f'*{year}*.tif'))
-            sorted_datasets = sorted(datasets, key=lambda x: int(
-                month_pattern.search(x).group(1)))  # First capturing group (the month)
-
-            # peff/cropET monthly array stacked in a single numpy array
-            arrs_stck = np.stack([read_raster_arr_object(i, get_file=False) for i in sorted_datasets], axis=0)
-
             # gathering, reading, and stacking growing season array
             gs_data = glob(os.path.join(growing_season_dir, f'*{year}*.tif'))[0]
             start_gs_arr, ras_file = read_raster_arr_object(gs_data, band=1, get_file=True)  # band 1
             end_gs_arr = read_raster_arr_object(gs_data, band=2, get_file=False)  # band 2
 
-            # We create a 1 pixel "kernel", representing months 1 to 12 (shape : 12, 1, 1).
-            # Then it is broadcasted across the array and named as the kernel_mask.
-            # The kernel_mask acts as a mask, and only sum peff values for months that are 'True'.
-            kernel = np.arange(1, 13, 1).reshape(12, 1, 1)
-            kernel_mask = (kernel >= start_gs_arr) & (kernel <= end_gs_arr)
-
-            # sum peff/cropET arrays over the valid months using the kernel_mask
-            summed_arr = np.sum(arrs_stck * kernel_mask, axis=0)
+            # sum peff/cropET over the growing season months (start to end month of each pixel)
+            summed_arr = sum_prefix_cube_window(prefix_cube_dir, variable=cube_variable,
+                                                start_idx_arr=get_month_index(year, start_gs_arr),
+                                                end_idx_arr=get_month_index(year, end_gs_arr))
 
             # saving the summed peff array
             output_name = f'{sum_keyword}_{year}.tif'
@@ -654,16 +593,25 @@ def dynamic_gs_sum_ET(year_list, growing_season_dir, monthly_input_dir,
 
 
 def dynamic_gs_sum_peff_with_3m_SM_storage(year_list, growing_season_dir, monthly_input_dir,
-                                           gs_output_dir, skip_processing=False):
+                                           gs_output_dir, prefix_cube_dir, skip_processing=False):
     """
     Dynamically (spatio-temporally) sums effective precipitation (peff) monthly rasters for
     the growing seasons with 3 month's lag peff included before the gorwing season starts.
 
+    The growing season sum is the difference of the prefix-sum cube's values at the end month and at the month before
+    the start month, so nan is handled differently than in the earlier month-mask sum. A pixel is nan if its growing
+    season start/end month is nan (the month-mask sum gave 0). Only the months inside a pixel's growing season window
+    count: a nan (or missing) month inside the window makes the pixel nan, while a nan month outside the window no
+    longer does.
+
     :param year_list: List of years_list to process the data for.
     :param growing_season_dir: Directory path for growing season datasets.
     :param monthly_input_dir:  Directory path for monthly effective precipitation/irrigated crop ET datasets.
     :param gs_output_dir:  Directory path (output) for summed growing season effective precipitation/irrigated crop ET
                            datasets.
+    :param prefix_cube_dir: Directory path of the (scratch) datacube to build the prefix-sum (cumulative monthly sum)
+                            cube in. The cube is reused in later runs while the monthly rasters are unchanged. Cubes
+                            of different monthly raster directories can share the datacube.
     :param skip_processing: Set to True if want to skip processing this step.
 
     :return: None.
@@ -671,78 +619,26 @@ def dynamic_gs_sum_peff_with_3m_SM_storage(year_list, growing_season_dir, monthl
     if not skip_processing:
         makedirs([gs_output_dir])
 
-        # The regex r'_([0-9]{1,2})\.tif' extracts the month (1 or 2 digits; e.g., '_1.tif', '_12.tif')
-        # from the filenames using the first group ([0-9]{1,2}).
-        # The extracted month is then (inside the for loop in the sorting block) converted to an integer with int(group(1))
-        # for proper sorting by month.
-        month_pattern_current_yr = re.compile(r'_([0-9]{1,2})\.tif')
-        month_pattern_prev_yr = re.compile(r'_([0-9]{1,2})\.tif')
+        # building the prefix-sum cube of the monthly peff once (from October of the year before the first year, for
+        # the 3 months' storage). As month indices run continuously over years, the window starting 3 months before
+        # the growing season start crosses into the previous year without any special handling
+        cube_variable = get_prefix_cube_variable('effective_precip', monthly_input_dir)
+        build_prefix_sum_cube(prefix_cube_dir, variable=cube_variable, raster_dir=monthly_input_dir,
+                              start_month=(min(year_list) - 1, 10), end_month=(max(year_list), 12))
 
         for year in year_list:
             print(f'Dynamically summing effective precipitation monthly datasets for growing season {year}...')
 
-            # current year: gathering and sorting the peff datasets by month for current year (from 1 to 12)
-            datasets_current_yr = glob(os.path.join(monthly_input_dir, f'*{year}*.tif'))
-            sorted_datasets_current_yr = sorted(datasets_current_yr, key=lambda x: int(
-                month_pattern_current_yr.search(x).group(1)))  # First capturing group (the month)
-
-            # current year: peff monthly array stacked in a single numpy array
-            arrs_stck_current_yr = np.stack(
-                [read_raster_arr_object(i, get_file=False) for i in sorted_datasets_current_yr], axis=0)
-
-            # previous year: gathering datasets for months 10-12 of the previous year
-            datasets_previous_year = glob(os.path.join(monthly_input_dir, f'*{year - 1}*.tif'))
-            datasets_prev_10_12 = [f for f in datasets_previous_year if
-                                   10 <= int(month_pattern_prev_yr.search(f).group(1)) <= 12]
-            sorted_datasets_prev_yr = sorted(datasets_prev_10_12,
-                                             key=lambda x: int(month_pattern_prev_yr.search(x).group(1)))
-
-            # previous year: peff monthly array stacked in a single numpy array
-            arrs_stck_prev_yr = np.stack([read_raster_arr_object(i, get_file=False) for i in sorted_datasets_prev_yr],
-                                         axis=0)
-
             # gathering, reading, and stacking growing season array
             gs_data = glob(os.path.join(growing_season_dir, f'*{year}*.tif'))[0]
             start_gs_arr, ras_file = read_raster_arr_object(gs_data, band=1, get_file=True)  # band 1
             end_gs_arr = read_raster_arr_object(gs_data, band=2, get_file=False)  # band 2
 
-            # current year: deduct 3 months from start_gs_arr to consider the effect of  3 months' peff storage
-            # then finalize the current year's start season array
-            # (where the value <= 0, set to 1 otherwise it's already been adjusted by deducting 3)
-            start_gs_arr_adjusted = start_gs_arr - 3
-            start_gs_arr_current_yr = np.where(start_gs_arr_adjusted <= 0, 1, start_gs_arr_adjusted)
-            end_gs_arr_current_yr = end_gs_arr
-
-            # previous year: create start and end season array
-            start_gs_arr_prev_yr = np.where(start_gs_arr_adjusted <= 0, start_gs_arr_adjusted + 12, np.nan)
-            end_gs_arr_prev_yr = np.where(start_gs_arr_adjusted <= 0, 12, np.nan)
-
-            # ****** Summing peff for the current year (using start_gs_arr_current_yr and end_gs_arr_current_yr) ******
-
-            # We create a 1 pixel "kernel", representing months 1 to 12 (shape : 12, 1, 1).
-            # Then it is broadcasted across the array and named as the kernel_mask.
-            # The kernel_mask acts as a mask, and only sum peff values for months that are 'True'.
-            kernel_current_year = np.arange(1, 13, 1).reshape(12, 1, 1)
-            kernel_mask_current_year = (kernel_current_year >= start_gs_arr_current_yr) & (
-                    kernel_current_year <= end_gs_arr_current_yr)
-
-            # sum peff arrays over the valid months using the kernel_mask
-            summed_arr_current_yr = np.sum(arrs_stck_current_yr * kernel_mask_current_year, axis=0)
-
-            # ****** Summing peff for the previous year (using start_gs_arr_prev_yr and end_gs_arr_prev_yr) ******
-
-            # We create a 1 pixel "kernel", representing months 10 to 12 (shape : 3, 1, 1).
-            # Then it is broadcasted across the array and named as the kernel_mask.
-            # The kernel_mask acts as a mask, and only sum peff values for months that are 'True'.
-            kernel_prev_year = np.arange(10, 13, 1).reshape(3, 1, 1)
-            kernel_mask_prev_year = (kernel_prev_year >= start_gs_arr_prev_yr) & (
-                    kernel_prev_year <= end_gs_arr_prev_yr)
-
-            # sum peff arrays over the valid months using the kernel_mask
-            summed_arr_prev_yr = np.sum(arrs_stck_prev_yr * kernel_mask_prev_year, axis=0)
-
-            # ****** Combine the results from the current year and previous year ******
-            summed_total_arr = np.sum([summed_arr_current_yr, summed_arr_prev_yr], axis=0)
+            # deduct 3 months from the growing season start to consider the effect of 3 months' peff storage, then
+            # sum peff from the adjusted start month (can be in October-December of the previous year) to the end month
+            summed_total_arr = sum_prefix_cube_window(prefix_cube_dir, variable=cube_variable,
+                                                      start_idx_arr=get_month_index(year, start_gs_arr) - 3,
+                                                      end_idx_arr=get_month_index(year, end_gs_arr))
 
             # saving the summed peff array
             output_name = f'effective_precip_{year}.tif'
@@ -791,9 +687,13 @@ def accumulate_monthly_datasets_to_water_year(skip_processing=False):
 
     if not skip_processing:
         # # processing the variables/predictors
+        # each variable is accumulated to all water years (with sum and/or mean) reading its monthly datasets once,
+        # the variables are processed in parallel
+        aggregate_job_list = []
         for var, path in monthly_data_path_dict.items():
             print(f'accumulating monthly datasets to water year for {var}...')
 
+            # creating output_dir
             if var == 'Irrigated_cropET':
                 output_dir = os.path.join(os.path.dirname(path), 'WestUS_water_year')
                 years_to_run = range(1986, 2024 + 1)
@@ -802,40 +702,21 @@ def accumulate_monthly_datasets_to_water_year(skip_processing=False):
                 output_dir = os.path.join(os.path.dirname(path), 'WestUS_water_year')
                 years_to_run = range(1985, 2024 + 1)
 
-            makedirs([output_dir])
-
             # accumulate by sum or mean
             accum_by = water_yr_accum_dict[var]
 
-            for yr in years_to_run:
-                # collecting monthly datasets for the water year
-                data_prev_years = glob(os.path.join(path, f'*{yr - 1}_1[0-2].*tif'))
-                data_current_years = glob(os.path.join(path, f'*{yr}_[1-9].*tif'))
-                total_data_list = data_prev_years + data_current_years
-
-                # data name extraction
-                data_name_extraction = os.path.basename(total_data_list[0]).split('_')[:-2]
-                data_name = '_'.join(data_name_extraction) + f'_{yr}' + '.tif'
-
-                # sum() or mean() accumulation
-                if var in ['GRIDMET_Precip', 'TERRACLIMATE_SR']:  # we perform both mean and sum
-                    sum_rasters(raster_dir=None, raster_list=total_data_list,
-                                output_raster=os.path.join(output_dir, 'sum', data_name),
-                                ref_raster=total_data_list[0], nodata=no_data_value)
-
-                    mean_rasters(raster_dir=None, raster_list=total_data_list,
-                                 output_raster=os.path.join(output_dir, 'mean', data_name),
-                                 ref_raster=total_data_list[0], nodata=no_data_value)
-
-                else:
-                    if accum_by == 'sum':
-                        sum_rasters(raster_dir=None, raster_list=total_data_list,
-                                    output_raster=os.path.join(output_dir, data_name),
-                                    ref_raster=total_data_list[0], nodata=no_data_value)
-                    elif accum_by == 'mean':
-                        mean_rasters(raster_dir=None, raster_list=total_data_list,
-                                     output_raster=os.path.join(output_dir, data_name),
-                                     ref_raster=total_data_list[0], nodata=no_data_value)
+            # sum() or mean() accumulation
+            if var in ['GRIDMET_Precip', 'TERRACLIMATE_SR']:  # we perform both mean and sum
+                output_dir_dict = {('water_year', 'sum'): os.path.join(output_dir, 'sum'),
+                                   ('water_year', 'mean'): os.path.join(output_dir, 'mean')}
+            else:
+                output_dir_dict = {('water_year', accum_by): output_dir}
+
+            aggregate_job_list.append({'input_dir': path,
+                                       'period_dict': {'water_year': get_period_months('water_year', years_to_run)},
+                                       'output_dir_dict': output_dir_dict})
+
+        aggregate_monthly_rasters_batch(aggregate_job_list)
     else:
         pass
 
@@ -934,37 +815,17 @@ def develop_P_PET_correlation_dataset(monthly_precip_dir, monthly_pet_dir,
 
         makedirs([output_dir])
 
-        # accumulating precip and pet data
-        monthly_precip_data_list = glob(os.path.join(monthly_precip_dir, '*.tif'))
-        monthly_pet_data_list = glob(os.path.join(monthly_pet_dir, '*.tif'))
-
-        # reading datasets as arrays
-        monthly_precip_arr_list = [read_raster_arr_object(i, get_file=False) for i in monthly_precip_data_list]
-        monthly_pet_arr_list = [read_raster_arr_object(i, get_file=False) for i in monthly_pet_data_list]
-
-        # stacking monthly datasets into a list
-        precip_stack = np.stack(monthly_precip_arr_list, axis=0)  # shape becomes - n_months, n_lat (height), n_lon(width)
-        pet_stack = np.stack(monthly_pet_arr_list, axis=0)  # shape becomes - n_months, n_lat (height), n_lon(width)
+        # pairing precip and pet datasets by (year, month) so that the time steps of both series align
+        common_keys = sorted(key for key in set(list_catalog_keys(monthly_precip_dir)) &
+                             set(list_catalog_keys(monthly_pet_dir)) if None not in key)
 
-        # Calculating mean along the time axis (i.e., across months) for each pixel
-        precip_mean = np.mean(precip_stack, axis=0)
-        pet_mean = np.mean(pet_stack, axis=0)
+        monthly_precip_data_list = find_rasters(monthly_precip_dir, keys=common_keys)
+        monthly_pet_data_list = find_rasters(monthly_pet_dir, keys=common_keys)
 
-        # estimating precip and pet anomalies
-        precip_anomalies = precip_stack - precip_mean
-        pet_anomalies = pet_stack - pet_mean
-
-        # getting numerator (covariance) for each pixel across time
-        numerator = np.sum(precip_anomalies * pet_anomalies, axis=0)
-
-        # getting denominator (sum of squares for both variables (this measures the total variation for each))
-        sum_of_squares_precip = np.sqrt(np.sum(precip_anomalies ** 2, axis=0))
-        sum_of_squares_pet = np.sqrt(np.sum(pet_anomalies ** 2, axis=0))
-        denominator = sum_of_squares_precip * sum_of_squares_pet
-
-        # calculating Pearson correlation for each pixel
-        with np.errstate(divide='ignore', invalid='ignore'):
-            correlation_arr = numerator / denominator
+        # calculating Pearson correlation for each pixel by streaming the monthly datasets one pair at a time
+        # (co-moment accumulation, memory doesn't grow with the number of months)
+        correlation_arr = calc_raster_moments(x_raster_list=monthly_precip_data_list,
+                                              y_raster_list=monthly_pet_data_list, stats=['corr'])['corr']
 
         output_raster = os.path.join(output_dir, 'PET_P_corr.tif')
         _, ref_file = read_raster_arr_object(monthly_precip_data_list[0])
@@ -1001,7 +862,8 @@ def process_lake_raster(lake_raster, AZ_shape, output_dir, skip_processing=False
 
 def interpolate_missing_Daymet_sunHr_data(years_to_interpolate, daymet_data_dir, skip_processing=False):
     """
-    interpolate missing monthly data for daymet sun dr.
+    interpolate missing monthly data for daymet sun dr. A missing month is filled with the mean of the same month of
+    the previous two years (already filled months are used for the next years). Months with data are not changed.
 
 
     :param years_to_interpolate: List of year to interpolate for.
@@ -1013,25 +875,8 @@ def interpolate_missing_Daymet_sunHr_data(years_to_interpolate, daymet_data_dir,
     if not skip_processing:
         print('interpolating Daymet Sun Hr data...')
 
-        for year in years_to_interpolate:
-            for month in range(1, 13):
-                if year == 2023 and month in range(1, 12):          # 2023 has data available from month 1-11
-                    continue
-                else:
-                    # reading previous two years' data
-                    data_two_year_back = glob(os.path.join(daymet_data_dir, f'*{year-2}_{month}.tif'))[0]
-                    data_one_year_back = glob(os.path.join(daymet_data_dir, f'*{year-1}_{month}.tif'))[0]
-
-                    arr_two, file = read_raster_arr_object(data_two_year_back)
-                    arr_one = read_raster_arr_object(data_one_year_back, get_file=False)
-
-                    # averaging last two years' data to interpolate missing data
-                    stacked_arr = np.stack([arr_two, arr_one], axis=0)
-                    new_arr = np.nanmean(stacked_arr, axis=0)
-
-                    # saving
-                    output_path = os.path.join(daymet_data_dir, f'DAYMET_sun_hr_{year}_{month}.tif')
-                    write_array_to_raster(new_arr, file, file.transform, output_path)
+        gap_fill_monthly_rasters(input_dir=daymet_data_dir, years=years_to_interpolate, strategy='previous_n',
+                                 n_years=2, output_name='DAYMET_sun_hr')
 
 
 def run_all_preprocessing(skip_process_GrowSeason_data=False,
@@ -1118,12 +963,12 @@ def run_all_preprocessing(skip_process_GrowSeason_data=False,
                       monthly_input_dir='../../Data_main/AZ_files/rasters/Irrigated_cropET/WestUS_monthly',
                       gs_output_dir='../../Data_main/AZ_files/rasters/Irrigated_cropET/WestUS_grow_season',
                       sum_keyword='Irrigated_cropET',
+                      prefix_cube_dir='../../Data_main/AZ_files/rasters/scratch/prefix_sum_cube',
                       skip_processing=skip_summing_irrigated_cropET_gs)
 
     # prism maximum temperature data processing
     process_prism_data(year_list=tuple(range(1984, 2025)),
                        prism_bil_dir='../../Data_main/AZ_files/rasters/PRISM_Tmax/bil_format',
-                       prism_tif_dir='../../Data_main/AZ_files/rasters/PRISM_Tmax/tif_format',
                        output_dir_prism_monthly='../../Data_main/AZ_files/rasters/PRISM_Tmax/WestUS_monthly',
                        output_dir_prism_yearly=None,
                        AZ_shape=AZ_shape,
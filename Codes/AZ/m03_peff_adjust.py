@@ -50,12 +50,14 @@ if __name__ == '__main__':
 
 
     # # # # #  Step 3: compile scaled monthly Peff to growing season including 3 months lagged Peff as soil moisture storage # # # # #
+    prefix_cube_dir = '../../Data_main/AZ_files/rasters/scratch/prefix_sum_cube'
     output_peff_grow_season_summed_dir = f'../../Data_main/AZ_files/rasters/Effective_precip_prediction_WestUS/{monthly_model_version}_grow_season_scaled_with_SM'
 
     dynamic_gs_sum_peff_with_3m_SM_storage(year_list=list(range(1986, 2024)),  # can't do 2024 as month 10-12's data wasn't scaled
                                            growing_season_dir='../../Data_main/AZ_files/rasters/Growing_season',
                                            monthly_input_dir=peff_monthly_scaled_output_dir,
                                            gs_output_dir=output_peff_grow_season_summed_dir,
+                                           prefix_cube_dir=prefix_cube_dir,
                                            skip_processing=skip_sum_scale_peff_to_gs_with_SM)
 
     # # # # #  Step 4: compile scaled monthly Peff to growing season (without considering additional soil mositure storage from previous months) # # # # #
@@ -66,4 +68,5 @@ if __name__ == '__main__':
                       monthly_input_dir=peff_monthly_scaled_output_dir,
                       gs_output_dir=final_peff_grow_season_summed_dir,
                       sum_keyword='effective_precip',
+                      prefix_cube_dir=prefix_cube_dir,
                       skip_processing=skip_sum_scale_peff_to_gs)
\ No newline at end of file
@@ -2,20 +2,19 @@ import os
 import ee
 import sys
 import zipfile
-import requests
 import itertools
 from glob import glob
 import geopandas as gpd
 from datetime import datetime
-from multiprocessing import cpu_count
-from multiprocessing.pool import ThreadPool
 
 from os.path import dirname, abspath
 
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
 from Codes.utils.system_ops import makedirs
-from Codes.utils.raster_ops import read_raster_arr_object, mosaic_rasters_from_directory, clip_resample_reproject_raster
+from Codes.utils.download_ops import download_urls, is_valid_download
+from Codes.utils.raster_ops import mosaic_rasters_from_directory, mosaic_rasters_batch, \
+    clip_resample_reproject_raster
 
 # ee.Authenticate()
 
@@ -44,13 +43,9 @@ def download_from_url(download_dir, url_list):
     :return:
     """
     makedirs([download_dir])
-    for url in url_list:
-        fname = url.rsplit('/', 1)[1]
-        print(f'Downloading {fname}......')
-        r = requests.get(url, allow_redirects=True)
-        download_fname = os.path.join(download_dir, fname)
-        open(download_fname, 'wb').write(r.content)
-        print('Download complete')
+    url_file_list = [(url, os.path.join(download_dir, url.rsplit('/', 1)[1])) for url in url_list]
+    download_urls(url_file_list, overwrite=True)
+    print('Download complete')
 
 
 def extract_data(zip_dir_or_list, out_dir, search_by='*.zip', rename_file=True):
@@ -431,6 +426,7 @@ def download_soil_datasets(data_name, download_dir, merge_keyword, grid_shape, r
         grid_geometry = grids['geometry']
         grid_no = grids['grid_no']
 
+        url_file_list = []
         for grid_sr, geometry in zip(grid_no, grid_geometry):  # second loop for grids
             roi = geometry.bounds
             gee_extent = ee.Geometry.Rectangle(roi)
@@ -443,9 +439,10 @@ def download_soil_datasets(data_name, download_dir, merge_keyword, grid_shape, r
                                                     'format': 'GEO_TIFF'})
             key_word = data_name
             local_file_name = os.path.join(download_dir, f'{key_word}_{str(grid_sr)}.tif')
-            print('Downloading', local_file_name, '.....')
-            r = requests.get(data_url, allow_redirects=True)
-            open(local_file_name, 'wb').write(r.content)
+            url_file_list.append((data_url, local_file_name))
+
+        print(f'Downloading {data_name}.....')
+        download_urls(url_file_list, overwrite=True)
 
         mosaic_name = f'{data_name}.tif'
         mosaic_dir = os.path.join(download_dir, f'{merge_keyword}', 'merged')
@@ -504,6 +501,7 @@ def download_tree_cover_data(data_name, download_dir, merge_keyword, grid_shape,
     grid_geometry = grids['geometry']
     grid_no = grids['grid_no']
 
+    url_file_list = []
     for grid_sr, geometry in zip(grid_no, grid_geometry):  # second loop for grids
         roi = geometry.bounds
         gee_extent = ee.Geometry.Rectangle(roi)
@@ -516,9 +514,10 @@ def download_tree_cover_data(data_name, download_dir, merge_keyword, grid_shape,
                                            'format': 'GEO_TIFF'})
         key_word = data_name
         local_file_name = os.path.join(download_dir, f'{key_word}_{str(grid_sr)}.tif')
-        print('Downloading', local_file_name, '.....')
-        r = requests.get(data_url, allow_redirects=True)
-        open(local_file_name, 'wb').write(r.content)
+        url_file_list.append((data_url, local_file_name))
+
+    print(f'Downloading {data_name}.....')
+    download_urls(url_file_list, overwrite=True)
 
     mosaic_name = f'{data_name}.tif'
     mosaic_dir = os.path.join(download_dir, f'{merge_keyword}', 'merged')
@@ -578,6 +577,7 @@ def download_DEM_Slope_data(data_name, download_dir, merge_keyword, grid_shape,
     grid_geometry = grids['geometry']
     grid_no = grids['grid_no']
 
+    url_file_list = []
     for grid_sr, geometry in zip(grid_no, grid_geometry):  # second loop for grids
         roi = geometry.bounds
         gee_extent = ee.Geometry.Rectangle(roi)
@@ -590,9 +590,10 @@ def download_DEM_Slope_data(data_name, download_dir, merge_keyword, grid_shape,
                                            'format': 'GEO_TIFF'})
         key_word = data_name
         local_file_name = os.path.join(download_dir, f'{key_word}_{str(grid_sr)}.tif')
-        print('Downloading', local_file_name, '.....')
-        r = requests.get(data_url, allow_redirects=True)
-        open(local_file_name, 'wb').write(r.content)
+        url_file_list.append((data_url, local_file_name))
+
+    print(f'Downloading {data_name}.....')
+    download_urls(url_file_list, overwrite=True)
 
     mosaic_name = f'{data_name}.tif'
     mosaic_dir = os.path.join(download_dir, f'{merge_keyword}', 'merged')
@@ -667,6 +668,7 @@ def download_gee_data_yearly(data_name, download_dir, year_list, month_range, me
         # a condition to check whether start and end date falls in the available data range in GEE
         # if not the block will not be executed
         if (start_date_dt >= year_start_range) & (end_date_dt <= year_end_range):
+            url_file_list = []
 
             for grid_sr, geometry in zip(grid_no, grid_geometry):  # second loop for grids
                 roi = geometry.bounds
@@ -730,20 +732,12 @@ def download_gee_data_yearly(data_name, download_dir, year_list, month_range, me
                                                          'format': 'GEO_TIFF'})
                 key_word = data_name
                 local_file_name = os.path.join(download_dir, f'{key_word}_{str(year)}_{str(grid_sr)}.tif')
-                print('Downloading', local_file_name, '.....')
-                r = requests.get(data_url, allow_redirects=True)
-                open(local_file_name, 'wb').write(r.content)
+                url_file_list.append((data_url, local_file_name))
 
-                # This is a check block to see if downloaded datasets are OK
-                # sometimes a particular grid's data is corrupted but it's completely random, not sure why it happens.
-                # Re-downloading the same data might not have that error
-                try:
-                    arr = read_raster_arr_object(local_file_name, get_file=False)
-
-                except:
-                    print(f'Downloaded data corrupted. Re-downloading {local_file_name}.....')
-                    r = requests.get(data_url, allow_redirects=True)
-                    open(local_file_name, 'wb').write(r.content)
+            # downloading all grids of the year concurrently. Sometimes a particular grid's data is corrupted (randomly),
+            # corrupted downloads are detected and re-downloaded
+            print(f'Downloading {data_name} for year {year}.....')
+            download_urls(url_file_list, overwrite=True)
 
             mosaic_name = f'{data_name}_{year}.tif'
             mosaic_dir = os.path.join(download_dir, f'{merge_keyword}', 'merged')
@@ -813,6 +807,13 @@ def download_gee_data_monthly(data_name, download_dir, year_list, month_range, m
                          'Sand_content', 'Clay_content', 'DEM', 'Effect_precip_DK', 'Tree_cover']
 
     if data_name not in data_exclude_list:
+        mosaic_dir = os.path.join(download_dir, f'{merge_keyword}', 'merged')
+        clip_dir = os.path.join(download_dir, f'{merge_keyword}')
+        makedirs([clip_dir, mosaic_dir])
+
+        # the downloaded data patches of each month are mosaicked in parallel after all months are downloaded
+        mosaic_job_list = []
+
         # Looping for years_list > months > grids
         for year in year_list:  # first loop for years_list
             for month in month_list:  # second loop for months
@@ -834,13 +835,20 @@ def download_gee_data_monthly(data_name, download_dir, year_list, month_range, m
                 # a condition to check whether start and end date falls in the available data range in GEE
                 # if not the block will not be executed
                 if (start_date_dt >= month_start_range) & (end_date_dt <= month_end_range):
-                    # will collect url and file name in url list and local_file_paths_list
-                    data_url_list = []
-                    local_file_paths_list = []
+                    # will collect url and file name of the grids to download
+                    url_file_list = []
 
                     for i in range(len(grid_no)):  # third loop for grids
-                        # converting grid geometry info to a GEE extent
                         grid_sr = grid_no[i]
+                        key_word = data_name
+                        local_file_path = os.path.join(download_dir,
+                                                       f'{key_word}_{str(year)}_{str(month)}_{str(grid_sr)}.tif')
+
+                        # grids downloaded (completely) in a previous run are not downloaded again
+                        if is_valid_download(local_file_path):
+                            continue
+
+                        # converting grid geometry info to a GEE extent
                         roi = grid_geometry[i].bounds
                         gee_extent = ee.Geometry.Rectangle(roi)
 
@@ -909,56 +917,35 @@ def download_gee_data_monthly(data_name, download_dir, year_list, month_range, m
                                                                      'region': gee_extent,
                                                                      'format': 'GEO_TIFF'})
 
-                        key_word = data_name
-                        local_file_path = os.path.join(download_dir,
-                                                       f'{key_word}_{str(year)}_{str(month)}_{str(grid_sr)}.tif')
-
                         # Appending data url and local file path (to save data) to a central list
-                        data_url_list.append(data_url)
-                        local_file_paths_list.append(local_file_path)
-
-                        # The GEE connection gets disconnected sometimes, therefore, we download the data in batches when
-                        # there is enough data url gathered for download.
-                        if (len(data_url_list) == 120) | (
-                                i == len(grid_no) - 1):  # downloads data when one of the conditions are met
-                            # Combining url and file paths together to pass in multiprocessing
-                            urls_to_file_paths_compile = []
-                            for j, k in zip(data_url_list, local_file_paths_list):
-                                urls_to_file_paths_compile.append([j, k])
-
-                            # Download data by multi-processing/multi-threading
-                            download_data_from_GEE_by_multiprocess(download_urls_fp_list=urls_to_file_paths_compile,
-                                                                   use_cpu=use_cpu_while_multidownloading)
-
-                            # After downloading some data in a batch, we empty the data_utl_list and local_file_paths_list.
-                            # The empty lists will gather some new urls and file paths, and download a new batch of datasets
-                            data_url_list = []
-                            local_file_paths_list = []
+                        url_file_list.append((data_url, local_file_path))
 
-                    mosaic_name = f'{data_name}_{year}_{month}.tif'
-                    mosaic_dir = os.path.join(download_dir, f'{merge_keyword}', 'merged')
-                    clip_dir = os.path.join(download_dir, f'{merge_keyword}')
-
-                    makedirs([clip_dir, mosaic_dir])
-                    search_by = f'*{year}_{month}*.tif'
-                    merged_arr, merged_raster = mosaic_rasters_from_directory(input_dir=download_dir,
-                                                                              output_dir=mosaic_dir,
-                                                                              raster_name=mosaic_name,
-                                                                              ref_raster=refraster_gee_merge,
-                                                                              search_by=search_by,
-                                                                              nodata=no_data_value)
+                    # Downloading all grids of the month concurrently. Throttled/disconnected/corrupted downloads are
+                    # retried with backoff (and fewer connections)
+                    download_data_from_GEE_by_multiprocess(download_urls_fp_list=url_file_list,
+                                                           use_cpu=use_cpu_while_multidownloading)
 
-                    clip_resample_reproject_raster(input_raster=merged_raster, input_shape=westUS_shape,
-                                                   output_raster_dir=clip_dir, clip_and_resample=True,
-                                                   use_ref_width_height=False, resolution=model_res,
-                                                   ref_raster=refraster_westUS)
+                    mosaic_name = f'{data_name}_{year}_{month}.tif'
+                    search_by = f'{data_name}_{year}_{month}_*.tif'
+                    mosaic_job_list.append((glob(os.path.join(download_dir, search_by)), mosaic_name))
 
-                    print(f'{data_name} monthly data downloaded and merged')
+                    print(f'{data_name} monthly data downloaded')
 
                 else:
                     print(f'Data for year {year}, month {month} is out of range. Skipping query')
                     pass
 
+        merged_rasters = mosaic_rasters_batch(mosaic_job_list, output_dir=mosaic_dir, ref_raster=refraster_gee_merge,
+                                              mask_by_ref=False, nodata=no_data_value)
+
+        for merged_raster in merged_rasters:
+            clip_resample_reproject_raster(input_raster=merged_raster, input_shape=westUS_shape,
+                                           output_raster_dir=clip_dir, clip_and_resample=True,
+                                           use_ref_width_height=False, resolution=model_res,
+                                           ref_raster=refraster_westUS)
+
+        print(f'{data_name} monthly data merged')
+
 
 def get_data_GEE_saveTopath(url_and_file_path):
     """
@@ -968,52 +955,28 @@ def get_data_GEE_saveTopath(url_and_file_path):
                              (2nd member).
     :return: None
     """
-    # unpacking tuple
-    data_url, file_path = url_and_file_path
-
-    # get data from GEE
-    r = requests.get(data_url, allow_redirects=True)
-    print('Downloading', file_path, '.....')
-
-    # save data to local file path
-    open(file_path, 'wb').write(r.content)
-
-    # This is a check block to see if downloaded datasets are OK
+    # streamed to disk, checked (geotiff header), and re-downloaded if corrupted
     # sometimes a particular grid's data is corrupted but it's completely random, not sure why it happens.
-    # Re-downloading the same data might not have that error
-    if '.tif' in file_path:  # only for data downloaded in geotiff format
-        try:
-            arr = read_raster_arr_object(file_path, get_file=False)
-
-        except:
-            print(f'Downloaded data corrupted. Re-downloading {file_path}.....')
-            r = requests.get(data_url, allow_redirects=True)
-            open(file_path, 'wb').write(r.content)
+    download_urls([url_and_file_path], max_concurrency=1, overwrite=True, progress=False)
 
 
 def download_data_from_GEE_by_multiprocess(download_urls_fp_list, use_cpu=2):
     """
-    Use python multiprocessing library to download data from GEE in a multi-thread approach. This function is a
-    wrapper over get_data_GEE_saveTopath() function providing muti-threading support.
+    Download data from GEE concurrently over a pool of reused connections. This function is a wrapper over
+    download_urls() (see utils/download_ops.py). The number of concurrent downloads starts at use_cpu and adapts to
+    GEE throttling. Grids that are already downloaded (complete) are not downloaded again.
 
     :param download_urls_fp_list: A list of tuples where each tuple has the data url (1st member) and local file path
                                   (2nd member).
-    :param use_cpu: Number of CPU/core (Int) to use for downloading. Default set to 2.
+    :param use_cpu: Maximum number of concurrent downloads (Int). Default set to 2.
 
     :return: None.
     """
-    # Using ThreadPool() instead of pool() as this is an I/O bound job not CPU bound
-    # Using imap() as it completes assigning one task at a time to the ThreadPool()
-    # and blocks until each task is complete
     print('######')
-    print('Downloading data from GEE..')
-    print(f'{cpu_count()} CPUs on this machine. Engaging {use_cpu} CPUs for downloading')
+    print(f'Downloading data from GEE.. ({len(download_urls_fp_list)} files, up to {use_cpu} concurrent downloads)')
     print('######')
 
-    pool = ThreadPool(use_cpu)
-    results = pool.imap(get_data_GEE_saveTopath, download_urls_fp_list)
-    pool.close()
-    pool.join()
+    download_urls(download_urls_fp_list, max_concurrency=use_cpu)
 
 
 def download_eff_precip_data_from_DK_asset(data_name, download_dir, year_list, month_range, grid_shape,
@@ -1060,13 +1023,20 @@ def download_eff_precip_data_from_DK_asset(data_name, download_dir, year_list, m
             # querying the data. original unit in m/month. multiplying with 100 to convert to mm/month
             download_data = ee.Image(data_band).multiply(1000).toFloat()
 
-            # will collect url and file name in url list and local_file_paths_list
-            data_url_list = []
-            local_file_paths_list = []
+            # will collect url and file name of the grids to download
+            url_file_list = []
 
             for i in range(len(grid_no)):  # third loop for grids
-                # converting grid geometry info to a GEE extent
                 grid_sr = grid_no[i]
+                key_word = data_name
+                local_file_path = os.path.join(download_dir,
+                                               f'{key_word}_{str(year)}_{str(month)}_{str(grid_sr)}.tif')
+
+                # grids downloaded (completely) in a previous run are not downloaded again
+                if is_valid_download(local_file_path):
+                    continue
+
+                # converting grid geometry info to a GEE extent
                 roi = grid_geometry[i].bounds
                 gee_extent = ee.Geometry.Rectangle(roi)
 
@@ -1086,31 +1056,13 @@ def download_eff_precip_data_from_DK_asset(data_name, download_dir, year_list, m
                                                              'region': gee_extent,
                                                              'format': 'GEO_TIFF'})
 
-                key_word = data_name
-                local_file_path = os.path.join(download_dir,
-                                               f'{key_word}_{str(year)}_{str(month)}_{str(grid_sr)}.tif')
-
                 # Appending data url and local file path (to save data) to a central list
-                data_url_list.append(data_url)
-                local_file_paths_list.append(local_file_path)
-
-                # The GEE connection gets disconnected sometimes, therefore, we download the data in batches when
-                # there is enough data url gathered for download.
-                if (len(data_url_list) == 120) | (
-                        i == len(grid_no) - 1):  # downloads data when one of the conditions are met
-                    # Combining url and file paths together to pass in multiprocessing
-                    urls_to_file_paths_compile = []
-                    for j, k in zip(data_url_list, local_file_paths_list):
-                        urls_to_file_paths_compile.append([j, k])
-
-                    # Download data by multi-processing/multi-threading
-                    download_data_from_GEE_by_multiprocess(download_urls_fp_list=urls_to_file_paths_compile,
-                                                           use_cpu=use_cpu_while_multidownloading)
+                url_file_list.append((data_url, local_file_path))
 
-                    # After downloading some data in a batch, we empty the data_utl_list and local_file_paths_list.
-                    # The empty lists will gather some new urls and file paths, and download a new batch of datasets
-                    data_url_list = []
-                    local_file_paths_list = []
+            # Downloading all grids of the month concurrently. Throttled/disconnected/corrupted downloads are retried
+            # with backoff (and fewer connections)
+            download_data_from_GEE_by_multiprocess(download_urls_fp_list=url_file_list,
+                                                   use_cpu=use_cpu_while_multidownloading)
 
             mosaic_name = f'{data_name}_{year}_{month}.tif'
             mosaic_dir = os.path.join(download_dir, f'{merge_keyword}')
@@ -1203,7 +1155,7 @@ def download_all_gee_data(data_list, download_dir, year_list, month_range,
 
 def download_ssebop_et(years_list, month_range_list, download_dir='../../Data_main/Raster_data/Ssebop_ETa',
                        ssebop_link='https://edcintl.cr.usgs.gov/downloads/sciweb1/shared/uswem/web/conus/eta/modis_eta/monthly/downloads/',
-                       skip_download=False):
+                       max_concurrent_downloads=8, skip_download=False):
     """
     Download ssebop actual ET data (unit in mm).
 
@@ -1211,6 +1163,7 @@ def download_ssebop_et(years_list, month_range_list, download_dir='../../Data_ma
     :param month_range_list: List of first and last month, i.e., to download data from April-September use [4, 9].
     :param download_dir: Directory path to download data.
     :param ssebop_link: USGS link with ssebop ET data.
+    :param max_concurrent_downloads: Maximum number of concurrent downloads. Default set to 8.
     :param skip_download: Set to True to skip download.
 
     :return: None.
@@ -1221,20 +1174,22 @@ def download_ssebop_et(years_list, month_range_list, download_dir='../../Data_ma
 
         year_month_combs = list(itertools.product(years_list, months_list))
 
+        url_file_list = []
         for each in year_month_combs:
             year, month = each
-            print(f'Downloading SSEBOP ET for year {year} month {month}...')
 
             if len(str(month)) == 1:
                 ssebop_et_link = f'{ssebop_link}m{str(year)}0{str(month)}.zip'
             else:
                 ssebop_et_link = f'{ssebop_link}m{str(year)}{str(month)}.zip'
-            r = requests.get(ssebop_et_link, allow_redirects=True)
 
             download_name = ssebop_et_link[ssebop_et_link.rfind('/') + 1:]
             download_to = os.path.join(download_dir, download_name)
+            url_file_list.append((ssebop_et_link, download_to))
 
-            open(download_to, 'wb').write(r.content)
+        # downloading all months concurrently
+        print(f'Downloading SSEBOP ET for {len(url_file_list)} months...')
+        download_urls(url_file_list, max_concurrency=max_concurrent_downloads)
 
         zipped_files = extract_data(download_dir, download_dir, search_by='*.zip', rename_file=True)
         for z in zipped_files:
@@ -2,18 +2,16 @@ import os
 import ee
 import sys
 import time
-import requests
 import geopandas as gpd
 from datetime import datetime
-from multiprocessing import cpu_count
-from multiprocessing.pool import ThreadPool
 
 from os.path import dirname, abspath
 
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
 from Codes.utils.system_ops import makedirs
-from Codes.utils.raster_ops import read_raster_arr_object, clip_resample_reproject_raster, mosaic_rasters_from_directory
+from Codes.utils.download_ops import download_urls
+from Codes.utils.raster_ops import clip_resample_reproject_raster, mosaic_rasters_from_directory
 
 # ee.Authenticate()
 
@@ -187,52 +185,28 @@ def get_data_GEE_saveTopath(url_and_file_path):
                              (2nd member).
     :return: None
     """
-    # unpacking tuple
-    data_url, file_path = url_and_file_path
-
-    # get data from GEE
-    r = requests.get(data_url, allow_redirects=True)
-    print('Downloading', file_path, '.....')
-
-    # save data to local file path
-    open(file_path, 'wb').write(r.content)
-
-    # This is a check block to see if downloaded datasets are OK
+    # streamed to disk, checked (geotiff header), and re-downloaded if corrupted
     # sometimes a particular grid's data is corrupted but it's completely random, not sure why it happens.
-    # Re-downloading the same data might not have that error
-    if '.tif' in file_path:  # only for data downloaded in geotiff format
-        try:
-            arr = read_raster_arr_object(file_path, get_file=False)
-
-        except:
-            print(f'Downloaded data corrupted. Re-downloading {file_path}.....')
-            r = requests.get(data_url, allow_redirects=True)
-            open(file_path, 'wb').write(r.content)
+    download_urls([url_and_file_path], max_concurrency=1, overwrite=True, progress=False)
 
 
 def download_data_from_GEE_by_multiprocess(download_urls_fp_list, use_cpu=2):
     """
-    Use python multiprocessing library to download data from GEE in a multi-thread approach. This function is a
-    wrapper over get_data_GEE_saveTopath() function providing muti-threading support.
+    Download data from GEE concurrently over a pool of reused connections. This function is a wrapper over
+    download_urls() (see utils/download_ops.py). The number of concurrent downloads starts at use_cpu and adapts to
+    GEE throttling. Grids that are already downloaded (complete) are not downloaded again.
 
     :param download_urls_fp_list: A list of tuples where each tuple has the data url (1st member) and local file path
                                   (2nd member).
-    :param use_cpu: Number of CPU/core (Int) to use for downloading. Default set to 2.
+    :param use_cpu: Maximum number of concurrent downloads (Int). Default set to 2.
 
     :return: None.
     """
-    # Using ThreadPool() instead of pool() as this is an I/O bound job not CPU bound
-    # Using imap() as it completes assigning one task at a time to the ThreadPool()
-    # and blocks until each task is complete
     print('######')
-    print('Downloading data from GEE..')
-    print(f'{cpu_count()} CPUs on this machine. Engaging {use_cpu} CPUs for downloading')
+    print(f'Downloading data from GEE.. ({len(download_urls_fp_list)} files, up to {use_cpu} concurrent downloads)')
     print('######')
 
-    pool = ThreadPool(use_cpu)
-    results = pool.imap(get_data_GEE_saveTopath, download_urls_fp_list)
-    pool.close()
-    pool.join()
+    download_urls(download_urls_fp_list, max_concurrency=use_cpu)
 
 
 def download_openet_indiv_models_grow_season(download_dir, year_list, merge_keyword, grid_shape,
@@ -1,29 +1,67 @@
 import os
-import re
 import sys
-import shutil
-import datetime
 import numpy as np
 from glob import glob
 from osgeo import gdal
-import rasterio as rio
-import geopandas as gpd
+from affine import Affine
 
 from os.path import dirname, abspath
 
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
-from Codes.utils.system_ops import makedirs
-from Codes.utils.raster_ops import read_raster_arr_object, write_array_to_raster, mosaic_rasters_list, \
-    clip_resample_reproject_raster, sum_rasters, mean_rasters, make_lat_lon_array_from_raster, shapefile_to_raster
+from Codes.utils.system_ops import makedirs, parallel_map
+from Codes.utils.time_ops import doy_to_month, get_period_months, aggregate_monthly_rasters, \
+    aggregate_monthly_rasters_batch
+from Codes.utils.stats_ops import calc_mode_along_stack, calc_raster_moments
+from Codes.utils.raster_ops import read_raster_arr_object, write_array_to_raster, mosaic_rasters_batch, \
+    clip_resample_reproject_raster, sum_rasters, make_lat_lon_array_from_raster, shapefile_to_raster, \
+    read_raster_metadata, translate_to_vrt, read_gdal_dataset_arr, rasterize_zone_labels
+from Codes.utils.block_ops import apply_blockwise, block_memory_budget
+from Codes.utils.geotiff_ops import create_raster
+from Codes.utils.catalog_ops import find_raster, find_rasters, list_catalog_keys
+from Codes.utils.expression_ops import evaluate_yearly_raster_expressions
+from Codes.utils.pipeline_ops import pipeline_step, run_pipeline
+from Codes.utils.datacube_ops import create_datacube, ingest_rasters_to_datacube, get_month_index, \
+    build_prefix_sum_cube, sum_prefix_cube_window, get_prefix_cube_variable
 from Codes.effective_precip.m00_eff_precip_utils import estimate_peff_precip_water_year_fraction
 
 no_data_value = -9999
+
+# water year ratio predictors (rasters read with nodata as nan, so nan propagates as nodata)
+water_yr_ratio_expressions = {'SR_frac': 'runoff / precip',
+                              'precip_intensity': 'where(rainy_days != 0, precip_mean / rainy_days, nan)',
+                              'PET_P': 'PET / precip',
+                              'rel_infil_capacity': 'ksat / precip_intensity'}
 model_res = 0.01976293625031605786  # in deg, ~2 km
 WestUS_shape = '../../Data_main/shapefiles/Western_US_ref_shapes/WestUS_states.shp'
 WestUS_raster = '../../Data_main/reference_rasters/Western_US_refraster_2km.tif'
 GEE_merging_refraster_large_grids = '../../Data_main/reference_rasters/GEE_merging_refraster_larger_grids.tif'
 
+# monthly datasets accumulated to water year (see accumulate_monthly_datasets_to_water_year())
+water_yr_accum_data_path_dict = {
+    'Effective_precip_train': '../../Data_main/Raster_data/Rainfed_cropET_filtered_training/final_filtered_cropET_for_training',
+    'PRISM_Tmax': '../../Data_main/Raster_data/PRISM_Tmax/WestUS_monthly',
+    'PRISM_Tmin': '../../Data_main/Raster_data/PRISM_Tmin/WestUS_monthly',
+    'GRIDMET_Precip': '../../Data_main/Raster_data/GRIDMET_Precip/WestUS_monthly',
+    'GRIDMET_RET': '../../Data_main/Raster_data/GRIDMET_RET/WestUS_monthly',
+    'GRIDMET_vap_pres_def': '../../Data_main/Raster_data/GRIDMET_vap_pres_def/WestUS_monthly',
+    'GRIDMET_max_RH': '../../Data_main/Raster_data/GRIDMET_max_RH/WestUS_monthly',
+    'GRIDMET_min_RH': '../../Data_main/Raster_data/GRIDMET_min_RH/WestUS_monthly',
+    'GRIDMET_wind_vel': '../../Data_main/Raster_data/GRIDMET_wind_vel/WestUS_monthly',
+    'GRIDMET_short_rad': '../../Data_main/Raster_data/GRIDMET_short_rad/WestUS_monthly',
+    'DAYMET_sun_hr': '../../Data_main/Raster_data/DAYMET_sun_hr/WestUS_monthly',
+    'TERRACLIMATE_SR': '../../Data_main/Raster_data/TERRACLIMATE_SR/WestUS_monthly',
+    'Rainy_days': '../../Data_main/Raster_data/Rainy_days/WestUS_monthly'}
+
+# # Criteria of irrigated and rainfed cropland classification
+# Rainfed: More than 10% (fraction 0.1) rainfed 30m pixels in a 2km pixel will be classified
+# as "Rainfed cropland". Also, it should have <6% tree cover.
+rainfed_frac_threshold = 0.10
+tree_cover_threshold = 6  # unit in %
+
+# Irrigated: A 2km pixel with >2% irr fraction was used to classify as irrigated
+irrigated_frac_threshold = 0.02
+
 
 def apply_maximum_occurrence_approach(input_rasters_list, output_dir, raster_name):
     """
@@ -41,36 +79,19 @@ def apply_maximum_occurrence_approach(input_rasters_list, output_dir, raster_nam
     ref_arr, ref_file = read_raster_arr_object(input_rasters_list[0], change_dtype=False)
     ref_shape = ref_arr.shape
 
-    # making input dataset placeholder names
-    input_raster_names = [f'input_raster_{i}' for i in range(1, len(input_rasters_list) + 1)]
-
-    # making a dictionary where each raster array (after data reading) will be assigned to individual names
-    input_raster_dict = {}
-    for name, data in zip(input_raster_names, input_rasters_list):
-        arr = read_raster_arr_object(data, get_file=False, change_dtype=False).flatten()
-        # the max occurrence approach uses np.bincount() which can't take non-negative element. So, replacing all
-        # nan/no data (-9999) values with 0
-        arr[arr == -9999] = 0
-
-        # adding the array to the dictionary
-        input_raster_dict[name] = arr
-
     # stacking the data arrays
-    array_list = [arr for arr in input_raster_dict.values()]
-    max_arr = np.stack(array_list, axis=0)
-
-    # creating an empty array to assign cropland (1) if most years_list between 2008-2011 are cropland
-    new_arr = np.zeros(array_list[0].shape, dtype=np.int8)  # this is a flatten shape array
+    array_list = []
+    for data in input_rasters_list:
+        arr = read_raster_arr_object(data, get_file=False, change_dtype=False)
+        # nan/no data (-9999) values are counted as 0 (not 1)
+        arr[(arr == -9999) | np.isnan(arr)] = 0
+        array_list.append(arr)
 
-    # this loop takes each column of stacked array. np.bincount() counts the number of occurrence of each value
-    # in the selected column. Then, np.argmax() selects the value which occurs most frequently. Then, we paste
-    # the selected value to a new array
+    max_arr = np.stack(array_list, axis=0)
 
-    for i in range(max_arr.shape[1]):
-        selected_arr = max_arr[:, i]
-        selected_arr = np.where(np.isnan(selected_arr), 0, selected_arr)  # replacing Nan values with 0
-        max_occurred_value = np.argmax(np.bincount(list(selected_arr)))  # # # improve this. try to avoid loop
-        new_arr[i] = max_occurred_value
+    # the value which occurs most frequently in each pixel (vectorized mode along the stacked rasters). Ties are
+    # assigned to the smaller value (same as np.argmax(np.bincount()))
+    new_arr = calc_mode_along_stack(max_arr).astype(np.int8)
 
     max_arr = new_arr.reshape(ref_shape)
 
@@ -110,6 +131,9 @@ def merge_GEE_data_patches_IrrMapper_LANID_extents(year_list, input_dir_irrmappe
     if not skip_processing:
         makedirs([merged_output_dir])
 
+        # collecting the data patches of each year (and month), the mosaics are created in parallel
+        mosaic_job_list = []
+
         if monthly_data:  # for datasets that are monthly
             month_list = list(range(1, 13))
 
@@ -126,12 +150,7 @@ def merge_GEE_data_patches_IrrMapper_LANID_extents(year_list, input_dir_irrmappe
 
                     if len(total_raster_list) > 0:  # to only merge for years_list and months when data is available
                         merged_raster_name = f'{merge_keyword}_{year}_{month}.tif'
-                        mosaic_rasters_list(input_raster_list=total_raster_list, output_dir=merged_output_dir,
-                                            raster_name=merged_raster_name, ref_raster=ref_raster, dtype=None,
-                                            resampling_method='nearest', mosaicing_method='first',
-                                            resolution=model_res, nodata=no_data_value)
-
-                        print(f'{merge_keyword} data merged for year {year}, month {month}')
+                        mosaic_job_list.append((total_raster_list, merged_raster_name))
 
         else:  # for datasets that are yearly
             for year in year_list:
@@ -147,21 +166,81 @@ def merge_GEE_data_patches_IrrMapper_LANID_extents(year_list, input_dir_irrmappe
 
                 if len(total_raster_list) > 0:  # to only merge for years_list and months when data is available
                     merged_raster_name = f'{merge_keyword}_{year}.tif'
-                    mosaic_rasters_list(input_raster_list=total_raster_list, output_dir=merged_output_dir,
-                                        raster_name=merged_raster_name, ref_raster=ref_raster, dtype=None,
-                                        resampling_method='nearest', mosaicing_method='first',
-                                        resolution=model_res, nodata=no_data_value)
+                    mosaic_job_list.append((total_raster_list, merged_raster_name))
+
+        merged_rasters = mosaic_rasters_batch(mosaic_job_list, output_dir=merged_output_dir, ref_raster=ref_raster,
+                                              dtype=None, resampling_method='nearest', nodata=no_data_value)
 
-                    print(f'{merge_keyword} data merged for year {year}')
+        for merged_raster in merged_rasters:
+            print(f'{merge_keyword} data merged: {os.path.basename(merged_raster)}')
     else:
         pass
 
 
+def classify_rainfed_cropland_arr(rainfed_frac_arr, tree_cover_arr):
+    """
+    Classify rainfed cropland using rainfed fraction and tree cover thresholds.
+
+    :param rainfed_frac_arr: Rainfed fraction array.
+    :param tree_cover_arr: Tree cover (%) array.
+
+    :return: Cropland array (1 for rainfed cropland, -9999 for no data).
+    """
+    return np.where((rainfed_frac_arr >= rainfed_frac_threshold) & (tree_cover_arr <= tree_cover_threshold), 1, -9999)
+
+
+def classify_irrigated_cropland_arr(irrigated_frac_arr):
+    """
+    Classify irrigated cropland using irrigated fraction threshold.
+
+    :param irrigated_frac_arr: Irrigated fraction array.
+
+    :return: Cropland array (1 for irrigated cropland, -9999 for no data).
+    """
+    return np.where(irrigated_frac_arr > irrigated_frac_threshold, 1, -9999)
+
+
+def classify_cropland_for_year(year, rainfed_fraction_dir, irrigated_fraction_dir, tree_cover_dataset,
+                               rainfed_cropland_output_dir, irrigated_cropland_output_dir, classify_rainfed=True):
+    """
+    Classifies rainfed and irrigated cropland of a year using rainfed and irrigated fraction data (task of
+    classify_irrigated_rainfed_cropland()).
+
+    :param year: Year to classify the data for.
+    :param rainfed_fraction_dir: Input directory path for rainfed fraction data.
+    :param irrigated_fraction_dir: Input directory path for irrigated fraction data.
+    :param tree_cover_dataset: Filepath of tree cover dataset.
+    :param rainfed_cropland_output_dir: Output directory path for classified rainfed cropland data.
+    :param irrigated_cropland_output_dir: Output directory path for classified irrigated cropland data.
+    :param classify_rainfed: Set to False to only classify irrigated cropland (years without rainfed fraction data).
+
+    :return: None.
+    """
+    print(f'Classifying rainfed and irrigated cropland data for year {year}')
+
+    # classifying and saving data block by block
+    if classify_rainfed:
+        rainfed_frac_data = os.path.join(rainfed_fraction_dir, f'Rainfed_Frac_{year}.tif')
+        output_rainfed_cropland_raster = os.path.join(rainfed_cropland_output_dir, f'Rainfed_cropland_{year}.tif')
+
+        apply_blockwise(input_rasters=[rainfed_frac_data, tree_cover_dataset], func=classify_rainfed_cropland_arr,
+                        output_raster=output_rainfed_cropland_raster,
+                        dtype=np.int32)  # linux can't save data properly if dtype isn't np.int32 in this case
+
+    irrigated_frac_data = os.path.join(irrigated_fraction_dir, f'Irrigated_Frac_{year}.tif')
+    output_irrigated_cropland_raster = os.path.join(irrigated_cropland_output_dir, f'Irrigated_cropland_{year}.tif')
+
+    apply_blockwise(input_rasters=[irrigated_frac_data], func=classify_irrigated_cropland_arr,
+                    output_raster=output_irrigated_cropland_raster,
+                    dtype=np.int32)  # linux can't save data properly if dtype isn't np.int32 in this case
+
+
 def classify_irrigated_rainfed_cropland(rainfed_fraction_dir, irrigated_fraction_dir, tree_cover_dir,
                                         rainfed_cropland_output_dir, irrigated_cropland_output_dir,
-                                        skip_processing=False):
+                                        max_workers=None, skip_processing=False):
     """
-    Classifies rainfed and irrigated cropland using rainfed and irrigated fraction data.
+    Classifies rainfed and irrigated cropland using rainfed and irrigated fraction data. Years are processed in
+    parallel.
 
     ** The rainfed fraction data is only available for 2008-2020, as CDL has Western US scale crop classification data
     starting from 2008. This function classifies rainfed cropland data for 2008-2020 only, but irrigated cropland data
@@ -172,6 +251,8 @@ def classify_irrigated_rainfed_cropland(rainfed_fraction_dir, irrigated_fraction
     :param tree_cover_dir: Input directory for tree cover dataset.
     :param rainfed_cropland_output_dir: Output directory path for classified rainfed cropland data.
     :param irrigated_cropland_output_dir: Output directory path for classified irrigated cropland data.
+    :param max_workers: Maximum number of parallel processes. Default set to None to pick from the number of CPUs and
+                        available memory.
     :param skip_processing: Set to True if want to skip classifying irrigated and rainfed cropland data.
 
     :return: None
@@ -179,76 +260,58 @@ def classify_irrigated_rainfed_cropland(rainfed_fraction_dir, irrigated_fraction
     if not skip_processing:
         makedirs([rainfed_cropland_output_dir, irrigated_cropland_output_dir])
 
-        ############################
-        # # Rainfed
-        # Criteria of irrigated and rainfed cropland classification
-        # More than 10% (fraction 0.1) rainfed 30m pixels in a 2km pixel will be classified
-        # as "Rainfed cropland". Also, it should have <6% tree cover.
-        rainfed_frac_threshold = 0.10
-        tree_threshold = 6  # unit in %
-
-        # # Irrigated
-        # A 2km pixel with >2% irr fraction was used to classify as irrigated
-        irrigated_frac_threshold_for_irrigated_class = 0.02
-
         # list of years_list when there are both irrigated and rainfed fraction datasets derived from
         # IrrMapper/LANID and USDA CDL. Classifying those data with defined threshold
         years_with_both_irrigated_rainfed_frac_data = [2008, 2009, 2010, 2011, 2012, 2013, 2014,
                                                        2015, 2016, 2017, 2018, 2019, 2020]
 
-        tree_cover_dataset = glob(os.path.join(tree_cover_dir, '*.tif'))[0]
-        tree_arr = read_raster_arr_object(tree_cover_dataset, get_file=False)
-
-        for year in years_with_both_irrigated_rainfed_frac_data:
-            print(f'Classifying rainfed and irrigated cropland data for year {year}')
-
-            rainfed_frac_data = os.path.join(rainfed_fraction_dir, f'Rainfed_Frac_{year}.tif')
-            irrigated_frac_data = os.path.join(irrigated_fraction_dir, f'Irrigated_Frac_{year}.tif')
-
-            rain_arr, rain_file = read_raster_arr_object(rainfed_frac_data)
-            irrig_arr, irrig_file = read_raster_arr_object(irrigated_frac_data)
-
-            # classification using defined rainfed, irrigated fraction, and tree fraction threshold. -9999 is no data
-            rainfed_cropland = np.where((rain_arr >= rainfed_frac_threshold) &
-                                        (tree_arr <= tree_threshold), 1, -9999)
+        # irrigated fraction data is also available for 1999-2007. Classifying those data to
+        # irrigated cropland with defined threshold
+        years_rest_irrigated_frac_data = [1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007]
 
-            irrigated_cropland = np.where((irrig_arr > irrigated_frac_threshold_for_irrigated_class), 1, -9999)
+        tree_cover_dataset = glob(os.path.join(tree_cover_dir, '*.tif'))[0]
 
-            # saving classified data
-            output_rainfed_cropland_raster = os.path.join(rainfed_cropland_output_dir, f'Rainfed_cropland_{year}.tif')
-            output_irrigated_cropland_raster = os.path.join(irrigated_cropland_output_dir,
-                                                            f'Irrigated_cropland_{year}.tif')
+        # the classification is done block by block, so a task's memory is bounded by the block memory budget
+        for classify_rainfed, years in ((True, years_with_both_irrigated_rainfed_frac_data),
+                                        (False, years_rest_irrigated_frac_data)):
+            parallel_map(classify_cropland_for_year, years,
+                         kwargs=dict(rainfed_fraction_dir=rainfed_fraction_dir,
+                                     irrigated_fraction_dir=irrigated_fraction_dir,
+                                     tree_cover_dataset=tree_cover_dataset,
+                                     rainfed_cropland_output_dir=rainfed_cropland_output_dir,
+                                     irrigated_cropland_output_dir=irrigated_cropland_output_dir,
+                                     classify_rainfed=classify_rainfed),
+                         task_memory=block_memory_budget, max_workers=max_workers,
+                         desc='Classifying cropland')
+    else:
+        pass
 
-            write_array_to_raster(raster_arr=rainfed_cropland, raster_file=rain_file, transform=rain_file.transform,
-                                  output_path=output_rainfed_cropland_raster,
-                                  dtype=np.int32)  # linux can't save data properly if dtype isn't np.int32 in this case
-            write_array_to_raster(raster_arr=irrigated_cropland, raster_file=irrig_file, transform=irrig_file.transform,
-                                  output_path=output_irrigated_cropland_raster,
-                                  dtype=np.int32)  # linux can't save data properly if dtype isn't np.int32 in this case
 
-        ############################
-        # irrigated fraction data is also available for 2000-2007. Classifying those data to
-        # irrigated cropland with defined threshold
-        years_rest_irrigated_frac_data = [1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007]
+def filter_cropET_with_cropland_for_month(year_month, cropET_input_dir, cropET_output_dir, save_keyword,
+                                          cropland_years, cropland_nan_stack):
+    """
+    Filter cropET data of a month by cropland (task of filter_rainfed_irrigated_cropET_with_rainfed_irrigated_cropland()).
 
-        for year in years_rest_irrigated_frac_data:
-            print(f'Classifying rainfed and irrigated cropland data for year {year}')
+    :param year_month: A tuple of (year, month).
+    :param cropET_input_dir: Input directory filepath of raw cropET data.
+    :param cropET_output_dir: Output directory filepath of filtered cropET data.
+    :param save_keyword: Keyword of the output rasters, i.e., 'Irrigated_cropET' or 'Rainfed_cropET'.
+    :param cropland_years: A list of years of the cropland nan stack.
+    :param cropland_nan_stack: A boolean array (years, rows, cols) that is True where the pixel is not cropland.
 
-            irrigated_frac_data = os.path.join(irrigated_fraction_dir, f'Irrigated_Frac_{year}.tif')
+    :return: None.
+    """
+    year, month = year_month
 
-            irrig_arr, irrig_file = read_raster_arr_object(irrigated_frac_data)
+    cropET_data = find_raster(cropET_input_dir, year, month)
+    cropET_arr, cropET_file = read_raster_arr_object(cropET_data)
 
-            # classification using defined rainfed and irrigated fraction threshold. -9999 is no data
-            irrigated_cropland = np.where(irrig_arr > irrigated_frac_threshold_for_irrigated_class, 1, -9999)
+    # applying the filter
+    cropET_arr[cropland_nan_stack[list(cropland_years).index(year)]] = -9999
 
-            # saving classified data
-            output_irrigated_cropland_raster = os.path.join(irrigated_cropland_output_dir,
-                                                            f'Irrigated_cropland_{year}.tif')
-            write_array_to_raster(raster_arr=irrigated_cropland, raster_file=irrig_file, transform=irrig_file.transform,
-                                  output_path=output_irrigated_cropland_raster,
-                                  dtype=np.int32)  # linux can't save data properly if dtype isn't np.int32 in this case
-    else:
-        pass
+    filtered_output_raster = os.path.join(cropET_output_dir, f'{save_keyword}_{year}_{month}.tif')
+    write_array_to_raster(raster_arr=cropET_arr, raster_file=cropET_file,
+                          transform=cropET_file.transform, output_path=filtered_output_raster)
 
 
 def filter_rainfed_irrigated_cropET_with_rainfed_irrigated_cropland(rainfed_cropland_dir, irrigated_cropland_dir,
@@ -256,9 +319,11 @@ def filter_rainfed_irrigated_cropET_with_rainfed_irrigated_cropland(rainfed_crop
                                                                     irrigated_cropET_input_dir,
                                                                     rainfed_cropET_output_dir,
                                                                     irrigated_cropET_output_dir,
+                                                                    max_workers=None,
                                                                     skip_processing=False):
     """
-    Filter Irrigated and Rainfed cropET data by rainfed and irrigated cropland, respectively.
+    Filter Irrigated and Rainfed cropET data by rainfed and irrigated cropland, respectively. Months are processed in
+    parallel, with the cropland masks of all years shared between the processes.
 
     ** The downloaded Irrigated and Rainfed cropET data from GEE is not fully filtered for rainfed and irrigated
     cropland because in some pixels there are some rainfed and some irrigated fields. So, we first classify rainfed and
@@ -271,6 +336,8 @@ def filter_rainfed_irrigated_cropET_with_rainfed_irrigated_cropland(rainfed_crop
     :param irrigated_cropET_input_dir: Input directory filepath of raw irrigated cropET data.
     :param rainfed_cropET_output_dir: Output directory filepath of filtered rainfed cropET data.
     :param irrigated_cropET_output_dir: Output directory filepath of filtered irrigated cropET data.
+    :param max_workers: Maximum number of parallel processes. Default set to None to pick from the number of CPUs and
+                        available memory.
     :param skip_processing: Set to True if want to skip filtering irrigated and rainfed cropET data.
 
     :return: None.
@@ -286,73 +353,215 @@ def filter_rainfed_irrigated_cropET_with_rainfed_irrigated_cropland(rainfed_crop
                                           2015, 2016, 2017, 2018, 2019, 2020]
         months_to_filter_cropET = list(range(1, 13))
 
-        for year in years_to_filter_irrig_cropET:
-            print(f'Filtering irrigated cropET data for year {year}...')
-
-            # pure irrigated cropland filtered by using irrigated fraction threshold (irrig frac > 0.02)
-            irrigated_cropland_data = glob(os.path.join(irrigated_cropland_dir, f'*{year}*.tif'))[0]
-            irrigated_cropland_arr = read_raster_arr_object(irrigated_cropland_data, get_file=False)
-
-            for month in months_to_filter_cropET:
-                # # applying irrigated cropland filter to get cropET at purely irrigated pixels
-                irrigated_cropET_data = glob(os.path.join(irrigated_cropET_input_dir, f'*{year}_{month}*.tif'))[0]
-                irrigated_cropET_arr, irrigated_cropET_file = read_raster_arr_object(irrigated_cropET_data)
-
-                # applying the filter
-                irrigated_cropET_arr[np.isnan(irrigated_cropland_arr)] = -9999
-
-                filtered_output_raster = os.path.join(irrigated_cropET_output_dir,
-                                                      f'Irrigated_cropET_{year}_{month}.tif')
-                write_array_to_raster(raster_arr=irrigated_cropET_arr, raster_file=irrigated_cropET_file,
-                                      transform=irrigated_cropET_file.transform, output_path=filtered_output_raster)
-
-        for year in years_to_filter_rainfed_cropET:
-            print(f'Filtering rainfed cropET data for year {year}...')
-
-            # pure rainfed cropland filtered using rainfed fraction threshold
-            # (rainfed frac > 0.10). Tree cover is less than 6%
-            rainfed_cropland_data = glob(os.path.join(rainfed_cropland_dir, f'*{year}*.tif'))[0]
-            rainfed_cropland_arr = read_raster_arr_object(rainfed_cropland_data, get_file=False)
-
-            for month in months_to_filter_cropET:
-                # # applying rainfed cropland filter to get cropET at purely rainfed pixels
-                rainfed_cropET_data = glob(os.path.join(rainfed_cropET_input_dir, f'*{year}_{month}*.tif'))[0]
-                rainfed_cropET_arr, rainfed_cropET_file = read_raster_arr_object(rainfed_cropET_data)
-
-                # applying the filter
-                rainfed_cropET_arr[np.isnan(rainfed_cropland_arr)] = -9999
-
-                filtered_output_raster = os.path.join(rainfed_cropET_output_dir, f'Rainfed_cropET_{year}_{month}.tif')
-                write_array_to_raster(raster_arr=rainfed_cropET_arr, raster_file=rainfed_cropET_file,
-                                      transform=rainfed_cropET_file.transform, output_path=filtered_output_raster)
+        # pure irrigated cropland filtered by using irrigated fraction threshold (irrig frac > 0.02)
+        # pure rainfed cropland filtered using rainfed fraction threshold (rainfed frac > 0.10). Tree cover is less than 6%
+        for save_keyword, years, cropland_dir, cropET_input_dir, cropET_output_dir in \
+                (('Irrigated_cropET', years_to_filter_irrig_cropET, irrigated_cropland_dir,
+                  irrigated_cropET_input_dir, irrigated_cropET_output_dir),
+                 ('Rainfed_cropET', years_to_filter_rainfed_cropET, rainfed_cropland_dir,
+                  rainfed_cropET_input_dir, rainfed_cropET_output_dir)):
+            print(f'Filtering {save_keyword} data...')
+
+            # non-cropland pixels of each year (read once, shared with all monthly tasks)
+            cropland_nan_stack = np.stack([np.isnan(read_raster_arr_object(find_raster(cropland_dir, year),
+                                                                           get_file=False))
+                                           for year in years])
+
+            # a task holds the cropET array, its filtered copy, and the read/write temporaries
+            task_memory = cropland_nan_stack[0].size * 4 * 4
+
+            parallel_map(filter_cropET_with_cropland_for_month,
+                         [(year, month) for year in years for month in months_to_filter_cropET],
+                         kwargs=dict(cropET_input_dir=cropET_input_dir, cropET_output_dir=cropET_output_dir,
+                                     save_keyword=save_keyword, cropland_years=years),
+                         shared_arrays={'cropland_nan_stack': cropland_nan_stack},
+                         task_memory=task_memory, max_workers=max_workers,
+                         desc=f'Filtering {save_keyword}')
     else:
         pass
 
 
-def convert_prism_data_to_tif(input_dir, output_dir, keyword='prism_precip'):
+def process_cropland_cropET_grow_season_for_year(year, rainfed_fraction_dir, irrigated_fraction_dir,
+                                                 growing_season_dir, rainfed_cropET_input_dir,
+                                                 irrigated_cropET_input_dir, rainfed_cropET_gs_output_dir,
+                                                 irrigated_cropET_gs_output_dir, rainfed_cropland_output_dir=None,
+                                                 irrigated_cropland_output_dir=None, rainfed_cropET_output_dir=None,
+                                                 irrigated_cropET_output_dir=None, process_rainfed=True,
+                                                 tree_cover_arr=None):
     """
-    Convert prism rainfall/temperature datasets from .bil format to GeoTiff format.
+    Classifies rainfed and irrigated cropland, filters the monthly rainfed and irrigated cropET with the cropland, and
+    sums the filtered cropET over the (dynamic) growing season of a year in one pass (task of
+    process_cropland_cropET_grow_season()). Each input raster is read once and the intermediates are kept in memory.
+    Same outputs as classify_cropland_for_year(), filter_cropET_with_cropland_for_month(), and dynamic_gs_sum_ET().
 
-    Download PRISM datasets directly from  'https://prism.oregonstate.edu/recent/'
+    :param year: Year to process the data for.
+    :param rainfed_fraction_dir: Input directory path for rainfed fraction data.
+    :param irrigated_fraction_dir: Input directory path for irrigated fraction data.
+    :param growing_season_dir: Directory path for growing season datasets.
+    :param rainfed_cropET_input_dir: Input directory filepath of raw monthly rainfed cropET data.
+    :param irrigated_cropET_input_dir: Input directory filepath of raw monthly irrigated cropET data.
+    :param rainfed_cropET_gs_output_dir: Output directory path for growing season rainfed cropET.
+    :param irrigated_cropET_gs_output_dir: Output directory path for growing season irrigated cropET.
+    :param rainfed_cropland_output_dir: Output directory path for classified rainfed cropland data. Default set to None
+                                        to not save it.
+    :param irrigated_cropland_output_dir: Output directory path for classified irrigated cropland data. Default set to
+                                          None to not save it.
+    :param rainfed_cropET_output_dir: Output directory filepath of filtered monthly rainfed cropET data. Default set to
+                                      None to not save it.
+    :param irrigated_cropET_output_dir: Output directory filepath of filtered monthly irrigated cropET data. Default set
+                                        to None to not save it.
+    :param process_rainfed: Set to False to only process irrigated cropland/cropET (years without rainfed fraction
+                            data).
+    :param tree_cover_arr: Tree cover array (on the grid of the fraction data). Required if process_rainfed is True.
+
+    :return: None.
+    """
+    print(f'Processing cropland, cropET, and growing season cropET for year {year}...')
+
+    # growing season start (band 1) and end (band 2) months
+    gs_data = find_raster(growing_season_dir, year)
+    start_gs_arr, gs_file = read_raster_arr_object(gs_data, band=1, get_file=True, use_cache=True)
+    end_gs_arr = read_raster_arr_object(gs_data, band=2, get_file=False, use_cache=True)
+
+    # classifying cropland (1 for cropland, -9999 for no data)
+    irrigated_frac_arr, frac_file = read_raster_arr_object(os.path.join(irrigated_fraction_dir,
+                                                                        f'Irrigated_Frac_{year}.tif'))
+    process_list = [('Irrigated', classify_irrigated_cropland_arr(irrigated_frac_arr), irrigated_cropland_output_dir,
+                     irrigated_cropET_input_dir, irrigated_cropET_output_dir, irrigated_cropET_gs_output_dir)]
+
+    if process_rainfed:
+        rainfed_frac_arr = read_raster_arr_object(os.path.join(rainfed_fraction_dir, f'Rainfed_Frac_{year}.tif'),
+                                                  get_file=False)
+        process_list.append(('Rainfed', classify_rainfed_cropland_arr(rainfed_frac_arr, tree_cover_arr),
+                             rainfed_cropland_output_dir, rainfed_cropET_input_dir, rainfed_cropET_output_dir,
+                             rainfed_cropET_gs_output_dir))
+
+    for cropland_type, cropland_arr, cropland_output_dir, cropET_input_dir, cropET_output_dir, gs_output_dir \
+            in process_list:
+        if cropland_output_dir is not None:
+            write_array_to_raster(raster_arr=cropland_arr, raster_file=frac_file, transform=frac_file.transform,
+                                  output_path=os.path.join(cropland_output_dir,
+                                                           f'{cropland_type}_cropland_{year}.tif'),
+                                  dtype=np.int32)  # linux can't save data properly if dtype isn't np.int32 in this case
 
-    :param input_dir: Directory path of prism data in .bil format.
-    :param output_dir: Directory path of converted (.tif) prism data.
-    :param keyword: keyword to add before processed datasets.
+        non_cropland = cropland_arr != 1
+
+        # growing season sum and nan flag (a nan month inside the growing season makes the sum nan, same as
+        # sum_prefix_cube_window()). Pixels with nan growing season start/end are nan, pixels with an empty growing
+        # season are 0.
+        gs_sum_arr = np.zeros(non_cropland.shape, dtype=np.float64)
+        gs_nan_arr = np.isnan(start_gs_arr) | np.isnan(end_gs_arr)
+
+        for month in range(1, 13):
+            # applying cropland filter to get cropET at purely rainfed/irrigated pixels
+            cropET_arr, cropET_file = read_raster_arr_object(find_raster(cropET_input_dir, year, month))
+            cropET_arr[non_cropland] = np.nan
+
+            if cropET_output_dir is not None:
+                write_array_to_raster(raster_arr=np.where(np.isnan(cropET_arr), -9999, cropET_arr),
+                                      raster_file=cropET_file, transform=cropET_file.transform,
+                                      output_path=os.path.join(cropET_output_dir,
+                                                               f'{cropland_type}_cropET_{year}_{month}.tif'))
+
+            in_gs = (start_gs_arr <= month) & (month <= end_gs_arr)
+            gs_sum_arr += np.where(in_gs, np.nan_to_num(cropET_arr, nan=0), 0)
+            gs_nan_arr |= in_gs & np.isnan(cropET_arr)
+
+        gs_sum_arr = np.where(gs_nan_arr, np.nan, gs_sum_arr).astype(np.float32)
+
+        # saving the summed cropET array
+        output_path = os.path.join(gs_output_dir, f'{cropland_type}_cropET_{year}.tif')
+        with create_raster(
+                output_path,
+                height=gs_sum_arr.shape[0],
+                width=gs_sum_arr.shape[1],
+                dtype=np.float32,
+                count=1,
+                crs=gs_file.crs,
+                transform=gs_file.transform,
+                nodata=-9999
+        ) as dst:
+            dst.write(gs_sum_arr, 1)
+
+
+def process_cropland_cropET_grow_season(rainfed_fraction_dir, irrigated_fraction_dir, tree_cover_dir,
+                                        growing_season_dir, rainfed_cropET_input_dir, irrigated_cropET_input_dir,
+                                        rainfed_cropET_gs_output_dir, irrigated_cropET_gs_output_dir,
+                                        rainfed_cropland_output_dir=None, irrigated_cropland_output_dir=None,
+                                        rainfed_cropET_output_dir=None, irrigated_cropET_output_dir=None,
+                                        max_workers=None, skip_processing=False):
+    """
+    Fused cropland classification -> cropET filtering -> growing season cropET summing. Does the work of
+    classify_irrigated_rainfed_cropland(), filter_rainfed_irrigated_cropET_with_rainfed_irrigated_cropland(), and
+    dynamic_gs_sum_ET() (for rainfed and irrigated cropET) in one pass per year, reading each input raster once instead
+    of re-reading the cropland and filtered cropET outputs in the next steps. Years are processed in parallel. The
+    intermediate cropland and filtered monthly cropET rasters are saved only if their output directories are given.
+
+    :param rainfed_fraction_dir: Input directory path for rainfed fraction data.
+    :param irrigated_fraction_dir: Input directory path for irrigated fraction data.
+    :param tree_cover_dir: Input directory for tree cover dataset.
+    :param growing_season_dir: Directory path for growing season datasets.
+    :param rainfed_cropET_input_dir: Input directory filepath of raw monthly rainfed cropET data.
+    :param irrigated_cropET_input_dir: Input directory filepath of raw monthly irrigated cropET data.
+    :param rainfed_cropET_gs_output_dir: Output directory path for growing season rainfed cropET.
+    :param irrigated_cropET_gs_output_dir: Output directory path for growing season irrigated cropET.
+    :param rainfed_cropland_output_dir: Output directory path for classified rainfed cropland data. Default set to None
+                                        to not save it.
+    :param irrigated_cropland_output_dir: Output directory path for classified irrigated cropland data. Default set to
+                                          None to not save it.
+    :param rainfed_cropET_output_dir: Output directory filepath of filtered monthly rainfed cropET data. Default set to
+                                      None to not save it.
+    :param irrigated_cropET_output_dir: Output directory filepath of filtered monthly irrigated cropET data. Default set
+                                        to None to not save it.
+    :param max_workers: Maximum number of parallel processes. Default set to None to pick from the number of CPUs and
+                        available memory.
+    :param skip_processing: Set to True if want to skip this step.
 
     :return: None.
     """
-    makedirs([output_dir])
-    prism_datasets = glob(os.path.join(input_dir, '*.bil'))
+    if not skip_processing:
+        makedirs([directory for directory in (rainfed_cropET_gs_output_dir, irrigated_cropET_gs_output_dir,
+                                              rainfed_cropland_output_dir, irrigated_cropland_output_dir,
+                                              rainfed_cropET_output_dir, irrigated_cropET_output_dir)
+                  if directory is not None])
 
-    for data in prism_datasets:
-        year_month = os.path.basename(data).split('_')[-2]
-        output_name = keyword + '_' + year_month + '.tif'
-        output_file = os.path.join(output_dir, output_name)
-        gdal.Translate(destName=output_file, srcDS=data, format='GTiff', outputType=gdal.GDT_Float32,
-                       outputSRS='EPSG:4269')
+        # both irrigated and rainfed fraction datasets (derived from IrrMapper/LANID and USDA CDL) are available for
+        # 2008-2020. Only irrigated fraction dataset is available for 1999-2007
+        years_with_both_irrigated_rainfed_frac_data = [2008, 2009, 2010, 2011, 2012, 2013, 2014,
+                                                       2015, 2016, 2017, 2018, 2019, 2020]
+        years_rest_irrigated_frac_data = [1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007]
+
+        # tree cover is read once and shared with all yearly tasks
+        tree_cover_dataset = glob(os.path.join(tree_cover_dir, '*.tif'))[0]
+        tree_cover_arr = read_raster_arr_object(tree_cover_dataset, get_file=False)
+
+        # a task holds the growing season, fraction, and cropland arrays, a monthly cropET array, the float64 sum
+        # and nan flag, and the read/write temporaries
+        task_memory = tree_cover_arr.size * 4 * 14
+
+        for process_rainfed, years in ((True, years_with_both_irrigated_rainfed_frac_data),
+                                       (False, years_rest_irrigated_frac_data)):
+            parallel_map(process_cropland_cropET_grow_season_for_year, years,
+                         kwargs=dict(rainfed_fraction_dir=rainfed_fraction_dir,
+                                     irrigated_fraction_dir=irrigated_fraction_dir,
+                                     growing_season_dir=growing_season_dir,
+                                     rainfed_cropET_input_dir=rainfed_cropET_input_dir,
+                                     irrigated_cropET_input_dir=irrigated_cropET_input_dir,
+                                     rainfed_cropET_gs_output_dir=rainfed_cropET_gs_output_dir,
+                                     irrigated_cropET_gs_output_dir=irrigated_cropET_gs_output_dir,
+                                     rainfed_cropland_output_dir=rainfed_cropland_output_dir,
+                                     irrigated_cropland_output_dir=irrigated_cropland_output_dir,
+                                     rainfed_cropET_output_dir=rainfed_cropET_output_dir,
+                                     irrigated_cropET_output_dir=irrigated_cropET_output_dir,
+                                     process_rainfed=process_rainfed),
+                         shared_arrays={'tree_cover_arr': tree_cover_arr},
+                         task_memory=task_memory, max_workers=max_workers,
+                         desc='Processing cropland, cropET, and growing season cropET')
+    else:
+        pass
 
 
-def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, output_dir_prism_yearly=None,
+def process_prism_data(prism_bil_dir, output_dir_prism_monthly, output_dir_prism_yearly=None,
                        year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007, 2008, 2009, 2010, 2011,
                                   2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020),
                        keyword='prism_precip',
@@ -363,7 +572,6 @@ def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, o
     summed for all months in a year.
 
     :param prism_bil_dir: Directory file path of downloaded prism datasets in .bil format.
-    :param prism_tif_dir: Directory file path of prism datasets converted to tif format.
     :param output_dir_prism_monthly: File path of directory to save monthly prism precipitation/temperature data for
                                      at Western US extent.
     :param output_dir_prism_yearly: File path of directory to save summed/mean prism precipitation/temperature data for
@@ -380,23 +588,19 @@ def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, o
     """
 
     if not skip_processing:
-        interim_dir_for_monthly_data = os.path.join(output_dir_prism_monthly, 'interim_dir_for_monthly_data')
-
         if output_dir_prism_yearly is not None:
-            makedirs([output_dir_prism_monthly, output_dir_prism_yearly, interim_dir_for_monthly_data])
+            makedirs([output_dir_prism_monthly, output_dir_prism_yearly])
         else:
-            makedirs([output_dir_prism_monthly, interim_dir_for_monthly_data])
-
-        convert_prism_data_to_tif(input_dir=prism_bil_dir, output_dir=prism_tif_dir, keyword=keyword)
+            makedirs([output_dir_prism_monthly])
 
         #########
         # # Code-block for saving monthly data for the Western US
         #########
         # Clipping Prism monthly datasets for Western US
-        monthly_prism_tifs = glob(os.path.join(prism_tif_dir, '*.tif'))  # monthly prism datasets
-        for data in monthly_prism_tifs:
-            month = os.path.basename(data).split('.')[0][-2:]
-            year = os.path.basename(data).split('.')[0].split('_')[2][:4]
+        monthly_prism_bils = glob(os.path.join(prism_bil_dir, '*.bil'))  # monthly prism datasets
+        for data in monthly_prism_bils:
+            year_month = os.path.basename(data).split('_')[-2]
+            year, month = year_month[:4], year_month[-2:]
 
             if month.startswith('0'):  # don't want to keep 0 in month for consistency will all datasets
                 month = month[-1]
@@ -408,17 +612,22 @@ def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, o
             elif 'tmin' in keyword:
                 monthly_raster_name = f'prism_tmin_{year}_{month}.tif'
 
+            # the .bil dataset is opened as a float32 VRT in NAD83 (same as converting it to tif), so it is warped
+            # without writing a tif copy
+            prism_vrt = translate_to_vrt(data, crs='EPSG:4269', output_datatype=gdal.GDT_Float32)
+
             # the prism datasets are at 4km native resolution and directly clipping and resampling them from 4km
             # resolution creates misalignment of pixels from reference raster. So, first we are resampling CONUS
-            # scale original datasets to 2km resolutions and then clipping them at reference raster (Western US) extent
-            interim_monthly_raster = clip_resample_reproject_raster(input_raster=data,
+            # scale original datasets to 2km resolutions and then clipping them at reference raster (Western US) extent.
+            # The resampled raster is kept in memory and directly clipped (no interim raster on disk).
+            interim_monthly_raster = clip_resample_reproject_raster(input_raster=prism_vrt,
                                                                     input_shape=west_US_shape,
                                                                     raster_name=monthly_raster_name, keyword=' ',
-                                                                    output_raster_dir=interim_dir_for_monthly_data,
+                                                                    output_raster_dir=None,
                                                                     clip=False, resample=True, clip_and_resample=False,
                                                                     targetaligned=True, resample_algorithm='near',
                                                                     use_ref_width_height=False, ref_raster=None,
-                                                                    resolution=resolution)
+                                                                    resolution=resolution, in_memory=True)
 
             clip_resample_reproject_raster(input_raster=interim_monthly_raster,
                                            input_shape=west_US_shape,
@@ -428,6 +637,9 @@ def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, o
                                            targetaligned=True, resample_algorithm='near',
                                            use_ref_width_height=False, ref_raster=ref_raster,
                                            resolution=resolution)
+
+            del prism_vrt, interim_monthly_raster
+
         #########
         # # Code-block for summing monthly precipitation data for years_list
         #########
@@ -435,8 +647,8 @@ def process_prism_data(prism_bil_dir, prism_tif_dir, output_dir_prism_monthly, o
             print(f'Processing {keyword} data for {year}...')
 
             if 'precip' in keyword:
-                prism_datasets = glob(
-                    os.path.join(output_dir_prism_monthly, f'*{year}*.tif'))  # monthly prism datasets for each year
+                # monthly prism datasets for each year
+                prism_datasets = find_rasters(output_dir_prism_monthly, year=year)
 
                 # Summing raster for each year
                 summed_output_for_year = os.path.join(output_dir_prism_yearly, f'prism_precip_{year}.tif')
@@ -464,16 +676,13 @@ def sum_GridMET_precip_yearly_data(year_list, input_gridmet_monthly_dir, output_
     :return: None.
     """
     if not skip_processing:
-        makedirs([output_dir_yearly])
+        print(f'summing GRIDMET precip data for years {list(year_list)}...')
 
-        for yr in year_list:  # first loop for years_list
-            print(f'summing GRIDMET precip data for year {yr}...')
-            gridmet_datasets = glob(os.path.join(input_gridmet_monthly_dir, f'*{yr}*.tif'))
-
-            # Summing raster for each year
-            summed_output_for_year = os.path.join(output_dir_yearly, f'GRIDMET_Precip_{yr}.tif')
-            sum_rasters(raster_list=gridmet_datasets, raster_dir=None, output_raster=summed_output_for_year,
-                        ref_raster=gridmet_datasets[0])
+        # Summing raster for each year
+        aggregate_monthly_rasters(input_dir=input_gridmet_monthly_dir,
+                                  period_dict={'calendar_year': get_period_months('calendar_year', year_list)},
+                                  output_dir_dict={('calendar_year', 'sum'): output_dir_yearly},
+                                  output_name='GRIDMET_Precip')
 
     else:
         pass
@@ -497,15 +706,13 @@ def sum_OpenET_yearly_data(year_list, input_OpenET_monthly_dir, output_dir_OpenE
     if not skip_processing:
         makedirs([output_dir_OpenET_yearly, output_dir_OpenET_growing_season])
 
-        for year in year_list:  # first loop for years_list
-            # # for total years_list
-            print(f'summing OpenET data for year {year}...')
-            openet_datasets = glob(os.path.join(input_OpenET_monthly_dir, f'*{year}*.tif'))
-
-            # Summing raster for each growing season
-            summed_output_for_year = os.path.join(output_dir_OpenET_yearly, f'OpenET_ensemble_{year}.tif')
-            sum_rasters(raster_list=openet_datasets, raster_dir=None, output_raster=summed_output_for_year,
-                        ref_raster=openet_datasets[0])
+        print(f'summing OpenET data for years {list(year_list)}...')
+
+        # Summing raster for each year
+        aggregate_monthly_rasters(input_dir=input_OpenET_monthly_dir,
+                                  period_dict={'calendar_year': get_period_months('calendar_year', year_list)},
+                                  output_dir_dict={('calendar_year', 'sum'): output_dir_OpenET_yearly},
+                                  output_name='OpenET_ensemble')
     else:
         pass
 
@@ -528,27 +735,16 @@ def sum_GridMET_RET_yearly_data(input_RET_monthly_dir, output_dir_RET_yearly, ou
     :return: None.
     """
     if not skip_processing:
-        makedirs([output_dir_RET_yearly, output_dir_RET_growing_season])
-
-        for year in year_list:  # first loop for years_list
-            # # for total years_list
-            print(f'summing GridMET RET data for year {year}...')
-            openet_datasets = glob(os.path.join(input_RET_monthly_dir, f'*{year}*.tif'))
-
-            # Summing raster for each growing season
-            summed_output_for_year = os.path.join(output_dir_RET_yearly, f'GRIDMET_RET_{year}.tif')
-            sum_rasters(raster_list=openet_datasets, raster_dir=None, output_raster=summed_output_for_year,
-                        ref_raster=openet_datasets[0])
+        print(f'summing GridMET RET data for years {list(year_list)} and their growing seasons...')
 
-            # # for growing seasons
-            print(f'summing GridMET RET data for year {year} growing seasons...')
-            openet_datasets = glob(os.path.join(input_RET_monthly_dir, f'*{year}_[4-9]*.tif')) + \
-                              glob(os.path.join(input_RET_monthly_dir, f'*{year}_10*.tif'))
+        # summing raster for each year and each year's growing season (April to October) in a single pass
+        period_dict = {'calendar_year': get_period_months('calendar_year', year_list),
+                       'growing_season': get_period_months('months', year_list, months=range(4, 11))}
 
-            # Summing raster for each growing season
-            summed_output_for_grow_season = os.path.join(output_dir_RET_growing_season, f'GRIDMET_RET_{year}.tif')
-            sum_rasters(raster_list=openet_datasets, raster_dir=None, output_raster=summed_output_for_grow_season,
-                        ref_raster=openet_datasets[0])
+        aggregate_monthly_rasters(input_dir=input_RET_monthly_dir, period_dict=period_dict,
+                                  output_dir_dict={('calendar_year', 'sum'): output_dir_RET_yearly,
+                                                   ('growing_season', 'sum'): output_dir_RET_growing_season},
+                                  output_name='GRIDMET_RET')
 
     else:
         pass
@@ -570,19 +766,13 @@ def sum_cropET_water_yr(years_list, input_cropET_monthly_dir, output_dir_water_y
     :return: None.
     """
     if not skip_processing:
-        makedirs([output_dir_water_yr])
-
-        for yr in years_list:
-            print(f'summing monthly cropET for water year {yr}...')
-
-            # summing rainfed/irrigated crop ET for water year (previous year's October to current year's september)
-            et_data_prev_years = glob(os.path.join(input_cropET_monthly_dir, f'*{yr - 1}_1[0-2].*tif'))
-            et_data_current_years = glob(os.path.join(input_cropET_monthly_dir, f'*{yr}_[1-9].*tif'))
-            et_water_yr_list = et_data_prev_years + et_data_current_years
-            print(et_water_yr_list)
-            sum_rasters(raster_list=et_water_yr_list, raster_dir=None,
-                        output_raster=os.path.join(output_dir_water_yr, f'{save_keyword}_{yr}.tif'),
-                        ref_raster=et_water_yr_list[0])
+        print(f'summing monthly cropET for water years {list(years_list)}...')
+
+        # summing rainfed/irrigated crop ET for water year (previous year's October to current year's september)
+        aggregate_monthly_rasters(input_dir=input_cropET_monthly_dir,
+                                  period_dict={'water_year': get_period_months('water_year', years_list)},
+                                  output_dir_dict={('water_year', 'sum'): output_dir_water_yr},
+                                  output_name=save_keyword)
     else:
         pass
 
@@ -637,20 +827,53 @@ def process_AWC_data(input_dir, westUS_shape, output_dir, ref_raster=WestUS_rast
                                        ref_raster=ref_raster)
 
 
+def develop_excess_ET_filter_for_year(year, water_yr_precip_dir, water_yr_rainfed_ET_dir, output_dir):
+    """
+    Developing the excess ET filter of a water year (task of develop_excess_ET_filter()).
+
+    :param year: Water year to process the data for.
+    :param water_yr_precip_dir: Input directory of water year precip data
+    :param water_yr_rainfed_ET_dir: Input directory of water year rainfed crop ET data.
+    :param output_dir: Filepath of output directory to save processed data.
+
+    :return: None.
+    """
+    print(f'processing Excess_ET_filter data for year {year}')
+
+    # getting water year precip data
+    precip_data = find_raster(water_yr_precip_dir, year)
+    precip_arr = read_raster_arr_object(precip_data, get_file=False)
+
+    # getting growing season et data
+    et_data = find_raster(water_yr_rainfed_ET_dir, year)
+    et_arr, file = read_raster_arr_object(et_data)
+
+    # setting value 1 to pixels where water year's total precip is greater than this year's
+    # total growing season ET
+    # we will only take training rainfed cropET (effective precip) data where the values are 1
+    new_arr = np.where((precip_arr < et_arr) | np.isnan(et_arr), -9999, 1)
+
+    output_raster = os.path.join(output_dir, f'Excess_ET_filter_{year}.tif')
+    write_array_to_raster(raster_arr=new_arr, raster_file=file, transform=file.transform,
+                          output_path=output_raster, dtype=np.float32)
+
+
 def develop_excess_ET_filter(years_list, water_yr_precip_dir, water_yr_rainfed_ET_dir, output_dir,
-                             skip_processing=False):
+                             max_workers=None, skip_processing=False):
     """
     Developing a yearly filter for rainfed cropET (effective precip) training data. Using this filter, we will exclude
     pixels where total rainfed crop ET in a water year is higher than precipitation of that water year
     (precipitation from from last year. These filtered out pixels that are using more water from storage than precipitation.
     But we only want to consider pixels where ET mostly comes from precipitation, with some supplement from storage that
     has been built from precipitation over the growing season of that particular year. In addition, this will help keep
-    water year Peff / water year precip ratio < 1.
+    water year Peff / water year precip ratio < 1. Years are processed in parallel.
 
     :param years_list: List of years_list to process the data for.
     :param water_yr_precip_dir: Input directory of water year precip data
     :param water_yr_rainfed_ET_dir: Input directory of water year rainfed crop ET data.
     :param output_dir: Filepath of output directory to save processed data.
+    :param max_workers: Maximum number of parallel processes. Default set to None to pick from the number of CPUs and
+                        available memory.
     :param skip_processing: Set to True if want to skip processing this dataset.
 
     :return: None.
@@ -658,27 +881,16 @@ def develop_excess_ET_filter(years_list, water_yr_precip_dir, water_yr_rainfed_E
     if not skip_processing:
         makedirs([output_dir])
 
+        # a task holds the precip, ET, and filter arrays plus temporaries
+        height, width = read_raster_metadata(find_raster(water_yr_precip_dir, years_list[0]))['shape']
+        task_memory = height * width * 4 * 6
+
         # we will compare growing season ET for a year with previous year's total precip.
         # so, there is a year lag in precip_years list
-        for yr in years_list:
-            print(f'processing Excess_ET_filter data for year {yr}')
-
-            # getting water year precip data
-            precip_data = glob(os.path.join(water_yr_precip_dir, f'*{yr}*.tif'))[0]
-            precip_arr = read_raster_arr_object(precip_data, get_file=False)
-
-            # getting growing season et data
-            et_data = glob(os.path.join(water_yr_rainfed_ET_dir, f'*{yr}*.tif'))[0]
-            et_arr, file = read_raster_arr_object(et_data)
-
-            # setting value 1 to pixels where water year's total precip is greater than this year's
-            # total growing season ET
-            # we will only take training rainfed cropET (effective precip) data where the values are 1
-            new_arr = np.where((precip_arr < et_arr) | np.isnan(et_arr), -9999, 1)
-
-            output_raster = os.path.join(output_dir, f'Excess_ET_filter_{yr}.tif')
-            write_array_to_raster(raster_arr=new_arr, raster_file=file, transform=file.transform,
-                                  output_path=output_raster, dtype=np.float32)
+        parallel_map(develop_excess_ET_filter_for_year, years_list,
+                     kwargs=dict(water_yr_precip_dir=water_yr_precip_dir,
+                                 water_yr_rainfed_ET_dir=water_yr_rainfed_ET_dir, output_dir=output_dir),
+                     task_memory=task_memory, max_workers=max_workers, desc='Excess ET filter')
     else:
         pass
 
@@ -696,80 +908,65 @@ def extract_month_from_GrowSeason_data(GS_data_dir, skip_processing=False):
     :return: None.
     """
 
-    def doy_to_month(year, doy):
-        """
-        Convert a day of year (DOY) to a month in a given year.
-
-        :return: Month of the corresponding date.
-        """
-        if np.isnan(doy):  # Check if the DOY is NaN
-            return np.nan
-
-        # January 1st of the given year + timedelta of the DoY to extract month
-        month = (datetime.datetime(year, 1, 1) + datetime.timedelta(int(doy) - 1)).month
-
-        return month
-
     if not skip_processing:
         print('Processing growing season data...')
 
         # collecting GEE exported data files and making new directories for processing
         GS_data_files = glob(os.path.join(GS_data_dir, 'ee_exports', '*.tif'))
-        interim_dir = os.path.join(GS_data_dir, 'interim')
-        makedirs([interim_dir])
 
         # looping through each dataset, extracting start and end of the growing season months, saving as an array
         for data in GS_data_files:
             raster_name = os.path.basename(data)
             year = int(raster_name.split('_')[1].split('.')[0])
 
-            # clipping and resampling the growing season data with the western US reference raster
+            # clipping and resampling the growing season data with the western US reference raster (kept in memory)
             interim_raster = clip_resample_reproject_raster(input_raster=data,
                                                             input_shape=WestUS_shape,
                                                             raster_name=raster_name,
-                                                            output_raster_dir=interim_dir,
+                                                            output_raster_dir=None,
                                                             clip=False, resample=False, clip_and_resample=True,
                                                             targetaligned=True, resample_algorithm='near',
                                                             use_ref_width_height=False, ref_raster=None,
-                                                            resolution=model_res)
-
-            # reading the start and end DoY of the growing season
-            startDOY_arr, ras_file = read_raster_arr_object(interim_raster, band=1)
-            endDOY_arr = read_raster_arr_object(interim_raster, band=2, get_file=False)
+                                                            resolution=model_res, in_memory=True)
 
-            # vectorizing the doy_to_month() function to apply on a numpy array
-            vectorized_doy_to_date = np.vectorize(doy_to_month)
+            # reading the start and end DoY of the growing season (stacked as 2 bands)
+            DOY_arr = np.stack((read_gdal_dataset_arr(interim_raster, band=1),
+                                read_gdal_dataset_arr(interim_raster, band=2)), axis=0)
+            interim_crs = interim_raster.GetProjection()
+            interim_transform = Affine.from_gdal(*interim_raster.GetGeoTransform())
+            del interim_raster
 
-            # converting the start and end DoY to corresponding month
-            start_months = vectorized_doy_to_date(year, startDOY_arr)
-            end_months = vectorized_doy_to_date(year, endDOY_arr)
-
-            # stacking the arrays together (single tif with 2 bands)
-            GS_month_arr = np.stack((start_months, end_months), axis=0)
+            # converting the start and end DoY to corresponding month with the DOY to month lookup table
+            # (single tif with 2 bands)
+            GS_month_arr = doy_to_month(DOY_arr, year, nodata=no_data_value)
 
             # saving the array
             output_raster = os.path.join(GS_data_dir, raster_name)
-            with rio.open(
+            with create_raster(
                     output_raster,
-                    'w',
-                    driver='GTiff',
                     height=GS_month_arr.shape[1],
                     width=GS_month_arr.shape[2],
                     dtype=np.float32,
                     count=GS_month_arr.shape[0],
-                    crs=ras_file.crs,
-                    transform=ras_file.transform,
+                    crs=interim_crs,
+                    transform=interim_transform,
                     nodata=-9999
             ) as dst:
                 dst.write(GS_month_arr)
 
 
 def dynamic_gs_sum_ET(year_list, growing_season_dir, monthly_input_dir, gs_output_dir,
-                      sum_keyword, skip_processing=False):
+                      sum_keyword, prefix_cube_dir, skip_processing=False):
     """
     Dynamically (spatio-temporally) sums effective precipitation and irrigated crop ET monthly rasters for
     the growing seasons.
 
+    The growing season sum is the difference of the prefix-sum cube's values at the end month and at the month before
+    the start month, so nan is handled differently than in the earlier month-mask sum. A pixel is nan if its growing
+    season start/end month is nan (the month-mask sum gave 0). Only the months inside a pixel's growing season window
+    count: a nan (or missing) month inside the window makes the pixel nan, while a nan month outside the window no
+    longer does.
+
     :param year_list: List of years_list to process the data for.
     :param growing_season_dir: Directory path for growing season datasets.
     :param monthly_input_dir:  Directory path for monthly effective precipitation/irrigated crop ET datasets.
@@ -777,6 +974,9 @@ def dynamic_gs_sum_ET(year_list, growing_season_dir, monthly_input_dir, gs_outpu
                            datasets.
     :param sum_keyword: Keyword str to add before the summed raster.
                        Should be 'effective_precip' or 'Irrigated_cropET' or 'OpenET_ensemble'
+    :param prefix_cube_dir: Directory path of the (scratch) datacube to build the prefix-sum (cumulative monthly sum)
+                            cube in. The cube is reused in later runs while the monthly rasters are unchanged. Cubes
+                            of different monthly raster directories can share the datacube.
     :param skip_processing: Set to True if want to skip processing this step.
 
     :return:
@@ -786,42 +986,28 @@ def dynamic_gs_sum_ET(year_list, growing_season_dir, monthly_input_dir, gs_outpu
 
         makedirs([gs_output_dir])
 
-        # The regex r'_([0-9]{1,2})\.tif' extracts the month (1 or 2 digits; e.g., '_1.tif', '_12.tif')
-        # from the filenames using the first group ([0-9]{1,2}).
-        # The extracted month is then (inside the for loop in the sorting block) converted to an integer with int(group(1))
-        # for proper sorting by month.
-        month_pattern = re.compile(r'_([0-9]{1,2})\.tif')
+        # building the prefix-sum cube of the monthly datasets once. The sum of the growing season months of a pixel
+        # is then the difference of the cube's values at the end month and at the month before the start month
+        cube_variable = get_prefix_cube_variable(sum_keyword, monthly_input_dir)
+        build_prefix_sum_cube(prefix_cube_dir, variable=cube_variable, raster_dir=monthly_input_dir,
+                              start_month=(min(year_list), 1), end_month=(max(year_list), 12))
 
         for year in year_list:
-            # gathering and sorting the peff datasets by month (from 1 to 12)
-            datasets = glob(os.path.join(monthly_input_dir, f'*{year}*.tif'))
-            sorted_datasets = sorted(datasets, key=lambda x: int(
-                month_pattern.search(x).group(1)))  # First capturing group (the month)
-
-            # peff/cropET monthly array stacked in a single numpy array
-            arrs_stck = np.stack([read_raster_arr_object(i, get_file=False) for i in sorted_datasets], axis=0)
-
             # gathering, reading, and stacking growing season array
-            gs_data = glob(os.path.join(growing_season_dir, f'*{year}*.tif'))[0]
-            start_gs_arr, ras_file = read_raster_arr_object(gs_data, band=1, get_file=True)  # band 1
-            end_gs_arr = read_raster_arr_object(gs_data, band=2, get_file=False)  # band 2
+            gs_data = find_raster(growing_season_dir, year)
+            start_gs_arr, ras_file = read_raster_arr_object(gs_data, band=1, get_file=True, use_cache=True)  # band 1
+            end_gs_arr = read_raster_arr_object(gs_data, band=2, get_file=False, use_cache=True)  # band 2
 
-            # We create a 1 pixel "kernel", representing months 1 to 12 (shape : 12, 1, 1).
-            # Then it is broadcasted across the array and named as the kernel_mask.
-            # The kernel_mask acts as a mask, and only sum peff values for months that are 'True'.
-            kernel = np.arange(1, 13, 1).reshape(12, 1, 1)
-            kernel_mask = (kernel >= start_gs_arr) & (kernel <= end_gs_arr)
-
-            # sum peff/cropET arrays over the valid months using the kernel_mask
-            summed_arr = np.sum(arrs_stck * kernel_mask, axis=0)
+            # sum peff/cropET over the growing season months (start to end month of each pixel)
+            summed_arr = sum_prefix_cube_window(prefix_cube_dir, variable=cube_variable,
+                                                start_idx_arr=get_month_index(year, start_gs_arr),
+                                                end_idx_arr=get_month_index(year, end_gs_arr))
 
             # saving the summed peff array
             output_name = f'{sum_keyword}_{year}.tif'
             output_path = os.path.join(gs_output_dir, output_name)
-            with rio.open(
+            with create_raster(
                     output_path,
-                    'w',
-                    driver='GTiff',
                     height=summed_arr.shape[0],
                     width=summed_arr.shape[1],
                     dtype=np.float32,
@@ -834,16 +1020,25 @@ def dynamic_gs_sum_ET(year_list, growing_season_dir, monthly_input_dir, gs_outpu
 
 
 def dynamic_gs_sum_peff_with_3m_SM_storage(year_list, growing_season_dir, monthly_input_dir,
-                                           gs_output_dir, skip_processing=False):
+                                           gs_output_dir, prefix_cube_dir, skip_processing=False):
     """
     Dynamically (spatio-temporally) sums effective precipitation (peff) monthly rasters for
     the growing seasons with 3 month's lag peff included before the gorwing season starts.
 
+    The growing season sum is the difference of the prefix-sum cube's values at the end month and at the month before
+    the start month, so nan is handled differently than in the earlier month-mask sum. A pixel is nan if its growing
+    season start/end month is nan (the month-mask sum gave 0). Only the months inside a pixel's growing season window
+    count: a nan (or missing) month inside the window makes the pixel nan, while a nan month outside the window no
+    longer does.
+
     :param year_list: List of years_list to process the data for.
     :param growing_season_dir: Directory path for growing season datasets.
     :param monthly_input_dir:  Directory path for monthly effective precipitation/irrigated crop ET datasets.
     :param gs_output_dir:  Directory path (output) for summed growing season effective precipitation/irrigated crop ET
                            datasets.
+    :param prefix_cube_dir: Directory path of the (scratch) datacube to build the prefix-sum (cumulative monthly sum)
+                            cube in. The cube is reused in later runs while the monthly rasters are unchanged. Cubes
+                            of different monthly raster directories can share the datacube.
     :param skip_processing: Set to True if want to skip processing this step.
 
     :return: None.
@@ -851,86 +1046,32 @@ def dynamic_gs_sum_peff_with_3m_SM_storage(year_list, growing_season_dir, monthl
     if not skip_processing:
         makedirs([gs_output_dir])
 
-        # The regex r'_([0-9]{1,2})\.tif' extracts the month (1 or 2 digits; e.g., '_1.tif', '_12.tif')
-        # from the filenames using the first group ([0-9]{1,2}).
-        # The extracted month is then (inside the for loop in the sorting block) converted to an integer with int(group(1))
-        # for proper sorting by month.
-        month_pattern_current_yr = re.compile(r'_([0-9]{1,2})\.tif')
-        month_pattern_prev_yr = re.compile(r'_([0-9]{1,2})\.tif')
+        # building the prefix-sum cube of the monthly peff once (from October of the year before the first year, for
+        # the 3 months' storage). As month indices run continuously over years, the window starting 3 months before
+        # the growing season start crosses into the previous year without any special handling
+        cube_variable = get_prefix_cube_variable('effective_precip', monthly_input_dir)
+        build_prefix_sum_cube(prefix_cube_dir, variable=cube_variable, raster_dir=monthly_input_dir,
+                              start_month=(min(year_list) - 1, 10), end_month=(max(year_list), 12))
 
         for year in year_list:
             print(f'Dynamically summing effective precipitation monthly datasets for growing season {year}...')
 
-            # current year: gathering and sorting the peff datasets by month for current year (from 1 to 12)
-            datasets_current_yr = glob(os.path.join(monthly_input_dir, f'*{year}*.tif'))
-            sorted_datasets_current_yr = sorted(datasets_current_yr, key=lambda x: int(
-                month_pattern_current_yr.search(x).group(1)))  # First capturing group (the month)
-
-            # current year: peff monthly array stacked in a single numpy array
-            arrs_stck_current_yr = np.stack(
-                [read_raster_arr_object(i, get_file=False) for i in sorted_datasets_current_yr], axis=0)
-
-            # previous year: gathering datasets for months 10-12 of the previous year
-            datasets_previous_year = glob(os.path.join(monthly_input_dir, f'*{year - 1}*.tif'))
-            datasets_prev_10_12 = [f for f in datasets_previous_year if
-                                   10 <= int(month_pattern_prev_yr.search(f).group(1)) <= 12]
-            sorted_datasets_prev_yr = sorted(datasets_prev_10_12,
-                                             key=lambda x: int(month_pattern_prev_yr.search(x).group(1)))
-
-            # previous year: peff monthly array stacked in a single numpy array
-            arrs_stck_prev_yr = np.stack([read_raster_arr_object(i, get_file=False) for i in sorted_datasets_prev_yr],
-                                         axis=0)
-
             # gathering, reading, and stacking growing season array
-            gs_data = glob(os.path.join(growing_season_dir, f'*{year}*.tif'))[0]
-            start_gs_arr, ras_file = read_raster_arr_object(gs_data, band=1, get_file=True)  # band 1
-            end_gs_arr = read_raster_arr_object(gs_data, band=2, get_file=False)  # band 2
-
-            # current year: deduct 3 months from start_gs_arr to consider the effect of  3 months' peff storage
-            # then finalize the current year's start season array
-            # (where the value <= 0, set to 1 otherwise it's already been adjusted by deducting 3)
-            start_gs_arr_adjusted = start_gs_arr - 3
-            start_gs_arr_current_yr = np.where(start_gs_arr_adjusted <= 0, 1, start_gs_arr_adjusted)
-            end_gs_arr_current_yr = end_gs_arr
-
-            # previous year: create start and end season array
-            start_gs_arr_prev_yr = np.where(start_gs_arr_adjusted <= 0, start_gs_arr_adjusted + 12, np.nan)
-            end_gs_arr_prev_yr = np.where(start_gs_arr_adjusted <= 0, 12, np.nan)
+            gs_data = find_raster(growing_season_dir, year)
+            start_gs_arr, ras_file = read_raster_arr_object(gs_data, band=1, get_file=True, use_cache=True)  # band 1
+            end_gs_arr = read_raster_arr_object(gs_data, band=2, get_file=False, use_cache=True)  # band 2
 
-            # ****** Summing peff for the current year (using start_gs_arr_current_yr and end_gs_arr_current_yr) ******
-
-            # We create a 1 pixel "kernel", representing months 1 to 12 (shape : 12, 1, 1).
-            # Then it is broadcasted across the array and named as the kernel_mask.
-            # The kernel_mask acts as a mask, and only sum peff values for months that are 'True'.
-            kernel_current_year = np.arange(1, 13, 1).reshape(12, 1, 1)
-            kernel_mask_current_year = (kernel_current_year >= start_gs_arr_current_yr) & (
-                    kernel_current_year <= end_gs_arr_current_yr)
-
-            # sum peff arrays over the valid months using the kernel_mask
-            summed_arr_current_yr = np.sum(arrs_stck_current_yr * kernel_mask_current_year, axis=0)
-
-            # ****** Summing peff for the previous year (using start_gs_arr_prev_yr and end_gs_arr_prev_yr) ******
-
-            # We create a 1 pixel "kernel", representing months 10 to 12 (shape : 3, 1, 1).
-            # Then it is broadcasted across the array and named as the kernel_mask.
-            # The kernel_mask acts as a mask, and only sum peff values for months that are 'True'.
-            kernel_prev_year = np.arange(10, 13, 1).reshape(3, 1, 1)
-            kernel_mask_prev_year = (kernel_prev_year >= start_gs_arr_prev_yr) & (
-                    kernel_prev_year <= end_gs_arr_prev_yr)
-
-            # sum peff arrays over the valid months using the kernel_mask
-            summed_arr_prev_yr = np.sum(arrs_stck_prev_yr * kernel_mask_prev_year, axis=0)
-
-            # ****** Combine the results from the current year and previous year ******
-            summed_total_arr = np.sum([summed_arr_current_yr, summed_arr_prev_yr], axis=0)
+            # deduct 3 months from the growing season start to consider the effect of 3 months' peff storage, then
+            # sum peff from the adjusted start month (can be in October-December of the previous year) to the end month
+            summed_total_arr = sum_prefix_cube_window(prefix_cube_dir, variable=cube_variable,
+                                                      start_idx_arr=get_month_index(year, start_gs_arr) - 3,
+                                                      end_idx_arr=get_month_index(year, end_gs_arr))
 
             # saving the summed peff array
             output_name = f'effective_precip_{year}.tif'
             output_path = os.path.join(gs_output_dir, output_name)
-            with rio.open(
+            with create_raster(
                     output_path,
-                    'w',
-                    driver='GTiff',
                     height=summed_total_arr.shape[0],
                     width=summed_total_arr.shape[1],
                     dtype=np.float32,
@@ -943,15 +1084,29 @@ def dynamic_gs_sum_peff_with_3m_SM_storage(year_list, growing_season_dir, monthl
 
 
 def filter_effective_precip_training_data(training_zone_shp, general_output_dir, refraster=WestUS_raster,
-                                          resolution=model_res, skip_processing=False):
+                                          resolution=model_res,
+                                          rainfed_cropET_dir='../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly',
+                                          rainfed_cropland_dir='../../Data_main/Raster_data/Rainfed_cropland',
+                                          usda_cdl_dir='../../Data_main/Raster_data/USDA_CDL/WestUS_yearly',
+                                          excess_ET_filter_dir='../../Data_main/Raster_data/Excess_ET_filter',
+                                          slope_dir='../../Data_main/Raster_data/Slope/WestUS',
+                                          skip_processing=False):
     """
     Filter the rainfed cropET training data by defined filters and bounding boxes.
 
+    The training zones are rasterized once into a zone label raster and the static (slope) and yearly (cropland
+    class, excess ET filter) masks are built once, so each month is filtered in a single pass (one read, one write).
+
     :param training_zone_shp: Input shapefile path of the training bounding box zones.
     :param general_output_dir: Filepath of general output directory. The final output dir will be configured inside
                                 the function.
     :param refraster: Default set to Western US reference raster.
     :param resolution: Default set to model resolution.
+    :param rainfed_cropET_dir: Directory of monthly rainfed cropET data.
+    :param rainfed_cropland_dir: Directory of yearly rainfed cropland data.
+    :param usda_cdl_dir: Directory of yearly USDA CDL data.
+    :param excess_ET_filter_dir: Directory of water year excess ET filter data.
+    :param slope_dir: Directory of slope data.
     :param skip_processing: Set to True if want to skip processing.
 
     :return: None.
@@ -963,170 +1118,100 @@ def filter_effective_precip_training_data(training_zone_shp, general_output_dir,
         # starting from 2008 as rainfed cropET dataset starts from 2008
         years = [2008, 2009, 2010, 2011, 2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020]
 
-        # training zone bounding box gdf
-        training_zone_gdf = gpd.read_file(training_zone_shp)
-
-        # reference raster
-        ref_arr, ref_file = read_raster_arr_object(refraster)
-        total_bounds = ref_file.bounds
-
-        # primary and secondary output directory creation
-        shape_temp_output_dir = os.path.join(general_output_dir, 'shapes')
-        cropET_interim_shape_dir = os.path.join(general_output_dir, 'cropET_interim_for_shapes')
+        # output directory creation
         final_filtered_cropET_dir = os.path.join(general_output_dir, 'final_filtered_cropET_for_training')
+        makedirs([general_output_dir, final_filtered_cropET_dir])
 
-        # removing old directory and making a new one
-        if os.path.exists(general_output_dir):
-            shutil.rmtree(general_output_dir)
-
-        makedirs([general_output_dir, shape_temp_output_dir, cropET_interim_shape_dir, final_filtered_cropET_dir])
-
-        for id, geom in zip(training_zone_gdf['id'], training_zone_gdf['geometry']):
-            # creating shapefile for each of the training boxes and rasterizing the shapefile such that values inside
-            # the box/shapefile is 1 and outside the box/shapefile is no data for that respective box
-
-            # creating polygon shapefile for each training zone
-            zone_selected = training_zone_gdf[training_zone_gdf['id'] == id]
-
-            zone_shapefile = os.path.join(shape_temp_output_dir, f'shape_{id}.shp')
-            zone_selected.to_file(zone_shapefile)
+        # rasterizing all training zones (bounding boxes) at once in a zone label raster. Pixels inside a zone have
+        # the zone id as value and pixels outside all zones are no data
+        zone_label_arr, _ = rasterize_zone_labels(training_zone_shp, label_attr='id', ref_raster=refraster,
+                                                  resolution=resolution, alltouched=True,
+                                                  output_raster=os.path.join(general_output_dir,
+                                                                             'training_zone_labels.tif'))
 
-            # rasterizing each training zone
-            zone_raster = os.path.join(shape_temp_output_dir, f'zone_raster_{id}.tif')
-            raster_options = gdal.RasterizeOptions(format='Gtiff', outputBounds=list(total_bounds),
-                                                   outputType=gdal.GDT_Float32, xRes=resolution, yRes=resolution,
-                                                   noData=no_data_value, burnValues=1, attribute=None, allTouched=True)
-            gdal.Rasterize(destNameOrDestDS=zone_raster, srcDS=zone_shapefile, options=raster_options,
-                           resolution=resolution)
+        # static mask (slope <= 1) combined with the zones
+        slope_arr = read_raster_arr_object(find_raster(slope_dir), get_file=False)
+        static_mask = (zone_label_arr != no_data_value) & (slope_arr <= 1)
 
-        rainfed_cropET_dir = '../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly'
-        rainfed_cropland_dir = '../../Data_main/Raster_data/Rainfed_cropland'
-        irrigated_cropland_dir = '../../Data_main/Raster_data/Irrigated_cropland'
-        usda_cdl_dir = '../../Data_main/Raster_data/USDA_CDL/WestUS_yearly'
-        excess_ET_filter_dir = '../../Data_main/Raster_data/Excess_ET_filter'
-        slope_dir = '../../Data_main/Raster_data/Slope/WestUS'
+        # water year excess ET filter masks, built once when first needed (shared by October-December of a year and
+        # January-September of the next year)
+        excess_et_mask_dict = {}
 
-        # collecting all rainfed cropET dataset
-        rainfed_cropET_datasets = []
-        for yr in years:
-            if yr == 2008:  # for 2008 will only consider October-December months' rainfed cropET as we start considering water year from 2009
-                for mn in range(10, 13):
-                    rainfed_cropET_datasets.extend(glob(os.path.join(rainfed_cropET_dir, f'*{yr}_{mn}*.tif')))
-
-            elif yr == 2020:  # for 2020 will only consider January-September months' rainfed cropET as we end considering water year at 2020
-                for mn in range(1, 10):
-                    rainfed_cropET_datasets.extend(glob(os.path.join(rainfed_cropET_dir, f'*{yr}_{mn}*.tif')))
-
-            else:  # for other years_list consider all months
-                rainfed_cropET_datasets.extend(glob(os.path.join(rainfed_cropET_dir, f'*{yr}*.tif')))
-
-        # going over each rainfed cropET data and applying the rasterized zone raster on it
-        # this will create individual raster for each cropET raster for each bounding box
-        for cropET in rainfed_cropET_datasets:
-            cropET_arr, file = read_raster_arr_object(cropET)
-
-            year = int(os.path.basename(cropET).split('_')[2])
-            month = int(os.path.basename(cropET).split('_')[3].split('.')[0])
-
-            rainfed_cropland_data = glob(os.path.join(rainfed_cropland_dir, f'*{year}*.tif'))[0]
-            irrigated_cropland_data = glob(os.path.join(irrigated_cropland_dir, f'*{year}*.tif'))[0]
-            cdl_data = glob(os.path.join(usda_cdl_dir, f'*{year}*.tif'))[0]
-            slope_data = glob(os.path.join(slope_dir, '*.tif'))[0]
-
-            # selecting excess ET filter based on water year of the monthly rainfed cropland ET data
-            if month in list(range(1, 10)):  # January-September, use excess ET filter of the same water year
-                excess_et_filter_data = glob(os.path.join(excess_ET_filter_dir, f'*{year}*.tif'))[0]
-            elif month in list(
-                    range(10, 13)) and year != 2020:  # October-December, use excess ET filter of the next water year
-                excess_et_filter_data = glob(os.path.join(excess_ET_filter_dir, f'*{year + 1}*.tif'))[0]
-
-            rainfed_cropland_arr = read_raster_arr_object(rainfed_cropland_data, get_file=False)
-            irrigated_cropland_arr = read_raster_arr_object(irrigated_cropland_data, get_file=False)
-            cdl_arr = read_raster_arr_object(cdl_data, get_file=False)
-            excess_et_arr = read_raster_arr_object(excess_et_filter_data, get_file=False)
-            slope_arr = read_raster_arr_object(slope_data, get_file=False)
-
-            # grass/pasture lands with rainfed croplands or any rainfed cropland with no overlapping with irrigated croplands,
-            # excess_et_filter = 1 in both cases
-
-            # collecting the train zone rasters and looping over them to apply each train zone raster on a cropET raster
-            zone_rasters = glob(os.path.join(shape_temp_output_dir, '*.tif'))
-
-            for zone_ras in zone_rasters:
-                zone_id = os.path.basename(zone_ras).split('_')[2].split('.')[0]
-                zone_arr = read_raster_arr_object(zone_ras, get_file=False)
-
-                filtered_cropET_arr = np.where(((cdl_arr == 176) & (rainfed_cropland_arr == 1) & (excess_et_arr == 1)) |
-                                               ((rainfed_cropland_arr == 1) &
-                                                # (irrigated_cropland_arr == -9999) &
-                                                (excess_et_arr == 1)), cropET_arr, -9999)
-                filtered_cropET_arr = np.where(slope_arr <= 1, filtered_cropET_arr, -9999)
-
-                # applying the zone raster on the filtered cropET so that everything outside the box becomes nodata
-                final_cropET_arr = filtered_cropET_arr * zone_arr
-
-                # saving the cropET raster for each year-month for each train zone
-                output_cropET = os.path.join(cropET_interim_shape_dir, f'cropET_zone_{zone_id}_{year}_{month}.tif')
-                write_array_to_raster(raster_arr=final_cropET_arr, raster_file=file, transform=file.transform,
-                                      output_path=output_cropET)
-
-        # compiling final filtered training data
         for year in years:
-            if year == 2008:
+            if year == 2008:  # for 2008 will only consider October-December months' rainfed cropET as we start considering water year from 2009
                 months = range(10, 13)
-            elif year == 2020:
+            elif year == 2020:  # for 2020 will only consider January-September months' rainfed cropET as we end considering water year at 2020
                 months = range(1, 10)
-            else:
+            else:  # for other years_list consider all months
                 months = range(1, 13)
 
+            # yearly cropland mask, built once for all months of the year
+            # grass/pasture lands with rainfed croplands or any rainfed cropland with no overlapping with irrigated
+            # croplands
+            rainfed_cropland_arr = read_raster_arr_object(find_raster(rainfed_cropland_dir, year), get_file=False)
+            cdl_arr = read_raster_arr_object(find_raster(usda_cdl_dir, year), get_file=False)
+
+            cropland_mask = ((cdl_arr == 176) & (rainfed_cropland_arr == 1)) | \
+                            (rainfed_cropland_arr == 1)  # & (irrigated_cropland_arr == -9999)
+
             for month in months:
                 print(f'compiling filtered effective precip training data for year {year}, month {month}...')
 
-                # collecting data for all boxes for a single year-month
-                # the  dot (.) is important to collect data for the same months. Not providing 'tif' here as glob will find
-                # the rasters without it and we can't use both 'dot' and 'tif' for our purpose at the same time.
-                filtered_training_rasters = glob(os.path.join(cropET_interim_shape_dir, f'*{year}_{month}.*'))
-                final_train_arr = None  # we will iterate and paste values of each training box here
+                # selecting excess ET filter based on water year of the monthly rainfed cropland ET data
+                # January-September, use excess ET filter of the same water year
+                # October-December, use excess ET filter of the next water year
+                water_year = year if month <= 9 else year + 1
 
-                # compiling the individual zone cropET raster in a single raster for each year-month
-                for each in filtered_training_rasters:
-                    if each == filtered_training_rasters[0]:
-                        arr = read_raster_arr_object(each, get_file=False)
-                        final_train_arr = arr
+                if water_year not in excess_et_mask_dict:
+                    excess_et_arr = read_raster_arr_object(find_raster(excess_ET_filter_dir, water_year),
+                                                           get_file=False)
+                    excess_et_mask_dict[water_year] = excess_et_arr == 1
 
-                    else:
-                        arr = read_raster_arr_object(each, get_file=False)
-                        final_train_arr = np.where(~np.isnan(final_train_arr), final_train_arr, arr)
+                cropET_arr, file = read_raster_arr_object(find_raster(rainfed_cropET_dir, year, month))
+
+                # applying all filters and the training zones in a single pass, everything outside the zones or
+                # filtered out becomes nodata
+                training_mask = static_mask & cropland_mask & excess_et_mask_dict[water_year]
+                final_train_arr = np.where(training_mask, cropET_arr, no_data_value)
 
                 output_raster_name = os.path.join(final_filtered_cropET_dir, f'CropET_for_training_{year}_{month}.tif')
-                write_array_to_raster(raster_arr=final_train_arr, raster_file=ref_file, transform=ref_file.transform,
+                write_array_to_raster(raster_arr=final_train_arr, raster_file=file, transform=file.transform,
                                       output_path=output_raster_name)
+
+            # excess ET filter mask of the water year ending in this year is not needed anymore
+            excess_et_mask_dict.pop(year, None)
     else:
         pass
 
 
-def accumulate_monthly_datasets_to_water_year(skip_processing=False):
+def get_water_yr_accum_output_dir(var):
+    """
+    Get the water year output directory of a variable accumulated by accumulate_monthly_datasets_to_water_year().
+
+    :param var: Variable name (key of water_yr_accum_data_path_dict).
+
+    :return: Directory path of the water year datasets.
+    """
+    path = water_yr_accum_data_path_dict[var]
+
+    if var == 'Effective_precip_train':
+        return os.path.join(os.path.dirname(path), 'final_filtered_cropET_for_training_water_year')
+    else:
+        return os.path.join(os.path.dirname(path), 'WestUS_water_year')
+
+
+def accumulate_monthly_datasets_to_water_year(variables=None, skip_processing=False):
     """
     accumulates monthly datasets to water year by sum or mean.
 
+    :param variables: List of variables (keys of water_yr_accum_data_path_dict) to accumulate. Default set to None to
+                      accumulate all variables.
     :param skip_processing: Set to true to skip this processing step.
 
     :return: False.
     """
-    monthly_data_path_dict = {
-        'Effective_precip_train': '../../Data_main/Raster_data/Rainfed_cropET_filtered_training/final_filtered_cropET_for_training',
-        'PRISM_Tmax': '../../Data_main/Raster_data/PRISM_Tmax/WestUS_monthly',
-        'PRISM_Tmin': '../../Data_main/Raster_data/PRISM_Tmin/WestUS_monthly',
-        'GRIDMET_Precip': '../../Data_main/Raster_data/GRIDMET_Precip/WestUS_monthly',
-        'GRIDMET_RET': '../../Data_main/Raster_data/GRIDMET_RET/WestUS_monthly',
-        'GRIDMET_vap_pres_def': '../../Data_main/Raster_data/GRIDMET_vap_pres_def/WestUS_monthly',
-        'GRIDMET_max_RH': '../../Data_main/Raster_data/GRIDMET_max_RH/WestUS_monthly',
-        'GRIDMET_min_RH': '../../Data_main/Raster_data/GRIDMET_min_RH/WestUS_monthly',
-        'GRIDMET_wind_vel': '../../Data_main/Raster_data/GRIDMET_wind_vel/WestUS_monthly',
-        'GRIDMET_short_rad': '../../Data_main/Raster_data/GRIDMET_short_rad/WestUS_monthly',
-        'DAYMET_sun_hr': '../../Data_main/Raster_data/DAYMET_sun_hr/WestUS_monthly',
-        'TERRACLIMATE_SR': '../../Data_main/Raster_data/TERRACLIMATE_SR/WestUS_monthly',
-        'Rainy_days': '../../Data_main/Raster_data/Rainy_days/WestUS_monthly'}
+    if variables is None:
+        variables = list(water_yr_accum_data_path_dict.keys())
 
     water_yr_accum_dict = {
         'Effective_precip_train': 'sum',
@@ -1146,56 +1231,35 @@ def accumulate_monthly_datasets_to_water_year(skip_processing=False):
 
     if not skip_processing:
         # # processing the variables/predictors
-        for var, path in monthly_data_path_dict.items():
+        # each variable is accumulated to all water years (with sum and/or mean) reading its monthly datasets once,
+        # the variables are processed in parallel
+        aggregate_job_list = []
+        for var in variables:
             print(f'accumulating monthly datasets to water year for {var}...')
 
-            # creating output_dir
+            path = water_yr_accum_data_path_dict[var]
+            output_dir = get_water_yr_accum_output_dir(var)
+
             if var == 'Effective_precip_train':
-                output_dir = os.path.join(os.path.dirname(path), 'final_filtered_cropET_for_training_water_year')
                 years_to_run = range(2009, 2020 + 1)
-
-            elif var == 'Irrigated_cropET':
-                output_dir = os.path.join(os.path.dirname(path), 'WestUS_water_year')
-                years_to_run = range(2000, 2020 + 1)
-
             else:
-                output_dir = os.path.join(os.path.dirname(path), 'WestUS_water_year')
                 years_to_run = range(2000, 2020 + 1)
 
-            makedirs([output_dir])
-
             # accumulate by sum or mean
             accum_by = water_yr_accum_dict[var]
 
-            for yr in years_to_run:
-                # collecting monthly datasets for the water year
-                data_prev_years = glob(os.path.join(path, f'*{yr - 1}_1[0-2].*tif'))
-                data_current_years = glob(os.path.join(path, f'*{yr}_[1-9].*tif'))
-                total_data_list = data_prev_years + data_current_years
-
-                # data name extraction
-                data_name_extraction = os.path.basename(total_data_list[0]).split('_')[:-2]
-                data_name = '_'.join(data_name_extraction) + f'_{yr}' + '.tif'
-
-                # sum() or mean() accumulation
-                if var in ['GRIDMET_Precip', 'TERRACLIMATE_SR']:  # we perform both mean and sum
-                    sum_rasters(raster_dir=None, raster_list=total_data_list,
-                                output_raster=os.path.join(output_dir, 'sum', data_name),
-                                ref_raster=total_data_list[0], nodata=no_data_value)
-
-                    mean_rasters(raster_dir=None, raster_list=total_data_list,
-                                 output_raster=os.path.join(output_dir, 'mean', data_name),
-                                 ref_raster=total_data_list[0], nodata=no_data_value)
-
-                else:
-                    if accum_by == 'sum':
-                        sum_rasters(raster_dir=None, raster_list=total_data_list,
-                                    output_raster=os.path.join(output_dir, data_name),
-                                    ref_raster=total_data_list[0], nodata=no_data_value)
-                    elif accum_by == 'mean':
-                        mean_rasters(raster_dir=None, raster_list=total_data_list,
-                                     output_raster=os.path.join(output_dir, data_name),
-                                     ref_raster=total_data_list[0], nodata=no_data_value)
+            # sum() or mean() accumulation
+            if var in ['GRIDMET_Precip', 'TERRACLIMATE_SR']:  # we perform both mean and sum
+                output_dir_dict = {('water_year', 'sum'): os.path.join(output_dir, 'sum'),
+                                   ('water_year', 'mean'): os.path.join(output_dir, 'mean')}
+            else:
+                output_dir_dict = {('water_year', accum_by): output_dir}
+
+            aggregate_job_list.append({'input_dir': path,
+                                       'period_dict': {'water_year': get_period_months('water_year', years_to_run)},
+                                       'output_dir_dict': output_dir_dict})
+
+        aggregate_monthly_rasters_batch(aggregate_job_list)
     else:
         pass
 
@@ -1217,22 +1281,13 @@ def fraction_SR_precip_water_yr(years_list, input_dir_runoff, input_dir_precip,
     if not skip_processing:
         makedirs([output_dir])
 
-        for year in years_list:
-            print(f'estimating water year runoff/precipitation fraction for year {year}...')
-
-            # loading and reading datasets
-            sr_data = glob(os.path.join(input_dir_runoff, f'*{year}*.tif'))[0]
-            precip_data = glob(os.path.join(input_dir_precip, f'*{year}*.tif'))[0]
+        print('estimating water year runoff/precipitation fraction...')
 
-            sr_arr, raster_file = read_raster_arr_object(sr_data)
-            precip_arr = read_raster_arr_object(precip_data, get_file=False)
-
-            # calculating runoff/precip fraction for the water year
-            frac_arr = np.where((sr_arr != -9999) & (precip_arr != -9999), sr_arr / precip_arr, nodata)
-
-            # saving estimated raster
-            output_raster = os.path.join(output_dir, f'Runoff_precip_fraction_{year}.tif')
-            write_array_to_raster(frac_arr, raster_file, raster_file.transform, output_raster)
+        # calculating runoff/precip fraction for the water year and saving estimated raster (block by block)
+        evaluate_yearly_raster_expressions(years_list, expression_dict=water_yr_ratio_expressions,
+                                           input_dir_dict={'runoff': input_dir_runoff, 'precip': input_dir_precip},
+                                           output_dict={'SR_frac': (output_dir, 'Runoff_precip_fraction')},
+                                           nodata=nodata)
 
     else:
         pass
@@ -1255,23 +1310,14 @@ def estimate_precip_intensity_water_yr(years_list, input_dir_precip, input_dir_r
     if not skip_processing:
         makedirs([output_dir])
 
-        for year in years_list:
-            print(f'estimating water year precipitation intensity for year {year}...')
-
-            # loading and reading datasets
-            precip_data = glob(os.path.join(input_dir_precip, f'*{year}*.tif'))[0]
-            rainy_data = glob(os.path.join(input_dir_rainy_day, f'*{year}*.tif'))[0]
-
-            precip_arr, raster_file = read_raster_arr_object(precip_data)
-            rainy_arr = read_raster_arr_object(rainy_data, get_file=False)
+        print('estimating water year precipitation intensity...')
 
-            # calculating precipitation intensity (water year precipitation / num of rainy days)
-            intensity_arr = np.where((precip_arr != -9999) & (rainy_arr != -9999) & (rainy_arr != 0),
-                                     precip_arr / rainy_arr, nodata)
-
-            # saving estimated raster
-            output_raster = os.path.join(output_dir, f'Precipitation_intensity_{year}.tif')
-            write_array_to_raster(intensity_arr, raster_file, raster_file.transform, output_raster)
+        # calculating precipitation intensity (water year precipitation / num of rainy days)
+        evaluate_yearly_raster_expressions(years_list, expression_dict=water_yr_ratio_expressions,
+                                           input_dir_dict={'precip_mean': input_dir_precip,
+                                                           'rainy_days': input_dir_rainy_day},
+                                           output_dict={'precip_intensity': (output_dir, 'Precipitation_intensity')},
+                                           nodata=nodata)
 
     else:
         pass
@@ -1294,23 +1340,69 @@ def estimate_PET_by_P_water_yr(years_list, input_dir_PET, input_dir_precip, outp
     if not skip_processing:
         makedirs([output_dir])
 
-        for year in years_list:
-            print(f'estimating water year PET/P for year {year}...')
+        print('estimating water year PET/P...')
 
-            # loading and reading datasets
-            pet_data = glob(os.path.join(input_dir_PET, f'*{year}*.tif'))[0]
-            precip_data = glob(os.path.join(input_dir_precip, f'*{year}*.tif'))[0]
+        # calculating PET/P
+        evaluate_yearly_raster_expressions(years_list, expression_dict=water_yr_ratio_expressions,
+                                           input_dir_dict={'PET': input_dir_PET, 'precip': input_dir_precip},
+                                           output_dict={'PET_P': (output_dir, 'dryness_index')},
+                                           nodata=nodata)
 
-            pet_arr = read_raster_arr_object(pet_data, get_file=False)
-            precip_arr, raster_file = read_raster_arr_object(precip_data)
+    else:
+        pass
 
-            # calculating PET/P
-            dry_arr = np.where((precip_arr != -9999) & (pet_arr != -9999), pet_arr / precip_arr, nodata)
 
-            # saving estimated raster
-            output_raster = os.path.join(output_dir, f'dryness_index_{year}.tif')
-            write_array_to_raster(dry_arr, raster_file, raster_file.transform, output_raster)
+def estimate_water_yr_ratio_predictors(years_list, input_dir_runoff, input_dir_precip_sum, input_dir_precip_mean,
+                                       input_dir_rainy_day, input_dir_PET, ksat_data, output_dir_runoff_frac,
+                                       output_dir_precip_intensity, output_dir_dryness_index,
+                                       output_dir_rel_infil_capacity, nodata=no_data_value, skip_processing=False):
+    """
+    Estimate water year runoff/precipitation fraction, precipitation intensity, PET/P (dryness index), and relative
+    infiltration capacity in one pass. Each year's input rasters are read once (block by block) for all four datasets,
+    and relative infiltration capacity uses the precipitation intensity in memory instead of reading it back.
+
+    Produces the same outputs as fraction_SR_precip_water_yr(), estimate_precip_intensity_water_yr(),
+    estimate_PET_by_P_water_yr(), and create_rel_infiltration_capacity_dataset().
 
+    :param years_list: List of years to process data for.
+    :param input_dir_runoff: Filepath of water year summed surface runoff data directory.
+    :param input_dir_precip_sum: Filepath of water year summed precipitation data directory.
+    :param input_dir_precip_mean: Filepath of water year mean precipitation data directory (for precipitation
+                                  intensity).
+    :param input_dir_rainy_day: Filepath of water year summed rainy days data directory.
+    :param input_dir_PET: Filepath of water year summed PET data directory.
+    :param ksat_data: Filepath of Ksat data (processed for the Western US).
+    :param output_dir_runoff_frac: Filepath of runoff/precipitation fraction output directory.
+    :param output_dir_precip_intensity: Filepath of precipitation intensity output directory.
+    :param output_dir_dryness_index: Filepath of dryness index output directory.
+    :param output_dir_rel_infil_capacity: Filepath of relative infiltration capacity output directory.
+    :param nodata: No data value. Default set to -9999.
+    :param skip_processing: Set to True if want to skip this process.
+
+    :return: None.
+    """
+    if not skip_processing:
+        makedirs([output_dir_runoff_frac, output_dir_precip_intensity, output_dir_dryness_index,
+                  output_dir_rel_infil_capacity])
+
+        print('estimating water year runoff/precipitation fraction, precipitation intensity, PET/P, and '
+              'relative infiltration capacity...')
+
+        evaluate_yearly_raster_expressions(years_list, expression_dict=water_yr_ratio_expressions,
+                                           input_dir_dict={'runoff': input_dir_runoff,
+                                                           'precip': input_dir_precip_sum,
+                                                           'precip_mean': input_dir_precip_mean,
+                                                           'rainy_days': input_dir_rainy_day,
+                                                           'PET': input_dir_PET},
+                                           static_input_dict={'ksat': ksat_data},
+                                           output_dict={'SR_frac': (output_dir_runoff_frac,
+                                                                    'Runoff_precip_fraction'),
+                                                        'precip_intensity': (output_dir_precip_intensity,
+                                                                             'Precipitation_intensity'),
+                                                        'PET_P': (output_dir_dryness_index, 'dryness_index'),
+                                                        'rel_infil_capacity': (output_dir_rel_infil_capacity,
+                                                                               'rel_infiltration_capacity')},
+                                           nodata=nodata)
     else:
         pass
 
@@ -1362,21 +1454,15 @@ def create_rel_infiltration_capacity_dataset(years_list, ksat_data, precip_inten
     if not skip_processing:
         makedirs([output_dir])
 
-        for year in years_list:
-            print(f'creating relative infiltration capacity dataset for year {year}...')
-
-            # loading and reading datasets
-            precip_intensity_data = glob(os.path.join(precip_intensity_dir, f'*{year}*.tif'))[0]
-            precip_intensity_arr = read_raster_arr_object(precip_intensity_data, get_file=False)
-
-            ksat_arr, raster_file = read_raster_arr_object(ksat_data)
-
-            # estimating relative infiltration capacity
-            rel_infil_arr = np.where(ksat_arr != -9999, ksat_arr / precip_intensity_arr, -9999)
+        print('creating relative infiltration capacity dataset...')
 
-            # saving output raster
-            output_raster = os.path.join(output_dir, f'rel_infiltration_capacity_{year}.tif')
-            write_array_to_raster(rel_infil_arr, raster_file, raster_file.transform, output_raster)
+        # estimating relative infiltration capacity (precipitation intensity is read from the saved dataset)
+        expression_dict = {'rel_infil_capacity': water_yr_ratio_expressions['rel_infil_capacity']}
+        evaluate_yearly_raster_expressions(years_list, expression_dict=expression_dict,
+                                           input_dir_dict={'precip_intensity': precip_intensity_dir},
+                                           static_input_dict={'ksat': ksat_data},
+                                           output_dict={'rel_infil_capacity': (output_dir,
+                                                                               'rel_infiltration_capacity')})
 
 
 def develop_P_PET_correlation_dataset(monthly_precip_dir, monthly_pet_dir, output_dir,skip_processing=False):
@@ -1395,41 +1481,21 @@ def develop_P_PET_correlation_dataset(monthly_precip_dir, monthly_pet_dir, outpu
 
         makedirs([output_dir])
 
-        # accumulating precip and pet data
-        monthly_precip_data_list = glob(os.path.join(monthly_precip_dir, '*.tif'))
-        monthly_pet_data_list = glob(os.path.join(monthly_pet_dir, '*.tif'))
+        # pairing precip and pet datasets by (year, month) so that the time steps of both series align
+        common_keys = sorted(key for key in set(list_catalog_keys(monthly_precip_dir)) &
+                             set(list_catalog_keys(monthly_pet_dir)) if None not in key)
 
-        # reading datasets as arrays
-        monthly_precip_arr_list = [read_raster_arr_object(i, get_file=False) for i in monthly_precip_data_list]
-        monthly_pet_arr_list = [read_raster_arr_object(i, get_file=False) for i in monthly_pet_data_list]
+        monthly_precip_data_list = find_rasters(monthly_precip_dir, keys=common_keys)
+        monthly_pet_data_list = find_rasters(monthly_pet_dir, keys=common_keys)
 
-        # stacking monthly datasets into a list
-        precip_stack = np.stack(monthly_precip_arr_list, axis=0)  # shape becomes - n_months, n_lat (height), n_lon(width)
-        pet_stack = np.stack(monthly_pet_arr_list, axis=0)  # shape becomes - n_months, n_lat (height), n_lon(width)
-
-        # Calculating mean along the time axis (i.e., across months) for each pixel
-        precip_mean = np.mean(precip_stack, axis=0)
-        pet_mean = np.mean(pet_stack, axis=0)
-
-        # estimating precip and pet anomalies
-        precip_anomalies = precip_stack - precip_mean
-        pet_anomalies = pet_stack - pet_mean
-
-        # getting numerator (covariance) for each pixel across time
-        numerator = np.sum(precip_anomalies * pet_anomalies, axis=0)
-
-        # getting denominator (sum of squares for both variables (this measures the total variation for each))
-        sum_of_squares_precip = np.sqrt(np.sum(precip_anomalies ** 2, axis=0))
-        sum_of_squares_pet = np.sqrt(np.sum(pet_anomalies ** 2, axis=0))
-        denominator = sum_of_squares_precip * sum_of_squares_pet
-
-        # calculating Pearson correlation for each pixel
-        with np.errstate(divide='ignore', invalid='ignore'):
-            correlation_arr = numerator / denominator
+        # calculating Pearson correlation for each pixel by streaming the monthly datasets one pair at a time
+        # (co-moment accumulation, memory doesn't grow with the number of months)
+        correlation_arr = calc_raster_moments(x_raster_list=monthly_precip_data_list,
+                                              y_raster_list=monthly_pet_data_list, stats=['corr'])['corr']
 
         output_raster = os.path.join(output_dir, 'PET_P_corr.tif')
-        _, ref_file = read_raster_arr_object(monthly_precip_data_list[0])
-        write_array_to_raster(correlation_arr, ref_file, ref_file.transform, output_raster)
+        write_array_to_raster(correlation_arr, raster_file=None, transform=None, output_path=output_raster,
+                              ref_file=monthly_precip_data_list[0])
 
     else:
         pass
@@ -1455,6 +1521,50 @@ def create_lake_raster(lake_shapefile, output_dir, skip_processing):
         pass
 
 
+def build_monthly_datacube(data_path_dict, cube_dir, ref_raster=WestUS_raster, skip_processing=False):
+    """
+    Ingest monthly (and yearly/static) datasets into a datacube keyed by (variable, year, month) so that later
+    steps can read slices of a variable without searching and opening individual GeoTIFFs.
+
+    :param data_path_dict: A dictionary with variables' names as keys and their (monthly/yearly/static) data
+                           directories as values.
+    :param cube_dir: Directory path of the datacube.
+    :param ref_raster: Filepath of Western US reference raster defining the datacube grid.
+    :param skip_processing: Set to True to skip building the datacube.
+
+    :return: None.
+    """
+    if not skip_processing:
+        create_datacube(cube_dir, ref_raster=ref_raster)
+
+        for var, path in data_path_dict.items():
+            print(f'ingesting {var} datasets into datacube...')
+            ingest_rasters_to_datacube(cube_dir=cube_dir, variable=var, raster_dir=path, ref_raster=ref_raster)
+    else:
+        pass
+
+
+def create_lat_lon_rasters(ref_raster, lon_dir, lat_dir):
+    """
+    Create longitude and latitude rasters from a reference raster.
+
+    :param ref_raster: Filepath of reference raster.
+    :param lon_dir: Output directory of the longitude raster.
+    :param lat_dir: Output directory of the latitude raster.
+
+    :return: None.
+    """
+    ref_arr, ref_file = read_raster_arr_object(ref_raster)
+    lon_arr, lat_arr = make_lat_lon_array_from_raster(ref_raster)
+
+    makedirs([lon_dir, lat_dir])
+
+    write_array_to_raster(raster_arr=lon_arr, raster_file=ref_file, transform=ref_file.transform,
+                          output_path=os.path.join(lon_dir, 'Longitude.tif'))
+    write_array_to_raster(raster_arr=lat_arr, raster_file=ref_file, transform=ref_file.transform,
+                          output_path=os.path.join(lat_dir, 'Latitude.tif'))
+
+
 def run_all_preprocessing(skip_process_GrowSeason_data=False,
                           skip_prism_processing=False,
                           skip_gridmet_precip_processing=False,
@@ -1483,9 +1593,16 @@ def run_all_preprocessing(skip_process_GrowSeason_data=False,
                           skip_process_rel_infiltration_capacity_data=False,
                           skip_create_P_PET_corr_dataset=False,
                           skip_create_lake_raster=False,
-                          ref_raster=WestUS_raster):
+                          skip_build_datacube=False,
+                          fuse_cropland_cropET_gs=True,
+                          fuse_water_yr_ratio_predictors=True,
+                          ref_raster=WestUS_raster,
+                          state_file='../../Data_main/Raster_data/preprocessing_pipeline_state.json',
+                          force_steps=None,
+                          max_parallel_steps=1):
     """
-    Run all preprocessing steps.
+    Run all preprocessing steps as an incremental pipeline (see pipeline_ops.run_pipeline()). A step runs only if it
+    never ran, its arguments changed, or any of its inputs/outputs changed since its last run.
 
     :param skip_process_GrowSeason_data: Set to True to skip processing growing season data.
     :param skip_prism_processing: Set True if want to skip prism (precipitation and temperature) data preprocessing.
@@ -1520,274 +1637,433 @@ def run_all_preprocessing(skip_process_GrowSeason_data=False,
     :param ref_raster: Filepath of Western US reference raster to use in 2km pixel lat-lon raster creation and to use
                         as reference raster in other processing operations.
     :param skip_create_lake_raster: Set to True to skip create lake raster.
+    :param skip_build_datacube: Set to True to skip ingesting the monthly datasets into the datacube.
+    :param fuse_cropland_cropET_gs: Set to False to run cropland classification, cropET filtering, and growing season
+                                    cropET summing as separate steps even if none of them is skipped.
+    :param fuse_water_yr_ratio_predictors: Set to False to estimate runoff/precipitation fraction, precipitation
+                                           intensity, dryness index, and relative infiltration capacity as separate
+                                           steps even if none of them is skipped.
+    :param state_file: Filepath of the pipeline state (JSON) recording the inputs/outputs of each step's last run.
+    :param force_steps: List of step names to rerun regardless of their state. Set to True to rerun all steps.
+                        Default set to None.
+    :param max_parallel_steps: Maximum number of independent steps running at a time. Default set to 1.
 
     :return: None.
     """
-    # process growing season data
-    extract_month_from_GrowSeason_data(GS_data_dir='../../Data_main/Raster_data/Growing_season',
-                                       skip_processing=skip_process_GrowSeason_data)
-
-    # merge rainfed fraction dataset
-    merge_GEE_data_patches_IrrMapper_LANID_extents(year_list=(2008, 2009, 2010, 2011, 2012,
-                                                              2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                                                   input_dir_irrmapper='../../Data_main/Raster_data/Rainfed_Frac_IrrMapper',
-                                                   input_dir_lanid='../../Data_main/Raster_data/Rainfed_Frac_LANID',
-                                                   merged_output_dir='../../Data_main/Raster_data/Rainfed_cropland/Rainfed_Frac',
-                                                   merge_keyword='Rainfed_Frac', monthly_data=False,
-                                                   ref_raster=WestUS_raster,
-                                                   skip_processing=skip_merging_rainfed_frac)
-
-    # merge rainfed cropET dataset
-    merge_GEE_data_patches_IrrMapper_LANID_extents(year_list=(2008, 2009, 2010, 2011, 2012,
-                                                              2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                                                   input_dir_irrmapper='../../Data_main/Raster_data/Rainfed_crop_OpenET_IrrMapper',
-                                                   input_dir_lanid='../../Data_main/Raster_data/Rainfed_crop_OpenET_LANID',
-                                                   merged_output_dir='../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly_raw',
-                                                   merge_keyword='Rainfed_cropET', monthly_data=True,
-                                                   ref_raster=WestUS_raster,
-                                                   skip_processing=skip_merging_rainfed_cropET)
-
-    # merge irrigated fraction dataset
-    merge_GEE_data_patches_IrrMapper_LANID_extents(year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007,
-                                                              2008, 2009, 2010, 2011, 2012, 2013, 2014, 2015,
-                                                              2016, 2017, 2018, 2019, 2020),
-                                                   input_dir_irrmapper='../../Data_main/Raster_data/Irrigation_Frac_IrrMapper',
-                                                   input_dir_lanid='../../Data_main/Raster_data/Irrigation_Frac_LANID',
-                                                   merged_output_dir='../../Data_main/Raster_data/Irrigated_cropland/Irrigated_Frac',
-                                                   merge_keyword='Irrigated_Frac', monthly_data=False,
-                                                   ref_raster=WestUS_raster,
-                                                   skip_processing=skip_merging_irrigated_frac)
-
-    # merge irrigated cropET dataset
-    merge_GEE_data_patches_IrrMapper_LANID_extents(year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007,
-                                                              2008, 2009, 2010, 2011, 2012, 2013, 2014, 2015,
-                                                              2016, 2017, 2018, 2019, 2020),
-                                                   input_dir_irrmapper='../../Data_main/Raster_data/Irrig_crop_OpenET_IrrMapper',
-                                                   input_dir_lanid='../../Data_main/Raster_data/Irrig_crop_OpenET_LANID',
-                                                   merged_output_dir='../../Data_main/Raster_data/Irrigated_cropET/WestUS_monthly_raw',
-                                                   merge_keyword='Irrigated_cropET', monthly_data=True,
-                                                   ref_raster=WestUS_raster,
-                                                   skip_processing=skip_merging_irrigated_cropET)
-
-    # classify rainfed and irrigated cropland data
-    classify_irrigated_rainfed_cropland(
-        rainfed_fraction_dir='../../Data_main/Raster_data/Rainfed_cropland/Rainfed_Frac',
-        irrigated_fraction_dir='../../Data_main/Raster_data/Irrigated_cropland/Irrigated_Frac',
-        tree_cover_dir='../../Data_main/Raster_data/Tree_cover/WestUS',
-        rainfed_cropland_output_dir='../../Data_main/Raster_data/Rainfed_cropland',
-        irrigated_cropland_output_dir='../../Data_main/Raster_data/Irrigated_cropland',
-        skip_processing=skip_classifying_irrigated_rainfed_cropland)
-
-    # filtering rainfed and irrigated cropET with rainfed and irrigated cropland data
-    filter_rainfed_irrigated_cropET_with_rainfed_irrigated_cropland(
-        rainfed_cropland_dir='../../Data_main/Raster_data/Rainfed_cropland',
-        irrigated_cropland_dir='../../Data_main/Raster_data/Irrigated_cropland',
-        rainfed_cropET_input_dir='../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly_raw',
-        irrigated_cropET_input_dir='../../Data_main/Raster_data/Irrigated_cropET/WestUS_monthly_raw',
-        rainfed_cropET_output_dir='../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly',
-        irrigated_cropET_output_dir='../../Data_main/Raster_data/Irrigated_cropET/WestUS_monthly',
-        skip_processing=skip_filtering_irrigated_rainfed_cropET)
-
-    # sum monthly irrigated cropET for dynamic growing season
-    dynamic_gs_sum_ET(year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007,
-                                 2008, 2009, 2010, 2011, 2012, 2013, 2014, 2015,
-                                 2016, 2017, 2018, 2019, 2020),
-                      growing_season_dir='../../Data_main/Raster_data/Growing_season',
-                      monthly_input_dir='../../Data_main/Raster_data/Irrigated_cropET/WestUS_monthly',
-                      gs_output_dir='../../Data_main/Raster_data/Irrigated_cropET/WestUS_grow_season',
-                      sum_keyword='Irrigated_cropET',
-                      skip_processing=skip_summing_irrigated_cropET_gs)
-
-    # sum monthly rainfed cropET for dynamic growing season
-    dynamic_gs_sum_ET(year_list=(2008, 2009, 2010, 2011, 2012, 2013, 2014, 2015,
-                                 2016, 2017, 2018, 2019, 2020),
-                      growing_season_dir='../../Data_main/Raster_data/Growing_season',
-                      monthly_input_dir='../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly',
-                      gs_output_dir='../../Data_main/Raster_data/Rainfed_cropET/WestUS_grow_season',
-                      sum_keyword='Rainfed_cropET',
-                      skip_processing=skip_summing_rainfed_cropET_gs)
+    # steps only run if their inputs/arguments changed or their outputs are missing (see pipeline_ops.run_pipeline()).
+    # Skipped steps are left out of the pipeline
+    growing_season_dir = '../../Data_main/Raster_data/Growing_season'
+    prefix_cube_dir = '../../Data_main/Raster_data/scratch/prefix_sum_cube'  # scratch datacube of growing season sums
+    rainfed_frac_dir = '../../Data_main/Raster_data/Rainfed_cropland/Rainfed_Frac'
+    irrigated_frac_dir = '../../Data_main/Raster_data/Irrigated_cropland/Irrigated_Frac'
+    tree_cover_dir = '../../Data_main/Raster_data/Tree_cover/WestUS'
+    rainfed_cropland_dir = '../../Data_main/Raster_data/Rainfed_cropland'
+    irrigated_cropland_dir = '../../Data_main/Raster_data/Irrigated_cropland'
+    rainfed_cropET_raw_dir = '../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly_raw'
+    irrigated_cropET_raw_dir = '../../Data_main/Raster_data/Irrigated_cropET/WestUS_monthly_raw'
+    rainfed_cropET_dir = '../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly'
+    irrigated_cropET_dir = '../../Data_main/Raster_data/Irrigated_cropET/WestUS_monthly'
+    rainfed_cropET_gs_dir = '../../Data_main/Raster_data/Rainfed_cropET/WestUS_grow_season'
+    irrigated_cropET_gs_dir = '../../Data_main/Raster_data/Irrigated_cropET/WestUS_grow_season'
+    west_US_states_shape = '../../Data_main/shapefiles/Western_US_ref_shapes/WestUS_states.shp'
+    gridmet_precip_monthly_dir = '../../Data_main/Raster_data/GRIDMET_Precip/WestUS_monthly'
+    gridmet_RET_monthly_dir = '../../Data_main/Raster_data/GRIDMET_RET/WestUS_monthly'
+    water_yr_precip_sum_dir = '../../Data_main/Raster_data/GRIDMET_Precip/WestUS_water_year/sum'
+    ksat_dir = '../../Data_main/Raster_data/Saturated_hydraulic_conductivity'
+    ksat_data = os.path.join(ksat_dir, 'Ksat_0cm.tif')
+    training_data_dir = '../../Data_main/Raster_data/Rainfed_cropET_filtered_training'
+    training_zone_shapefile = '../../Data_main/shapefiles/Training_zones/effective_precip_training_zone.shp'
+    excess_ET_filter_dir = '../../Data_main/Raster_data/Excess_ET_filter'
+    slope_dir = '../../Data_main/Raster_data/Slope/WestUS'
+    usda_cdl_dir = '../../Data_main/Raster_data/USDA_CDL/WestUS_yearly'
 
-    # sum monthly rainfed cropET for water year
-    sum_cropET_water_yr(years_list=(2009, 2010, 2011, 2012, 2013, 2014, 2015,
-                                    2016, 2017, 2018, 2019, 2020),
-                        input_cropET_monthly_dir='../../Data_main/Raster_data/Rainfed_cropET/WestUS_monthly',
-                        output_dir_water_yr='../../Data_main/Raster_data/Rainfed_cropET/WestUS_water_year',
-                        save_keyword='Rainfed_cropET',
-                        skip_processing=skip_summing_rainfed_cropET_water_yr)
-
-    # prism precipitation data processing
-    process_prism_data(year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007, 2008, 2009, 2010, 2011,
-                                  2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                       prism_bil_dir='../../Data_main/Raster_data/PRISM_Precip/bil_format',
-                       prism_tif_dir='../../Data_main/Raster_data/PRISM_Precip/tif_format',
-                       output_dir_prism_monthly='../../Data_main/Raster_data/PRISM_Precip/WestUS_monthly',
-                       output_dir_prism_yearly='../../Data_main/Raster_data/PRISM_Precip/WestUS_yearly',
-                       west_US_shape='../../Data_main/shapefiles/Western_US_ref_shapes/WestUS_states.shp',
-                       keyword='prism_precip', skip_processing=skip_prism_processing)
+    steps = []
 
-    # prism maximum temperature data processing
-    process_prism_data(year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007, 2008, 2009, 2010, 2011,
-                                  2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                       prism_bil_dir='../../Data_main/Raster_data/PRISM_Tmax/bil_format',
-                       prism_tif_dir='../../Data_main/Raster_data/PRISM_Tmax/tif_format',
-                       output_dir_prism_monthly='../../Data_main/Raster_data/PRISM_Tmax/WestUS_monthly',
-                       output_dir_prism_yearly=None,
-                       west_US_shape='../../Data_main/shapefiles/Western_US_ref_shapes/WestUS_states.shp',
-                       keyword='prism_tmax', skip_processing=skip_prism_processing)
+    # process growing season data
+    if not skip_process_GrowSeason_data:
+        steps.append(pipeline_step('process_growing_season', extract_month_from_GrowSeason_data,
+                                   kwargs=dict(GS_data_dir=growing_season_dir),
+                                   inputs=[os.path.join(growing_season_dir, 'ee_exports')],
+                                   outputs=[growing_season_dir]))
+
+    # merge rainfed fraction, rainfed cropET, irrigated fraction, and irrigated cropET datasets
+    merge_list = [('merge_rainfed_frac', skip_merging_rainfed_frac, 'Rainfed_Frac_IrrMapper', 'Rainfed_Frac_LANID',
+                   rainfed_frac_dir, 'Rainfed_Frac', False, range(2008, 2020 + 1)),
+                  ('merge_rainfed_cropET', skip_merging_rainfed_cropET, 'Rainfed_crop_OpenET_IrrMapper',
+                   'Rainfed_crop_OpenET_LANID', rainfed_cropET_raw_dir, 'Rainfed_cropET', True, range(2008, 2020 + 1)),
+                  ('merge_irrigated_frac', skip_merging_irrigated_frac, 'Irrigation_Frac_IrrMapper',
+                   'Irrigation_Frac_LANID', irrigated_frac_dir, 'Irrigated_Frac', False, range(1999, 2020 + 1)),
+                  ('merge_irrigated_cropET', skip_merging_irrigated_cropET, 'Irrig_crop_OpenET_IrrMapper',
+                   'Irrig_crop_OpenET_LANID', irrigated_cropET_raw_dir, 'Irrigated_cropET', True,
+                   range(1999, 2020 + 1))]
+
+    for step_name, skip_step, irrmapper_name, lanid_name, merged_output_dir, merge_keyword, monthly_data, years \
+            in merge_list:
+        if not skip_step:
+            input_dir_irrmapper = os.path.join('../../Data_main/Raster_data', irrmapper_name)
+            input_dir_lanid = os.path.join('../../Data_main/Raster_data', lanid_name)
+            steps.append(pipeline_step(step_name, merge_GEE_data_patches_IrrMapper_LANID_extents,
+                                       kwargs=dict(year_list=tuple(years), input_dir_irrmapper=input_dir_irrmapper,
+                                                   input_dir_lanid=input_dir_lanid,
+                                                   merged_output_dir=merged_output_dir,
+                                                   merge_keyword=merge_keyword, monthly_data=monthly_data,
+                                                   ref_raster=WestUS_raster),
+                                       inputs=[input_dir_irrmapper, input_dir_lanid, WestUS_raster],
+                                       outputs=[merged_output_dir]))
+
+    # classify rainfed and irrigated cropland, filter cropET with the cropland, and sum the growing season cropET.
+    # The fused version reads each input once per year (used when the whole chain is to be run)
+    if fuse_cropland_cropET_gs and not any([skip_classifying_irrigated_rainfed_cropland,
+                                            skip_filtering_irrigated_rainfed_cropET,
+                                            skip_summing_irrigated_cropET_gs, skip_summing_rainfed_cropET_gs]):
+        steps.append(pipeline_step('process_cropland_cropET_grow_season', process_cropland_cropET_grow_season,
+                                   kwargs=dict(rainfed_fraction_dir=rainfed_frac_dir,
+                                               irrigated_fraction_dir=irrigated_frac_dir,
+                                               tree_cover_dir=tree_cover_dir,
+                                               growing_season_dir=growing_season_dir,
+                                               rainfed_cropET_input_dir=rainfed_cropET_raw_dir,
+                                               irrigated_cropET_input_dir=irrigated_cropET_raw_dir,
+                                               rainfed_cropET_gs_output_dir=rainfed_cropET_gs_dir,
+                                               irrigated_cropET_gs_output_dir=irrigated_cropET_gs_dir,
+                                               rainfed_cropland_output_dir=rainfed_cropland_dir,
+                                               irrigated_cropland_output_dir=irrigated_cropland_dir,
+                                               rainfed_cropET_output_dir=rainfed_cropET_dir,
+                                               irrigated_cropET_output_dir=irrigated_cropET_dir),
+                                   inputs=[rainfed_frac_dir, irrigated_frac_dir, tree_cover_dir, growing_season_dir,
+                                           rainfed_cropET_raw_dir, irrigated_cropET_raw_dir],
+                                   outputs=[rainfed_cropland_dir, irrigated_cropland_dir, rainfed_cropET_dir,
+                                            irrigated_cropET_dir, rainfed_cropET_gs_dir, irrigated_cropET_gs_dir]))
+    else:
+        # classify rainfed and irrigated cropland data
+        if not skip_classifying_irrigated_rainfed_cropland:
+            steps.append(pipeline_step('classify_irrigated_rainfed_cropland', classify_irrigated_rainfed_cropland,
+                                       kwargs=dict(rainfed_fraction_dir=rainfed_frac_dir,
+                                                   irrigated_fraction_dir=irrigated_frac_dir,
+                                                   tree_cover_dir=tree_cover_dir,
+                                                   rainfed_cropland_output_dir=rainfed_cropland_dir,
+                                                   irrigated_cropland_output_dir=irrigated_cropland_dir),
+                                       inputs=[rainfed_frac_dir, irrigated_frac_dir, tree_cover_dir],
+                                       outputs=[rainfed_cropland_dir, irrigated_cropland_dir]))
+
+        # filtering rainfed and irrigated cropET with rainfed and irrigated cropland data
+        if not skip_filtering_irrigated_rainfed_cropET:
+            steps.append(pipeline_step('filter_irrigated_rainfed_cropET',
+                                       filter_rainfed_irrigated_cropET_with_rainfed_irrigated_cropland,
+                                       kwargs=dict(rainfed_cropland_dir=rainfed_cropland_dir,
+                                                   irrigated_cropland_dir=irrigated_cropland_dir,
+                                                   rainfed_cropET_input_dir=rainfed_cropET_raw_dir,
+                                                   irrigated_cropET_input_dir=irrigated_cropET_raw_dir,
+                                                   rainfed_cropET_output_dir=rainfed_cropET_dir,
+                                                   irrigated_cropET_output_dir=irrigated_cropET_dir),
+                                       inputs=[rainfed_cropland_dir, irrigated_cropland_dir, rainfed_cropET_raw_dir,
+                                               irrigated_cropET_raw_dir],
+                                       outputs=[rainfed_cropET_dir, irrigated_cropET_dir]))
+
+        # sum monthly irrigated cropET for dynamic growing season
+        if not skip_summing_irrigated_cropET_gs:
+            steps.append(pipeline_step('sum_irrigated_cropET_grow_season', dynamic_gs_sum_ET,
+                                       kwargs=dict(year_list=tuple(range(1999, 2020 + 1)),
+                                                   growing_season_dir=growing_season_dir,
+                                                   monthly_input_dir=irrigated_cropET_dir,
+                                                   gs_output_dir=irrigated_cropET_gs_dir,
+                                                   sum_keyword='Irrigated_cropET',
+                                                   prefix_cube_dir=prefix_cube_dir),
+                                       inputs=[growing_season_dir, irrigated_cropET_dir],
+                                       outputs=[irrigated_cropET_gs_dir]))
+
+        # sum monthly rainfed cropET for dynamic growing season
+        if not skip_summing_rainfed_cropET_gs:
+            steps.append(pipeline_step('sum_rainfed_cropET_grow_season', dynamic_gs_sum_ET,
+                                       kwargs=dict(year_list=tuple(range(2008, 2020 + 1)),
+                                                   growing_season_dir=growing_season_dir,
+                                                   monthly_input_dir=rainfed_cropET_dir,
+                                                   gs_output_dir=rainfed_cropET_gs_dir,
+                                                   sum_keyword='Rainfed_cropET',
+                                                   prefix_cube_dir=prefix_cube_dir),
+                                       inputs=[growing_season_dir, rainfed_cropET_dir],
+                                       outputs=[rainfed_cropET_gs_dir]))
 
-    # prism minimum temperature data processing
-    process_prism_data(year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007, 2008, 2009, 2010, 2011,
-                                  2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                       prism_bil_dir='../../Data_main/Raster_data/PRISM_Tmin/bil_format',
-                       prism_tif_dir='../../Data_main/Raster_data/PRISM_Tmin/tif_format',
-                       output_dir_prism_monthly='../../Data_main/Raster_data/PRISM_Tmin/WestUS_monthly',
-                       output_dir_prism_yearly=None,
-                       west_US_shape='../../Data_main/shapefiles/Western_US_ref_shapes/WestUS_states.shp',
-                       keyword='prism_tmin', skip_processing=skip_prism_processing)
+    # sum monthly rainfed cropET for water year
+    if not skip_summing_rainfed_cropET_water_yr:
+        steps.append(pipeline_step('sum_rainfed_cropET_water_year', sum_cropET_water_yr,
+                                   kwargs=dict(years_list=tuple(range(2009, 2020 + 1)),
+                                               input_cropET_monthly_dir=rainfed_cropET_dir,
+                                               output_dir_water_yr='../../Data_main/Raster_data/Rainfed_cropET/'
+                                                                   'WestUS_water_year',
+                                               save_keyword='Rainfed_cropET'),
+                                   inputs=[rainfed_cropET_dir],
+                                   outputs=['../../Data_main/Raster_data/Rainfed_cropET/WestUS_water_year']))
+
+    # prism precipitation, maximum temperature, and minimum temperature data processing
+    if not skip_prism_processing:
+        for prism_var, keyword, save_yearly in (('PRISM_Precip', 'prism_precip', True),
+                                                ('PRISM_Tmax', 'prism_tmax', False),
+                                                ('PRISM_Tmin', 'prism_tmin', False)):
+            prism_bil_dir = f'../../Data_main/Raster_data/{prism_var}/bil_format'
+            output_dir_prism_monthly = f'../../Data_main/Raster_data/{prism_var}/WestUS_monthly'
+            output_dir_prism_yearly = f'../../Data_main/Raster_data/{prism_var}/WestUS_yearly' if save_yearly \
+                else None
+
+            steps.append(pipeline_step(f'process_{keyword}', process_prism_data,
+                                       kwargs=dict(year_list=tuple(range(1999, 2020 + 1)),
+                                                   prism_bil_dir=prism_bil_dir,
+                                                   output_dir_prism_monthly=output_dir_prism_monthly,
+                                                   output_dir_prism_yearly=output_dir_prism_yearly,
+                                                   west_US_shape=west_US_states_shape, keyword=keyword),
+                                       inputs=[prism_bil_dir, west_US_states_shape],
+                                       outputs=[output_dir_prism_monthly] +
+                                               ([output_dir_prism_yearly] if save_yearly else [])))
 
     # gridmet precip yearly data processing
-    sum_GridMET_precip_yearly_data(
-        year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007, 2008, 2009, 2010, 2011,
-                   2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020),
-        input_gridmet_monthly_dir='../../Data_main/Raster_data/GRIDMET_Precip/WestUS_monthly',
-        output_dir_yearly='../../Data_main/Raster_data/GRIDMET_Precip/WestUS_yearly',
-        skip_processing=skip_gridmet_precip_processing)
+    if not skip_gridmet_precip_processing:
+        steps.append(pipeline_step('sum_gridmet_precip_yearly', sum_GridMET_precip_yearly_data,
+                                   kwargs=dict(year_list=tuple(range(1999, 2020 + 1)),
+                                               input_gridmet_monthly_dir=gridmet_precip_monthly_dir,
+                                               output_dir_yearly='../../Data_main/Raster_data/GRIDMET_Precip/'
+                                                                 'WestUS_yearly'),
+                                   inputs=[gridmet_precip_monthly_dir],
+                                   outputs=['../../Data_main/Raster_data/GRIDMET_Precip/WestUS_yearly']))
 
     # OpenET ensemble growing season summing
-    dynamic_gs_sum_ET(year_list=(2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007,
-                                 2008, 2009, 2010, 2011, 2012, 2013, 2014, 2015,
-                                 2016, 2017, 2018, 2019, 2020),
-                      growing_season_dir='../../Data_main/Raster_data/Growing_season',
-                      monthly_input_dir='../../Data_main/Raster_data/OpenET_ensemble/WestUS_monthly',
-                      gs_output_dir='../../Data_main/Raster_data/OpenET_ensemble/WestUS_grow_season',
-                      sum_keyword='OpenET_ensemble',
-                      skip_processing=skip_sum_openET)
+    if not skip_sum_openET:
+        steps.append(pipeline_step('sum_openET_grow_season', dynamic_gs_sum_ET,
+                                   kwargs=dict(year_list=tuple(range(2000, 2020 + 1)),
+                                               growing_season_dir=growing_season_dir,
+                                               monthly_input_dir='../../Data_main/Raster_data/OpenET_ensemble/'
+                                                                 'WestUS_monthly',
+                                               gs_output_dir='../../Data_main/Raster_data/OpenET_ensemble/'
+                                                             'WestUS_grow_season',
+                                               sum_keyword='OpenET_ensemble',
+                                               prefix_cube_dir=prefix_cube_dir),
+                                   inputs=[growing_season_dir,
+                                           '../../Data_main/Raster_data/OpenET_ensemble/WestUS_monthly'],
+                                   outputs=['../../Data_main/Raster_data/OpenET_ensemble/WestUS_grow_season']))
 
     # GridMET yearly data processing
-    sum_GridMET_RET_yearly_data(year_list=(1999, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 2007, 2008, 2009, 2010, 2011,
-                                           2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                                input_RET_monthly_dir='../../Data_main/Raster_data/GRIDMET_RET/WestUS_monthly',
-                                output_dir_RET_yearly='../../Data_main/Raster_data/GRIDMET_RET/WestUS_yearly',
-                                output_dir_RET_growing_season='../../Data_main/Raster_data/GRIDMET_RET/WestUS_grow_season',
-                                skip_processing=skip_gridmet_RET_precessing)
+    if not skip_gridmet_RET_precessing:
+        steps.append(pipeline_step('sum_gridmet_RET_yearly', sum_GridMET_RET_yearly_data,
+                                   kwargs=dict(year_list=tuple(range(1999, 2020 + 1)),
+                                               input_RET_monthly_dir=gridmet_RET_monthly_dir,
+                                               output_dir_RET_yearly='../../Data_main/Raster_data/GRIDMET_RET/'
+                                                                     'WestUS_yearly',
+                                               output_dir_RET_growing_season='../../Data_main/Raster_data/'
+                                                                             'GRIDMET_RET/WestUS_grow_season'),
+                                   inputs=[gridmet_RET_monthly_dir],
+                                   outputs=['../../Data_main/Raster_data/GRIDMET_RET/WestUS_yearly',
+                                            '../../Data_main/Raster_data/GRIDMET_RET/WestUS_grow_season']))
 
     # processing excess ET filter
-    develop_excess_ET_filter(years_list=(2009, 2010, 2011, 2012, 2013, 2014,
-                                         2015, 2016, 2017, 2018, 2019, 2020),
-                             # starting from water year 2009 as 2008 water year couldn't be considered due to missing rainfed cropland data for 2007
-                             water_yr_precip_dir='../../Data_main/Raster_data/GRIDMET_Precip/WestUS_water_year/sum',
-                             water_yr_rainfed_ET_dir='../../Data_main/Raster_data/Rainfed_cropET/WestUS_water_year',
-                             output_dir='../../Data_main/Raster_data/Excess_ET_filter',
-                             skip_processing=skip_excess_ET_filter_processing)
+    # starting from water year 2009 as 2008 water year couldn't be considered due to missing rainfed cropland data for
+    # 2007
+    if not skip_excess_ET_filter_processing:
+        steps.append(pipeline_step('develop_excess_ET_filter', develop_excess_ET_filter,
+                                   kwargs=dict(years_list=tuple(range(2009, 2020 + 1)),
+                                               water_yr_precip_dir=water_yr_precip_sum_dir,
+                                               water_yr_rainfed_ET_dir='../../Data_main/Raster_data/Rainfed_cropET/'
+                                                                       'WestUS_water_year',
+                                               output_dir=excess_ET_filter_dir),
+                                   inputs=[water_yr_precip_sum_dir,
+                                           '../../Data_main/Raster_data/Rainfed_cropET/WestUS_water_year'],
+                                   outputs=[excess_ET_filter_dir]))
 
     # converting DEM data to slope
-    create_slope_raster(input_raster='../../Data_main/Raster_data/DEM/WestUS/DEM.tif',
-                        output_dir='../../Data_main/Raster_data/Slope/WestUS', raster_name='Slope.tif',
-                        skip_processing=skip_processing_slope_data)
+    if not skip_processing_slope_data:
+        steps.append(pipeline_step('create_slope_raster', create_slope_raster,
+                                   kwargs=dict(input_raster='../../Data_main/Raster_data/DEM/WestUS/DEM.tif',
+                                               output_dir=slope_dir, raster_name='Slope.tif'),
+                                   inputs=['../../Data_main/Raster_data/DEM/WestUS/DEM.tif'],
+                                   outputs=[os.path.join(slope_dir, 'Slope.tif')]))
 
     # processing available water capacity (AWC) data
-    process_AWC_data(input_dir='../../Data_main/Raster_data/Available_water_capacity/awc_gNATSGO',
-                     westUS_shape=WestUS_shape,
-                     output_dir='../../Data_main/Raster_data/Available_water_capacity/WestUS',
-                     ref_raster=ref_raster, resolution=model_res,
-                     skip_processing=skip_process_AWC_data)
+    if not skip_process_AWC_data:
+        steps.append(pipeline_step('process_AWC_data', process_AWC_data,
+                                   kwargs=dict(input_dir='../../Data_main/Raster_data/Available_water_capacity/'
+                                                         'awc_gNATSGO',
+                                               westUS_shape=WestUS_shape,
+                                               output_dir='../../Data_main/Raster_data/Available_water_capacity/'
+                                                          'WestUS',
+                                               ref_raster=ref_raster, resolution=model_res),
+                                   inputs=['../../Data_main/Raster_data/Available_water_capacity/awc_gNATSGO',
+                                           WestUS_shape, ref_raster],
+                                   outputs=['../../Data_main/Raster_data/Available_water_capacity/WestUS']))
 
     # making a latitude longitude raster from reference raster
-    ref_arr, ref_file = read_raster_arr_object(ref_raster)
-    lon_arr, lat_arr = make_lat_lon_array_from_raster(ref_raster)
-
-    lon_dir = os.path.join('../../Data_main/Raster_data', 'Longitude/WestUS')
-    lat_dir = os.path.join('../../Data_main/Raster_data', 'Latitude/WestUS')
-    makedirs([lon_dir, lat_dir])
-
-    write_array_to_raster(raster_arr=lon_arr, raster_file=ref_file, transform=ref_file.transform,
-                          output_path=os.path.join(lon_dir, 'Longitude.tif'))
-    write_array_to_raster(raster_arr=lat_arr, raster_file=ref_file, transform=ref_file.transform,
-                          output_path=os.path.join(lat_dir, 'Latitude.tif'))
+    steps.append(pipeline_step('create_lat_lon_rasters', create_lat_lon_rasters,
+                               kwargs=dict(ref_raster=ref_raster,
+                                           lon_dir='../../Data_main/Raster_data/Longitude/WestUS',
+                                           lat_dir='../../Data_main/Raster_data/Latitude/WestUS'),
+                               inputs=[ref_raster],
+                               outputs=['../../Data_main/Raster_data/Longitude/WestUS',
+                                        '../../Data_main/Raster_data/Latitude/WestUS']))
 
     # filtering effective precipitation training data with excess ET and bounding box filter
-    training_zone_shapefile = '../../Data_main/shapefiles/Training_zones/effective_precip_training_zone.shp'
-    output_dir = '../../Data_main/Raster_data/Rainfed_cropET_filtered_training'
-
-    filter_effective_precip_training_data(training_zone_shp=training_zone_shapefile,
-                                          general_output_dir=output_dir,
-                                          refraster=WestUS_raster,
-                                          resolution=model_res,
-                                          skip_processing=skip_effective_precip_training_data_filtering)
+    if not skip_effective_precip_training_data_filtering:
+        steps.append(pipeline_step('filter_effective_precip_training_data', filter_effective_precip_training_data,
+                                   kwargs=dict(training_zone_shp=training_zone_shapefile,
+                                               general_output_dir=training_data_dir,
+                                               refraster=WestUS_raster, resolution=model_res,
+                                               rainfed_cropET_dir=rainfed_cropET_dir,
+                                               rainfed_cropland_dir=rainfed_cropland_dir,
+                                               usda_cdl_dir=usda_cdl_dir,
+                                               excess_ET_filter_dir=excess_ET_filter_dir,
+                                               slope_dir=slope_dir),
+                                   inputs=[training_zone_shapefile, WestUS_raster, rainfed_cropET_dir,
+                                           rainfed_cropland_dir, usda_cdl_dir, excess_ET_filter_dir, slope_dir],
+                                   # only the outputs of this step (the training data dir also holds the outputs of
+                                   # later steps)
+                                   outputs=[os.path.join(training_data_dir, 'training_zone_labels.tif'),
+                                            os.path.join(training_data_dir, 'final_filtered_cropET_for_training')]))
 
     # # # # # # # # # # # # # # # # # # # # # # for water year model # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-    # accumulating monthly dataset to water year
-    accumulate_monthly_datasets_to_water_year(skip_processing=skip_accum_to_water_year_datasets)
+    # accumulating monthly dataset to water year. The training data is accumulated in a separate step, as it depends
+    # on the excess ET filter which depends on the water year precipitation accumulated here
+    if not skip_accum_to_water_year_datasets:
+        for step_name, variables in (('accumulate_predictors_to_water_year',
+                                      [var for var in water_yr_accum_data_path_dict
+                                       if var != 'Effective_precip_train']),
+                                     ('accumulate_training_data_to_water_year', ['Effective_precip_train'])):
+            steps.append(pipeline_step(step_name, accumulate_monthly_datasets_to_water_year,
+                                       kwargs=dict(variables=variables),
+                                       inputs=[water_yr_accum_data_path_dict[var] for var in variables],
+                                       outputs=[get_water_yr_accum_output_dir(var) for var in variables]))
 
     # sum monthly irrigated cropET for water year
-    sum_cropET_water_yr(years_list=(2000, 2001, 2002, 2003, 2004, 2005, 2006,
-                                    2007, 2008, 2009, 2010, 2011, 2012, 2013,
-                                    2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                        input_cropET_monthly_dir='../../Data_main/Raster_data/Irrigated_cropET/WestUS_monthly',
-                        output_dir_water_yr='../../Data_main/Raster_data/Irrigated_cropET/WestUS_water_year',
-                        save_keyword='Irrigated_cropET',
-                        skip_processing=skip_summing_irrigated_cropET_water_yr)
-
-    # estimate fraction of water year surface runoff to precipitation
-    fraction_SR_precip_water_yr(years_list=(2000, 2001, 2002, 2003, 2004, 2005, 2006,
-                                            2007, 2008, 2009, 2010, 2011, 2012, 2013,
-                                            2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                                input_dir_runoff='../../Data_main/Raster_data/TERRACLIMATE_SR/WestUS_water_year/sum',
-                                input_dir_precip='../../Data_main/Raster_data/GRIDMET_Precip/WestUS_water_year/sum',
-                                output_dir='../../Data_main/Raster_data/Runoff_precip_fraction',
-                                skip_processing=skip_estimate_runoff_precip_frac)
-
-    # estimate water year precipitation intensity (precipitation / rainy days)
-    estimate_precip_intensity_water_yr(years_list=(2000, 2001, 2002, 2003, 2004, 2005, 2006,
-                                                   2007, 2008, 2009, 2010, 2011, 2012, 2013,
-                                                   2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                                       input_dir_precip='../../Data_main/Raster_data/GRIDMET_Precip/WestUS_water_year/mean',
-                                       input_dir_rainy_day='../../Data_main/Raster_data/Rainy_days/WestUS_water_year',
-                                       output_dir='../../Data_main/Raster_data/Precipitation_intensity',
-                                       skip_processing=skip_estimate_precip_intensity)
-
-    # estimate PET/P (dryness index) for water year
-    estimate_PET_by_P_water_yr(years_list=(2000, 2001, 2002, 2003, 2004, 2005, 2006,
-                                           2007, 2008, 2009, 2010, 2011, 2012, 2013,
-                                           2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                               input_dir_PET='../../Data_main/Raster_data/GRIDMET_RET/WestUS_water_year',
-                               input_dir_precip='../../Data_main/Raster_data/GRIDMET_Precip/WestUS_water_year/sum',
-                               output_dir='../../Data_main/Raster_data/Dryness_index',
-                               skip_processing=skip_estimate_dryness_index)
+    if not skip_summing_irrigated_cropET_water_yr:
+        steps.append(pipeline_step('sum_irrigated_cropET_water_year', sum_cropET_water_yr,
+                                   kwargs=dict(years_list=tuple(range(2000, 2020 + 1)),
+                                               input_cropET_monthly_dir=irrigated_cropET_dir,
+                                               output_dir_water_yr='../../Data_main/Raster_data/Irrigated_cropET/'
+                                                                   'WestUS_water_year',
+                                               save_keyword='Irrigated_cropET'),
+                                   inputs=[irrigated_cropET_dir],
+                                   outputs=['../../Data_main/Raster_data/Irrigated_cropET/WestUS_water_year']))
 
     # process saturated hydraulic conductivity (Ksat) data
-    process_Ksat_data_for_WestUS(
-        ksat_data='../../Data_main/Raster_data/Saturated_hydraulic_conductivity/raw/Global_Ksat_1Km_s0....0cm_v1.0.tif',
-        output_dir='../../Data_main/Raster_data/Saturated_hydraulic_conductivity',
-        skip_processing=skip_process_ksat_data)
-
-    # create relative infiltration capacity dataset
-    create_rel_infiltration_capacity_dataset(years_list=(2000, 2001, 2002, 2003, 2004, 2005, 2006,
-                                                         2007, 2008, 2009, 2010, 2011, 2012, 2013,
-                                                         2014, 2015, 2016, 2017, 2018, 2019, 2020),
-                                             ksat_data='../../Data_main/Raster_data/Saturated_hydraulic_conductivity/Ksat_0cm.tif',
-                                             precip_intensity_dir='../../Data_main/Raster_data/Precipitation_intensity',
-                                             output_dir='../../Data_main/Raster_data/Relative_infiltration_capacity',
-                                             skip_processing=skip_process_rel_infiltration_capacity_data)
+    if not skip_process_ksat_data:
+        ksat_raw_data = os.path.join(ksat_dir, 'raw/Global_Ksat_1Km_s0....0cm_v1.0.tif')
+        steps.append(pipeline_step('process_ksat_data', process_Ksat_data_for_WestUS,
+                                   kwargs=dict(ksat_data=ksat_raw_data, output_dir=ksat_dir),
+                                   inputs=[ksat_raw_data],
+                                   outputs=[ksat_data]))
+
+    # estimate water year runoff/precipitation fraction, precipitation intensity, PET/P (dryness index), and relative
+    # infiltration capacity. The fused version reads each year's inputs once (used when all four are to be run)
+    water_yr_years = tuple(range(2000, 2020 + 1))
+    runoff_dir = '../../Data_main/Raster_data/TERRACLIMATE_SR/WestUS_water_year/sum'
+    precip_mean_dir = '../../Data_main/Raster_data/GRIDMET_Precip/WestUS_water_year/mean'
+    rainy_day_dir = '../../Data_main/Raster_data/Rainy_days/WestUS_water_year'
+    PET_dir = '../../Data_main/Raster_data/GRIDMET_RET/WestUS_water_year'
+    runoff_frac_dir = '../../Data_main/Raster_data/Runoff_precip_fraction'
+    precip_intensity_dir = '../../Data_main/Raster_data/Precipitation_intensity'
+    dryness_index_dir = '../../Data_main/Raster_data/Dryness_index'
+    rel_infil_capacity_dir = '../../Data_main/Raster_data/Relative_infiltration_capacity'
+
+    if fuse_water_yr_ratio_predictors and not any([skip_estimate_runoff_precip_frac, skip_estimate_precip_intensity,
+                                                   skip_estimate_dryness_index,
+                                                   skip_process_rel_infiltration_capacity_data]):
+        steps.append(pipeline_step('estimate_water_yr_ratio_predictors', estimate_water_yr_ratio_predictors,
+                                   kwargs=dict(years_list=water_yr_years, input_dir_runoff=runoff_dir,
+                                               input_dir_precip_sum=water_yr_precip_sum_dir,
+                                               input_dir_precip_mean=precip_mean_dir,
+                                               input_dir_rainy_day=rainy_day_dir, input_dir_PET=PET_dir,
+                                               ksat_data=ksat_data, output_dir_runoff_frac=runoff_frac_dir,
+                                               output_dir_precip_intensity=precip_intensity_dir,
+                                               output_dir_dryness_index=dryness_index_dir,
+                                               output_dir_rel_infil_capacity=rel_infil_capacity_dir),
+                                   inputs=[runoff_dir, water_yr_precip_sum_dir, precip_mean_dir, rainy_day_dir,
+                                           PET_dir, ksat_data],
+                                   outputs=[runoff_frac_dir, precip_intensity_dir, dryness_index_dir,
+                                            rel_infil_capacity_dir]))
+    else:
+        # estimate fraction of water year surface runoff to precipitation
+        if not skip_estimate_runoff_precip_frac:
+            steps.append(pipeline_step('estimate_runoff_precip_frac', fraction_SR_precip_water_yr,
+                                       kwargs=dict(years_list=water_yr_years, input_dir_runoff=runoff_dir,
+                                                   input_dir_precip=water_yr_precip_sum_dir,
+                                                   output_dir=runoff_frac_dir),
+                                       inputs=[runoff_dir, water_yr_precip_sum_dir],
+                                       outputs=[runoff_frac_dir]))
+
+        # estimate water year precipitation intensity (precipitation / rainy days)
+        if not skip_estimate_precip_intensity:
+            steps.append(pipeline_step('estimate_precip_intensity', estimate_precip_intensity_water_yr,
+                                       kwargs=dict(years_list=water_yr_years, input_dir_precip=precip_mean_dir,
+                                                   input_dir_rainy_day=rainy_day_dir,
+                                                   output_dir=precip_intensity_dir),
+                                       inputs=[precip_mean_dir, rainy_day_dir],
+                                       outputs=[precip_intensity_dir]))
+
+        # estimate PET/P (dryness index) for water year
+        if not skip_estimate_dryness_index:
+            steps.append(pipeline_step('estimate_dryness_index', estimate_PET_by_P_water_yr,
+                                       kwargs=dict(years_list=water_yr_years, input_dir_PET=PET_dir,
+                                                   input_dir_precip=water_yr_precip_sum_dir,
+                                                   output_dir=dryness_index_dir),
+                                       inputs=[PET_dir, water_yr_precip_sum_dir],
+                                       outputs=[dryness_index_dir]))
+
+        # create relative infiltration capacity dataset
+        if not skip_process_rel_infiltration_capacity_data:
+            steps.append(pipeline_step('create_rel_infiltration_capacity', create_rel_infiltration_capacity_dataset,
+                                       kwargs=dict(years_list=water_yr_years, ksat_data=ksat_data,
+                                                   precip_intensity_dir=precip_intensity_dir,
+                                                   output_dir=rel_infil_capacity_dir, skip_processing=False),
+                                       inputs=[ksat_data, precip_intensity_dir],
+                                       outputs=[rel_infil_capacity_dir]))
 
     # create P-PET correlation dataset
-    develop_P_PET_correlation_dataset(monthly_precip_dir='../../Data_main/Raster_data/GRIDMET_Precip/WestUS_monthly',
-                                      monthly_pet_dir='../../Data_main/Raster_data/GRIDMET_RET/WestUS_monthly',
-                                      output_dir='../../Data_main/Raster_data/P_PET_correlation',
-                                      skip_processing=skip_create_P_PET_corr_dataset)
+    if not skip_create_P_PET_corr_dataset:
+        steps.append(pipeline_step('create_P_PET_correlation', develop_P_PET_correlation_dataset,
+                                   kwargs=dict(monthly_precip_dir=gridmet_precip_monthly_dir,
+                                               monthly_pet_dir=gridmet_RET_monthly_dir,
+                                               output_dir='../../Data_main/Raster_data/P_PET_correlation'),
+                                   inputs=[gridmet_precip_monthly_dir, gridmet_RET_monthly_dir],
+                                   outputs=['../../Data_main/Raster_data/P_PET_correlation']))
 
     # processing the training data
     # water year rainfed cropET (effective precip) / water year precip fraction estimation
-    estimate_peff_precip_water_year_fraction(
-        years_list=(2009, 2010, 2011, 2012, 2013, 2014, 2015,
-                    2016, 2017, 2018, 2019, 2020),
-        peff_dir_water_yr='../../Data_main/Raster_data/Rainfed_cropET_filtered_training/final_filtered_cropET_for_training_water_year',
-        precip_dir_water_yr='../../Data_main/Raster_data/GRIDMET_Precip/WestUS_water_year/sum',
-        output_dir='../../Data_main/Raster_data/Rainfed_cropET_filtered_training/rainfed_cropET_water_year_fraction',
-        skip_processing=skip_estimate_peff_water_yr_frac)
+    if not skip_estimate_peff_water_yr_frac:
+        peff_water_yr_dir = os.path.join(training_data_dir, 'final_filtered_cropET_for_training_water_year')
+        peff_water_yr_frac_dir = os.path.join(training_data_dir, 'rainfed_cropET_water_year_fraction')
+        steps.append(pipeline_step('estimate_peff_water_yr_frac', estimate_peff_precip_water_year_fraction,
+                                   kwargs=dict(years_list=tuple(range(2009, 2020 + 1)),
+                                               peff_dir_water_yr=peff_water_yr_dir,
+                                               precip_dir_water_yr=water_yr_precip_sum_dir,
+                                               output_dir=peff_water_yr_frac_dir),
+                                   inputs=[peff_water_yr_dir, water_yr_precip_sum_dir],
+                                   outputs=[peff_water_yr_frac_dir]))
 
     # creating 2km resolution lake raster (value 1 where lake present) to use in post-processing (water body masking)
-    create_lake_raster(lake_shapefile='../../Data_main/shapefiles/HydroLakes/Lake_WestUS.shp',
-                       output_dir='../../Data_main/Raster_data/HydroLakes',
-                       skip_processing=skip_create_lake_raster)
+    if not skip_create_lake_raster:
+        steps.append(pipeline_step('create_lake_raster', create_lake_raster,
+                                   kwargs=dict(lake_shapefile='../../Data_main/shapefiles/HydroLakes/Lake_WestUS.shp',
+                                               output_dir='../../Data_main/Raster_data/HydroLakes',
+                                               skip_processing=False),
+                                   inputs=['../../Data_main/shapefiles/HydroLakes/Lake_WestUS.shp'],
+                                   outputs=['../../Data_main/Raster_data/HydroLakes']))
+
+    # ingesting the monthly predictors into a (variable, year, month) keyed datacube. The train-test dataframe of the
+    # monthly model (m01) reads these from the datacube. Only new/changed rasters are ingested in re-runs
+    monthly_data_path_dict = {
+        'PRISM_Precip': '../../Data_main/Raster_data/PRISM_Precip/WestUS_monthly',
+        'PRISM_Tmax': '../../Data_main/Raster_data/PRISM_Tmax/WestUS_monthly',
+        'PRISM_Tmin': '../../Data_main/Raster_data/PRISM_Tmin/WestUS_monthly',
+        'GRIDMET_Precip': '../../Data_main/Raster_data/GRIDMET_Precip/WestUS_monthly',
+        'GRIDMET_RET': '../../Data_main/Raster_data/GRIDMET_RET/WestUS_monthly',
+        'GRIDMET_vap_pres_def': '../../Data_main/Raster_data/GRIDMET_vap_pres_def/WestUS_monthly',
+        'GRIDMET_max_RH': '../../Data_main/Raster_data/GRIDMET_max_RH/WestUS_monthly',
+        'GRIDMET_min_RH': '../../Data_main/Raster_data/GRIDMET_min_RH/WestUS_monthly',
+        'GRIDMET_wind_vel': '../../Data_main/Raster_data/GRIDMET_wind_vel/WestUS_monthly',
+        'GRIDMET_short_rad': '../../Data_main/Raster_data/GRIDMET_short_rad/WestUS_monthly',
+        'DAYMET_sun_hr': '../../Data_main/Raster_data/DAYMET_sun_hr/WestUS_monthly'}
+
+    if not skip_build_datacube:
+        steps.append(pipeline_step('build_monthly_datacube', build_monthly_datacube,
+                                   kwargs=dict(data_path_dict=monthly_data_path_dict,
+                                               cube_dir='../../Data_main/Raster_data/Datacube',
+                                               ref_raster=ref_raster),
+                                   inputs=list(monthly_data_path_dict.values()) + [ref_raster],
+                                   outputs=['../../Data_main/Raster_data/Datacube']))
+
+    run_pipeline(steps, state_file=state_file, max_workers=max_parallel_steps, force=force_steps)
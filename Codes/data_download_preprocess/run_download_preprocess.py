@@ -64,6 +64,9 @@ skip_process_rel_infil_cap_data = True                  ######
 skip_create_P_PET_corr_dataset = True                   ######
 skip_estimate_peff_water_yr_frac = True                 ######
 skip_lake_raster_creation = True                        ######
+skip_build_datacube = True                              ######
+force_steps = None                                      ###### list of step names to rerun regardless of their state
+max_parallel_steps = 1                                  ######
 
 # # # #  runs # # # #
 if __name__ == '__main__':
@@ -113,5 +116,8 @@ if __name__ == '__main__':
                           skip_process_rel_infiltration_capacity_data=skip_process_rel_infil_cap_data,
                           skip_create_P_PET_corr_dataset=skip_create_P_PET_corr_dataset,
                           skip_create_lake_raster=skip_lake_raster_creation,
-                          ref_raster=WestUS_raster)
+                          skip_build_datacube=skip_build_datacube,
+                          ref_raster=WestUS_raster,
+                          force_steps=force_steps,
+                          max_parallel_steps=max_parallel_steps)
 
@@ -10,9 +10,12 @@ from datetime import datetime, timedelta
 from os.path import dirname, abspath
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
-from Codes.utils.system_ops import makedirs
+from Codes.utils.system_ops import makedirs, parallel_map
 from Codes.utils.ml_ops import reindex_df
-from Codes.utils.raster_ops import read_raster_arr_object, write_array_to_raster, create_multiband_raster, sum_rasters
+from Codes.utils.catalog_ops import find_raster, find_rasters
+from Codes.utils.time_ops import get_period_months, aggregate_monthly_rasters
+from Codes.utils.raster_ops import read_raster_arr_object, read_raster_into, write_array_to_raster, \
+    create_multiband_raster, read_raster_metadata
 
 no_data_value = -9999
 model_res = 0.01976293625031605786  # in deg, ~2 km
@@ -46,6 +49,27 @@ def create_monthly_dataframes_for_eff_precip_prediction(years_list, month_range,
 
         month_list = [m for m in range(month_range[0], month_range[1] + 1)]  # creating list of months
 
+        # static data doesn't change between months, so reading it only once
+        static_arr_dict = {}
+        if static_data_path_dict is not None:
+            for var in static_data_path_dict.keys():
+                if var in datasets_to_include:
+                    static_data = glob(os.path.join(static_data_path_dict[var], '*.tif'))[0]
+                    data_arr = read_raster_arr_object(static_data, get_file=False).ravel()
+
+                    data_arr[np.isnan(data_arr)] = 0  # setting nan-position values with 0
+                    static_arr_dict[var] = data_arr
+
+        # one read buffer per variable, reused for all months (all rasters are on the same grid)
+        buffer_dict = {}
+
+        def read_into_buffer(raster, buffer_name):
+            buffer_dict[buffer_name] = read_raster_into(raster, out=buffer_dict.get(buffer_name))
+            data_arr = buffer_dict[buffer_name].ravel()
+            data_arr[np.isnan(data_arr)] = 0  # setting nan-position values with 0
+
+            return data_arr
+
         for year in years_list:  # 1st loop controlling years_list
             for month in month_list:  # 2nd loop controlling months
 
@@ -62,7 +86,7 @@ def create_monthly_dataframes_for_eff_precip_prediction(years_list, month_range,
                         if var in datasets_to_include:
 
                             if var == 'GRIDMET_Precip':  # for including monthly and lagged monthly GRIDMET_precip in the dataframe
-                                current_precip_data = glob(os.path.join(monthly_data_path_dict[var], f'*{year}_{month}.tif*'))[0]
+                                current_precip_data = find_raster(monthly_data_path_dict[var], year, month)
 
                                 current_month_date = datetime(year, month, 1)
 
@@ -70,53 +94,37 @@ def create_monthly_dataframes_for_eff_precip_prediction(years_list, month_range,
                                 prev_month_date = current_month_date - timedelta(30)
                                 prev_2_month_date = current_month_date - timedelta(60)
 
-                                prev_month_precip_data = glob(os.path.join(monthly_data_path_dict[var],
-                                                                           f'*{prev_month_date.year}_{prev_month_date.month}.tif*'))[0]
-                                prev_2_month_precip_data = glob(os.path.join(monthly_data_path_dict[var],
-                                                                             f'*{prev_2_month_date.year}_{prev_2_month_date.month}.tif*'))[0]
+                                prev_month_precip_data = find_raster(monthly_data_path_dict[var],
+                                                                     prev_month_date.year, prev_month_date.month)
+                                prev_2_month_precip_data = find_raster(monthly_data_path_dict[var],
+                                                                       prev_2_month_date.year, prev_2_month_date.month)
 
                                 # reading datasets
-                                current_precip_arr = read_raster_arr_object(current_precip_data, get_file=False).flatten()
+                                current_precip_arr = read_into_buffer(current_precip_data, var)
+                                prev_month_precip_arr = read_into_buffer(prev_month_precip_data, 'GRIDMET_Precip_1_lag')
+                                prev_2_month_precip_arr = read_into_buffer(prev_2_month_precip_data, 'GRIDMET_Precip_2_lag')
 
-                                prev_month_precip_arr = read_raster_arr_object(prev_month_precip_data, get_file=False).flatten()
-                                prev_2_month_precip_arr = read_raster_arr_object(prev_2_month_precip_data, get_file=False).flatten()
-
-                                current_precip_arr[np.isnan(current_precip_arr)] = 0  # setting nan-position values with 0
-                                prev_month_precip_arr[np.isnan(prev_month_precip_arr)] = 0  # setting nan-position values with 0
-                                prev_2_month_precip_arr [np.isnan(prev_2_month_precip_arr)] = 0  # setting nan-position values with 0
-
-                                variable_dict[var] = list(current_precip_arr)
-                                variable_dict['month'] = [int(month)] * len(current_precip_arr)
-                                variable_dict['GRIDMET_Precip_1_lag'] = list(prev_month_precip_arr)
-                                variable_dict['GRIDMET_Precip_2_lag'] = list(prev_2_month_precip_arr)
+                                variable_dict[var] = current_precip_arr
+                                variable_dict['month'] = np.full(len(current_precip_arr), int(month))
+                                variable_dict['GRIDMET_Precip_1_lag'] = prev_month_precip_arr
+                                variable_dict['GRIDMET_Precip_2_lag'] = prev_2_month_precip_arr
 
                             else:
-                                monthly_data = glob(os.path.join(monthly_data_path_dict[var], f'*{year}_{month}.tif*'))[0]
-                                data_arr = read_raster_arr_object(monthly_data, get_file=False).flatten()
+                                monthly_data = find_raster(monthly_data_path_dict[var], year, month)
+                                data_arr = read_into_buffer(monthly_data, var)
 
-                                data_arr[np.isnan(data_arr)] = 0  # setting nan-position values with 0
-                                variable_dict[var] = list(data_arr)
-                                variable_dict['month'] = [int(month)] * len(data_arr)
+                                variable_dict[var] = data_arr
+                                variable_dict['month'] = np.full(len(data_arr), int(month))
 
                 # reading yearly data and storing it in a dictionary
                 if yearly_data_path_dict is not None:
                     for var in yearly_data_path_dict.keys():
                         if var in datasets_to_include:
-                            yearly_data = glob(os.path.join(yearly_data_path_dict[var], f'*{year}*.tif'))[0]
-                            data_arr = read_raster_arr_object(yearly_data, get_file=False).flatten()
+                            yearly_data = find_raster(yearly_data_path_dict[var], year)
+                            variable_dict[var] = read_into_buffer(yearly_data, var)
 
-                            data_arr[np.isnan(data_arr)] = 0  # setting nan-position values with 0
-                            variable_dict[var] = list(data_arr)
-
-                # reading static data and storing it in a dictionary
-                if static_data_path_dict is not None:
-                    for var in static_data_path_dict.keys():
-                        if var in datasets_to_include:
-                            static_data = glob(os.path.join(static_data_path_dict[var], '*.tif'))[0]
-                            data_arr = read_raster_arr_object(static_data, get_file=False).flatten()
-
-                            data_arr[np.isnan(data_arr)] = 0  # setting nan-position values with 0
-                            variable_dict[var] = list(data_arr)
+                # adding static data
+                variable_dict.update(static_arr_dict)
 
                 predictor_df = pd.DataFrame(variable_dict)
                 predictor_df = predictor_df.dropna()
@@ -162,64 +170,99 @@ def create_nan_pos_dict_for_monthly_irrigated_cropET(irrigated_cropET_dir, outpu
         pass
 
 
-def create_monthly_effective_precip_rasters(trained_model, input_csv_dir, exclude_columns,
-                                            irrig_cropET_nan_pos_dir,
-                                            prediction_name_keyword, output_dir,
-                                            ref_raster=WestUS_raster, skip_processing=False):
+def create_monthly_effective_precip_raster(input_csv, trained_model, exclude_columns, irrig_cropET_nan_pos_dir,
+                                           prediction_name_keyword, output_dir, ref_raster=WestUS_raster):
     """
-    Create monthly effective precipitation prediction raster.
+    Create effective precipitation prediction raster of a month (task of create_monthly_effective_precip_rasters()).
 
+    :param input_csv: Filepath of the month's predictor csv (named as <name>_<year>_<month>.csv).
     :param trained_model: Trained ML model object.
-    :param input_csv_dir: Filepath of input directory consisting of monthly predictor csvs for the model.
     :param exclude_columns: List of predictors to exclude from model prediction.
     :param irrig_cropET_nan_pos_dir: Filepath of input directory consisting of monthly nan position (irrigated cropET)
                                      pkl files.
     :param prediction_name_keyword: A str that will be added before prediction file name.
     :param output_dir: Filepath of output directory to store predicted rasters.
     :param ref_raster: Filepath of ref raster. Default set to WestUS reference raster.
-    :param skip_processing: Set to true to skip this processing step.
 
     :return: None.
     """
+    # ref raster shape
+    ref_arr, ref_file = read_raster_arr_object(ref_raster, use_cache=True)
+    ref_shape = ref_arr.shape
 
-    if not skip_processing:
-        makedirs([output_dir])
+    year = os.path.basename(input_csv).split('_')[1]
+    month = os.path.basename(input_csv).split('_')[2].split('.')[0]
+    print(f'Generating {prediction_name_keyword} prediction raster for year {year}, month {month}...')
 
-        # ref raster shape
-        ref_arr, ref_file = read_raster_arr_object(ref_raster)
-        ref_shape = ref_arr.shape
+    # loading input variable dataframe and filtering out columns
+    df = pd.read_csv(input_csv)
+    df = df.drop(columns=exclude_columns)
+    df = reindex_df(df)
 
-        # creating prediction raster for each month
-        input_csvs = glob(os.path.join(input_csv_dir, '*.csv'))
+    # generating prediction with trained model
+    pred_arr = trained_model.predict(df)
+    pred_arr = np.array(pred_arr)
 
-        for csv in input_csvs:
-            year = os.path.basename(csv).split('_')[1]
-            month = os.path.basename(csv).split('_')[2].split('.')[0]
-            print(f'Generating {prediction_name_keyword} prediction raster for year {year}, month {month}...')
+    # replacing values with -9999 where irrigated cropET is nan
+    irrig_cropET_nan = glob(os.path.join(irrig_cropET_nan_pos_dir, f'*{year}_{month}.pkl*'))[0]
+    nan_pos_dict = pickle.load(open(irrig_cropET_nan, mode='rb'))
 
-            # loading input variable dataframe and filtering out columns
-            df = pd.read_csv(csv)
-            df = df.drop(columns=exclude_columns)
-            df = reindex_df(df)
+    nan_key = f'Irrigated_cropET_{year}_{month}'
+    pred_arr[nan_pos_dict[nan_key]] = -9999
 
-            # generating prediction with trained model
-            pred_arr = trained_model.predict(df)
-            pred_arr = np.array(pred_arr)
+    # reshaping the prediction raster for Western US and saving
+    pred_arr = pred_arr.reshape(ref_shape)
 
-            # replacing values with -9999 where irrigated cropET is nan
-            irrig_cropET_nan = glob(os.path.join(irrig_cropET_nan_pos_dir, f'*{year}_{month}.pkl*'))[0]
-            nan_pos_dict = pickle.load(open(irrig_cropET_nan, mode='rb'))
+    output_prediction_raster = os.path.join(output_dir, f'{prediction_name_keyword}_{year}_{month}.tif')
 
-            nan_key = f'Irrigated_cropET_{year}_{month}'
-            pred_arr[nan_pos_dict[nan_key]] = -9999
+    write_array_to_raster(raster_arr=pred_arr, raster_file=ref_file, transform=ref_file.transform,
+                          output_path=output_prediction_raster)
 
-            # reshaping the prediction raster for Western US and saving
-            pred_arr = pred_arr.reshape(ref_shape)
 
-            output_prediction_raster = os.path.join(output_dir, f'{prediction_name_keyword}_{year}_{month}.tif')
+def create_monthly_effective_precip_rasters(trained_model, input_csv_dir, exclude_columns,
+                                            irrig_cropET_nan_pos_dir,
+                                            prediction_name_keyword, output_dir,
+                                            ref_raster=WestUS_raster, max_workers=None, skip_processing=False):
+    """
+    Create monthly effective precipitation prediction raster. Months are predicted in parallel (the trained model is
+    sent once to each process).
 
-            write_array_to_raster(raster_arr=pred_arr, raster_file=ref_file, transform=ref_file.transform,
-                                  output_path=output_prediction_raster)
+    :param trained_model: Trained ML model object.
+    :param input_csv_dir: Filepath of input directory consisting of monthly predictor csvs for the model.
+    :param exclude_columns: List of predictors to exclude from model prediction.
+    :param irrig_cropET_nan_pos_dir: Filepath of input directory consisting of monthly nan position (irrigated cropET)
+                                     pkl files.
+    :param prediction_name_keyword: A str that will be added before prediction file name.
+    :param output_dir: Filepath of output directory to store predicted rasters.
+    :param ref_raster: Filepath of ref raster. Default set to WestUS reference raster.
+    :param max_workers: Maximum number of parallel processes. Default set to None to pick from the number of CPUs and
+                        available memory.
+    :param skip_processing: Set to true to skip this processing step.
+
+    :return: None.
+    """
+
+    if not skip_processing:
+        makedirs([output_dir])
+
+        # creating prediction raster for each month
+        input_csvs = glob(os.path.join(input_csv_dir, '*.csv'))
+        if len(input_csvs) == 0:
+            return None
+
+        # a task holds the predictor dataframe (float64, plus a copy made while filtering/reindexing columns) and the
+        # prediction array
+        n_rows, n_cols = read_raster_metadata(ref_raster)['shape']
+        n_predictors = len(pd.read_csv(input_csvs[0], nrows=0).columns)
+        task_memory = n_rows * n_cols * 8 * (2 * n_predictors + 2)
+
+        parallel_map(create_monthly_effective_precip_raster, input_csvs,
+                     kwargs=dict(trained_model=trained_model, exclude_columns=exclude_columns,
+                                 irrig_cropET_nan_pos_dir=irrig_cropET_nan_pos_dir,
+                                 prediction_name_keyword=prediction_name_keyword, output_dir=output_dir,
+                                 ref_raster=ref_raster),
+                     task_memory=task_memory, max_workers=max_workers,
+                     desc=f'Predicting {prediction_name_keyword}')
     else:
         pass
 
@@ -252,7 +295,7 @@ def create_annual_dataframes_for_peff_frac_prediction(years_list, yearly_data_pa
                 # reading yearly data and storing it in a dictionary
                 for var in yearly_data_path_dict.keys():
                     if var in datasets_to_include:
-                        yearly_data = glob(os.path.join(yearly_data_path_dict[var], f'*{year}*.tif'))[0]
+                        yearly_data = find_raster(yearly_data_path_dict[var], year)
                         data_arr = read_raster_arr_object(yearly_data, get_file=False).flatten()
 
                         data_arr[np.isnan(data_arr)] = 0  # setting nan-position values with 0
@@ -263,7 +306,7 @@ def create_annual_dataframes_for_peff_frac_prediction(years_list, yearly_data_pa
                     for var in static_data_path_dict.keys():
                         if var in datasets_to_include:
                             static_data = glob(os.path.join(static_data_path_dict[var], '*.tif'))[0]
-                            data_arr = read_raster_arr_object(static_data, get_file=False).flatten()
+                            data_arr = read_raster_arr_object(static_data, get_file=False, use_cache=True).flatten()
 
                             data_arr[np.isnan(data_arr)] = 0  # setting nan-position values with 0
                             variable_dict[var] = list(data_arr)
@@ -335,11 +378,11 @@ def create_annual_peff_fraction_rasters(trained_model, input_csv_dir, exclude_co
         makedirs([output_dir])
 
         # ref raster shape
-        ref_arr, ref_file = read_raster_arr_object(ref_raster)
+        ref_arr, ref_file = read_raster_arr_object(ref_raster, use_cache=True)
         ref_shape = ref_arr.shape
 
         # loading lake raster data
-        lake_arr = read_raster_arr_object(lake_raster, get_file=False)
+        lake_arr = read_raster_arr_object(lake_raster, get_file=False, use_cache=True)
 
         # creating prediction raster for each year
         input_csvs = glob(os.path.join(input_csv_dir, '*.csv'))
@@ -427,17 +470,11 @@ def sum_peff_water_year(years_list, monthly_peff_dir, output_peff_dir, skip_proc
     if not skip_processing:
         print('Summing water year effective precipitation...')
 
-        makedirs([output_peff_dir])
-
-        for yr in years_list:
-            # # summing peff for water year (previous year's October to current year's september)
-            peff_prev_years = glob(os.path.join(monthly_peff_dir, f'*{yr - 1}_1[0-2].*tif'))
-            pff_data_current_years = glob(os.path.join(monthly_peff_dir, f'*{yr}_[1-9].*tif'))
-            peff_water_yr_list = peff_prev_years + pff_data_current_years
-
-            sum_rasters(raster_list=peff_water_yr_list, raster_dir=None,
-                        output_raster=os.path.join(output_peff_dir, f'effective_precip_{yr}.tif'),
-                        ref_raster=peff_water_yr_list[0])
+        # # summing peff for water year (previous year's October to current year's september)
+        aggregate_monthly_rasters(input_dir=monthly_peff_dir,
+                                  period_dict={'water_year': get_period_months('water_year', years_list)},
+                                  output_dir_dict={('water_year', 'sum'): output_peff_dir},
+                                  output_name='effective_precip')
     else:
         pass
 
@@ -460,8 +497,8 @@ def estimate_peff_precip_water_year_fraction(years_list, peff_dir_water_yr, prec
 
         for yr in years_list:
             # collecting and reading datasets
-            peff_data = glob(os.path.join(peff_dir_water_yr, f'*{yr}*.tif'))[0]
-            precip_data = glob(os.path.join(precip_dir_water_yr, f'*{yr}*.tif'))[0]
+            peff_data = find_raster(peff_dir_water_yr, yr)
+            precip_data = find_raster(precip_dir_water_yr, yr)
 
             peff_arr, file = read_raster_arr_object(peff_data)
             precip_arr = read_raster_arr_object(precip_data, get_file=False)
@@ -495,7 +532,7 @@ def process_monthly_peff_rasters_to_multiband_forGEE(years, peff_monthly_dir, ou
 
         # collecting the monthly Peff estimates serially for a year
         for month in list(range(1, 13)):
-            monthly_peff = glob(os.path.join(peff_monthly_dir, f'*{year}_{month}*.tif'))
+            monthly_peff = find_rasters(peff_monthly_dir, year=year, months=[month])
 
             if len(monthly_peff) == 0:  # in case of 2020, Peff data is available up to month 9. This blocks controls data ingestion for year 2020
                 pass
@@ -532,8 +569,8 @@ def estimate_water_yr_peff_using_peff_frac(years_list, water_year_precip_dir, wa
             print(f'Estimating water year Peff using water year Peff fraction (from water year model) for year {yr}...')
 
             # laoding and reading data
-            precip = glob(os.path.join(water_year_precip_dir, f'*{yr}*.tif'))[0]
-            peff_frac = glob(os.path.join(water_year_peff_frac_dir, f'*{yr}*.tif'))[0]
+            precip = find_raster(water_year_precip_dir, yr)
+            peff_frac = find_raster(water_year_peff_frac_dir, yr)
 
             precip_arr = read_raster_arr_object(precip, get_file=False)
             peff_frac_arr, raster_file = read_raster_arr_object(peff_frac)
@@ -587,21 +624,21 @@ def scale_monthy_peff_with_wateryr_peff_model(years_list, unscaled_peff_monthly_
 
                     # selecting the water year of total peff data based on month
                     if mn in range(10, 12 + 1):
-                        peff_unbound_wy = glob(os.path.join(unscaled_peff_water_yr_dir, f'*{yr + 1}*.tif'))[0]
+                        peff_unbound_wy = find_raster(unscaled_peff_water_yr_dir, yr + 1)
                         peff_unbound_wy_arr = read_raster_arr_object(peff_unbound_wy, get_file=False)
 
-                        peff_bound_wy = glob(os.path.join(scaled_peff_water_yr_dir, f'*{yr + 1}*.tif'))[0]
+                        peff_bound_wy = find_raster(scaled_peff_water_yr_dir, yr + 1)
                         peff_bound_wy_arr = read_raster_arr_object(peff_bound_wy, get_file=False)
 
                     elif mn in range(1, 9 + 1):
-                        peff_unbound_wy = glob(os.path.join(unscaled_peff_water_yr_dir, f'*{yr}*.tif'))[0]
+                        peff_unbound_wy = find_raster(unscaled_peff_water_yr_dir, yr)
                         peff_unbound_wy_arr = read_raster_arr_object(peff_unbound_wy, get_file=False)
 
-                        peff_bound_wy = glob(os.path.join(scaled_peff_water_yr_dir, f'*{yr}*.tif'))[0]
+                        peff_bound_wy = find_raster(scaled_peff_water_yr_dir, yr)
                         peff_bound_wy_arr = read_raster_arr_object(peff_bound_wy, get_file=False)
 
                     # selecting the monthly peff data
-                    unscaled_peff_monthly = glob(os.path.join(unscaled_peff_monthly_dir, f'*{yr}_{mn}*.tif'))[0]
+                    unscaled_peff_monthly = find_raster(unscaled_peff_monthly_dir, yr, mn)
                     unscaled_peff_monthly_arr, raster_file = read_raster_arr_object(unscaled_peff_monthly)
 
                     # scaling monthly peff with bounded peff total
@@ -115,7 +115,8 @@ if __name__ == '__main__':
                                                            datasets_to_include=datasets_to_include,
                                                            output_parquet=train_test_parquet_path,
                                                            skip_processing=skip_train_test_df_creation,
-                                                           n_partitions=5)
+                                                           n_partitions=5,
+                                                           datacube_dir='../../Data_main/Raster_data/Datacube')
 
     # # train-test split
     output_dir = '../../Eff_Precip_Model_Run/monthly_model/Model_csv'
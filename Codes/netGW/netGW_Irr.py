@@ -1,14 +1,14 @@
 import os
 import sys
 import numpy as np
-from glob import glob
 
 from os.path import dirname, abspath
 
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
-from Codes.utils.system_ops import makedirs
-from Codes.utils.raster_ops import read_raster_arr_object, write_array_to_raster
+from Codes.utils.system_ops import makedirs, parallel_map
+from Codes.utils.block_ops import apply_blockwise, block_memory_budget
+from Codes.utils.catalog_ops import find_raster
 
 no_data_value = -9999
 model_res = 0.01976293625031605786  # in deg, ~2 km
@@ -17,13 +17,43 @@ WestUS_raster = '../../Data_main/reference_rasters/Western_US_refraster_2km.tif'
 GEE_merging_refraster_large_grids = '../../Data_main/reference_rasters/GEE_merging_refraster_larger_grids.tif'
 
 
+def estimate_netGW_Irr_for_year(year, effective_precip_dir_pp, irrigated_cropET_dir, irrigated_fraction_dir,
+                                sw_cnsmp_use_dir, output_dir, ref_raster=WestUS_raster):
+    """
+    Estimate growing season net groundwater irrigation of a year (task of estimate_netGW_Irr()).
+
+    :param year: Year to process data for.
+    :param effective_precip_dir_pp: Directory path for growing season effective precipitation (post processed version).
+    :param irrigated_cropET_dir: Directory path for growing season irrigated cropET.
+    :param irrigated_fraction_dir: Directory path for irrigated cropland fraction in 2 km pixels.
+    :param sw_cnsmp_use_dir: Directory path for growing season distributed surface water consumptive use.
+    :param output_dir: Output directory to save the growing season netGW datasets.
+    :param ref_raster : Western US reference raster.
+
+    :return: None.
+    """
+    print(f'Estimating growing season netGW for {year}...')
+
+    # loading effective precipitation, irrigated cropET, irrigated fraction,
+    # and surface water irrigation datasets
+    eff_precip = find_raster(effective_precip_dir_pp, year)
+    irrigated_cropET = find_raster(irrigated_cropET_dir, year)
+    irrigated_fraction = find_raster(irrigated_fraction_dir, year)
+    sw_cnsmp_data = find_raster(sw_cnsmp_use_dir, year)
+
+    # the rasters are processed block by block to bound memory use
+    output_raster = os.path.join(output_dir, f'netGW_Irr_{year}.tif')
+    apply_blockwise(input_rasters=[eff_precip, irrigated_cropET, irrigated_fraction, sw_cnsmp_data, ref_raster],
+                    func=calc_netGW_Irr_block, output_raster=output_raster, ref_raster=ref_raster)
+
+
 def estimate_netGW_Irr(years_list, effective_precip_dir_pp, irrigated_cropET_dir,
                        irrigated_fraction_dir, sw_cnsmp_use_dir, output_dir,
-                       ref_raster=WestUS_raster, skip_processing=False):
+                       ref_raster=WestUS_raster, max_workers=None, skip_processing=False):
     """
     Estimate growing season (annual) net groundwater irrigation (consumptive groundwater use by crops or ET_gw) for
     the Western US compiling growing season irrigated cropET, growing season effective precipitation, and growing
-    season surface water irrigation that has been distributed).
+    season surface water irrigation that has been distributed). Years are processed in parallel.
 
     :param years_list: A list of years_list to process data for.
     :param effective_precip_dir_pp: Directory path for growing season effective precipitation (post processed version).
@@ -36,6 +66,8 @@ def estimate_netGW_Irr(years_list, effective_precip_dir_pp, irrigated_cropET_dir
                                 (source: USGS HUC12-level surface water irrigation dataset)
     :param output_dir: Output directory to save the growing season netGW datasets.
     :param ref_raster : Western US reference raster.
+    :param max_workers: Maximum number of parallel processes. Default set to None to pick from the number of CPUs and
+                        available memory.
     :param skip_processing: Set to True if want to skip this step.
 
     :return: None.
@@ -43,46 +75,49 @@ def estimate_netGW_Irr(years_list, effective_precip_dir_pp, irrigated_cropET_dir
     if not skip_processing:
         makedirs([output_dir])
 
-        ref_arr, ref_file = read_raster_arr_object(ref_raster)
-        for year in years_list:
-            print(f'Estimating growing season netGW for {year}...')
+        # the estimation is done block by block, so a task's memory is bounded by the block memory budget
+        parallel_map(estimate_netGW_Irr_for_year, years_list,
+                     kwargs=dict(effective_precip_dir_pp=effective_precip_dir_pp,
+                                 irrigated_cropET_dir=irrigated_cropET_dir,
+                                 irrigated_fraction_dir=irrigated_fraction_dir, sw_cnsmp_use_dir=sw_cnsmp_use_dir,
+                                 output_dir=output_dir, ref_raster=ref_raster),
+                     task_memory=block_memory_budget, max_workers=max_workers, desc='Estimating netGW')
 
-            # loading effective precipitation, irrigated cropET, irrigated fraction,
-            # and surface water irrigation datasets
-            eff_precip = glob(os.path.join(effective_precip_dir_pp, f'*{year}*.tif'))[0]
-            irrigated_cropET = glob(os.path.join(irrigated_cropET_dir, f'*{year}*.tif'))[0]
-            irrigated_fraction = glob(os.path.join(irrigated_fraction_dir, f'*{year}*.tif'))[0]
-            sw_cnsmp_data = glob(os.path.join(sw_cnsmp_use_dir, f'*{year}*.tif'))[0]
 
-            eff_precip_arr = read_raster_arr_object(eff_precip, get_file=False)
-            irrigated_cropET_arr = read_raster_arr_object(irrigated_cropET, get_file=False)
-            irrigated_frac_arr = read_raster_arr_object(irrigated_fraction, get_file=False)
-            sw_cnsmp_use_arr = read_raster_arr_object(sw_cnsmp_data, get_file=False)
+def calc_netGW_Irr_block(eff_precip_arr, irrigated_cropET_arr, irrigated_frac_arr, sw_cnsmp_use_arr, ref_arr):
+    """
+    Calculate net groundwater irrigation for a block of the input datasets (used with apply_blockwise()).
 
-            # # estimating growing season net ET (SW and GW) irrigation
-            net_et_irrig = np.where(~np.isnan(eff_precip_arr), irrigated_cropET_arr - eff_precip_arr, -9999)
+    :param eff_precip_arr: Growing season effective precipitation array.
+    :param irrigated_cropET_arr: Growing season irrigated cropET array.
+    :param irrigated_frac_arr: Irrigated cropland fraction array.
+    :param sw_cnsmp_use_arr: Growing season surface water consumptive use array.
+    :param ref_arr: Reference raster array.
 
-            # the processed net ET irrigation estimates are averaged over only irrigated areas in a pixel.
-            # before subtracting sw irrigation from this value to get netGW_irrig, the net_et_irrig need to be area
-            # averaged for 2km pixel. This will lead to area-averaged netGW estimate which can be compared to area-averaged pumping.
-            # multiplying with irrigated fraction will give the 2km pixel averaged net et irrigation estimates
-            net_et_irrig_aa = np.where(~np.isnan(net_et_irrig), net_et_irrig * irrigated_frac_arr, -9999)
+    :return: Net groundwater irrigation array.
+    """
+    # # estimating growing season net ET (SW and GW) irrigation
+    net_et_irrig = np.where(~np.isnan(eff_precip_arr), irrigated_cropET_arr - eff_precip_arr, -9999)
 
-            # netGW estimation
-            # netGW over irrigated cropland = irrigated cropET - effective precipitation - surface water irrigation
-            net_gw_irrig = np.where(~np.isnan(net_et_irrig_aa), net_et_irrig_aa - sw_cnsmp_use_arr, -9999)
+    # the processed net ET irrigation estimates are averaged over only irrigated areas in a pixel.
+    # before subtracting sw irrigation from this value to get netGW_irrig, the net_et_irrig need to be area
+    # averaged for 2km pixel. This will lead to area-averaged netGW estimate which can be compared to area-averaged pumping.
+    # multiplying with irrigated fraction will give the 2km pixel averaged net et irrigation estimates
+    net_et_irrig_aa = np.where(~np.isnan(net_et_irrig), net_et_irrig * irrigated_frac_arr, -9999)
 
-            # in case net GW is < 0 (surface water irrigation or effective precipitation is higher than
-            # irrigated cropET), netGW is assigned to 0
-            net_gw_irrig = np.where(net_gw_irrig >= 0, net_gw_irrig, -9999)
+    # netGW estimation
+    # netGW over irrigated cropland = irrigated cropET - effective precipitation - surface water irrigation
+    net_gw_irrig = np.where(~np.isnan(net_et_irrig_aa), net_et_irrig_aa - sw_cnsmp_use_arr, -9999)
 
-            # assigning 0 to all non-irrigated pixels inside the landmass of the Western US
-            # using reference raster
-            net_gw_irrig = np.where((net_gw_irrig == -9999) & (ref_arr == 0), 0, net_gw_irrig)
+    # in case net GW is < 0 (surface water irrigation or effective precipitation is higher than
+    # irrigated cropET), netGW is assigned to 0
+    net_gw_irrig = np.where(net_gw_irrig >= 0, net_gw_irrig, -9999)
 
-            output_raster = os.path.join(output_dir, f'netGW_Irr_{year}.tif')
-            write_array_to_raster(net_gw_irrig, ref_file, ref_file.transform, output_raster)
+    # assigning 0 to all non-irrigated pixels inside the landmass of the Western US
+    # using reference raster
+    net_gw_irrig = np.where((net_gw_irrig == -9999) & (ref_arr == 0), 0, net_gw_irrig)
 
+    return net_gw_irrig
 
 if __name__ == '__main__':
     # estimating netGW (coverage WestUS)
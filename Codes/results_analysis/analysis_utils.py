@@ -8,8 +8,11 @@ import geopandas as gpd
 from Codes.utils.system_ops import makedirs
 from Codes.utils.vector_ops import clip_vector
 from Codes.utils.ml_ops import create_train_test_monthly_dataframe
-from Codes.utils.raster_ops import read_raster_arr_object, write_array_to_raster, shapefile_to_raster, \
-    clip_resample_reproject_raster, make_lat_lon_array_from_raster
+from Codes.utils.catalog_ops import find_raster
+from Codes.utils.raster_ops import read_raster_arr_object, write_array_to_raster, \
+    clip_resample_reproject_raster, clip_resample_reproject_rasters, get_lat_lon_grids, rasterize_accumulate, \
+    get_accumulate_grid
+from Codes.utils.geotiff_ops import create_raster
 
 no_data_value = -9999
 model_res = 0.01976293625031605786  # in deg, ~2 km
@@ -36,34 +39,26 @@ def clip_netGW_Irr_frac_for_basin(years, basin_shp, netGW_input_dir, basin_netGW
     :return: None.
     """
 
-    for year in years:
-        print(f'Clipping growing season netGW for {year}...')
-
-        # netGW
-        netGW_raster = glob(os.path.join(netGW_input_dir, f'*{year}*.tif'))[0]
-
-        clip_resample_reproject_raster(input_raster=netGW_raster, input_shape=basin_shp,
-                                       output_raster_dir=basin_netGW_output_dir,
-                                       keyword=' ', raster_name=f'netGW_Irr_{year}.tif',
-                                       clip=True, resample=False, clip_and_resample=False,
-                                       targetaligned=True, resample_algorithm='near',
-                                       resolution=resolution,
-                                       crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                       use_ref_width_height=False)
-
-        if irr_frac_input_dir is not None:
-            print(f'Clipping irrigated fraction for {year}...')
-            # irrigation fraction
-            irr_frac_raster = glob(os.path.join(irr_frac_input_dir, f'*{year}*.tif'))[0]
-
-            clip_resample_reproject_raster(input_raster=irr_frac_raster, input_shape=basin_shp,
-                                           output_raster_dir=basin_irr_frac_output_dir,
-                                           keyword=' ', raster_name=f'Irr_frac_{year}.tif',
-                                           clip=True, resample=False, clip_and_resample=False,
-                                           targetaligned=True, resample_algorithm='near',
-                                           resolution=resolution,
-                                           crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                           use_ref_width_height=False)
+    # all years are clipped with a single warp plan (same grid and basin)
+    print(f'Clipping growing season netGW for {years}...')
+
+    # netGW
+    netGW_rasters = [find_raster(netGW_input_dir, year) for year in years]
+
+    clip_resample_reproject_rasters(input_raster_list=netGW_rasters, input_shape=basin_shp,
+                                    output_raster_dir=basin_netGW_output_dir,
+                                    raster_names=[f'netGW_Irr_{year}.tif' for year in years],
+                                    resolution=None, crs='EPSG:4269', targetaligned=True)
+
+    if irr_frac_input_dir is not None:
+        print(f'Clipping irrigated fraction for {years}...')
+        # irrigation fraction
+        irr_frac_rasters = [find_raster(irr_frac_input_dir, year) for year in years]
+
+        clip_resample_reproject_rasters(input_raster_list=irr_frac_rasters, input_shape=basin_shp,
+                                        output_raster_dir=basin_irr_frac_output_dir,
+                                        raster_names=[f'Irr_frac_{year}.tif' for year in years],
+                                        resolution=None, crs='EPSG:4269', targetaligned=True)
 
 
 def pumping_AF_pts_to_raster(years, pumping_pts_shp, pumping_attr_AF,
@@ -86,40 +81,39 @@ def pumping_AF_pts_to_raster(years, pumping_pts_shp, pumping_attr_AF,
     :return: Raster directories' path with AF and mm pumping.
     """
     # creating sub-directories
-    annual_pump_shp_dir = os.path.join(output_dir, 'annual_pumping_shp')
     pumping_AF_dir = os.path.join(output_dir, 'pumping_AF')
     interim_pumping_AF_dir = os.path.join(pumping_AF_dir, 'interim')
     pumping_mm_dir = os.path.join(output_dir, 'pumping_mm')
     interim_pumping_mm_dir = os.path.join(pumping_mm_dir, 'interim')
 
-    makedirs([annual_pump_shp_dir, pumping_AF_dir, interim_pumping_AF_dir,
-              pumping_mm_dir, interim_pumping_mm_dir])
+    makedirs([pumping_AF_dir, interim_pumping_AF_dir, pumping_mm_dir, interim_pumping_mm_dir])
 
     # loading pumping shapefile
     pumping_gdf = gpd.read_file(pumping_pts_shp)
 
-    # looping by year and processing pumping shapefile to raster
+    # converting yearly pumping point dataset into yearly AF rasters (all years in a single pass).
+    # all pumping inside a 2 km pixel will be summed
+    # the generated raster is for the whole Western US with 0 values outside the basin
+    print(f'Converting pumping AF shapefile to AF rasters for {years}...')
+    pumping_AF_arr_dict = rasterize_accumulate(pumping_gdf, value_attrs=[pumping_attr_AF], ref_raster=ref_raster,
+                                               resolution=resolution, group_attr=year_attr, groups=years)
+    transform, _ = get_accumulate_grid(ref_raster, resolution)
+
+    # looping by year and saving pumping rasters
+    pumping_AF_rasters, pumping_mm_rasters = [], []
     for year in years:
-        print(f'Converting pumping AF shapefile to mm raster for {year}...')
-
-        # filtering pumping dataset by year (unit Acre-ft) and saving it
-        gdf_filtered = pumping_gdf[pumping_gdf[year_attr] == year]
-        annual_filtered_shp = os.path.join(annual_pump_shp_dir, f'pumping_{year}.shp')
-        gdf_filtered.to_file(annual_filtered_shp)
-
-        # converting yearly pumping point dataset into yearly AF raster.
-        # all pumping inside a 2 km pixel will be summed
-        # the generated raster is for the whole Western US with 0 values outside the basin
-        output_AF_raster = f'pumping_{year}_AF.tif'
-        pumping_AF_raster = shapefile_to_raster(input_shape=annual_filtered_shp,
-                                                output_dir=interim_pumping_AF_dir,
-                                                raster_name=output_AF_raster, use_attr=True,
-                                                attribute=pumping_attr_AF, add=True,
-                                                ref_raster=ref_raster, resolution=resolution)
+        print(f'Converting pumping AF to mm raster for {year}...')
+
+        pumping_AF_arr = pumping_AF_arr_dict[year][pumping_attr_AF]
+
+        pumping_AF_raster = os.path.join(interim_pumping_AF_dir, f'pumping_{year}_AF.tif')
+        with create_raster(pumping_AF_raster, height=pumping_AF_arr.shape[0], width=pumping_AF_arr.shape[1],
+                           count=1, dtype=np.float32, crs=pumping_gdf.crs, transform=transform,
+                           nodata=no_data_value) as dst:
+            dst.write(pumping_AF_arr, 1)
 
         # converting pumping unit from AF to mm
         # pixels with no pumping or zero pumping is assigned to 0 (need the 'no pumping' info for GW models..)
-        pumping_AF_arr, file = read_raster_arr_object(pumping_AF_raster)
 
         # area of a 2 km pixel
         area_mm2_single_pixel = (2193 * 1000) * (2193 * 1000)  # unit in mm2
@@ -127,29 +121,24 @@ def pumping_AF_pts_to_raster(years, pumping_pts_shp, pumping_attr_AF,
         pumping_mm_arr = np.where(~np.isnan(pumping_AF_arr), pumping_AF_arr * 1233481837548 /
                                   area_mm2_single_pixel, 0)
 
-        pumping_raster_name = f'pumping_{year}_mm.tif'
         pumping_mm_raster = os.path.join(interim_pumping_mm_dir, '', f'pumping_{year}_mm.tif')
-        write_array_to_raster(pumping_mm_arr, file, file.transform, pumping_mm_raster)
-
-        # # clipping data only to required basin
-        # pumping AF data
-        clip_resample_reproject_raster(input_raster=pumping_AF_raster,
-                                       input_shape=basin_shp, output_raster_dir=pumping_AF_dir,
-                                       keyword=' ', raster_name=output_AF_raster,
-                                       clip=True, resample=False, clip_and_resample=False,
-                                       targetaligned=True, resample_algorithm='near',
-                                       resolution=model_res,
-                                       crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                       use_ref_width_height=False)
-        # pumping mm data
-        clip_resample_reproject_raster(input_raster=pumping_mm_raster,
-                                       input_shape=basin_shp, output_raster_dir=pumping_mm_dir,
-                                       keyword=' ', raster_name=pumping_raster_name,
-                                       clip=True, resample=False, clip_and_resample=False,
-                                       targetaligned=True, resample_algorithm='near',
-                                       resolution=model_res,
-                                       crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                       use_ref_width_height=False)
+        with create_raster(pumping_mm_raster, height=pumping_mm_arr.shape[0], width=pumping_mm_arr.shape[1],
+                           count=1, dtype=pumping_mm_arr.dtype, crs=pumping_gdf.crs, transform=transform,
+                           nodata=no_data_value) as dst:
+            dst.write(pumping_mm_arr, 1)
+
+        pumping_AF_rasters.append(pumping_AF_raster)
+        pumping_mm_rasters.append(pumping_mm_raster)
+
+    # # clipping data only to required basin (all years with a single warp plan)
+    # pumping AF data
+    clip_resample_reproject_rasters(input_raster_list=pumping_AF_rasters, input_shape=basin_shp,
+                                    output_raster_dir=pumping_AF_dir, resolution=None, crs='EPSG:4269',
+                                    targetaligned=True)
+    # pumping mm data
+    clip_resample_reproject_rasters(input_raster_list=pumping_mm_rasters, input_shape=basin_shp,
+                                    output_raster_dir=pumping_mm_dir, resolution=None, crs='EPSG:4269',
+                                    targetaligned=True)
 
     return pumping_AF_dir, pumping_mm_dir
 
@@ -181,12 +170,13 @@ def compile_pixelwise_basin_df_for_netGW_pumping(years, basin_netGW_dir, output_
 
     # lopping through each year and storing data in a list
     for year in years:
-        netGW_data = glob(os.path.join(basin_netGW_dir, f'*{year}*.tif'))[0]
+        netGW_data = find_raster(basin_netGW_dir, year)
         netGW_arr = read_raster_arr_object(netGW_data, get_file=False).flatten()
 
-        lon_arr, lat_arr = make_lat_lon_array_from_raster(netGW_data)
-        lon_arr = lon_arr.flatten()
-        lat_arr = lat_arr.flatten()
+        # pixel center coordinates from the raster's affine transform (cached per basin grid)
+        lon_arr, lat_arr = get_lat_lon_grids(netGW_data, offset='center', dtype=np.float64)
+        lon_arr = lon_arr.ravel()
+        lat_arr = lat_arr.ravel()
 
         year_list = [year] * len(netGW_arr)
 
@@ -196,8 +186,8 @@ def compile_pixelwise_basin_df_for_netGW_pumping(years, basin_netGW_dir, output_
         extract_dict['lat'].extend(list(lat_arr))
 
         if basin_pumping_AF_dir and basin_pumping_mm_dir:     # reading pumping data if directories are provided
-            pumping_mm_data = glob(os.path.join(basin_pumping_mm_dir, f'*{year}*.tif'))[0]
-            pumping_AF_data = glob(os.path.join(basin_pumping_AF_dir, f'*{year}*.tif'))[0]
+            pumping_mm_data = find_raster(basin_pumping_mm_dir, year)
+            pumping_AF_data = find_raster(basin_pumping_AF_dir, year)
 
             pump_mm_arr = read_raster_arr_object(pumping_mm_data, get_file=False).flatten()
             pump_AF_arr = read_raster_arr_object(pumping_AF_data, get_file=False).flatten()
@@ -244,7 +234,7 @@ def compile_pixelwise_netGW_to_annual_df(years, basin_netGW_dir, output_csv):
 
     # lopping through each year and storing data in a list
     for year in years:
-        netGW_data = glob(os.path.join(basin_netGW_dir, f'*{year}*.tif'))[0]
+        netGW_data = find_raster(basin_netGW_dir, year)
         netGW_arr = read_raster_arr_object(netGW_data, get_file=False).flatten()
 
         year_list = [year] * len(netGW_arr)
@@ -448,7 +438,7 @@ def aggregate_netGW_insitu_usgs_pumping_to_annualCSV_NV_UT(years, basin_netGW_di
 
     # lopping through each year and storing data in a list
     for year in years:
-        netGW_data = glob(os.path.join(basin_netGW_dir, f'*{year}*.tif'))[0]
+        netGW_data = find_raster(basin_netGW_dir, year)
 
         netGW_arr = read_raster_arr_object(netGW_data, get_file=False).flatten()
         year_list = [year] * len(netGW_arr)
@@ -968,7 +958,7 @@ def extract_pumping_estimate_with_lat_lon(years, input_csv, input_data_dir, resa
     makedirs([resampled_output_dir])
     # looping through each year and extracting values in each coordinate
     for year in years:
-        pumping_data = glob(os.path.join(input_data_dir, f'*{year}*.tif'))[0]
+        pumping_data = find_raster(input_data_dir, year)
         raster_name = os.path.basename(pumping_data)
 
         # resampling pumping data as it might be only for a region, but to extract data it need to be of
@@ -1026,7 +1016,7 @@ def process_and_aggregate_irrigated_acres(years, irr_cropland_input_dir, irr_fra
         print(f'Clipping irrigated cropland and fraction data for {year}...')
 
         # irrigation fraction
-        irr_frac_raster = glob(os.path.join(irr_frac_input_dir, f'*{year}*.tif'))[0]
+        irr_frac_raster = find_raster(irr_frac_input_dir, year)
 
         basin_irr_frac_data = clip_resample_reproject_raster(input_raster=irr_frac_raster, input_shape=basin_shp,
                                                              output_raster_dir=basin_irr_frac_output_dir,
@@ -1038,7 +1028,7 @@ def process_and_aggregate_irrigated_acres(years, irr_cropland_input_dir, irr_fra
                                                              use_ref_width_height=False)
 
         # irrigation cropland
-        irr_crop_raster = glob(os.path.join(irr_cropland_input_dir, f'*{year}*.tif'))[0]
+        irr_crop_raster = find_raster(irr_cropland_input_dir, year)
 
         basin_irr_cropland_data = clip_resample_reproject_raster(input_raster=irr_crop_raster, input_shape=basin_shp,
                                                                  output_raster_dir=basin_irr_cropland_output_dir,
@@ -1321,37 +1311,23 @@ def clip_Peff_for_basin(years, basin_shp, Peff_input_dir, basin_Peff_output_dir,
     """
     makedirs([basin_Peff_output_dir])
 
-    for year in years:
-        if month_range is None:
-            print(f'Clipping effective precipitation for {year}...')
+    # all rasters are clipped with a single warp plan (same grid and basin)
+    if month_range is None:
+        print(f'Clipping effective precipitation for {years}...')
 
-            peff_raster = glob(os.path.join(Peff_input_dir, f'*{year}*.tif'))[0]
+        peff_rasters = [find_raster(Peff_input_dir, year) for year in years]
+        keyword = basin_code
 
-            clip_resample_reproject_raster(input_raster=peff_raster, input_shape=basin_shp,
-                                           output_raster_dir=basin_Peff_output_dir,
-                                           keyword=basin_code, raster_name=None,
-                                           clip=True, resample=False, clip_and_resample=False,
-                                           targetaligned=True, resample_algorithm='near',
-                                           resolution=resolution,
-                                           crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                           use_ref_width_height=False)
-
-        else:  # for monthly effective precipitation estimates
-            months = list(range(month_range[0], month_range[1] + 1))
-
-            for month in months:
-                print(f'Clipping effective precipitation for {year=}, {month=} ...')
+    else:  # for monthly effective precipitation estimates
+        months = list(range(month_range[0], month_range[1] + 1))
+        print(f'Clipping effective precipitation for {years=}, {months=} ...')
 
-                peff_raster = glob(os.path.join(Peff_input_dir, f'*{year}_{month}*.tif'))[0]
+        peff_rasters = [find_raster(Peff_input_dir, year, month) for year in years for month in months]
+        keyword = ' '
 
-                clip_resample_reproject_raster(input_raster=peff_raster, input_shape=basin_shp,
-                                               output_raster_dir=basin_Peff_output_dir,
-                                               keyword=' ', raster_name=None,
-                                               clip=True, resample=False, clip_and_resample=False,
-                                               targetaligned=True, resample_algorithm='near',
-                                               resolution=resolution,
-                                               crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                               use_ref_width_height=False)
+    clip_resample_reproject_rasters(input_raster_list=peff_rasters, input_shape=basin_shp,
+                                    output_raster_dir=basin_Peff_output_dir, keyword=keyword,
+                                    resolution=None, crs='EPSG:4269', targetaligned=True)
 
 
 def clip_precip_for_basin(years, basin_shp, precip_input_dir, basin_precip_output_dir,
@@ -1372,36 +1348,23 @@ def clip_precip_for_basin(years, basin_shp, precip_input_dir, basin_precip_outpu
     """
     makedirs([basin_precip_output_dir])
 
-    for year in years:
-        if month_range is None:
-            print(f'Clipping water year precipitation for {year}...')
-
-            precip_raster = glob(os.path.join(precip_input_dir, f'*{year}*.tif'))[0]
+    # all rasters are clipped with a single warp plan (same grid and basin)
+    if month_range is None:
+        print(f'Clipping water year precipitation for {years}...')
 
-            clip_resample_reproject_raster(input_raster=precip_raster, input_shape=basin_shp,
-                                           output_raster_dir=basin_precip_output_dir,
-                                           keyword=basin_code, raster_name=None,
-                                           clip=True, resample=False, clip_and_resample=False,
-                                           targetaligned=True, resample_algorithm='near',
-                                           resolution=resolution,
-                                           crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                           use_ref_width_height=False)
-        else:  # for monthly precipitation estimates
-            months = list(range(month_range[0], month_range[1] + 1))
+        precip_rasters = [find_raster(precip_input_dir, year) for year in years]
+        keyword = basin_code
 
-            for month in months:
-                print(f'Clipping monthly precipitation for {year=}, {month=} ...')
+    else:  # for monthly monthly precipitation estimates
+        months = list(range(month_range[0], month_range[1] + 1))
+        print(f'Clipping monthly precipitation for {years=}, {months=} ...')
 
-                precip_raster = glob(os.path.join(precip_input_dir, f'*{year}_{month}*.tif'))[0]
+        precip_rasters = [find_raster(precip_input_dir, year, month) for year in years for month in months]
+        keyword = ' '
 
-                clip_resample_reproject_raster(input_raster=precip_raster, input_shape=basin_shp,
-                                               output_raster_dir=basin_precip_output_dir,
-                                               keyword=' ', raster_name=None,
-                                               clip=True, resample=False, clip_and_resample=False,
-                                               targetaligned=True, resample_algorithm='near',
-                                               resolution=resolution,
-                                               crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                               use_ref_width_height=False)
+    clip_resample_reproject_rasters(input_raster_list=precip_rasters, input_shape=basin_shp,
+                                    output_raster_dir=basin_precip_output_dir, keyword=keyword,
+                                    resolution=None, crs='EPSG:4269', targetaligned=True)
 
 
 def compile_basin_growS_peff_water_yr_precip_to_csv(years, basin_peff_dir, basin_water_yr_precip_dir,
@@ -1433,8 +1396,8 @@ def compile_basin_growS_peff_water_yr_precip_to_csv(years, basin_peff_dir, basin
 
     # lopping through each year and storing data in a list
     for year in years:
-        peff_data = glob(os.path.join(basin_peff_dir, f'*{year}*.tif'))[0]
-        precip_data = glob(os.path.join(basin_water_yr_precip_dir, f'*{year}*.tif'))[0]
+        peff_data = find_raster(basin_peff_dir, year)
+        precip_data = find_raster(basin_water_yr_precip_dir, year)
 
         peff_arr = read_raster_arr_object(peff_data, get_file=False).flatten()
         precip_arr = read_raster_arr_object(precip_data, get_file=False).flatten()
@@ -1510,7 +1473,7 @@ def compile_basin_monthly_peff_to_csv(years, month_range, basin_peff_dir, basin_
         months = list(range(month_range[0], month_range[1]+1))
 
         for month in months:
-            peff_data = glob(os.path.join(basin_peff_dir, f'*{year}_{month}*.tif'))[0]
+            peff_data = find_raster(basin_peff_dir, year, month)
 
             peff_arr = read_raster_arr_object(peff_data, get_file=False).flatten()
 
@@ -1569,7 +1532,7 @@ def compile_basin_monthly_precip_mv_avg_to_csv(years, month_range, basin_precip_
         months = list(range(month_range[0], month_range[1] + 1))
 
         for month in months:
-            precip_data = glob(os.path.join(basin_precip_dir, f'*{year}_{month}*.tif'))[0]
+            precip_data = find_raster(basin_precip_dir, year, month)
 
             precip_arr = read_raster_arr_object(precip_data, get_file=False).flatten()
 
@@ -3,6 +3,7 @@ import numpy as np
 from glob import glob
 
 from Codes.utils.system_ops import makedirs
+from Codes.utils.stats_ops import calc_raster_moments
 from Codes.utils.raster_ops import read_raster_arr_object, write_array_to_raster
 
 
@@ -19,21 +20,12 @@ def coef_var_openET_models(years, model_dir_dict, netGW_dir, stdv_output_dir):
         sims_data = glob(os.path.join(model_dir_dict['SIMS'], f'*{year}*'))[0]
         disalexi_data = glob(os.path.join(model_dir_dict['DISALEXI'], f'*{year}*'))[0]
 
-        # reading each model's data
-        ssebop_arr = read_raster_arr_object(ssebop_data, get_file=False)
-        eemetric_arr = read_raster_arr_object(eemetric_data, get_file=False)
-        geesebal_arr = read_raster_arr_object(geesebal_data, get_file=False)
-        ptjpl_arr = read_raster_arr_object(ptjpl_data, get_file=False)
-        sims_arr = read_raster_arr_object(sims_data, get_file=False)
-        disalexi_arr = read_raster_arr_object(disalexi_data, get_file=False)
-
-        # estimating standard deviation of the models at annual scale
-        stacked_arrays = np.stack([ssebop_arr, eemetric_arr, geesebal_arr,
-                                   ptjpl_arr, sims_arr, disalexi_arr], axis=0)
-        stdv_per_element = np.std(stacked_arrays, axis=0)
-
-        # estimating annual mean
-        mean_per_element = np.mean(stacked_arrays, axis=0)
+        # estimating standard deviation and mean of the models at annual scale by streaming each model's data
+        # one at a time
+        model_stats = calc_raster_moments([ssebop_data, eemetric_data, geesebal_data,
+                                           ptjpl_data, sims_data, disalexi_data], stats=['std', 'mean', 'coef_var'])
+        stdv_per_element = model_stats['std']
+        mean_per_element = model_stats['mean']
 
         # reading netGW data. will be used as filter
         netGW_data = glob(os.path.join(netGW_dir, f'*{year}*'))[0]
@@ -54,7 +46,7 @@ def coef_var_openET_models(years, model_dir_dict, netGW_dir, stdv_output_dir):
 
         # calculating coef. of variation
         coef_variation_arr = np.where((stdv_per_element != -9999) & (mean_per_element != -9999),
-                                      stdv_per_element /mean_per_element, -9999)
+                                      model_stats['coef_var'], -9999)
         coef_var_raster = os.path.join(stdv_output_dir, f'openET_coef_var_{year}.tif')
         write_array_to_raster(raster_arr=coef_variation_arr, raster_file=file, transform=file.transform,
                               output_path=coef_var_raster)
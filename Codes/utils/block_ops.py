@@ -0,0 +1,157 @@
+import numpy as np
+import rasterio as rio
+from contextlib import ExitStack
+from rasterio.windows import Window
+
+from Codes.utils.geotiff_ops import create_raster, get_raster_tile_rows
+
+no_data_value = -9999
+
+# default memory budget (bytes) of the block-wise engine. Covers the input blocks, the output block and the
+# temporaries created by the block function.
+block_memory_budget = 256 * 1024 ** 2  # 256 MB
+
+# number of block-sized temporaries assumed to be created by a block function (chained np.where etc.)
+block_temp_factor = 4
+
+
+def get_block_shape(height, width, n_arrays, block_size=None, memory_budget=block_memory_budget, itemsize=4,
+                    tile_rows=None):
+    """
+    Get the (rows, cols) shape of the blocks to process a raster with. Row strips are aligned to the internal tiles
+    of the output raster, so a tile row is never split between two strips (compressed twice).
+
+    :param height: Height (number of rows) of the raster.
+    :param width: Width (number of columns) of the raster.
+    :param n_arrays: Number of raster arrays (inputs + output) held per block.
+    :param block_size: Size of square blocks (in pixels). Default set to None to use full-width row strips sized by
+                       the memory budget.
+    :param memory_budget: Memory budget (bytes) of the block-wise operation. Default set to 256 MB.
+    :param itemsize: Bytes per pixel of the arrays. Default set to 4 (float32).
+    :param tile_rows: Internal tile height (rows) of the output raster (see geotiff_ops.get_raster_tile_rows()). Row
+                      strips are rounded down to a multiple of it (minimum one tile). Default set to None to not align.
+
+    :return: A tuple of (block rows, block cols).
+    """
+    if block_size is not None:
+        return min(int(block_size), height), min(int(block_size), width)
+
+    bytes_per_row = width * itemsize * (n_arrays + block_temp_factor)
+    block_rows = int(max(1, min(height, memory_budget // bytes_per_row)))
+
+    if tile_rows is not None and block_rows < height:
+        block_rows = min(height, max(tile_rows, block_rows // tile_rows * tile_rows))
+
+    return block_rows, width
+
+
+def iter_block_windows(height, width, block_rows, block_cols):
+    """
+    Iterate over the windows of a raster grid, block by block (row major).
+
+    :param height: Height (number of rows) of the raster.
+    :param width: Width (number of columns) of the raster.
+    :param block_rows: Number of rows in a block.
+    :param block_cols: Number of columns in a block.
+
+    :return: A generator of rasterio Windows.
+    """
+    for row_off in range(0, height, block_rows):
+        for col_off in range(0, width, block_cols):
+            yield Window(col_off=col_off, row_off=row_off,
+                         width=min(block_cols, width - col_off), height=min(block_rows, height - row_off))
+
+
+def get_nodata_mask(arr, nodata):
+    """
+    Get the nodata mask of a raster array. Used by all raster readers so that they mask nodata the same way. The
+    nodata value is compared with np.isclose (values rounded by a dtype cast still match) and a nan nodata value
+    matches the nan pixels.
+
+    :param arr: Raster array.
+    :param nodata: Nodata value of the raster. Can be None, 0, or nan.
+
+    :return: Boolean array (True at nodata pixels). None if nodata is None.
+    """
+    if nodata is None:
+        return None
+    elif np.isnan(nodata):
+        return np.isnan(arr)
+    else:
+        return np.isclose(arr, nodata)
+
+
+def read_block(dataset, window, band=1):
+    """
+    Read a block of a raster as float32 array with nodata set to np.nan (same as read_raster_arr_object).
+
+    :param dataset: Rasterio dataset (read mode).
+    :param window: Rasterio Window of the block.
+    :param band: Selected band to read. Default set to 1.
+
+    :return: Block array.
+    """
+    block_arr = dataset.read(band, window=window).astype(np.float32)
+
+    nodata_mask = get_nodata_mask(block_arr, dataset.nodata)
+    if nodata_mask is not None:
+        block_arr[nodata_mask] = np.nan
+
+    return block_arr
+
+
+def apply_blockwise(input_rasters, func, output_raster, ref_raster=None, block_size=None,
+                    memory_budget=block_memory_budget, bands=None, dtype=np.float32, nodata=no_data_value,
+                    write_options=None):
+    """
+    Apply a per-pixel function on aligned rasters block by block and write the output raster block by block. Peak
+    memory is bounded by the memory budget (or block size) regardless of the grid size.
+
+    :param input_rasters: A list of input raster filepaths. All rasters must be on the same grid.
+    :param func: Function applied on each block. Takes the input block arrays (float32, nodata as np.nan) as positional
+                 arguments in the order of input_rasters and returns the output block array.
+    :param output_raster: Filepath of output raster.
+    :param ref_raster: Raster filepath to get the output grid (crs, transform, shape) from. Default set to None to use
+                       the first input raster.
+    :param block_size: Size of square blocks (in pixels). Default set to None to use full-width row strips sized by
+                       memory_budget.
+    :param memory_budget: Memory budget (bytes) of the operation. Default set to 256 MB.
+    :param bands: A list of bands to read from each input raster. Default set to None to read band 1 of all.
+    :param dtype: Output raster data type. Default set to np.float32. Set to None to use the data type of the array
+                  returned by func.
+    :param nodata: No data value of output raster. Default set to -9999.
+    :param write_options: A dictionary of GeoTIFF creation options (compress, blockxsize, cog, etc.) to override the
+                          pipeline-wide defaults of geotiff_ops. Default set to None.
+
+    :return: Output raster filepath.
+    """
+    if bands is None:
+        bands = [1] * len(input_rasters)
+
+    with ExitStack() as stack:
+        datasets = [stack.enter_context(rio.open(raster)) for raster in input_rasters]
+        ref_file = stack.enter_context(rio.open(ref_raster)) if ref_raster is not None else datasets[0]
+        height, width = ref_file.shape
+
+        for raster, src in zip(input_rasters, datasets):
+            if src.shape != (height, width) or not src.transform.almost_equals(ref_file.transform):
+                raise ValueError(f'{raster} is not aligned with the output grid of the block-wise operation')
+
+        block_rows, block_cols = get_block_shape(height, width, n_arrays=len(input_rasters) + 1,
+                                                 block_size=block_size, memory_budget=memory_budget,
+                                                 tile_rows=get_raster_tile_rows(write_options))
+
+        dst = None
+        for window in iter_block_windows(height, width, block_rows, block_cols):
+            block_arrs = [read_block(src, window, band) for src, band in zip(datasets, bands)]
+            out_block = np.asarray(func(*block_arrs))
+
+            if dst is None:  # output raster is created with the first block (to get dtype from it if needed)
+                dtype = out_block.dtype if dtype is None else dtype
+                dst = stack.enter_context(create_raster(output_raster, height=height, width=width, count=1,
+                                                        dtype=dtype, crs=ref_file.crs, transform=ref_file.transform,
+                                                        nodata=nodata, write_options=write_options))
+
+            dst.write(out_block.astype(dtype, copy=False), 1, window=window)
+
+    return output_raster
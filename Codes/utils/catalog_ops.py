@@ -0,0 +1,250 @@
+import os
+import re
+import json
+
+# name of the sidecar file holding the parsed catalog of a raster directory
+catalog_sidecar_name = '.raster_catalog.json'
+
+# filename convention of the rasters: {name}_{year}.tif, {name}_{year}_{month}.tif, optionally followed by a
+# non-numeric suffix (e.g., pumping_2000_AF.tif). Files without a year (e.g., Slope.tif) are catalogued as static.
+raster_file_pattern = re.compile(r'^(?P<name>.+?)_(?P<year>(?:19|20)\d{2})(?:_(?P<month>\d{1,2}))?'
+                                 r'(?:_(?P<suffix>[A-Za-z][A-Za-z0-9]*(?:_[A-Za-z][A-Za-z0-9]*)*))?\.tif$')
+
+# in-memory catalogs of the directories looked up in this session, {absolute dir path: (dir mtime_ns, catalog)}
+_catalog_cache = {}
+
+
+def parse_raster_filename(filename):
+    """
+    Parse a raster filename following the {name}_{year}_{month}.tif convention.
+
+    :param filename: Raster filename (or filepath).
+
+    :return: A tuple of (name, year, month). year/month is None for yearly/static rasters. Returns None if the file
+             isn't a '.tif' or the month isn't valid.
+    """
+    filename = os.path.basename(filename)
+    if not filename.endswith('.tif'):
+        return None
+
+    match = raster_file_pattern.match(filename)
+    if match is None:
+        return filename[:-4], None, None
+
+    name = match.group('name')
+    if match.group('suffix') is not None:
+        name = f"{name}_{match.group('suffix')}"
+
+    year = int(match.group('year'))
+    month = match.group('month')
+    if month is not None:
+        month = int(month)
+        if not 1 <= month <= 12:
+            return None
+
+    return name, year, month
+
+
+def _scan_raster_dir(directory):
+    """
+    Scan a directory once and parse the names of the rasters in it.
+
+    :param directory: Directory path of the rasters.
+
+    :return: A list of [name, year, month, filename] records.
+    """
+    records = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+
+            parsed = parse_raster_filename(entry.name)
+            if parsed is not None:
+                records.append([*parsed, entry.name])
+
+    return records
+
+
+def _build_catalog(records):
+    """
+    Build the lookup dictionary of a catalog from its records.
+
+    :param records: A list of [name, year, month, filename] records.
+
+    :return: A dictionary with (year, month) as keys and list of (name, filename) as values.
+    """
+    catalog = {}
+    for name, year, month, filename in records:
+        catalog.setdefault((year, month), []).append((name, filename))
+
+    for key in catalog:
+        catalog[key].sort()
+
+    return catalog
+
+
+def _read_catalog_sidecar(directory, dir_mtime_ns):
+    """
+    Read the catalog sidecar file of a directory if it is still valid. The sidecar is touched after being written,
+    so it is valid as long as the directory hasn't been modified (files added/removed/renamed) after it.
+
+    :param directory: Directory path of the rasters.
+    :param dir_mtime_ns: Current modification time of the directory (in ns).
+
+    :return: A list of [name, year, month, filename] records. None if the sidecar doesn't exist or is outdated.
+    """
+    sidecar = os.path.join(directory, catalog_sidecar_name)
+    try:
+        if os.stat(sidecar).st_mtime_ns < dir_mtime_ns:
+            return None
+
+        with open(sidecar) as f:
+            return json.load(f)['records']
+
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_catalog_sidecar(directory, records):
+    """
+    Write the catalog sidecar file of a directory. Silently skipped if the directory isn't writable.
+
+    :param directory: Directory path of the rasters.
+    :param records: A list of [name, year, month, filename] records.
+
+    :return: None.
+    """
+    sidecar = os.path.join(directory, catalog_sidecar_name)
+    temp_file = sidecar + '.tmp'
+    try:
+        with open(temp_file, 'w') as f:
+            json.dump({'records': records}, f)
+
+        os.replace(temp_file, sidecar)
+
+        # the rename updates the directory mtime; touching the sidecar afterwards keeps it newer than the directory
+        os.utime(sidecar)
+
+    except OSError:
+        pass
+
+
+def get_raster_catalog(directory, use_sidecar=True):
+    """
+    Get the catalog of the rasters in a directory. The directory is scanned only once and the catalog is kept in
+    memory (and in a sidecar file) until the directory's modification time changes.
+
+    :param directory: Directory path of the rasters.
+    :param use_sidecar: Set to False to not read/write the sidecar file.
+
+    :return: A dictionary with (year, month) as keys and list of (name, filename) as values. year/month is None for
+             yearly/static rasters.
+    """
+    directory = os.path.abspath(directory)
+    dir_mtime_ns = os.stat(directory).st_mtime_ns
+
+    cached = _catalog_cache.get(directory)
+    if cached is not None and cached[0] == dir_mtime_ns:
+        return cached[1]
+
+    records = _read_catalog_sidecar(directory, dir_mtime_ns) if use_sidecar else None
+
+    if records is None:
+        records = _scan_raster_dir(directory)
+
+        if use_sidecar:
+            _write_catalog_sidecar(directory, records)
+            dir_mtime_ns = os.stat(directory).st_mtime_ns
+
+    catalog = _build_catalog(records)
+    _catalog_cache[directory] = (dir_mtime_ns, catalog)
+
+    return catalog
+
+
+def clear_raster_catalog_cache():
+    """
+    Clear the in-memory raster catalogs. The sidecar files are kept.
+
+    :return: None.
+    """
+    _catalog_cache.clear()
+
+
+def find_raster(directory, year=None, month=None, name=None):
+    """
+    Find the raster of a (year, month) in a directory using an exact key lookup on the directory's catalog.
+
+    :param directory: Directory path of the rasters.
+    :param year: Year of the raster. Set to None (default) for static rasters.
+    :param month: Month of the raster. Set to None (default) for yearly/static rasters.
+    :param name: Name of the raster variable (filename without the date part), e.g., 'Irrigated_cropET'. Only needed
+                 if the directory holds multiple variables for the same (year, month). Default set to None.
+
+    :return: Filepath of the raster.
+    """
+    key = (None if year is None else int(year), None if month is None else int(month))
+    matches = get_raster_catalog(directory).get(key, [])
+
+    if name is not None:
+        matches = [match for match in matches if match[0] == name]
+
+    if len(matches) == 0:
+        raise FileNotFoundError(f'No raster found for name={name}, year={year}, month={month} in {directory}')
+    elif len(matches) > 1:
+        raise ValueError(f'Multiple rasters found for year={year}, month={month} in {directory}: '
+                         f'{[match[1] for match in matches]}. Set the name to select one.')
+
+    return os.path.join(directory, matches[0][1])
+
+
+def find_rasters(directory, year=None, months=None, keys=None, name=None):
+    """
+    Find the rasters of multiple (year, month) in a directory. Missing (year, month) are skipped.
+
+    :param directory: Directory path of the rasters.
+    :param year: Year of the rasters. Used with months to select the monthly rasters of that year. If months is None,
+                 all rasters (monthly and yearly) of that year are returned.
+    :param months: A list of months to select for the year. Default set to None.
+    :param keys: A list of (year, month) tuples to select. Overrides year/months. Set month to None for yearly rasters.
+                 Default set to None to select all dated rasters (if year is also None).
+    :param name: Name of the raster variable (filename without the date part). Default set to None.
+
+    :return: A list of raster filepaths sorted by (year, month) of the rasters.
+    """
+    catalog = get_raster_catalog(directory)
+
+    if keys is not None:
+        keys = [(int(yr), None if mn is None else int(mn)) for yr, mn in keys]
+    elif year is not None and months is not None:
+        keys = [(int(year), int(mn)) for mn in months]
+    elif year is not None:
+        keys = sorted([key for key in catalog if key[0] == int(year)], key=lambda k: (k[1] is not None, k[1]))
+    else:
+        keys = sorted([key for key in catalog if key[0] is not None],
+                      key=lambda k: (k[0], k[1] is not None, k[1]))
+
+    raster_list = []
+    for key in keys:
+        for raster_name, filename in catalog.get(key, []):
+            if name is None or raster_name == name:
+                raster_list.append(os.path.join(directory, filename))
+
+    return raster_list
+
+
+def list_catalog_keys(directory, name=None):
+    """
+    List the (year, month) keys available in a directory.
+
+    :param directory: Directory path of the rasters.
+    :param name: Name of the raster variable (filename without the date part). Default set to None.
+
+    :return: A sorted list of (year, month) tuples. year/month is None for yearly/static rasters.
+    """
+    catalog = get_raster_catalog(directory)
+    keys = [key for key, matches in catalog.items()
+            if name is None or any(match[0] == name for match in matches)]
+
+    return sorted(keys, key=lambda k: (k[0] is not None, k[0] or 0, k[1] is not None, k[1] or 0))
@@ -0,0 +1,676 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+from glob import glob
+import rasterio as rio
+from rasterio.windows import Window
+from affine import Affine
+
+from Codes.utils.system_ops import makedirs
+from Codes.utils.geotiff_ops import create_raster
+from Codes.utils.catalog_ops import find_raster
+from Codes.utils.raster_ops import read_raster_arr_object, read_raster_into
+
+no_data_value = -9999
+WestUS_raster = '../../Data_main/reference_rasters/Western_US_refraster_2km.tif'
+
+# serializes prefix-sum cube builds and queries, as pipeline steps running in threads share the cube (a build rewrites
+# the variables and the cube index a concurrent query reads)
+_prefix_cube_lock = threading.RLock()
+
+# name of the sidecar file holding the grid definition and the (year, month) -> time slot index of each variable
+cube_index_name = 'cube_index.json'
+
+# suffixes of the variables holding the prefix (cumulative) sums and cumulative nan counts of a monthly variable
+prefix_sum_suffix = '_prefix_sum'
+prefix_nan_count_suffix = '_prefix_nan_count'
+
+# filename patterns of monthly ({name}_{year}_{month}.tif) and yearly ({name}_{year}.tif) rasters
+monthly_file_pattern = re.compile(r'_(\d{4})_(\d{1,2})\.tif$')
+yearly_file_pattern = re.compile(r'_(\d{4})\.tif$')
+
+
+def make_datacube_key(year, month=None):
+    """
+    Make the time key of a datacube slice.
+
+    :param year: Year of the slice. Set to None for static datasets.
+    :param month: Month of the slice. Set to None for yearly/static datasets.
+
+    :return: Time key string, e.g., '2010_4' (monthly), '2010' (yearly), 'static'.
+    """
+    if year is None:
+        return 'static'
+    elif month is None:
+        return f'{int(year)}'
+    else:
+        return f'{int(year)}_{int(month)}'
+
+
+def read_datacube_index(cube_dir):
+    """
+    Read the index (grid definition and variable time slots) of a datacube.
+
+    :param cube_dir: Directory path of the datacube.
+
+    :return: A dictionary of the datacube index.
+    """
+    index_file = os.path.join(cube_dir, cube_index_name)
+
+    with open(index_file, 'r') as f:
+        cube_index = json.load(f)
+
+    return cube_index
+
+
+def write_datacube_index(cube_dir, cube_index):
+    """
+    Write the index of a datacube. The index is written to a temporary file first and then renamed, so an
+    interrupted write never leaves a broken index behind.
+
+    :param cube_dir: Directory path of the datacube.
+    :param cube_index: A dictionary of the datacube index.
+
+    :return: None.
+    """
+    index_file = os.path.join(cube_dir, cube_index_name)
+    temp_file = index_file + '.tmp'
+
+    with open(temp_file, 'w') as f:
+        json.dump(cube_index, f, indent=1)
+
+    os.replace(temp_file, index_file)
+
+
+def create_datacube(cube_dir, ref_raster=WestUS_raster, nodata=no_data_value):
+    """
+    Create an (empty) datacube on the grid of a reference raster. If the datacube already exists, the existing
+    index is kept.
+
+    Each variable of the datacube is stored as a memory-mapped binary file of shape (n_time, height, width) with the
+    pixels of a time slot stored contiguously, so a single month can be read/written in one I/O call and a window
+    for all months of a variable can be sliced without opening any GeoTIFF.
+
+    :param cube_dir: Directory path of the datacube.
+    :param ref_raster: Filepath of reference raster defining the grid. Default set to WestUS_raster.
+    :param nodata: No data value used when exporting slices to raster. Default set to -9999.
+
+    :return: Directory path of the datacube.
+    """
+    makedirs([cube_dir])
+
+    if not os.path.exists(os.path.join(cube_dir, cube_index_name)):
+        with rio.open(ref_raster) as ref_file:
+            cube_index = {'height': ref_file.height,
+                          'width': ref_file.width,
+                          'transform': list(ref_file.transform.to_gdal()),
+                          'crs': ref_file.crs.to_wkt(),
+                          'nodata': nodata,
+                          'variables': {}}
+
+        write_datacube_index(cube_dir, cube_index)
+
+    return cube_dir
+
+
+def get_datacube_profile(cube_dir):
+    """
+    Get the grid information of a datacube.
+
+    :param cube_dir: Directory path of the datacube.
+
+    :return: A dictionary with height, width, transform (Affine), crs (wkt), and nodata of the datacube grid.
+    """
+    cube_index = read_datacube_index(cube_dir)
+
+    profile = {'height': cube_index['height'],
+               'width': cube_index['width'],
+               'transform': Affine.from_gdal(*cube_index['transform']),
+               'crs': cube_index['crs'],
+               'nodata': cube_index['nodata']}
+
+    return profile
+
+
+def list_datacube_keys(cube_dir, variable):
+    """
+    List the time keys stored for a variable of a datacube.
+
+    :param cube_dir: Directory path of the datacube.
+    :param variable: Variable name.
+
+    :return: A list of time keys (in the order of their time slots). Empty list if the variable does not exist.
+    """
+    cube_index = read_datacube_index(cube_dir)
+
+    if variable not in cube_index['variables']:
+        return []
+
+    return list(cube_index['variables'][variable]['keys'])
+
+
+def _open_variable_memmap(cube_dir, cube_index, variable, mode='r'):
+    """
+    Open the memory-mapped array of a datacube variable.
+
+    :param cube_dir: Directory path of the datacube.
+    :param cube_index: A dictionary of the datacube index.
+    :param variable: Variable name.
+    :param mode: Memory-map mode. Default set to 'r' (read only).
+
+    :return: A numpy memmap of shape (n_time, height, width).
+    """
+    var_info = cube_index['variables'][variable]
+    n_time = len(var_info['keys'])
+    shape = (n_time, cube_index['height'], cube_index['width'])
+
+    return np.memmap(os.path.join(cube_dir, var_info['file']), dtype=np.dtype(var_info['dtype']),
+                     mode=mode, shape=shape)
+
+
+def write_to_datacube(cube_dir, variable, arr, year=None, month=None, dtype=np.float32):
+    """
+    Write a 2D array to the (variable, year, month) slot of a datacube. A new time slot is appended to the variable's
+    file if the key does not exist yet; otherwise the existing slot is overwritten in place.
+
+    :param cube_dir: Directory path of the datacube (created with create_datacube()).
+    :param variable: Variable name, e.g., 'GRIDMET_Precip'.
+    :param arr: 2D array on the datacube grid. No data pixels should be NaN.
+    :param year: Year of the slice. Set to None for static datasets.
+    :param month: Month of the slice. Set to None for yearly/static datasets.
+    :param dtype: Data type used when the variable is created. Default set to np.float32.
+
+    :return: Time key of the written slice.
+    """
+    cube_index = read_datacube_index(cube_dir)
+    height, width = cube_index['height'], cube_index['width']
+
+    if arr.shape != (height, width):
+        raise ValueError(f'array shape {arr.shape} does not match the datacube grid {(height, width)}')
+
+    if variable not in cube_index['variables']:
+        cube_index['variables'][variable] = {'file': f'{variable}.dat', 'dtype': np.dtype(dtype).name, 'keys': []}
+
+    var_info = cube_index['variables'][variable]
+    key = make_datacube_key(year, month)
+    slot_dtype = np.dtype(var_info['dtype'])
+
+    if key in var_info['keys']:
+        # overwriting the existing time slot in place
+        slot = var_info['keys'].index(key)
+        cube = _open_variable_memmap(cube_dir, cube_index, variable, mode='r+')
+        cube[slot] = arr
+        cube.flush()
+        del cube
+
+    else:
+        # slots are stored contiguously along the time axis, so a new slot is simply appended to the file.
+        # Bytes beyond the indexed slots (an append interrupted before the index was updated) are truncated first,
+        # otherwise the new slot would be written after them
+        slot_bytes = height * width * slot_dtype.itemsize
+        indexed_bytes = len(var_info['keys']) * slot_bytes
+
+        with open(os.path.join(cube_dir, var_info['file']), 'ab') as f:
+            file_bytes = f.seek(0, os.SEEK_END)
+            if file_bytes < indexed_bytes:
+                raise ValueError(f'{variable} file of datacube {cube_dir} is shorter than its index '
+                                 f'({file_bytes} < {indexed_bytes} bytes)')
+            elif file_bytes > indexed_bytes:
+                f.truncate(indexed_bytes)
+
+            f.write(np.ascontiguousarray(arr, dtype=slot_dtype).tobytes())
+
+        var_info['keys'].append(key)
+        write_datacube_index(cube_dir, cube_index)
+
+    return key
+
+
+def read_from_datacube(cube_dir, variable, year=None, month=None, window=None, cube_index=None):
+    """
+    Read a (variable, year, month) slice from a datacube.
+
+    :param cube_dir: Directory path of the datacube.
+    :param variable: Variable name.
+    :param year: Year of the slice. Set to None for static datasets.
+    :param month: Month of the slice. Set to None for yearly/static datasets.
+    :param window: A rasterio Window to read a part of the grid. Default set to None to read the full grid.
+    :param cube_index: A dictionary of the datacube index (see read_datacube_index()) already read by the caller.
+                       Default set to None to read it from cube_dir.
+
+    :return: 2D array (a copy, safe to modify) of the slice. No data pixels are NaN.
+    """
+    if cube_index is None:
+        cube_index = read_datacube_index(cube_dir)
+    key = make_datacube_key(year, month)
+
+    try:
+        slot = cube_index['variables'][variable]['keys'].index(key)
+    except (KeyError, ValueError):
+        raise KeyError(f'{variable} {key} not found in datacube {cube_dir}')
+
+    cube = _open_variable_memmap(cube_dir, cube_index, variable)
+    rows, cols = _window_to_slices(window, cube_index)
+    arr = np.array(cube[slot, rows, cols])
+    del cube
+
+    return arr
+
+
+def read_datacube_timeseries(cube_dir, variable, keys=None, window=None, cube_index=None):
+    """
+    Read multiple time slices of a datacube variable (e.g., all months of GRIDMET_Precip for a window) in a single
+    slicing call.
+
+    :param cube_dir: Directory path of the datacube.
+    :param variable: Variable name.
+    :param keys: A list of time keys (see make_datacube_key()) to read. Default set to None to read all slots.
+    :param window: A rasterio Window to read a part of the grid. Default set to None to read the full grid.
+    :param cube_index: A dictionary of the datacube index (see read_datacube_index()) already read by the caller.
+                       Default set to None to read it from cube_dir.
+
+    :return: A 3D array of shape (n_keys, height, width) and the list of time keys in the same order.
+    """
+    if cube_index is None:
+        cube_index = read_datacube_index(cube_dir)
+    stored_keys = cube_index['variables'][variable]['keys']
+
+    if keys is None:
+        keys = list(stored_keys)
+        slots = slice(None)
+    else:
+        slot_dict = {k: slot for slot, k in enumerate(stored_keys)}
+        missing_keys = [k for k in keys if k not in slot_dict]
+        if len(missing_keys) > 0:
+            raise KeyError(f'{variable} {missing_keys} not found in datacube {cube_dir}')
+
+        slots = [slot_dict[k] for k in keys]
+
+        # contiguous slots are read as a slice (a view on the memmap) instead of fancy indexing
+        if slots == list(range(slots[0], slots[-1] + 1)):
+            slots = slice(slots[0], slots[-1] + 1)
+
+    cube = _open_variable_memmap(cube_dir, cube_index, variable)
+    rows, cols = _window_to_slices(window, cube_index)
+    arr = np.array(cube[slots, rows, cols])
+    del cube
+
+    return arr, keys
+
+
+def _window_to_slices(window, cube_index):
+    """
+    Convert a rasterio Window to row and column slices clipped to the datacube grid.
+
+    :param window: A rasterio Window or None (full grid).
+    :param cube_index: A dictionary of the datacube index.
+
+    :return: Row slice, column slice.
+    """
+    if window is None:
+        return slice(None), slice(None)
+
+    window = Window(*window) if not isinstance(window, Window) else window
+    (row_start, row_stop), (col_start, col_stop) = window.toranges()
+
+    rows = slice(max(int(row_start), 0), min(int(row_stop), cube_index['height']))
+    cols = slice(max(int(col_start), 0), min(int(col_stop), cube_index['width']))
+
+    return rows, cols
+
+
+def get_raster_source(raster):
+    """
+    Get the source record (absolute filepath, modification time) of a raster ingested into a datacube.
+
+    :param raster: Raster filepath.
+
+    :return: A list of [absolute filepath, modification time in ns].
+    """
+    return [os.path.abspath(raster), os.stat(raster).st_mtime_ns]
+
+
+def is_datacube_slice_current(cube_index, variable, key, raster):
+    """
+    Check that a datacube slice exists and was ingested from the current version of a raster (same file, not modified
+    since), so the slice can be read instead of the raster.
+
+    :param cube_index: A dictionary of the datacube index (see read_datacube_index()).
+    :param variable: Variable name.
+    :param key: Time key of the slice (see make_datacube_key()).
+    :param raster: Filepath of the source raster of the slice.
+
+    :return: True if the slice is current, False otherwise.
+    """
+    var_info = cube_index['variables'].get(variable)
+    if var_info is None:
+        return False
+
+    # sources are recorded only for ingested slices, so a recorded source also means the slice exists
+    source = var_info.get('sources', {}).get(key)
+
+    return source is not None and source == get_raster_source(raster)
+
+
+def ingest_rasters_to_datacube(cube_dir, variable, raster_dir, ref_raster=WestUS_raster, search_by='*.tif',
+                               overwrite=False):
+    """
+    Ingest the rasters of a directory into a datacube variable. Monthly ({name}_{year}_{month}.tif), yearly
+    ({name}_{year}.tif) and static (single raster) filenames are recognized. Rasters must be on the datacube grid.
+    The source (filepath, modification time) of each slice is recorded in the index, and slices whose raster has
+    changed since they were ingested are re-ingested.
+
+    :param cube_dir: Directory path of the datacube. Will be created on the reference raster grid if not existing.
+    :param variable: Variable name to store the rasters under.
+    :param raster_dir: Input directory of the rasters.
+    :param ref_raster: Filepath of reference raster used for creating a new datacube. Default set to WestUS_raster.
+    :param search_by: Input raster search criteria. Default set to '*.tif'.
+    :param overwrite: Set to True to re-write slices that already exist in the datacube. Default set to False.
+
+    :return: A list of the ingested time keys.
+    """
+    create_datacube(cube_dir, ref_raster=ref_raster)
+    cube_index = read_datacube_index(cube_dir)
+
+    input_rasters = glob(os.path.join(raster_dir, search_by))
+
+    # parsing (year, month) from the filenames
+    parsed_rasters = []
+    for raster in input_rasters:
+        raster_name = os.path.basename(raster)
+
+        monthly_match = monthly_file_pattern.search(raster_name)
+        yearly_match = yearly_file_pattern.search(raster_name)
+
+        if monthly_match:
+            parsed_rasters.append((int(monthly_match.group(1)), int(monthly_match.group(2)), raster))
+        elif yearly_match:
+            parsed_rasters.append((int(yearly_match.group(1)), None, raster))
+        elif len(input_rasters) == 1:
+            parsed_rasters.append((None, None, raster))
+        else:
+            print(f'could not parse year/month from {raster_name}. Skipping it...')
+
+    # ingesting in chronological order so that consecutive months occupy consecutive time slots
+    parsed_rasters = sorted(parsed_rasters, key=lambda x: (x[0] or 0, x[1] or 0))
+
+    ingested_keys = []
+    source_dict = {}
+    for year, month, raster in parsed_rasters:
+        key = make_datacube_key(year, month)
+        if is_datacube_slice_current(cube_index, variable, key, raster) and not overwrite:
+            continue
+
+        arr = read_raster_arr_object(raster, get_file=False)
+        write_to_datacube(cube_dir, variable, arr, year=year, month=month)
+        ingested_keys.append(key)
+        source_dict[key] = get_raster_source(raster)
+
+    if len(source_dict) > 0:
+        cube_index = read_datacube_index(cube_dir)
+        var_info = cube_index['variables'][variable]
+        var_info['sources'] = {**var_info.get('sources', {}), **source_dict}
+        write_datacube_index(cube_dir, cube_index)
+
+    print(f'ingested {len(ingested_keys)} rasters of {variable} into datacube')
+
+    return ingested_keys
+
+
+def export_datacube_slice_to_raster(cube_dir, variable, output_raster, year=None, month=None, nodata=None):
+    """
+    Export a (variable, year, month) slice of a datacube to a GeoTIFF.
+
+    :param cube_dir: Directory path of the datacube.
+    :param variable: Variable name.
+    :param output_raster: Filepath of output raster.
+    :param year: Year of the slice. Set to None for static datasets.
+    :param month: Month of the slice. Set to None for yearly/static datasets.
+    :param nodata: No data value of the output raster. Default set to None to use the datacube's no data value.
+
+    :return: Filepath of output raster.
+    """
+    profile = get_datacube_profile(cube_dir)
+    nodata = profile['nodata'] if nodata is None else nodata
+
+    arr = read_from_datacube(cube_dir, variable, year=year, month=month)
+    arr[np.isnan(arr)] = nodata
+
+    makedirs([os.path.dirname(output_raster)])
+
+    with create_raster(
+            output_raster,
+            height=profile['height'],
+            width=profile['width'],
+            dtype=arr.dtype,
+            count=1,
+            crs=profile['crs'],
+            transform=profile['transform'],
+            nodata=nodata
+    ) as dst:
+        dst.write(arr, 1)
+
+    return output_raster
+
+
+def delete_datacube_variable(cube_dir, variable):
+    """
+    Delete a variable (its binary file and index entry) from a datacube.
+
+    :param cube_dir: Directory path of the datacube.
+    :param variable: Variable name.
+
+    :return: None.
+    """
+    cube_index = read_datacube_index(cube_dir)
+
+    if variable in cube_index['variables']:
+        var_file = os.path.join(cube_dir, cube_index['variables'][variable]['file'])
+        if os.path.exists(var_file):
+            os.remove(var_file)
+
+        del cube_index['variables'][variable]
+        write_datacube_index(cube_dir, cube_index)
+
+
+def get_month_index(year, month):
+    """
+    Get the running month index (months counted from January of year 0) of a (year, month). Consecutive months have
+    consecutive indices, also across year boundaries.
+
+    :param year: Year.
+    :param month: Month (int or array of months, e.g., growing season start months).
+
+    :return: Month index (same type as month).
+    """
+    return year * 12 + month - 1
+
+
+def get_prefix_cube_variable(variable, raster_dir):
+    """
+    Get the prefix-sum cube variable name of a monthly variable. The name includes a short hash of the raster
+    directory, so cubes of the same variable from different directories (e.g., unscaled and scaled effective
+    precipitation) can share a datacube without rebuilding each other.
+
+    :param variable: Variable name, e.g., 'effective_precip'.
+    :param raster_dir: Directory path of the monthly rasters.
+
+    :return: Variable name of the prefix-sum cube, e.g., 'effective_precip_1a2b3c4d'.
+    """
+    dir_hash = hashlib.md5(os.path.abspath(raster_dir).encode()).hexdigest()[:8]
+
+    return f'{variable}_{dir_hash}'
+
+
+def _get_prefix_cube_month_rasters(raster_dir, start_idx, end_idx, name=None):
+    """
+    Find the monthly rasters of a prefix-sum cube (see build_prefix_sum_cube()).
+
+    :param raster_dir: Directory path of the monthly rasters.
+    :param start_idx: Month index of the first month.
+    :param end_idx: Month index of the last month.
+    :param name: Name of the monthly raster variable. Default set to None.
+
+    :return: A list of (year, month, raster filepath or None if missing) in chronological order, and a dictionary of
+             {month index (str): source of the raster (see get_raster_source()) or None if missing}.
+    """
+    month_rasters = []
+    for month_idx in range(start_idx, end_idx + 1):
+        year, month = divmod(month_idx, 12)
+        try:
+            month_rasters.append((year, month + 1, find_raster(raster_dir, year, month + 1, name=name)))
+        except FileNotFoundError:
+            month_rasters.append((year, month + 1, None))
+
+    month_source_dict = {str(month_idx): None if raster is None else get_raster_source(raster)
+                         for month_idx, (_, _, raster) in enumerate(month_rasters, start=start_idx)}
+
+    return month_rasters, month_source_dict
+
+
+def build_prefix_sum_cube(cube_dir, variable, raster_dir, start_month, end_month, ref_raster=None, name=None):
+    """
+    Build the prefix-sum (cumulative sum over months) cube of a monthly variable, so that the sum of any per-pixel
+    [start, end] month window (also across year boundaries) is two gathers and a subtraction
+    (see sum_prefix_cube_window()).
+
+    Two variables are stored in the datacube: <variable>_prefix_sum (float64, cumulative sum of the valid values
+    through each month) and <variable>_prefix_nan_count (int32, cumulative count of nan values through each month).
+    Slot 0 holds the month before start_month (all zeros). Missing monthly rasters are counted as nan months.
+
+    The source (filepath, modification time) of each month is recorded. An existing prefix-sum cube of the variable
+    is reused (not rebuilt) if it covers the [start_month, end_month] range and none of the monthly rasters of the
+    range has changed, been added, or been removed since it was built. Otherwise it is rebuilt.
+
+    :param cube_dir: Directory path of the datacube. Will be created on the grid of ref_raster if not existing.
+    :param variable: Variable name to store the prefix-sum cube under, e.g., 'effective_precip'.
+    :param raster_dir: Directory path of the monthly rasters.
+    :param start_month: (year, month) of the first month of the cube.
+    :param end_month: (year, month) of the last month of the cube.
+    :param ref_raster: Filepath of reference raster used for creating a new datacube. Default set to None to use the
+                       first monthly raster.
+    :param name: Name of the monthly raster variable (filename without the date part). Only needed if raster_dir holds
+                 multiple variables. Default set to None.
+
+    :return: Directory path of the datacube.
+    """
+    with _prefix_cube_lock:
+        start_idx, end_idx = get_month_index(*start_month), get_month_index(*end_month)
+        sum_var, nan_var = variable + prefix_sum_suffix, variable + prefix_nan_count_suffix
+
+        month_rasters, month_source_dict = _get_prefix_cube_month_rasters(raster_dir, start_idx, end_idx, name)
+
+        # reusing the existing cube if it was built from the same monthly rasters
+        if os.path.exists(os.path.join(cube_dir, cube_index_name)):
+            cube_index = read_datacube_index(cube_dir)
+            if sum_var in cube_index['variables'] and nan_var in cube_index['variables']:
+                built_source_dict = cube_index['variables'][sum_var].get('month_sources', {})
+                if all(built_source_dict.get(month_idx, False) == source
+                       for month_idx, source in month_source_dict.items()):
+                    print(f'reusing {variable} prefix-sum cube (monthly rasters unchanged)...')
+                    return cube_dir
+
+                # the rebuilt cube also covers the months of the existing cube, so callers querying different month
+                # ranges of the same variable don't rebuild each other's cube
+                if len(built_source_dict) > 0:
+                    built_month_idx = [int(month_idx) for month_idx in built_source_dict]
+                    start_idx, end_idx = min(start_idx, min(built_month_idx)), max(end_idx, max(built_month_idx))
+                    month_rasters, month_source_dict = _get_prefix_cube_month_rasters(raster_dir, start_idx, end_idx,
+                                                                                      name)
+
+        if ref_raster is None:
+            ref_raster = next(raster for _, _, raster in month_rasters if raster is not None)
+
+        create_datacube(cube_dir, ref_raster=ref_raster)
+        for var in (sum_var, nan_var):
+            delete_datacube_variable(cube_dir, var)
+
+        profile = get_datacube_profile(cube_dir)
+        shape = (profile['height'], profile['width'])
+        cum_sum_arr = np.zeros(shape, dtype=np.float64)
+        cum_nan_arr = np.zeros(shape, dtype=np.int32)
+
+        # slot 0: cumulative values through the month before start_month
+        prev_year, prev_month = divmod(start_idx - 1, 12)
+        write_to_datacube(cube_dir, sum_var, cum_sum_arr, year=prev_year, month=prev_month + 1, dtype=np.float64)
+        write_to_datacube(cube_dir, nan_var, cum_nan_arr, year=prev_year, month=prev_month + 1, dtype=np.int32)
+
+        arr = None  # read buffer reused for all months
+        for year, month, raster in month_rasters:
+            if raster is None:
+                print(f'{variable} raster for year {year}, month {month} not found. Counting it as nan month...')
+                cum_nan_arr += 1
+            else:
+                arr = read_raster_into(raster, out=arr)
+                nan_arr = np.isnan(arr)
+
+                np.add(cum_sum_arr, arr, out=cum_sum_arr, where=~nan_arr)
+                cum_nan_arr += nan_arr
+
+            write_to_datacube(cube_dir, sum_var, cum_sum_arr, year=year, month=month)
+            write_to_datacube(cube_dir, nan_var, cum_nan_arr, year=year, month=month)
+
+        # month index of slot 0 is saved to locate the slot of any month without parsing the keys. The month sources are
+        # saved last, so an interrupted build is never reused
+        cube_index = read_datacube_index(cube_dir)
+        for var in (sum_var, nan_var):
+            cube_index['variables'][var]['first_month_index'] = start_idx - 1
+        cube_index['variables'][sum_var]['month_sources'] = month_source_dict
+        write_datacube_index(cube_dir, cube_index)
+
+        return cube_dir
+
+
+def sum_prefix_cube_window(cube_dir, variable, start_idx_arr, end_idx_arr):
+    """
+    Sum a monthly variable over per-pixel [start, end] month windows using its prefix-sum cube
+    (see build_prefix_sum_cube()). The sum is prefix[end] - prefix[start - 1], so each query reads two values per
+    pixel regardless of the window length.
+
+    :param cube_dir: Directory path of the datacube.
+    :param variable: Variable name of the prefix-sum cube.
+    :param start_idx_arr: Array (or scalar) of the month index (see get_month_index()) of the first month of the
+                          windows. nan for no data pixels.
+    :param end_idx_arr: Array (or scalar) of the month index of the last month of the windows (inclusive). nan for
+                        no data pixels.
+
+    :return: Float32 array of window sums. Pixels with nan start/end are nan. Pixels with an empty window
+             (end < start) are 0. Pixels whose window has any nan month or falls outside the cube months are nan.
+    """
+    with _prefix_cube_lock:
+        cube_index = read_datacube_index(cube_dir)
+        sum_var, nan_var = variable + prefix_sum_suffix, variable + prefix_nan_count_suffix
+        first_month_idx = cube_index['variables'][sum_var]['first_month_index']
+        n_slots = len(cube_index['variables'][sum_var]['keys'])
+
+        shape = (cube_index['height'], cube_index['width'])
+        start_idx_arr = np.broadcast_to(np.asarray(start_idx_arr, dtype=np.float64), shape)
+        end_idx_arr = np.broadcast_to(np.asarray(end_idx_arr, dtype=np.float64), shape)
+
+        is_valid = ~np.isnan(start_idx_arr) & ~np.isnan(end_idx_arr)
+        with np.errstate(invalid='ignore'):
+            has_window = is_valid & (end_idx_arr >= start_idx_arr)
+
+        # slots of prefix[start - 1] and prefix[end]
+        lower_slot_arr = np.where(has_window, start_idx_arr - 1 - first_month_idx, 0).astype(np.int64)
+        upper_slot_arr = np.where(has_window, end_idx_arr - first_month_idx, 0).astype(np.int64)
+        in_cube = (lower_slot_arr >= 0) & (upper_slot_arr < n_slots)
+
+        window_sum_arr = np.full(shape, np.nan, dtype=np.float32)
+        window_sum_arr[is_valid & ~has_window] = 0
+
+        rows, cols = np.nonzero(has_window & in_cube)
+        lower_slots, upper_slots = lower_slot_arr[rows, cols], upper_slot_arr[rows, cols]
+
+        sum_cube = _open_variable_memmap(cube_dir, cube_index, sum_var)
+        nan_cube = _open_variable_memmap(cube_dir, cube_index, nan_var)
+
+        window_sums = sum_cube[upper_slots, rows, cols] - sum_cube[lower_slots, rows, cols]
+        window_nans = nan_cube[upper_slots, rows, cols] - nan_cube[lower_slots, rows, cols]
+        window_sum_arr[rows, cols] = np.where(window_nans > 0, np.nan, window_sums)
+        del sum_cube, nan_cube
+
+        return window_sum_arr
@@ -0,0 +1,396 @@
+import os
+import time
+import struct
+import random
+import asyncio
+import zipfile
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+download_chunk_size = 1024 * 1024  # bytes written to disk at a time (1 MB)
+
+# HTTP status codes of throttled/overloaded servers. Downloads are retried (with fewer connections) on these
+retry_status_codes = (429, 500, 502, 503, 504)
+
+# network errors that are retried (with fewer connections)
+retry_exceptions = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+# TIFF data types of the strip/tile offsets and byte counts tags ({type: (struct format, size)})
+_tiff_int_types = {3: ('H', 2), 4: ('I', 4), 16: ('Q', 8)}
+
+
+def _read_tiff_tag_values(file, byte_order, value_type, count, value_field, inline_size):
+    """
+    Read the values of an integer TIFF tag (inline or at an offset).
+
+    :param file: Opened TIFF file (binary mode).
+    :param byte_order: struct byte order ('<' or '>').
+    :param value_type: TIFF data type of the tag.
+    :param count: Number of values of the tag.
+    :param value_field: Bytes of the value/offset field of the IFD entry.
+    :param inline_size: Size (bytes) of the value/offset field (4 for TIFF, 8 for BigTIFF).
+
+    :return: A tuple of values. None if the tag isn't of an integer type.
+    """
+    if value_type not in _tiff_int_types:
+        return None
+
+    fmt, size = _tiff_int_types[value_type]
+    if count * size <= inline_size:
+        data = value_field[:count * size]
+    else:
+        offset = struct.unpack(byte_order + ('I' if inline_size == 4 else 'Q'), value_field)[0]
+        file.seek(offset)
+        data = file.read(count * size)
+        if len(data) < count * size:
+            return None
+
+    return struct.unpack(f'{byte_order}{count}{fmt}', data)
+
+
+def is_valid_geotiff(file_path):
+    """
+    Check that a (Big)TIFF file is complete from its header, without reading the pixels. Checks the TIFF signature,
+    that the first IFD is within the file, and that all strips/tiles of the first image end within the file (catches
+    truncated downloads and error pages saved as .tif).
+
+    :param file_path: Filepath of the GeoTIFF.
+
+    :return: True if the file looks complete, False otherwise.
+    """
+    try:
+        file_size = os.path.getsize(file_path)
+
+        with open(file_path, 'rb') as f:
+            header = f.read(16)
+            if len(header) < 8 or header[:2] not in (b'II', b'MM'):
+                return False
+
+            byte_order = '<' if header[:2] == b'II' else '>'
+            version = struct.unpack(byte_order + 'H', header[2:4])[0]
+
+            if version == 42:  # TIFF
+                ifd_offset = struct.unpack(byte_order + 'I', header[4:8])[0]
+                count_fmt, count_size, entry_size, inline_size = 'H', 2, 12, 4
+            elif version == 43 and len(header) == 16:  # BigTIFF
+                ifd_offset = struct.unpack(byte_order + 'Q', header[8:16])[0]
+                count_fmt, count_size, entry_size, inline_size = 'Q', 8, 20, 8
+            else:
+                return False
+
+            if ifd_offset < 8 or ifd_offset + count_size > file_size:
+                return False
+
+            f.seek(ifd_offset)
+            n_entries = struct.unpack(byte_order + count_fmt, f.read(count_size))[0]
+            if n_entries == 0 or ifd_offset + count_size + n_entries * entry_size + inline_size > file_size:
+                return False
+
+            entries = f.read(n_entries * entry_size)
+
+            tag_dict = {}
+            for i in range(n_entries):
+                entry = entries[i * entry_size: (i + 1) * entry_size]
+                tag, value_type = struct.unpack(byte_order + 'HH', entry[:4])
+                if tag in (273, 279, 324, 325):  # strip offsets, strip byte counts, tile offsets, tile byte counts
+                    count = struct.unpack(byte_order + ('I' if inline_size == 4 else 'Q'),
+                                          entry[4: 4 + inline_size])[0]
+                    tag_dict[tag] = (value_type, count, entry[4 + inline_size:])
+
+            for offset_tag, count_tag in ((273, 279), (324, 325)):
+                if offset_tag in tag_dict and count_tag in tag_dict:
+                    offsets = _read_tiff_tag_values(f, byte_order, *tag_dict[offset_tag], inline_size)
+                    byte_counts = _read_tiff_tag_values(f, byte_order, *tag_dict[count_tag], inline_size)
+                    if offsets is None or byte_counts is None or len(offsets) != len(byte_counts):
+                        return False
+
+                    if max(offset + count for offset, count in zip(offsets, byte_counts)) > file_size:
+                        return False
+
+                    return True
+
+            return False  # no strips/tiles
+
+    except (OSError, struct.error):
+        return False
+
+
+def is_valid_download(file_path):
+    """
+    Cheap check of a downloaded file. GeoTIFFs are checked from the header (is_valid_geotiff()), zip files from the
+    central directory, other files should not be empty.
+
+    :param file_path: Filepath of the downloaded file.
+
+    :return: True if the file looks complete, False otherwise.
+    """
+    if not os.path.isfile(file_path):
+        return False
+
+    extension = os.path.splitext(file_path.removesuffix('.part'))[1].lower()
+    if extension in ('.tif', '.tiff'):
+        return is_valid_geotiff(file_path)
+    elif extension == '.zip':
+        return zipfile.is_zipfile(file_path)
+    else:
+        return os.path.getsize(file_path) > 0
+
+
+def get_backoff_delay(attempt, base_delay=1, max_delay=60, retry_after=None):
+    """
+    Get the wait time before retrying a download (exponential backoff with full jitter).
+
+    :param attempt: Retry attempt number (starting at 0).
+    :param base_delay: Wait time (seconds) of the first retry (before jitter). Default set to 1.
+    :param max_delay: Maximum wait time (seconds). Default set to 60.
+    :param retry_after: Wait time (seconds) requested by the server (Retry-After header). Default set to None.
+
+    :return: Wait time in seconds.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, max_delay))
+
+    return delay
+
+
+def create_download_session(pool_size=16):
+    """
+    Create a requests session with a connection pool, so connections are reused across downloads.
+
+    :param pool_size: Number of connections to keep per host. Default set to 16.
+
+    :return: A requests.Session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def stream_url_to_file(session, url, file_path, timeout=(30, 300)):
+    """
+    Download a url to a file, streaming the response to disk. The data is written to <file_path>.part and renamed to
+    file_path only if it is complete (Content-Length matches and is_valid_download()), so file_path is never a partial
+    download.
+
+    :param session: A requests session (see create_download_session()).
+    :param url: Url to download.
+    :param file_path: Filepath to save the data to.
+    :param timeout: A tuple of (connect, read) timeouts in seconds. Default set to (30, 300).
+
+    :return: A tuple of (status, retry_after). status is 200 if downloaded, the HTTP status code if the request failed,
+             or 'corrupt' if the downloaded data is incomplete. retry_after is the Retry-After wait time (seconds) sent
+             by the server (None if not sent).
+    """
+    part_file = f'{file_path}.part'
+
+    try:
+        with session.get(url, stream=True, timeout=timeout, allow_redirects=True) as r:
+            if not r.ok:
+                try:
+                    retry_after = float(r.headers.get('Retry-After'))
+                except (TypeError, ValueError):
+                    retry_after = None
+
+                return r.status_code, retry_after
+
+            # Content-Length is the compressed size if the response is encoded
+            expected_size = r.headers.get('Content-Length') if 'Content-Encoding' not in r.headers else None
+
+            n_bytes = 0
+            os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+            with open(part_file, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=download_chunk_size):
+                    f.write(chunk)
+                    n_bytes += len(chunk)
+
+        if (expected_size is not None and n_bytes != int(expected_size)) or not is_valid_download(part_file):
+            return 'corrupt', None
+
+        os.replace(part_file, file_path)
+
+        return 200, None
+
+    finally:
+        if os.path.exists(part_file):
+            os.remove(part_file)
+
+
+def _create_download_limiter(max_concurrency, min_concurrency):
+    """
+    Create the state of the adaptive concurrency limit of download_urls(). The limit is halved when the server
+    throttles (429/5xx/network errors) and increased by one after a full round (limit) of successful downloads.
+
+    :param max_concurrency: Maximum (and starting) number of concurrent downloads.
+    :param min_concurrency: Minimum number of concurrent downloads.
+
+    :return: A dictionary of the limiter state.
+    """
+    return {'limit': max_concurrency, 'min': min_concurrency, 'max': max_concurrency, 'active': 0, 'n_success': 0,
+            'epoch': 0, 'condition': asyncio.Condition()}
+
+
+async def _acquire_download_slot(limiter):
+    """
+    Wait for a download slot.
+
+    :param limiter: Limiter state (see _create_download_limiter()).
+
+    :return: The limit epoch when the slot was acquired.
+    """
+    async with limiter['condition']:
+        await limiter['condition'].wait_for(lambda: limiter['active'] < limiter['limit'])
+        limiter['active'] += 1
+
+        return limiter['epoch']
+
+
+async def _release_download_slot(limiter, epoch, throttled):
+    """
+    Release a download slot and adapt the limit. Only downloads started after the last decrease can decrease the limit
+    again, so a burst of throttled responses halves the limit once.
+
+    :param limiter: Limiter state (see _create_download_limiter()).
+    :param epoch: The limit epoch when the slot was acquired.
+    :param throttled: True if the server throttled the download.
+
+    :return: None.
+    """
+    async with limiter['condition']:
+        limiter['active'] -= 1
+
+        if throttled:
+            if epoch == limiter['epoch']:
+                limiter['limit'] = max(limiter['min'], limiter['limit'] // 2)
+                limiter['n_success'] = 0
+                limiter['epoch'] += 1
+        else:
+            limiter['n_success'] += 1
+            if limiter['n_success'] >= limiter['limit']:
+                limiter['limit'] = min(limiter['max'], limiter['limit'] + 1)
+                limiter['n_success'] = 0
+
+        limiter['condition'].notify_all()
+
+
+async def _download_urls_async(url_file_list, max_concurrency, min_concurrency, max_retries, base_delay, max_delay,
+                               timeout, overwrite, progress):
+    """
+    Async part of download_urls(). Downloads run in a thread pool (one pooled session), scheduled by an adaptive
+    concurrency limit.
+
+    :return: A dictionary of {file path: status}.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = _create_download_limiter(max_concurrency, min_concurrency)
+    status_dict = {}
+    start_time = time.time()
+
+    def _report(file_path):
+        if progress:
+            print(f'downloads: {len(status_dict)}/{len(url_file_list)} done (last: {os.path.basename(file_path)} '
+                  f'{status_dict[file_path]}, {limiter["limit"]} connections, '
+                  f'{round((time.time() - start_time) / 60, 2)} mins)')
+
+    with create_download_session(max_concurrency) as session, \
+            ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+
+        async def _download(url, file_path):
+            if not overwrite and is_valid_download(file_path):
+                status_dict[file_path] = 'exists'
+                _report(file_path)
+                return
+
+            for attempt in range(max_retries + 1):
+                epoch = await _acquire_download_slot(limiter)
+                throttled = False
+                try:
+                    status, retry_after = await loop.run_in_executor(executor, stream_url_to_file, session, url,
+                                                                     file_path, timeout)
+                    throttled = status in retry_status_codes
+                except retry_exceptions as e:
+                    status, retry_after, throttled = type(e).__name__, None, True
+                except (requests.RequestException, OSError) as e:  # e.g., invalid url, disk error. Not retried
+                    status, retry_after = f'{type(e).__name__}: {e}', None
+                finally:
+                    await _release_download_slot(limiter, epoch, throttled)
+
+                if status == 200:
+                    status_dict[file_path] = 'downloaded'
+                    break
+                elif not throttled and status != 'corrupt':  # e.g., 404, not worth retrying
+                    status_dict[file_path] = f'failed ({status})'
+                    break
+                elif attempt == max_retries:
+                    status_dict[file_path] = f'failed ({status} after {max_retries} retries)'
+                else:
+                    await asyncio.sleep(get_backoff_delay(attempt, base_delay, max_delay, retry_after))
+
+            _report(file_path)
+
+        await asyncio.gather(*(_download(url, file_path) for url, file_path in url_file_list))
+
+    return status_dict
+
+
+def download_urls(url_file_list, max_concurrency=16, min_concurrency=1, max_retries=5, base_delay=1, max_delay=60,
+                  timeout=(30, 300), overwrite=False, progress=True, raise_on_failure=True):
+    """
+    Download urls to files concurrently over a pool of reused connections.
+
+    - Responses are streamed to disk (not held in memory) and a file is only saved once it is complete (see
+      stream_url_to_file()), so files that exist are complete and are not downloaded again (unless overwrite=True).
+      A failed/restarted run resumes from the missing files.
+    - The number of concurrent downloads adapts to the server: it is halved on 429/5xx responses and network errors
+      and increases again after successful downloads.
+    - Throttled, failed, and corrupted (incomplete) downloads are retried with exponential backoff and jitter
+      (respecting the Retry-After header). Other HTTP errors (e.g., 404), invalid urls, and local (disk) errors are
+      not retried. A failed download doesn't stop the other downloads.
+
+    :param url_file_list: A list of (url, file path) pairs. Duplicate pairs are downloaded once. A file path can't be
+                          the target of different urls.
+    :param max_concurrency: Maximum (and starting) number of concurrent downloads. Default set to 16.
+    :param min_concurrency: Minimum number of concurrent downloads. Default set to 1.
+    :param max_retries: Maximum number of retries of a download. Default set to 5.
+    :param base_delay: Wait time (seconds) of the first retry (before jitter). Default set to 1.
+    :param max_delay: Maximum wait time (seconds) between retries. Default set to 60.
+    :param timeout: A tuple of (connect, read) timeouts in seconds. Default set to (30, 300).
+    :param overwrite: Set to True to download files that already exist. Default set to False.
+    :param progress: Set to False to not print progress. Default set to True.
+    :param raise_on_failure: Set to False to not raise an error if some downloads failed. Default set to True.
+
+    :return: A dictionary of {file path: status}. Status is 'downloaded', 'exists', or 'failed (<reason>)'.
+    """
+    # de-duplicating by target path, so that the same .part file isn't written by two concurrent downloads
+    url_dict = {}
+    for url, file_path in url_file_list:
+        target = os.path.abspath(file_path)
+        if target not in url_dict:
+            url_dict[target] = (url, file_path)
+        elif url_dict[target][0] != url:
+            raise ValueError(f'{file_path} is the target of multiple urls: {url_dict[target][0]}, {url}')
+
+    url_file_list = list(url_dict.values())
+    if len(url_file_list) == 0:
+        return {}
+
+    max_concurrency = max(1, max_concurrency)
+    min_concurrency = min(max(1, min_concurrency), max_concurrency)
+
+    status_dict = asyncio.run(_download_urls_async(url_file_list, max_concurrency, min_concurrency, max_retries,
+                                                   base_delay, max_delay, timeout, overwrite, progress))
+
+    failed_list = [file_path for file_path, status in status_dict.items() if status.startswith('failed')]
+    if progress:
+        print(f'{len(url_file_list) - len(failed_list)}/{len(url_file_list)} downloads complete')
+
+    if raise_on_failure and len(failed_list) > 0:
+        raise RuntimeError(f'{len(failed_list)} downloads failed: ' +
+                           ', '.join(f'{file_path} ({status_dict[file_path]})' for file_path in failed_list[:10]))
+
+    return status_dict
@@ -0,0 +1,249 @@
+import os
+import ast
+import numpy as np
+import rasterio as rio
+from contextlib import ExitStack
+
+from Codes.utils.system_ops import makedirs
+from Codes.utils.catalog_ops import find_raster
+from Codes.utils.geotiff_ops import create_raster, get_raster_tile_rows
+from Codes.utils.block_ops import get_block_shape, iter_block_windows, read_block, block_memory_budget
+
+try:
+    import numexpr
+except ImportError:  # numexpr is optional. Expressions are evaluated with numpy (block by block) without it
+    numexpr = None
+
+no_data_value = -9999
+
+# functions that can be used in the expressions (the numexpr functions, with their numpy equivalents used when numexpr
+# isn't installed)
+expression_functions = {'where': np.where, 'abs': np.abs, 'sqrt': np.sqrt, 'exp': np.exp, 'expm1': np.expm1,
+                        'log': np.log, 'log10': np.log10, 'log1p': np.log1p, 'sin': np.sin, 'cos': np.cos,
+                        'tan': np.tan, 'arcsin': np.arcsin, 'arccos': np.arccos, 'arctan': np.arctan,
+                        'arctan2': np.arctan2, 'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh}
+
+# constants that can be used in the expressions
+expression_constants = {'nan': np.float32(np.nan), 'inf': np.float32(np.inf)}
+
+# syntax allowed in the expressions (arithmetic, comparisons, logical operators, and function calls)
+_allowed_nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load,
+                  ast.Constant, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.USub, ast.UAdd,
+                  ast.Invert, ast.BitAnd, ast.BitOr, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+def get_expression_names(expression):
+    """
+    Get the variable names used in an expression. Only arithmetic, (non-chained) comparisons, '&', '|', '~', and the
+    functions of expression_functions are allowed.
+
+    :param expression: Expression string, e.g., 'RET / precip' or 'where(rainy_days != 0, precip / rainy_days, nan)'.
+
+    :return: A set of variable names (excluding functions and constants).
+    """
+    tree = ast.parse(expression, mode='eval')
+
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _allowed_nodes):
+            raise ValueError(f'{type(node).__name__} is not allowed in expression: {expression}')
+
+        if isinstance(node, ast.Compare) and len(node.ops) > 1:  # a < b < c can't be evaluated on arrays
+            raise ValueError(f'Chained comparisons are not allowed in expression: {expression}. Combine the '
+                             f'comparisons with & instead, e.g., (a < b) & (b < c)')
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in expression_functions:
+                raise ValueError(f'Only {sorted(expression_functions)} functions are allowed in expression: '
+                                 f'{expression}')
+        elif isinstance(node, ast.Name) and node.id not in expression_functions \
+                and node.id not in expression_constants:
+            names.add(node.id)
+
+    return names
+
+
+def check_expressions(expression_dict, input_names):
+    """
+    Check that each expression only uses the inputs and the expressions defined before it.
+
+    :param expression_dict: A dictionary of {expression name: expression string}, evaluated in order.
+    :param input_names: Names of the input rasters.
+
+    :return: A dictionary of {expression name: set of variable names used}.
+    """
+    name_dict = {}
+    known_names = set(input_names)
+
+    for name, expression in expression_dict.items():
+        if name in input_names:
+            raise ValueError(f'Expression name {name} is also an input name')
+
+        names = get_expression_names(expression)
+        unknown = names - known_names
+        if len(unknown) > 0:
+            raise ValueError(f'Unknown variables {sorted(unknown)} in expression {name} = {expression}')
+
+        name_dict[name] = names
+        known_names.add(name)
+
+    return name_dict
+
+
+def select_expressions(expression_dict, output_names):
+    """
+    Select the expressions needed to compute the outputs (the outputs and the expressions they use).
+
+    :param expression_dict: A dictionary of {expression name: expression string}, evaluated in order.
+    :param output_names: Names of the expressions to compute.
+
+    :return: A dictionary of {expression name: expression string} of the needed expressions, in evaluation order.
+    """
+    unknown_outputs = set(output_names) - set(expression_dict)
+    if len(unknown_outputs) > 0:
+        raise ValueError(f'Outputs {sorted(unknown_outputs)} are not defined in the expressions')
+
+    needed = set(output_names)
+    for name in reversed(list(expression_dict)):
+        if name in needed:
+            needed |= get_expression_names(expression_dict[name])
+
+    return {name: expression for name, expression in expression_dict.items() if name in needed}
+
+
+def evaluate_expression(expression, variable_dict):
+    """
+    Evaluate an expression on arrays. Uses numexpr (fused multithreaded kernel, no full-size temporaries) if installed,
+    otherwise numpy.
+
+    :param expression: Expression string (see get_expression_names()).
+    :param variable_dict: A dictionary of {variable name: array} used in the expression.
+
+    :return: Result array.
+    """
+    if numexpr is not None:
+        return numexpr.evaluate(expression, local_dict={**expression_constants, **variable_dict})
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return eval(compile(expression, '<expression>', 'eval'), {'__builtins__': {}},
+                    {**expression_functions, **expression_constants, **variable_dict})
+
+
+def evaluate_raster_expressions(expression_dict, input_dict, output_dict, ref_raster=None, block_size=None,
+                                memory_budget=block_memory_budget, nodata=no_data_value, write_options=None):
+    """
+    Evaluate named expressions of aligned rasters and write the outputs, block by block. Each input raster is read
+    once per block and shared by all expressions, so adding an expression doesn't add any read. Expressions can use
+    the expressions defined before them (e.g., an intermediate variable that isn't written). Expressions not needed
+    for the outputs are skipped.
+
+    Input nodata is read as nan, so nan propagates through the arithmetic. nan (nodata) can be produced explicitly,
+    e.g., 'where(rainy_days != 0, precip / rainy_days, nan)'. nan outputs are written as nodata.
+
+    :param expression_dict: A dictionary of {expression name: expression string}, evaluated in order, e.g.,
+                            {'PET_P': 'RET / precip', 'SR_frac': 'runoff / precip'}.
+    :param input_dict: A dictionary of {input name: raster filepath}. All rasters must be on the same grid. Inputs
+                       not used by the expressions to write are not read.
+    :param output_dict: A dictionary of {expression name: output raster filepath} of the expressions to write.
+    :param ref_raster: Raster filepath to get the output grid (crs, transform, shape) from. Default set to None to use
+                       the first input raster used.
+    :param block_size: Size of square blocks (in pixels). Default set to None to use full-width row strips sized by
+                       memory_budget.
+    :param memory_budget: Memory budget (bytes) of the operation. Default set to 256 MB.
+    :param nodata: No data value of output rasters. Default set to -9999.
+    :param write_options: A dictionary of GeoTIFF creation options (compress, blockxsize, cog, etc.) to override the
+                          pipeline-wide defaults of geotiff_ops. Default set to None.
+
+    :return: output_dict.
+    """
+    # expressions (and inputs) needed for the outputs, in evaluation order
+    expression_dict = select_expressions(expression_dict, output_dict)
+    name_dict = check_expressions(expression_dict, input_dict)
+
+    expression_list = list(expression_dict.items())
+    needed = set(expression_dict).union(*name_dict.values())
+    input_names = [name for name in input_dict if name in needed]
+
+    with ExitStack() as stack:
+        datasets = {name: stack.enter_context(rio.open(input_dict[name])) for name in input_names}
+        ref_file = stack.enter_context(rio.open(ref_raster)) if ref_raster is not None \
+            else next(iter(datasets.values()))
+        height, width = ref_file.shape
+
+        for name, src in datasets.items():
+            if src.shape != (height, width) or not src.transform.almost_equals(ref_file.transform):
+                raise ValueError(f'{input_dict[name]} is not aligned with the output grid of the expressions')
+
+        block_rows, block_cols = get_block_shape(height, width, n_arrays=len(input_names) + len(expression_list),
+                                                 block_size=block_size, memory_budget=memory_budget,
+                                                 tile_rows=get_raster_tile_rows(write_options))
+
+        dst_dict = {}
+        for name, output_raster in output_dict.items():
+            makedirs([os.path.dirname(output_raster) or '.'])
+            dst_dict[name] = stack.enter_context(create_raster(output_raster, height=height, width=width, count=1,
+                                                               dtype=np.float32, crs=ref_file.crs,
+                                                               transform=ref_file.transform, nodata=nodata,
+                                                               write_options=write_options))
+
+        for window in iter_block_windows(height, width, block_rows, block_cols):
+            block_dict = {name: read_block(src, window) for name, src in datasets.items()}
+
+            for name, expression in expression_list:
+                block_dict[name] = np.asarray(evaluate_expression(expression, block_dict), dtype=np.float32)
+
+            for name, dst in dst_dict.items():
+                out_block = block_dict[name]
+                dst.write(np.where(np.isnan(out_block), np.float32(nodata), out_block), 1, window=window)
+
+    return output_dict
+
+
+def evaluate_yearly_raster_expressions(years_list, expression_dict, input_dir_dict, output_dict,
+                                       static_input_dict=None, ref_raster=None, block_size=None,
+                                       memory_budget=block_memory_budget, nodata=no_data_value, write_options=None):
+    """
+    Evaluate named expressions of yearly rasters for multiple years with evaluate_raster_expressions(). Each year's
+    inputs are read once for all expressions. Inputs of the expressions not needed for the outputs can be left out of
+    input_dir_dict.
+
+    :param years_list: A list of years to evaluate the expressions for.
+    :param expression_dict: A dictionary of {expression name: expression string}, evaluated in order.
+    :param input_dir_dict: A dictionary of {input name: directory of the yearly rasters (named as <name>_<year>.tif)}.
+    :param output_dict: A dictionary of {expression name: (output directory, output raster name)} of the expressions
+                        to write. Outputs are saved as <output raster name>_<year>.tif.
+    :param static_input_dict: A dictionary of {input name: raster filepath} of static (same for all years) inputs.
+                              Default set to None.
+    :param ref_raster: Raster filepath to get the output grid from. Default set to None to use the first input raster.
+    :param block_size: Size of square blocks (in pixels). Default set to None to use full-width row strips sized by
+                       memory_budget.
+    :param memory_budget: Memory budget (bytes) of the operation. Default set to 256 MB.
+    :param nodata: No data value of output rasters. Default set to -9999.
+    :param write_options: A dictionary of GeoTIFF creation options to override the pipeline-wide defaults of
+                          geotiff_ops. Default set to None.
+
+    :return: A dictionary of {expression name: {year: output raster filepath}}.
+    """
+    static_input_dict = {} if static_input_dict is None else static_input_dict
+
+    # checking the expressions once before reading any raster
+    expression_dict = select_expressions(expression_dict, output_dict)
+    check_expressions(expression_dict, list(input_dir_dict) + list(static_input_dict))
+
+    output_raster_dict = {name: {} for name in output_dict}
+    for year in years_list:
+        print(f'evaluating {list(output_dict)} for year {year}...')
+
+        input_dict = {name: find_raster(input_dir, year) for name, input_dir in input_dir_dict.items()}
+        input_dict.update(static_input_dict)
+
+        year_output_dict = {name: os.path.join(output_dir, f'{output_name}_{year}.tif')
+                            for name, (output_dir, output_name) in output_dict.items()}
+
+        evaluate_raster_expressions(expression_dict, input_dict, year_output_dict, ref_raster=ref_raster,
+                                    block_size=block_size, memory_budget=memory_budget, nodata=nodata,
+                                    write_options=write_options)
+
+        for name, output_raster in year_output_dict.items():
+            output_raster_dict[name][year] = output_raster
+
+    return output_raster_dict
@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import rasterio as rio
+import rasterio.shutil
+from contextlib import contextmanager
+
+no_data_value = -9999
+
+# pipeline-wide default GeoTIFF creation options. Can be changed for the whole run with set_raster_write_options()
+# or overridden per call with the write_options argument of the raster writers.
+#   tiled/blockxsize/blockysize : internal tiling (256 or 512) instead of strips.
+#   compress : 'deflate', 'zstd' (GDAL built with ZSTD support), 'lzw', or 'none'.
+#   predictor : 'auto' uses floating-point predictor (3) for float rasters and horizontal differencing (2) for integer
+#               rasters. Can also be set to 1 (no predictor), 2, or 3.
+#   num_threads : number of threads for compression ('all_cpus' or an int).
+#   bigtiff : 'if_safer' switches to BigTIFF only when the output might exceed 4 GB.
+#   cog : Set to True to write Cloud-Optimized GeoTIFFs (tiled, compressed, with internal overviews).
+raster_write_options = {'tiled': True, 'blockxsize': 256, 'blockysize': 256, 'compress': 'deflate',
+                        'predictor': 'auto', 'num_threads': 'all_cpus', 'bigtiff': 'if_safer', 'cog': False}
+
+
+def set_raster_write_options(**options):
+    """
+    Set the pipeline-wide default GeoTIFF creation options (see raster_write_options).
+
+    :param options: Creation options to set, e.g., compress='zstd', blockxsize=512, blockysize=512, cog=True.
+
+    :return: None.
+    """
+    raster_write_options.update({key.lower(): value for key, value in options.items()})
+
+
+def get_raster_write_options(dtype, write_options=None):
+    """
+    Get GeoTIFF creation options for a raster by combining the pipeline-wide default options with per call overrides.
+
+    :param dtype: Data type of the raster.
+    :param write_options: A dictionary of creation options to override the default ones. Default set to None.
+
+    :return: A dictionary of creation options (for rasterio.open()) and a boolean that is True if COG layout
+             is required.
+    """
+    options = dict(raster_write_options)
+    if write_options is not None:
+        options.update({key.lower(): value for key, value in write_options.items()})
+
+    cog = bool(options.pop('cog', False))
+
+    if str(options.get('compress', 'none')).lower() == 'none':
+        options.pop('compress', None)
+        options.pop('predictor', None)
+    elif options.get('predictor') == 'auto':
+        options['predictor'] = 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+
+    if not options.get('tiled', False):
+        options.pop('blockxsize', None)
+        options.pop('blockysize', None)
+
+    return options, cog
+
+
+def get_raster_tile_rows(write_options=None):
+    """
+    Get the internal tile height (rows) of the GeoTIFFs written with the pipeline-wide default options and per call
+    overrides. Block-wise writers align their row strips to it so that each tile is compressed once.
+
+    :param write_options: A dictionary of creation options to override the default ones. Default set to None.
+
+    :return: Tile height (rows). None if the rasters aren't tiled.
+    """
+    options = dict(raster_write_options)
+    if write_options is not None:
+        options.update({key.lower(): value for key, value in write_options.items()})
+
+    if not options.get('tiled', False):
+        return None
+
+    return int(options.get('blockysize', 256))
+
+
+def convert_to_cog(input_raster, output_raster, options):
+    """
+    Convert a GeoTIFF to Cloud-Optimized GeoTIFF (tiled, compressed, with internal overviews).
+
+    :param input_raster: Filepath of input GeoTIFF.
+    :param output_raster: Filepath of output COG.
+    :param options: A dictionary of creation options from get_raster_write_options().
+
+    :return: Filepath of output COG.
+    """
+    predictor_dict = {1: 'NO', 2: 'STANDARD', 3: 'FLOATING_POINT'}
+
+    cog_options = {'BLOCKSIZE': options.get('blockxsize', 256), 'BIGTIFF': str(options.get('bigtiff', 'if_safer')),
+                   'NUM_THREADS': str(options.get('num_threads', 'all_cpus')), 'OVERVIEW_RESAMPLING': 'NEAREST'}
+    if 'compress' in options:
+        cog_options['COMPRESS'] = str(options['compress']).upper()
+        cog_options['PREDICTOR'] = predictor_dict.get(options.get('predictor', 1), 'NO')
+
+    rasterio.shutil.copy(input_raster, output_raster, driver='COG', **cog_options)
+
+    return output_raster
+
+
+@contextmanager
+def create_raster(output_path, height, width, count, dtype, crs, transform, nodata=no_data_value,
+                  write_options=None):
+    """
+    Create a GeoTIFF (write mode) with the pipeline-wide creation options. The raster is written to a temporary file
+    ('<output_path>.part') and renamed to output_path when the context exits, so an interrupted write never leaves a
+    partial raster behind. If COG layout is required, the raster is written to an interim GeoTIFF first and converted
+    to COG when the context exits.
+
+    :param output_path: Output filepath.
+    :param height: Height (number of rows) of the raster.
+    :param width: Width (number of columns) of the raster.
+    :param count: Number of bands.
+    :param dtype: Data type of the raster.
+    :param crs: Coordinate reference system of the raster.
+    :param transform: Affine transformation matrix.
+    :param nodata: no_data_value set as -9999.
+    :param write_options: A dictionary of creation options to override the default ones. Default set to None.
+
+    :return: A rasterio dataset (write mode).
+    """
+    options, cog = get_raster_write_options(dtype, write_options)
+    temp_path = f'{output_path}.part'
+    interim_path = f'{output_path}.interim.part' if cog else temp_path
+
+    try:
+        with rio.open(interim_path, 'w', driver='GTiff', height=height, width=width, count=count, dtype=dtype,
+                      crs=crs, transform=transform, nodata=nodata, **options) as dst:
+            yield dst
+
+        if cog:
+            convert_to_cog(interim_path, temp_path, options)
+
+        os.replace(temp_path, output_path)
+
+    finally:
+        for path in {interim_path, temp_path}:
+            if os.path.exists(path):
+                os.remove(path)
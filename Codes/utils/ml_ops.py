@@ -29,6 +29,9 @@ sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 from Codes.utils.system_ops import makedirs
 from Codes.utils.stats_ops import calculate_rmse, calculate_r2
 from Codes.utils.raster_ops import read_raster_arr_object
+from Codes.utils.catalog_ops import find_raster
+from Codes.utils.datacube_ops import cube_index_name, read_datacube_index, read_datacube_timeseries, \
+    make_datacube_key, is_datacube_slice_current
 
 no_data_value = -9999
 model_res = 0.02000000000000000389  # in deg, 2 km
@@ -57,11 +60,15 @@ def apply_OneHotEncoding(input_df):
 
 def create_train_test_monthly_dataframe(years_list, monthly_data_path_dict, yearly_data_path_dict,
                                         static_data_path_dict, datasets_to_include, output_parquet,
-                                        skip_processing=False, n_partitions=20):
+                                        skip_processing=False, n_partitions=20, datacube_dir=None):
     """
     Compile monthly/yearly/static datasets into a dataframe. This function-generated dataframe will be used as
     train-test data for ML model at monthly scale.
 
+    Monthly datasets ingested in the datacube (see preprocesses.build_monthly_datacube()) are read from the datacube
+    instead of decoding their GeoTIFFs, if the datacube slice is up-to-date with the raster. All up-to-date months of
+    a variable are read in a single sliced read.
+
     *** if there is no yearly dataset, set yearly_data_path_dict to None.
     *** if there is no static data, set static_data_path_dict to None.
 
@@ -77,6 +84,8 @@ def create_train_test_monthly_dataframe(years_list, monthly_data_path_dict, year
                             Can also save smaller dataframe as csv file if name has '.csv' extension.
     :param skip_processing: Set to True to skip this dataframe creation process.
     :param n_partitions: Number of partitions to save the parquet file in using dask dataframe.
+    :param datacube_dir: Directory path of the monthly datacube. Default set to None to read all datasets from the
+                         GeoTIFFs.
 
     :return: The filepath of the output parquet file.
     """
@@ -86,6 +95,53 @@ def create_train_test_monthly_dataframe(years_list, monthly_data_path_dict, year
         output_dir = os.path.dirname(output_parquet)
         makedirs([output_dir])
 
+        cube_index = None
+        if datacube_dir is not None and os.path.exists(os.path.join(datacube_dir, cube_index_name)):
+            cube_index = read_datacube_index(datacube_dir)
+
+        def read_monthly_data(var, year_month_list):
+            # finds the rasters in the directory's catalog, reads the datacube slices that are up-to-date with their
+            # rasters in a single sliced read and the other months from the rasters.
+            # Returns a dictionary of {(year, month): flattened array}
+            raster_dict = {(year, month): find_raster(monthly_data_path_dict[var], year, month)
+                           for year, month in year_month_list}
+
+            cube_year_months = []
+            if cube_index is not None:
+                cube_year_months = [(year, month) for (year, month), raster in raster_dict.items()
+                                    if is_datacube_slice_current(cube_index, var, make_datacube_key(year, month),
+                                                                 raster)]
+
+            data_dict = {}
+            if len(cube_year_months) > 0:
+                cube_arr, _ = read_datacube_timeseries(datacube_dir, var, cube_index=cube_index,
+                                                       keys=[make_datacube_key(year, month)
+                                                             for year, month in cube_year_months])
+                data_dict.update(zip(cube_year_months, cube_arr.reshape(len(cube_year_months), -1)))
+
+            for year_month, raster in raster_dict.items():
+                if year_month not in data_dict:
+                    data_dict[year_month] = read_raster_arr_object(raster, get_file=False).flatten()
+
+            return data_dict
+
+        def get_month_list(year):
+            # creating list of month to be included for each year
+            if year == 2008:
+                return range(10, 13)
+            elif year == 2020:
+                return range(1, 10)
+            else:
+                return range(1, 13)
+
+        def get_lag_year_months(year, month):
+            # previous and 2nd previous months of a month (for the lagged GRIDMET_precip)
+            current_month_date = datetime(year, month, 1)
+            prev_month_date = current_month_date - timedelta(30)
+            prev_2_month_date = current_month_date - timedelta(60)
+
+            return (prev_month_date.year, prev_month_date.month), (prev_2_month_date.year, prev_2_month_date.month)
+
         variable_dict = {}
         yearly_month_count_dict = {}
 
@@ -94,43 +150,29 @@ def create_train_test_monthly_dataframe(years_list, monthly_data_path_dict, year
             if var in datasets_to_include:
                 print(f'processing data for {var}...')
 
+                # reading all months (and lagged months of GRIDMET_Precip) of the variable at once
+                year_month_list = [(year, month) for year in years_list for month in get_month_list(year)]
+                if var == 'GRIDMET_Precip':
+                    year_month_list += [lag_year_month for year, month in list(year_month_list)
+                                        for lag_year_month in get_lag_year_months(year, month)]
+                monthly_arr_dict = read_monthly_data(var, list(dict.fromkeys(year_month_list)))
+
                 for year in years_list:
-                    # creating list of month to be included for each year
-                    if year == 2008:
-                        month_list = range(10, 13)
-                    elif year == 2020:
-                        month_list = range(1, 10)
-                    else:
-                        month_list = range(1, 13)
+                    month_list = get_month_list(year)
 
                     if var == 'GRIDMET_Precip':  # for including monthly and lagged monthly GRIDMET_precip in the dataframe
                         for month_count, month in enumerate(month_list):
-                            current_precip_data = \
-                            glob(os.path.join(monthly_data_path_dict[var], f'*{year}_{month}.tif*'))[0]
-
-                            current_month_date = datetime(year, month, 1)
-
                             # Collect previous month's precip data
-                            prev_month_date = current_month_date - timedelta(30)
-                            prev_2_month_date = current_month_date - timedelta(60)
-
-                            prev_month_precip_data = glob(os.path.join(monthly_data_path_dict[var],
-                                                                       f'*{prev_month_date.year}_{prev_month_date.month}.tif*'))[
-                                0]
-                            prev_2_month_precip_data = glob(os.path.join(monthly_data_path_dict[var],
-                                                                         f'*{prev_2_month_date.year}_{prev_2_month_date.month}.tif*'))[
-                                0]
+                            prev_year_month, prev_2_year_month = get_lag_year_months(year, month)
 
                             # reading datasets
-                            current_precip_arr = read_raster_arr_object(current_precip_data, get_file=False).flatten()
+                            current_precip_arr = monthly_arr_dict[(year, month)]
                             len_arr = len(list(current_precip_arr))
                             year_data = [int(year)] * len_arr
                             month_data = [int(month)] * len_arr
 
-                            prev_month_precip_arr = read_raster_arr_object(prev_month_precip_data,
-                                                                           get_file=False).flatten()
-                            prev_2_month_precip_arr = read_raster_arr_object(prev_2_month_precip_data,
-                                                                             get_file=False).flatten()
+                            prev_month_precip_arr = monthly_arr_dict[prev_year_month]
+                            prev_2_month_precip_arr = monthly_arr_dict[prev_2_year_month]
 
                             if (month_count == 0) & (
                                     var not in variable_dict.keys()):  # initiating the key and adding first series of data
@@ -153,9 +195,7 @@ def create_train_test_monthly_dataframe(years_list, monthly_data_path_dict, year
 
                     else:
                         for month_count, month in enumerate(month_list):
-                            monthly_data = glob(os.path.join(monthly_data_path_dict[var], f'*{year}_{month}.tif*'))[0]
-
-                            data_arr = read_raster_arr_object(monthly_data, get_file=False).flatten()
+                            data_arr = monthly_arr_dict[(year, month)]
                             len_arr = len(list(data_arr))
                             year_data = [int(year)] * len_arr
                             month_data = [int(month)] * len_arr
@@ -203,7 +243,7 @@ def create_train_test_monthly_dataframe(years_list, monthly_data_path_dict, year
 
                     static_data = glob(os.path.join(static_data_path_dict[var], '*.tif'))[0]
 
-                    data_arr = read_raster_arr_object(static_data, get_file=False).flatten()
+                    data_arr = read_raster_arr_object(static_data, get_file=False, use_cache=True).flatten()
                     data_duplicated_for_total_months = list(data_arr) * total_month_count
 
                     variable_dict[var] = data_duplicated_for_total_months
@@ -277,7 +317,7 @@ def create_train_test_annual_dataframe(years_list, yearly_data_path_dict,
                     print(f'processing data for {var}..')
 
                     static_data = glob(os.path.join(static_data_path_dict[var], '*.tif'))[0]
-                    data_arr = read_raster_arr_object(static_data, get_file=False).flatten()
+                    data_arr = read_raster_arr_object(static_data, get_file=False, use_cache=True).flatten()
 
                     data_duplicated_for_total_years = list(data_arr) * len(years_list)
                     variable_dict[var] = data_duplicated_for_total_years
@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+pipeline_state_name = 'pipeline_state.json'
+
+# files skipped while fingerprinting a directory: hidden files (e.g., raster catalog sidecars) and partially written
+# (temporary) outputs
+_skip_file_suffixes = ('.part', '.tmp')
+
+
+def pipeline_step(name, func, kwargs=None, inputs=None, outputs=None, deps=None):
+    """
+    Define a step of a processing pipeline.
+
+    :param name: Unique name of the step.
+    :param func: Function to run the step with. Called as func(**kwargs).
+    :param kwargs: A dictionary of keyword arguments of func. Default set to None.
+    :param inputs: A list of input filepaths/directories read by the step. Default set to None.
+    :param outputs: A list of output filepaths/directories written by the step. Default set to None.
+    :param deps: A list of names of steps that must run before this step. Steps writing any of the inputs of this step
+                 are added automatically. Default set to None.
+
+    :return: A dictionary of the step definition.
+    """
+    return {'name': name, 'func': func, 'kwargs': {} if kwargs is None else dict(kwargs),
+            'inputs': [] if inputs is None else list(inputs), 'outputs': [] if outputs is None else list(outputs),
+            'deps': [] if deps is None else list(deps)}
+
+
+def _list_files(path):
+    """
+    List the files of a filepath/directory (recursively) used for fingerprinting.
+
+    :param path: Filepath or directory path.
+
+    :return: A sorted list of filepaths.
+    """
+    if os.path.isfile(path):
+        return [path]
+
+    file_list = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for file in files:
+            if not file.startswith('.') and not file.endswith(_skip_file_suffixes):
+                file_list.append(os.path.join(root, file))
+
+    return sorted(file_list)
+
+
+def _hash_file_content(filepath, hash_cache=None, chunk_size=1024 ** 2):
+    """
+    Get the sha256 hash of a file's content. Hashes are cached by (size, mtime) so an unchanged file is hashed only
+    once.
+
+    :param filepath: Filepath.
+    :param hash_cache: A dictionary of {absolute filepath: [size, mtime_ns, hash]}. Updated in place. Default set to
+                       None.
+    :param chunk_size: Number of bytes read at a time. Default set to 1 MB.
+
+    :return: Hash string.
+    """
+    stat = os.stat(filepath)
+    key = os.path.abspath(filepath)
+
+    if hash_cache is not None and key in hash_cache and hash_cache[key][:2] == [stat.st_size, stat.st_mtime_ns]:
+        return hash_cache[key][2]
+
+    file_hash = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    file_hash = file_hash.hexdigest()
+
+    if hash_cache is not None:
+        hash_cache[key] = [stat.st_size, stat.st_mtime_ns, file_hash]
+
+    return file_hash
+
+
+def get_path_fingerprint(path, method='mtime', hash_cache=None):
+    """
+    Get the fingerprint of a filepath/directory to detect changes in it.
+
+    :param path: Filepath or directory path. Directories are scanned recursively.
+    :param method: Can be 'mtime' (file names, sizes, and modification times) or 'hash' (file names and content
+                   hashes). Default set to 'mtime'.
+    :param hash_cache: A dictionary of cached content hashes for method='hash'. Default set to None.
+
+    :return: Fingerprint string. None if the path doesn't exist or is an empty directory.
+    """
+    if not os.path.exists(path):
+        return None
+
+    file_list = _list_files(path)
+    if len(file_list) == 0:
+        return None
+
+    fingerprint = hashlib.sha256()
+    for file in file_list:
+        rel_path = os.path.relpath(file, path) if os.path.isdir(path) else os.path.basename(file)
+
+        if method == 'mtime':
+            stat = os.stat(file)
+            fingerprint.update(f'{rel_path}|{stat.st_size}|{stat.st_mtime_ns}\n'.encode())
+        elif method == 'hash':
+            fingerprint.update(f'{rel_path}|{_hash_file_content(file, hash_cache)}\n'.encode())
+        else:
+            raise ValueError("method must be 'mtime' or 'hash'")
+
+    return fingerprint.hexdigest()
+
+
+def _get_kwargs_hash(func, kwargs):
+    """
+    Get the hash of a step's function and keyword arguments. A change in either invalidates the step.
+
+    :param func: Function of the step.
+    :param kwargs: A dictionary of keyword arguments of func.
+
+    :return: Hash string.
+    """
+    def _default(obj):
+        if callable(obj):
+            return f'{getattr(obj, "__module__", "")}.{getattr(obj, "__qualname__", repr(obj))}'
+        return repr(obj)
+
+    kwargs_str = json.dumps({'func': _default(func), 'kwargs': kwargs}, sort_keys=True, default=_default)
+
+    return hashlib.sha256(kwargs_str.encode()).hexdigest()
+
+
+def read_pipeline_state(state_file):
+    """
+    Read the state file of a pipeline.
+
+    :param state_file: Filepath of the pipeline state (JSON).
+
+    :return: A dictionary of the pipeline state ({'steps': {}, 'hash_cache': {}} if the file doesn't exist).
+    """
+    if not os.path.exists(state_file):
+        return {'steps': {}, 'hash_cache': {}}
+
+    with open(state_file, 'r') as f:
+        state = json.load(f)
+
+    state.setdefault('steps', {})
+    state.setdefault('hash_cache', {})
+
+    return state
+
+
+def write_pipeline_state(state_file, state):
+    """
+    Write the state file of a pipeline. The state is written to a temporary file first and then renamed, so an
+    interrupted write never leaves a broken state behind.
+
+    :param state_file: Filepath of the pipeline state (JSON).
+    :param state: A dictionary of the pipeline state.
+
+    :return: None.
+    """
+    state_dir = os.path.dirname(state_file)
+    if state_dir != '':
+        os.makedirs(state_dir, exist_ok=True)
+
+    temp_file = state_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=1)
+
+    os.replace(temp_file, state_file)
+
+
+def _get_step_deps(steps):
+    """
+    Get the dependencies of pipeline steps. A step depends on its declared deps and on the steps writing any of its
+    inputs (same path, or one path inside the other).
+
+    :param steps: A list of step dictionaries from pipeline_step().
+
+    :return: A dictionary of {step name: set of dependency step names}.
+    """
+    def _overlaps(path_1, path_2):
+        path_1, path_2 = os.path.abspath(path_1), os.path.abspath(path_2)
+        return path_1 == path_2 or path_1.startswith(path_2 + os.sep) or path_2.startswith(path_1 + os.sep)
+
+    step_names = [step['name'] for step in steps]
+    if len(set(step_names)) != len(step_names):
+        raise ValueError('Pipeline step names must be unique')
+
+    deps_dict = {}
+    for step in steps:
+        deps = set(step['deps'])
+        unknown = deps - set(step_names)
+        if len(unknown) > 0:
+            raise ValueError(f'Unknown deps {sorted(unknown)} of step {step["name"]}')
+
+        for other in steps:
+            if other['name'] != step['name'] and \
+                    any(_overlaps(inp, out) for inp in step['inputs'] for out in other['outputs']):
+                deps.add(other['name'])
+
+        deps_dict[step['name']] = deps
+
+    # checking for cycles (Kahn's algorithm)
+    remaining = {name: set(deps) for name, deps in deps_dict.items()}
+    while len(remaining) > 0:
+        ready = [name for name, deps in remaining.items() if len(deps) == 0]
+        if len(ready) == 0:
+            raise ValueError(f'Pipeline steps have circular dependencies: {sorted(remaining)}')
+        for name in ready:
+            remaining.pop(name)
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    return deps_dict
+
+
+def _check_step(step, step_state, method, hash_cache):
+    """
+    Check whether a pipeline step is stale (needs to run).
+
+    :param step: Step dictionary from pipeline_step().
+    :param step_state: Recorded state of the step's last successful run. None if it never ran.
+    :param method: Fingerprinting method ('mtime' or 'hash').
+    :param hash_cache: A dictionary of cached content hashes.
+
+    :return: A tuple of (stale (bool), reason of staleness).
+    """
+    if step_state is None:
+        return True, 'never run'
+
+    if step_state.get('method') != method:
+        return True, 'fingerprint method changed'
+
+    if step_state['kwargs_hash'] != _get_kwargs_hash(step['func'], step['kwargs']):
+        return True, 'function/arguments changed'
+
+    for output in step['outputs']:
+        fingerprint = get_path_fingerprint(output, method, hash_cache)
+        if fingerprint is None:
+            return True, f'output missing: {output}'
+        if step_state['outputs'].get(output) != fingerprint:
+            return True, f'output changed: {output}'
+
+    for inp in step['inputs']:
+        if step_state['inputs'].get(inp) != get_path_fingerprint(inp, method, hash_cache):
+            return True, f'input changed: {inp}'
+
+    return False, 'up to date'
+
+
+def run_pipeline(steps, state_file, max_workers=1, method='mtime', force=None, dry_run=False):
+    """
+    Run a pipeline of steps incrementally. A step runs only if it is stale, i.e., it never ran successfully, its
+    function/arguments changed, any of its outputs is missing or changed, any of its inputs changed since its last
+    successful run, or one of its declared deps ran in this run. Independent steps run concurrently in a thread pool
+    (steps can use process pools internally). A step is recorded in the state file only after it finishes, so an
+    interrupted run resumes from the unfinished steps.
+
+    :param steps: A list of step dictionaries from pipeline_step().
+    :param state_file: Filepath of the pipeline state (JSON).
+    :param max_workers: Maximum number of steps running at a time. Default set to 1. Each running step sizes its own
+                        process pools by the CPUs and the available memory, so keep it 1 for steps with process pools.
+    :param method: Fingerprinting method to detect changes. Can be 'mtime' (fast) or 'hash' (content hash, robust to
+                   re-written identical files). Default set to 'mtime'.
+    :param force: A list of step names to run regardless of their state. Set to True to run all. Default set to None.
+    :param dry_run: Set to True to only report the steps that would run. Default set to False.
+
+    :return: A dictionary of {step name: status} with status 'ran', 'up to date', 'would run', 'failed', or 'blocked'
+             (a dependency failed).
+    """
+    deps_dict = _get_step_deps(steps)
+    step_dict = {step['name']: step for step in steps}
+    force = set(step_dict) if force is True else set([] if force is None else force)
+
+    state = read_pipeline_state(state_file)
+    hash_cache = state['hash_cache']
+
+    status_dict, rerun, errors = {}, set(), {}
+    pending = [step['name'] for step in steps]
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            ready = [name for name in pending if deps_dict[name].issubset(status_dict)]
+            for name in ready:
+                pending.remove(name)
+                step = step_dict[name]
+
+                if any(status_dict[dep] in ('failed', 'blocked') for dep in deps_dict[name]):
+                    status_dict[name] = 'blocked'
+                    print(f'Step {name}: blocked by failed dependency')
+                    continue
+
+                if name in force:
+                    stale, reason = True, 'forced'
+                elif len(rerun & set(step['deps'])) > 0:
+                    stale, reason = True, 'dependency ran'
+                elif dry_run and len(rerun & deps_dict[name]) > 0:
+                    stale, reason = True, 'dependency would run'
+                else:
+                    stale, reason = _check_step(step, state['steps'].get(name), method, hash_cache)
+
+                if not stale:
+                    status_dict[name] = 'up to date'
+                    print(f'Step {name}: up to date')
+                elif dry_run:
+                    status_dict[name] = 'would run'
+                    rerun.add(name)
+                    print(f'Step {name}: would run ({reason})')
+                else:
+                    print(f'Step {name}: running ({reason})')
+                    running[executor.submit(step['func'], **step['kwargs'])] = (name, time.time())
+
+            if len(ready) > 0:
+                continue  # steps marked done/blocked above might have released others
+            if len(running) == 0:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, start_time = running.pop(future)
+                step = step_dict[name]
+
+                try:
+                    future.result()
+                except Exception as error:
+                    status_dict[name] = 'failed'
+                    errors[name] = error
+                    print(f'Step {name}: failed ({error!r})')
+                    continue
+
+                state['steps'][name] = {
+                    'method': method,
+                    'kwargs_hash': _get_kwargs_hash(step['func'], step['kwargs']),
+                    'inputs': {inp: get_path_fingerprint(inp, method, hash_cache) for inp in step['inputs']},
+                    'outputs': {out: get_path_fingerprint(out, method, hash_cache) for out in step['outputs']}}
+                write_pipeline_state(state_file, state)
+
+                status_dict[name] = 'ran'
+                rerun.add(name)
+                print(f'Step {name}: finished in {round((time.time() - start_time) / 60, 2)} mins')
+
+    if len(errors) > 0:
+        raise RuntimeError(f'Pipeline steps failed: {sorted(errors)}') from next(iter(errors.values()))
+
+    return status_dict
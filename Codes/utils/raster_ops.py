@@ -1,17 +1,25 @@
 import os
-import subprocess
+import math
+import threading
 import numpy as np
 from glob import glob
 import rasterio as rio
 from osgeo import gdal
 import geopandas as gpd
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext, ExitStack
 from rasterio.mask import mask
 from rasterio.merge import merge
 from rasterio.enums import Resampling
+from rasterio.features import geometry_mask, rasterize
+from rasterio.enums import MergeAlg
+from rasterio.warp import reproject, transform_bounds
 from shapely.geometry import box, mapping
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from Codes.utils.system_ops import make_gdal_sys_call
-from Codes.utils.system_ops import makedirs
+from Codes.utils.system_ops import makedirs, get_process_pool_context
+from Codes.utils.block_ops import apply_blockwise, get_nodata_mask
+from Codes.utils.geotiff_ops import create_raster
 
 no_data_value = -9999
 model_res = 0.01976293625031605786  # in deg, ~2 km
@@ -19,8 +27,48 @@ WestUS_shape = '../../Data_main/shapefiles/Western_US_ref_shapes/WestUS_states.s
 WestUS_raster = '../../Data_main/reference_rasters/Western_US_refraster_2km.tif'
 GEE_merging_refraster_large_grids = '../../Data_main/reference_rasters/GEE_merging_refraster_larger_grids.tif'
 
+# process-wide LRU cache of constant rasters (reference grid, static predictors, masks).
+# {(abs filepath, band, mtime_ns): read-only float32 array}
+raster_cache_max_bytes = 2 * 1024 ** 3  # 2 GB
+_raster_cache = OrderedDict()
+_raster_cache_info = {'hits': 0, 'misses': 0, 'nbytes': 0}
+_raster_cache_lock = threading.Lock()
 
-def read_raster_arr_object(raster_file, rasterio_obj=False, band=1, get_file=True, change_dtype=True):
+# pixel (col, row) offsets of the coordinates returned by get_coordinate_vectors() and get_lat_lon_grids()
+_pixel_offset_dict = {'center': (0.5, 0.5), 'ul': (0, 0), 'ur': (1, 0), 'll': (0, 1), 'lr': (1, 1)}
+
+# coordinate vectors of the grids looked up in this session, {(transform, height, width, offset, dtype): (x, y)}
+_coord_vector_cache = {}
+
+# process-wide pool of open (read mode) rasterio dataset handles.
+# {(abs filepath, mtime_ns, thread id): [dataset, number of active users]}
+# Handles are not shared between threads as GDAL dataset handles aren't thread-safe.
+raster_handle_pool_size = 64
+_raster_handle_pool = OrderedDict()
+_raster_handle_lock = threading.Lock()
+
+
+def _reset_raster_pools_after_fork():
+    """
+    Reset the raster handle pool (and the locks) in a forked child process (e.g., parallel_map() workers). GDAL
+    dataset handles must not be shared across fork, so the child opens its own handles. The cached arrays are kept
+    (they are plain memory).
+
+    :return: None.
+    """
+    global _raster_handle_lock, _raster_cache_lock
+
+    _raster_handle_pool.clear()
+    _raster_handle_lock = threading.Lock()
+    _raster_cache_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_raster_pools_after_fork)
+
+
+def read_raster_arr_object(raster_file, rasterio_obj=False, band=1, get_file=True, change_dtype=True,
+                           use_cache=False):
     """
     Get raster array and raster file.
 
@@ -29,26 +77,255 @@ def read_raster_arr_object(raster_file, rasterio_obj=False, band=1, get_file=Tru
     :param band: Selected band to read. Default set to 1.
     :param get_file: Set to False if raster file is not required.
     :param change_dtype: Set to True if want to change raster data type to float. Default set to True.
+    :param use_cache: Set to True to get the array from the process-wide raster cache (see read_raster_arr_cached).
+                      The returned array is read-only, copy it before modifying. Only used with raster filepath and
+                      change_dtype=True. Default set to False.
 
     :return: Raster numpy array and rasterio object file (get_file=True, rasterio_obj=False).
     """
+    if use_cache and not rasterio_obj and change_dtype:
+        raster_arr = read_raster_arr_cached(raster_file, band=band)
+        if get_file:
+            return raster_arr, rio.open(raster_file)
+        else:
+            return raster_arr
+
     if not rasterio_obj:
         raster_file = rio.open(raster_file)
     else:
         get_file = False
-    raster_arr = raster_file.read(band)
     if change_dtype:
-        raster_arr = raster_arr.astype(np.float32)
-        if raster_file.nodata:
-            raster_arr[np.isclose(raster_arr, raster_file.nodata)] = np.nan
+        raster_arr = read_raster_into(raster_file, band=band)
+    else:
+        raster_arr = raster_file.read(band)
     if get_file:
         return raster_arr, raster_file
     else:
+        if not rasterio_obj:  # the raster was opened here and isn't returned, so closing it
+            raster_file.close()
         return raster_arr
 
 
+def read_raster_into(raster_file, out=None, band=1, dtype=np.float32, masked=False):
+    """
+    Read a raster band directly into a (preallocated) array of the target data type. Casting is done by GDAL during
+    the read and nodata pixels are set to np.nan in place, so no intermediate copy of the array is created. Reusing
+    the same out array for rasters of the same grid avoids allocating a new array for every read.
+
+    :param raster_file: Input raster filepath or rasterio dataset (read mode).
+    :param out: A 2D array (same shape as the raster) to read the raster into. Default set to None to allocate a new
+                array.
+    :param band: Selected band to read. Default set to 1.
+    :param dtype: Data type of the array if out is None. Default set to np.float32.
+    :param masked: Set to True to return a masked array (view of out with nodata pixels masked) instead of setting
+                   nodata pixels to np.nan. Needed for integer data types. Default set to False.
+
+    :return: Raster array (out, if given).
+    """
+    with (nullcontext(raster_file) if isinstance(raster_file, rio.io.DatasetReader)
+          else open_raster(raster_file)) as src:
+        if out is None:
+            out = np.empty(src.shape, dtype=dtype)
+        elif out.shape != src.shape:
+            raise ValueError(f'out array shape {out.shape} does not match raster shape {src.shape}')
+
+        src.read(band, out=out)
+        nodata = src.nodata
+
+    nodata_mask = get_nodata_mask(out, nodata)
+
+    if masked:
+        return np.ma.MaskedArray(out, mask=np.ma.nomask if nodata_mask is None else nodata_mask, copy=False)
+
+    if nodata_mask is not None:
+        if not np.issubdtype(out.dtype, np.floating):
+            raise ValueError('nodata can only be set to np.nan in a float array. Set masked=True for integer arrays.')
+        np.copyto(out, np.nan, where=nodata_mask)
+
+    return out
+
+
+def read_raster_arr_cached(raster_file, band=1):
+    """
+    Read a raster array through the process-wide LRU raster cache. Meant for rasters that are read repeatedly in a run
+    (reference raster, static predictors, masks, growing season rasters). The cache is keyed by
+    (filepath, band, modification time), so a rewritten raster is read again. Least recently used arrays are evicted
+    when the cache exceeds raster_cache_max_bytes.
+
+    :param raster_file: Input raster filepath.
+    :param band: Selected band to read. Default set to 1.
+
+    :return: Read-only float32 raster array (nodata set to np.nan).
+    """
+    raster_path = os.path.abspath(raster_file)
+    key = (raster_path, band, os.stat(raster_path).st_mtime_ns)
+
+    with _raster_cache_lock:
+        if key in _raster_cache:
+            _raster_cache.move_to_end(key)
+            _raster_cache_info['hits'] += 1
+            return _raster_cache[key]
+
+        _raster_cache_info['misses'] += 1
+
+    with rio.open(raster_path) as src:
+        raster_arr = read_raster_arr_object(src, rasterio_obj=True, band=band)
+    raster_arr.flags.writeable = False
+
+    with _raster_cache_lock:
+        # dropping outdated entries of the same raster (i.e., raster has been rewritten)
+        for old_key in [k for k in _raster_cache if k[:2] == key[:2] and k != key]:
+            _raster_cache_info['nbytes'] -= _raster_cache.pop(old_key).nbytes
+
+        if key not in _raster_cache and raster_arr.nbytes <= raster_cache_max_bytes:
+            _raster_cache[key] = raster_arr
+            _raster_cache_info['nbytes'] += raster_arr.nbytes
+
+            while _raster_cache_info['nbytes'] > raster_cache_max_bytes:
+                _, evicted_arr = _raster_cache.popitem(last=False)
+                _raster_cache_info['nbytes'] -= evicted_arr.nbytes
+
+    return raster_arr
+
+
+def get_raster_cache_info():
+    """
+    Get the state of the process-wide raster cache.
+
+    :return: A dictionary with number of cache hits, misses, cached arrays, cached bytes, and the memory cap (bytes).
+    """
+    with _raster_cache_lock:
+        return {'hits': _raster_cache_info['hits'], 'misses': _raster_cache_info['misses'],
+                'currsize': len(_raster_cache), 'nbytes': _raster_cache_info['nbytes'],
+                'max_bytes': raster_cache_max_bytes}
+
+
+def set_raster_cache_limit(max_bytes):
+    """
+    Set the memory cap of the process-wide raster cache. Least recently used arrays are evicted to fit the new cap.
+
+    :param max_bytes: Maximum total size (bytes) of the cached arrays. Set to 0 to disable caching.
+
+    :return: None.
+    """
+    global raster_cache_max_bytes
+
+    with _raster_cache_lock:
+        raster_cache_max_bytes = max_bytes
+
+        while _raster_cache and _raster_cache_info['nbytes'] > raster_cache_max_bytes:
+            _, evicted_arr = _raster_cache.popitem(last=False)
+            _raster_cache_info['nbytes'] -= evicted_arr.nbytes
+
+
+def clear_raster_cache():
+    """
+    Clear the process-wide raster cache and reset its hit/miss counters.
+
+    :return: None.
+    """
+    with _raster_cache_lock:
+        _raster_cache.clear()
+        _raster_cache_info.update({'hits': 0, 'misses': 0, 'nbytes': 0})
+
+
+def _evict_idle_raster_handles(max_handles, raster_path=None):
+    """
+    Close the least recently used idle (not in use) handles of the raster handle pool. Must be called while holding
+    _raster_handle_lock.
+
+    :param max_handles: Number of handles to keep in the pool.
+    :param raster_path: Absolute filepath of a raster. If given, all idle handles of this raster are closed instead.
+
+    :return: None.
+    """
+    if raster_path is not None:
+        idle_keys = [k for k, v in _raster_handle_pool.items() if k[0] == raster_path and v[1] == 0]
+    else:
+        idle_keys = [k for k, v in _raster_handle_pool.items() if v[1] == 0]
+        idle_keys = idle_keys[:max(len(_raster_handle_pool) - max_handles, 0)]
+
+    for key in idle_keys:
+        _raster_handle_pool.pop(key)[0].close()
+
+
+@contextmanager
+def open_raster(raster_file):
+    """
+    Open a raster (read mode) through the process-wide raster handle pool. The handle is kept open after the context
+    exits so that re-opening the same raster is free. Idle handles beyond raster_handle_pool_size are closed
+    (least recently used first). Don't close the yielded dataset.
+
+    :param raster_file: Input raster filepath.
+
+    :return: A rasterio dataset (read mode).
+    """
+    raster_path = os.path.abspath(raster_file)
+    key = (raster_path, os.stat(raster_path).st_mtime_ns, threading.get_ident())
+
+    with _raster_handle_lock:
+        entry = _raster_handle_pool.get(key)
+        if entry is not None:
+            entry[1] += 1
+            _raster_handle_pool.move_to_end(key)
+
+    if entry is None:
+        # keys are per thread, so no other thread can add the same key in between
+        entry = [rio.open(raster_path), 1]
+        with _raster_handle_lock:
+            _raster_handle_pool[key] = entry
+
+    try:
+        yield entry[0]
+    finally:
+        with _raster_handle_lock:
+            entry[1] -= 1
+            _evict_idle_raster_handles(raster_handle_pool_size)
+
+
+@contextmanager
+def open_rasters(raster_files):
+    """
+    Open multiple rasters (read mode) through the process-wide raster handle pool. See open_raster.
+
+    :param raster_files: A list of input raster filepaths.
+
+    :return: A list of rasterio datasets (read mode).
+    """
+    with ExitStack() as stack:
+        yield [stack.enter_context(open_raster(raster)) for raster in raster_files]
+
+
+def close_raster_handles(raster_file=None):
+    """
+    Close the idle handles of the process-wide raster handle pool.
+
+    :param raster_file: Raster filepath to close the handles of. Default set to None to close all idle handles.
+
+    :return: None.
+    """
+    raster_path = None if raster_file is None else os.path.abspath(raster_file)
+
+    with _raster_handle_lock:
+        _evict_idle_raster_handles(0, raster_path=raster_path)
+
+
+def read_raster_metadata(raster_file):
+    """
+    Read raster metadata without decoding the pixels.
+
+    :param raster_file: Input raster filepath.
+
+    :return: A dictionary with the raster's profile, bounds, nodata, transform, crs, shape (height, width), count,
+             resolution, and dtype.
+    """
+    with open_raster(raster_file) as src:
+        return {'profile': src.profile, 'bounds': src.bounds, 'nodata': src.nodata, 'transform': src.transform,
+                'crs': src.crs, 'shape': src.shape, 'count': src.count, 'res': src.res, 'dtype': src.dtypes[0]}
+
+
 def write_array_to_raster(raster_arr, raster_file, transform, output_path, dtype=None,
-                          ref_file=None, nodata=no_data_value):
+                          ref_file=None, nodata=no_data_value, write_options=None, tags=None):
     """
     Write raster array to Geotiff format.
 
@@ -59,6 +336,9 @@ def write_array_to_raster(raster_arr, raster_file, transform, output_path, dtype
     :param dtype: Output raster data type. Default set to None.
     :param ref_file: Write output raster considering parameters from reference raster file.
     :param nodata: no_data_value set as -9999.
+    :param write_options: A dictionary of GeoTIFF creation options (compress, blockxsize, cog, etc.) to override the
+                          pipeline-wide defaults of geotiff_ops. Default set to None.
+    :param tags: A dictionary of metadata tags (e.g., provenance) to write to the raster. Default set to None.
 
     :return: Output filepath.
     """
@@ -66,22 +346,28 @@ def write_array_to_raster(raster_arr, raster_file, transform, output_path, dtype
         dtype = raster_arr.dtype
 
     if ref_file:
-        raster_file = rio.open(ref_file)
-        transform = raster_file.transform
+        ref_metadata = read_raster_metadata(ref_file)
+        count, crs, transform = ref_metadata['count'], ref_metadata['crs'], ref_metadata['transform']
+    else:
+        count, crs = raster_file.count, raster_file.crs
+
+    # pooled handles of the output raster (if any) must be closed before overwriting it
+    close_raster_handles(output_path)
 
-    with rio.open(
+    with create_raster(
             output_path,
-            'w',
-            driver='GTiff',
             height=raster_arr.shape[0],
             width=raster_arr.shape[1],
             dtype=dtype,
-            count=raster_file.count,
-            crs=raster_file.crs,
+            count=count,
+            crs=crs,
             transform=transform,
-            nodata=nodata
+            nodata=nodata,
+            write_options=write_options
     ) as dst:
-        dst.write(raster_arr, raster_file.count)
+        dst.write(raster_arr, count)
+        if tags is not None:
+            dst.update_tags(**tags)
 
     return output_path
 
@@ -108,10 +394,10 @@ def mask_raster_by_extent(input_raster, ref_file, output_dir, raster_name, inver
     if '.shp' in ref_file:
         ref_extent = gpd.read_file(ref_file)
     else:
-        ref_raster = rio.open(ref_file)
-        minx, miny, maxx, maxy = ref_raster.bounds
+        ref_metadata = read_raster_metadata(ref_file)
+        minx, miny, maxx, maxy = ref_metadata['bounds']
         ref_extent = gpd.GeoDataFrame({'geometry': box(minx, miny, maxx, maxy)}, index=[0],
-                                      crs=ref_raster.crs.to_string())
+                                      crs=ref_metadata['crs'].to_string())
 
     ref_extent = ref_extent.to_crs(crs=input_file.crs.data)
     geoms = ref_extent['geometry'].values  # list of shapely geometries
@@ -154,10 +440,6 @@ def mosaic_rasters_from_directory(input_dir, output_dir, raster_name, ref_raster
     :return: Mosaiced raster array and filepath of mosaiced raster.
     """
     input_rasters = glob(os.path.join(input_dir, search_by))
-    raster_list = []
-    for raster in input_rasters:
-        arr, file = read_raster_arr_object(raster)
-        raster_list.append(file)
 
     # setting resampling method
     if resampling_method == 'nearest':
@@ -166,17 +448,18 @@ def mosaic_rasters_from_directory(input_dir, output_dir, raster_name, ref_raster
         resampling_method = Resampling.bilinear
 
     # reference raster
-    ref_arr, ref_file = read_raster_arr_object(ref_raster)
+    ref_bounds = read_raster_metadata(ref_raster)['bounds']
 
-    # merging
-    if resolution is None:  # will use first input raster's resolution
-        merged_arr, out_transform = merge(raster_list, bounds=ref_file.bounds,
-                                          resampling=resampling_method, method=mosaicing_method,
-                                          nodata=nodata)
+    # merging (input rasters are passed as pooled handles, merge reads the pixels only once)
+    with open_rasters(input_rasters) as raster_list:
+        if resolution is None:  # will use first input raster's resolution
+            merged_arr, out_transform = merge(raster_list, bounds=ref_bounds,
+                                              resampling=resampling_method, method=mosaicing_method,
+                                              nodata=nodata)
 
-    else:  # will use input resolution
-        merged_arr, out_transform = merge(raster_list, bounds=ref_file.bounds, res=(resolution, resolution),
-                                          resampling=resampling_method, method=mosaicing_method, nodata=nodata)
+        else:  # will use input resolution
+            merged_arr, out_transform = merge(raster_list, bounds=ref_bounds, res=(resolution, resolution),
+                                              resampling=resampling_method, method=mosaicing_method, nodata=nodata)
 
     # nodata operation
     # merged_arr = np.where(ref_arr == 0, merged_arr, ref_arr)
@@ -184,7 +467,7 @@ def mosaic_rasters_from_directory(input_dir, output_dir, raster_name, ref_raster
 
     makedirs([output_dir])
     out_raster = os.path.join(output_dir, raster_name)
-    write_array_to_raster(raster_arr=merged_arr, raster_file=ref_file, transform=ref_file.transform,
+    write_array_to_raster(raster_arr=merged_arr, raster_file=None, transform=None,
                           output_path=out_raster, nodata=nodata, ref_file=ref_raster, dtype=dtype)
 
     return merged_arr, out_raster
@@ -210,11 +493,6 @@ def mosaic_rasters_list(input_raster_list, output_dir, raster_name, ref_raster=W
 
     :return: Mosaiced raster array and filepath of mosaiced raster.
     """
-    raster_file_list = []  # a list to store raster file information
-    for raster in input_raster_list:
-        arr, file = read_raster_arr_object(raster)
-        raster_file_list.append(file)
-
     # setting resampling method
     if resampling_method == 'nearest':
         resampling_method = Resampling.nearest
@@ -222,17 +500,19 @@ def mosaic_rasters_list(input_raster_list, output_dir, raster_name, ref_raster=W
         resampling_method = Resampling.bilinear
 
     # reference raster
-    ref_arr, ref_file = read_raster_arr_object(ref_raster)
+    ref_arr = read_raster_arr_object(ref_raster, get_file=False, use_cache=True)
+    ref_bounds = read_raster_metadata(ref_raster)['bounds']
 
-    # merging
-    if resolution is None:  # will use first input raster's resolution
-        merged_arr, out_transform = merge(raster_file_list, bounds=ref_file.bounds,
-                                          resampling=resampling_method, method=mosaicing_method,
-                                          nodata=nodata)
+    # merging (input rasters are passed as pooled handles, merge reads the pixels only once)
+    with open_rasters(input_raster_list) as raster_file_list:
+        if resolution is None:  # will use first input raster's resolution
+            merged_arr, out_transform = merge(raster_file_list, bounds=ref_bounds,
+                                              resampling=resampling_method, method=mosaicing_method,
+                                              nodata=nodata)
 
-    else:  # will use input resolution
-        merged_arr, out_transform = merge(raster_file_list, bounds=ref_file.bounds, res=(resolution, resolution),
-                                          resampling=resampling_method, method=mosaicing_method, nodata=nodata)
+        else:  # will use input resolution
+            merged_arr, out_transform = merge(raster_file_list, bounds=ref_bounds, res=(resolution, resolution),
+                                              resampling=resampling_method, method=mosaicing_method, nodata=nodata)
 
     # nodata operation
     merged_arr = np.where(ref_arr == 0, merged_arr, ref_arr)
@@ -241,25 +521,111 @@ def mosaic_rasters_list(input_raster_list, output_dir, raster_name, ref_raster=W
     # saving output
     makedirs([output_dir])
     out_raster = os.path.join(output_dir, raster_name)
-    write_array_to_raster(raster_arr=merged_arr, raster_file=ref_file, transform=out_transform,
+    write_array_to_raster(raster_arr=merged_arr, raster_file=None, transform=None,
                           output_path=out_raster, nodata=nodata, ref_file=ref_raster, dtype=dtype)
 
     return merged_arr, out_raster
 
 
+def mosaic_rasters_vrt(input_raster_list, output_dir, raster_name, ref_raster=WestUS_raster, dtype=None,
+                       resampling_method='nearest', mask_by_ref=True, nodata=no_data_value, write_options=None):
+    """
+    Mosaics a list of input rasters through a VRT. The VRT only references the input rasters, so only the
+    reference raster's window of them is decoded when the mosaic is materialized on the reference raster grid.
+    Overlapping pixels are taken from the first raster in the list (same as mosaicing_method='first' of
+    mosaic_rasters_list).
+
+    :param input_raster_list: A list of input rasters to merge/mosaic.
+    :param output_dir: Output raster directory.
+    :param raster_name: Output raster name.
+    :param ref_raster: Reference raster filepath. Set default to WestUS_raster.
+    :param dtype: Output raster data type. Default set to None.
+    :param resampling_method: Resampling method. Default set to 'nearest'. Can also take 'bilinear'.
+    :param mask_by_ref: Set to False to not set the pixels outside the reference raster's extent (nodata pixels) to
+                        the reference raster's values (same as mosaic_rasters_from_directory). Default set to True
+                        (same as mosaic_rasters_list).
+    :param nodata: no_data_value set as -9999.
+    :param write_options: A dictionary of GeoTIFF creation options to override the pipeline-wide defaults of
+                          geotiff_ops. Default set to None.
+
+    :return: Filepath of mosaiced raster.
+    """
+    resampling_method = 'near' if resampling_method == 'nearest' else resampling_method
+
+    # later sources of a VRT are drawn over the earlier ones, so the rasters are added in reverse order to give
+    # priority to the first raster
+    mosaic_vrt = gdal.BuildVRT(destName='', srcDSOrSrcDSTab=list(input_raster_list)[::-1],
+                               resampleAlg=resampling_method, VRTNodata=nodata)
+
+    # materializing the mosaic only on the reference raster's grid
+    ref_metadata = read_raster_metadata(ref_raster)
+    height, width = ref_metadata['shape']
+    mosaic_dataset = gdal.Warp(destNameOrDestDS='', srcDSOrSrcDSTab=mosaic_vrt, format='MEM',
+                               outputBounds=list(ref_metadata['bounds']), width=width, height=height,
+                               resampleAlg=resampling_method, dstNodata=nodata)
+    merged_arr = mosaic_dataset.GetRasterBand(1).ReadAsArray()
+    del mosaic_dataset, mosaic_vrt
+
+    # nodata operation
+    if mask_by_ref:
+        ref_arr = read_raster_arr_object(ref_raster, get_file=False, use_cache=True)
+        merged_arr = np.where(ref_arr == 0, merged_arr, ref_arr)
+
+    # saving output
+    makedirs([output_dir])
+    out_raster = os.path.join(output_dir, raster_name)
+    write_array_to_raster(raster_arr=merged_arr, raster_file=None, transform=None,
+                          output_path=out_raster, nodata=nodata, ref_file=ref_raster, dtype=dtype,
+                          write_options=write_options)
+
+    return out_raster
+
+
+def mosaic_rasters_batch(mosaic_job_list, output_dir, ref_raster=WestUS_raster, max_workers=None, **mosaic_kwargs):
+    """
+    Mosaics multiple sets of rasters (e.g., the GEE data patches of each year-month) with mosaic_rasters_vrt() in a
+    process pool.
+
+    :param mosaic_job_list: A list of (input raster list, output raster name) tuples. One mosaic is created for
+                            each tuple.
+    :param output_dir: Output raster directory.
+    :param ref_raster: Reference raster filepath. Set default to WestUS_raster.
+    :param max_workers: Number of processes. Default set to None to use the number of CPUs.
+    :param mosaic_kwargs: Other arguments of mosaic_rasters_vrt() (dtype, resampling_method, mask_by_ref, nodata,
+                          write_options).
+
+    :return: A list of mosaiced raster filepaths (same order as mosaic_job_list).
+    """
+    if len(mosaic_job_list) == 0:
+        return []
+
+    makedirs([output_dir])
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(mosaic_job_list)),
+                             mp_context=get_process_pool_context()) as executor:
+        futures = [executor.submit(mosaic_rasters_vrt, input_raster_list, output_dir, raster_name,
+                                   ref_raster=ref_raster, **mosaic_kwargs)
+                   for input_raster_list, raster_name in mosaic_job_list]
+
+        return [future.result() for future in futures]
+
+
 def clip_resample_reproject_raster(input_raster, input_shape, output_raster_dir,
                                    keyword=' ', raster_name=None,
                                    clip=False, resample=False, clip_and_resample=True,
                                    targetaligned=True, resample_algorithm='near',
                                    resolution=None,
                                    crs='EPSG:4269', output_datatype=gdal.GDT_Float32,
-                                   use_ref_width_height=False, ref_raster=WestUS_raster):
+                                   use_ref_width_height=False, ref_raster=WestUS_raster, in_memory=False):
     """
     Clips, resamples, reprojects a given raster using input shapefile, resolution, and crs.
 
     ** If resolution is None, must provide a left_zone_ref_raster. One of resolution and left_zone_ref_raster must be available.
 
-    :param input_raster: Input raster filepath.
+    :param input_raster: Input raster filepath or gdal dataset (e.g., in-memory output of a previous call).
     :param input_shape: Input shape filepath. Set to None when resample=True.
     :param keyword: 'str' keyword to attach in front of processed raster. Default set to ' '.
                     ** Only works when raster_name = None.
@@ -282,11 +648,17 @@ def clip_resample_reproject_raster(input_raster, input_shape, output_raster_dir,
     :param use_ref_width_height: Set to True to use reference raster's widht+height for resampling/clipping,
                                  instead of a particular assigned resolution. 'resolution' can be set to None.
     :param ref_raster: Filepath of reference raster to be used for assigning processed raster's width+height.
+    :param in_memory: Set to True to keep the processed raster in memory (GDAL MEM dataset) instead of writing it to
+                      output_raster_dir. The returned dataset can be passed as input_raster to chain multiple warps
+                      without writing interim rasters to disk. Default set to False.
 
-    :return: Processed raster filepath.
+    :return: Processed raster filepath. A gdal dataset if in_memory=True.
     """
+    # opening input raster
+    raster_file = gdal.Open(input_raster) if isinstance(input_raster, str) else input_raster
+
     if raster_name is None:  # if raster_name is None will set raster name from the input raster.
-        raster_name = os.path.basename(input_raster)
+        raster_name = os.path.basename(raster_file.GetDescription())
         output_raster_name = keyword + '_' + raster_name
         if keyword == ' ':
             output_raster_name = raster_name
@@ -295,71 +667,257 @@ def clip_resample_reproject_raster(input_raster, input_shape, output_raster_dir,
             raster_name = raster_name + '.tif'
         output_raster_name = raster_name
 
-    # creating output directory
-    makedirs([output_raster_dir])
-    output_filepath = os.path.join(output_raster_dir, output_raster_name)
-
-    # opening input raster
-    raster_file = gdal.Open(input_raster)
+    if in_memory:
+        output_filepath, output_format = '', 'MEM'
+    else:
+        # creating output directory
+        makedirs([output_raster_dir])
+        output_filepath, output_format = os.path.join(output_raster_dir, output_raster_name), 'GTiff'
 
     if clip:  # set resample, clip_and_resample = False
         # resolution argument can be None in clip operation
         if use_ref_width_height:
             # have to provide a reference raster
             # resolution can be set to None
-            ref_arr = read_raster_arr_object(ref_raster, get_file=False)
-            height, width = ref_arr.shape
+            height, width = read_raster_metadata(ref_raster)['shape']
             processed_data = gdal.Warp(destNameOrDestDS=output_filepath, srcDSOrSrcDSTab=raster_file, dstSRS=crs,
                                        targetAlignedPixels=False, width=width, height=height,
-                                       cutlineDSName=input_shape,
-                                       cropToCutline=True, dstNodata=no_data_value, outputType=output_datatype)
+                                       cutlineDSName=input_shape, cropToCutline=True, dstNodata=no_data_value,
+                                       outputType=output_datatype, format=output_format)
         else:
             _, xres, _, _, _, yres = raster_file.GetGeoTransform()
             processed_data = gdal.Warp(destNameOrDestDS=output_filepath, srcDSOrSrcDSTab=raster_file, dstSRS=crs,
                                        targetAlignedPixels=targetaligned, xRes=xres, yRes=yres,
                                        cutlineDSName=input_shape, cropToCutline=True, dstNodata=no_data_value,
-                                       outputType=output_datatype)
+                                       outputType=output_datatype, format=output_format)
 
     elif resample:  # set clip, clip_and_resample = False
         if use_ref_width_height:
             # have to provide a reference raster
             # resolution can be set to None
             # input_shape can be set to None
-            ref_arr = read_raster_arr_object(ref_raster, get_file=False)
-            height, width = ref_arr.shape
+            height, width = read_raster_metadata(ref_raster)['shape']
             processed_data = gdal.Warp(destNameOrDestDS=output_filepath, srcDSOrSrcDSTab=raster_file, dstSRS=crs,
                                        targetAlignedPixels=False, width=width, height=height,
                                        dstNodata=no_data_value, resampleAlg=resample_algorithm,
-                                       outputType=output_datatype)
+                                       outputType=output_datatype, format=output_format)
         else:
             # have to provide a resolution value in argument
             # input_shape can be set to None
             processed_data = gdal.Warp(destNameOrDestDS=output_filepath, srcDSOrSrcDSTab=raster_file, dstSRS=crs,
                                        targetAlignedPixels=targetaligned, xRes=resolution, yRes=resolution,
                                        dstNodata=no_data_value, resampleAlg=resample_algorithm,
-                                       outputType=output_datatype)
+                                       outputType=output_datatype, format=output_format)
 
     elif clip_and_resample:  # set clip=False, resample = False
         if use_ref_width_height:
             # have to provide a reference raster
             # resolution can be set to None
-            ref_arr = read_raster_arr_object(ref_raster, get_file=False)
-            height, width = ref_arr.shape
+            height, width = read_raster_metadata(ref_raster)['shape']
             processed_data = gdal.Warp(destNameOrDestDS=output_filepath, srcDSOrSrcDSTab=raster_file, dstSRS=crs,
                                        targetAlignedPixels=False, width=width, height=height,
                                        cutlineDSName=input_shape, cropToCutline=True, dstNodata=no_data_value,
-                                       resampleAlg=resample_algorithm, outputType=output_datatype)
+                                       resampleAlg=resample_algorithm, outputType=output_datatype, format=output_format)
         else:
             # argument must have input_shape and resolution value
             processed_data = gdal.Warp(destNameOrDestDS=output_filepath, srcDSOrSrcDSTab=raster_file, dstSRS=crs,
                                        targetAlignedPixels=targetaligned, xRes=resolution, yRes=resolution,
                                        cutlineDSName=input_shape, cropToCutline=True, dstNodata=no_data_value,
-                                       resampleAlg=resample_algorithm, outputType=output_datatype)
+                                       resampleAlg=resample_algorithm, outputType=output_datatype, format=output_format)
+    if in_memory:
+        return processed_data
+
     del processed_data
 
     return output_filepath
 
 
+def create_warp_plan(input_raster, input_shape=None, ref_raster=None, resolution=None, crs='EPSG:4269',
+                     targetaligned=True):
+    """
+    Create the warp plan (output grid and cutline mask) for a set of rasters on the same grid. The plan is computed
+    once and reused by warp_rasters_with_plan() for all the rasters.
+
+    :param input_raster: Filepath of one of the input rasters (all rasters to warp with the plan must be on its grid).
+    :param input_shape: Filepath of cutline shapefile. The output is cropped to the cutline and pixels (centers)
+                        outside the cutline are set to nodata. Default set to None to not use a cutline.
+    :param ref_raster: Filepath of reference raster to take the output grid from. Default set to None to create the
+                       output grid from the cutline (or input raster) bounds and resolution.
+    :param resolution: Output raster resolution. Default set to None to use the resolution of the input raster
+                       (clip only).
+    :param crs: Output raster projection. Default set to 'EPSG:4269' (NAD83).
+    :param targetaligned: Set to False if the output grid doesn't need to be aligned to multiples of the resolution
+                          (same as targetAlignedPixels of gdal.Warp). Default set to True.
+
+    :return: A dictionary with the output grid (crs, transform, height, width) and the cutline mask (True outside the
+             cutline, None if there is no cutline).
+    """
+    cutline_gdf = None if input_shape is None else gpd.read_file(input_shape).to_crs(crs)
+    input_metadata = read_raster_metadata(input_raster)
+
+    if ref_raster is not None:
+        ref_metadata = read_raster_metadata(ref_raster)
+        transform, (height, width) = ref_metadata['transform'], ref_metadata['shape']
+        crs = ref_metadata['crs']
+
+    else:
+        xres, yres = (resolution, resolution) if resolution is not None else input_metadata['res']
+
+        if cutline_gdf is not None:
+            minx, miny, maxx, maxy = cutline_gdf.total_bounds
+        else:
+            minx, miny, maxx, maxy = transform_bounds(input_metadata['crs'], crs, *input_metadata['bounds'])
+
+        if targetaligned:
+            minx, maxx = math.floor(minx / xres) * xres, math.ceil(maxx / xres) * xres
+            miny, maxy = math.floor(miny / yres) * yres, math.ceil(maxy / yres) * yres
+
+        width, height = int(round((maxx - minx) / xres)), int(round((maxy - miny) / yres))
+        transform = rio.transform.from_origin(minx, maxy, xres, yres)
+
+    cutline_mask = None
+    if cutline_gdf is not None:
+        cutline_mask = geometry_mask(cutline_gdf.geometry, out_shape=(height, width), transform=transform)
+
+    return {'crs': crs, 'transform': transform, 'height': height, 'width': width, 'cutline_mask': cutline_mask}
+
+
+def warp_raster_with_plan(input_raster, output_raster, warp_plan, resample_algorithm='near', dtype=np.float32,
+                          nodata=no_data_value, warp_threads=1, warp_memory_limit=256, write_options=None):
+    """
+    Warp a raster on the output grid of a warp plan (see create_warp_plan) and apply the cutline mask of the plan.
+
+    :param input_raster: Input raster filepath.
+    :param output_raster: Output raster filepath.
+    :param warp_plan: Warp plan from create_warp_plan().
+    :param resample_algorithm: Resample algorithm to use in resampling. Can take near/bilinear/average/mode/max/min/
+                               cubic etc. Default is 'near'.
+    :param dtype: Output raster data type. Default set to np.float32.
+    :param nodata: No data value of output raster. Default set to -9999.
+    :param warp_threads: Number of threads used by GDAL for the warp. Default set to 1.
+    :param warp_memory_limit: Working memory (in MB) of the GDAL warper. Default set to 256 MB.
+    :param write_options: A dictionary of GeoTIFF creation options to override the pipeline-wide defaults of
+                          geotiff_ops. Default set to None.
+
+    :return: Output raster filepath.
+    """
+    resampling = Resampling.nearest if resample_algorithm == 'near' else Resampling[resample_algorithm]
+    height, width = warp_plan['height'], warp_plan['width']
+
+    # a new handle (instead of the pooled ones) as the rasters are warped concurrently
+    with rio.open(input_raster) as src:
+        bands = list(range(1, src.count + 1))
+        warped_arr = np.full((len(bands), height, width), nodata, dtype=dtype)
+
+        reproject(source=rio.band(src, bands), destination=warped_arr, src_nodata=src.nodata,
+                  dst_transform=warp_plan['transform'], dst_crs=warp_plan['crs'], dst_nodata=nodata,
+                  resampling=resampling, num_threads=warp_threads, warp_mem_limit=warp_memory_limit)
+
+    if warp_plan['cutline_mask'] is not None:
+        warped_arr[:, warp_plan['cutline_mask']] = nodata
+
+    close_raster_handles(output_raster)
+    with create_raster(output_raster, height=height, width=width, count=len(bands), dtype=dtype,
+                       crs=warp_plan['crs'], transform=warp_plan['transform'], nodata=nodata,
+                       write_options=write_options) as dst:
+        dst.write(warped_arr)
+
+    return output_raster
+
+
+def clip_resample_reproject_rasters(input_raster_list, input_shape, output_raster_dir, keyword=' ',
+                                    raster_names=None, resolution=None, ref_raster=None, crs='EPSG:4269',
+                                    targetaligned=True, resample_algorithm='near', dtype=np.float32,
+                                    max_workers=None, warp_memory_limit=256, write_options=None):
+    """
+    Clips, resamples, reprojects a list of rasters (on the same grid) using a single warp plan. The output grid and
+    cutline mask are computed once and the rasters are warped concurrently. Batch counterpart of
+    clip_resample_reproject_raster() with clip=True (resolution=None) or clip_and_resample=True.
+
+    :param input_raster_list: A list of input raster filepaths. All rasters must be on the same grid.
+    :param input_shape: Filepath of cutline shapefile. Set to None to resample/reproject only.
+    :param output_raster_dir: Output directory filepath.
+    :param keyword: 'str' keyword to attach in front of processed rasters. Default set to ' '.
+                    ** Only works when raster_names = None.
+    :param raster_names: A list of output raster names (same order as input_raster_list). Default set to None to set
+                         raster names from the input rasters.
+    :param resolution: Output raster resolution. Default set to None to keep the resolution of the input rasters.
+    :param ref_raster: Filepath of reference raster to take the output grid from. Default set to None.
+    :param crs: Output raster projection. Default set to 'EPSG:4269' (NAD83).
+    :param targetaligned: Set to False if pixels don't need to be aligned to multiples of the resolution.
+                          Default set to True.
+    :param resample_algorithm: Resample algorithm to use in resampling. Can take near/bilinear/average/mode/max/min/
+                               cubic etc. Default is 'near'.
+    :param dtype: Output raster data type. Default set to np.float32.
+    :param max_workers: Number of rasters to warp concurrently. Default set to None to use the number of CPUs.
+    :param warp_memory_limit: Working memory (in MB) of the GDAL warper (per raster). Default set to 256 MB.
+    :param write_options: A dictionary of GeoTIFF creation options to override the pipeline-wide defaults of
+                          geotiff_ops. Default set to None.
+
+    :return: A list of processed raster filepaths.
+    """
+    if len(input_raster_list) == 0:
+        return []
+
+    if raster_names is None:
+        raster_names = [os.path.basename(raster) if keyword == ' ' else f'{keyword}_{os.path.basename(raster)}'
+                        for raster in input_raster_list]
+    else:
+        raster_names = [name if '.tif' in name else f'{name}.tif' for name in raster_names]
+
+    makedirs([output_raster_dir])
+    output_raster_list = [os.path.join(output_raster_dir, name) for name in raster_names]
+
+    warp_plan = create_warp_plan(input_raster_list[0], input_shape=input_shape, ref_raster=ref_raster,
+                                 resolution=resolution, crs=crs, targetaligned=targetaligned)
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(input_raster_list))) as executor:
+        processed_rasters = list(executor.map(
+            lambda rasters: warp_raster_with_plan(rasters[0], rasters[1], warp_plan,
+                                                  resample_algorithm=resample_algorithm, dtype=dtype,
+                                                  warp_memory_limit=warp_memory_limit, write_options=write_options),
+            zip(input_raster_list, output_raster_list)))
+
+    return processed_rasters
+
+
+def translate_to_vrt(input_raster, crs=None, output_datatype=gdal.GDT_Float32):
+    """
+    Open a raster (e.g., PRISM .bil) as an in-memory VRT dataset with data type/projection overrides. Nothing is
+    written to disk, the pixels are read from the input raster when the VRT is warped.
+
+    :param input_raster: Input raster filepath.
+    :param crs: Projection to assign to the raster. Default set to None to keep the projection of the input raster.
+    :param output_datatype: Output data type. Default set to gdal.GDT_Float32.
+
+    :return: A gdal (VRT) dataset.
+    """
+    return gdal.Translate(destName='', srcDS=input_raster, format='VRT', outputType=output_datatype, outputSRS=crs)
+
+
+def read_gdal_dataset_arr(dataset, band=1):
+    """
+    Read a band of a gdal dataset (e.g., in-memory output of clip_resample_reproject_raster) as float32 array with
+    nodata set to np.nan (same as read_raster_arr_object).
+
+    :param dataset: A gdal dataset.
+    :param band: Selected band to read. Default set to 1.
+
+    :return: Raster numpy array.
+    """
+    raster_band = dataset.GetRasterBand(band)
+    raster_arr = raster_band.ReadAsArray().astype(np.float32, copy=False)
+
+    nodata_mask = get_nodata_mask(raster_arr, raster_band.GetNoDataValue())
+    if nodata_mask is not None:
+        raster_arr[nodata_mask] = np.nan
+
+    return raster_arr
+
+
 def shapefile_to_raster(input_shape, output_dir, raster_name, burnvalue=None, use_attr=True, attribute="", add=None,
                         ref_raster=WestUS_raster, resolution=model_res, alltouched=False):
     """
@@ -379,21 +937,23 @@ def shapefile_to_raster(input_shape, output_dir, raster_name, burnvalue=None, us
 
     :return: Filepath of created raster.
     """
-    ref_arr, ref_file = read_raster_arr_object(ref_raster)
-    total_bounds = ref_file.bounds
+    total_bounds = read_raster_metadata(ref_raster)['bounds']
 
     makedirs([output_dir])
     output_raster = os.path.join(output_dir, raster_name)
 
     if use_attr:
         if add is not None:
-            minx, miny, maxx, maxy = total_bounds
-            layer_name = os.path.basename(input_shape).split('.')[0]
-            args = ['-l', layer_name, '-a', attribute, '-tr', str(resolution), str(resolution), '-te', str(minx),
-                    str(miny), str(maxx), str(maxy), '-init', str(0.0), '-add', '-ot', 'Float32', '-of', 'GTiff',
-                    '-a_nodata', str(no_data_value), input_shape, output_raster]
-            sys_call = make_gdal_sys_call(gdal_command='gdal_rasterize', args=args)
-            subprocess.call(sys_call)
+            # values of all features inside a pixel are summed (in-process, same as gdal_rasterize -add -init 0)
+            input_gdf = gpd.read_file(input_shape)
+            accumulated_arr = rasterize_accumulate(input_gdf, value_attrs=[attribute], ref_raster=ref_raster,
+                                                   resolution=resolution, alltouched=alltouched)[None][attribute]
+
+            height, width = accumulated_arr.shape
+            with create_raster(output_raster, height=height, width=width, count=1, dtype=np.float32,
+                               crs=input_gdf.crs, transform=get_accumulate_grid(ref_raster, resolution)[0],
+                               nodata=no_data_value) as dst:
+                dst.write(accumulated_arr, 1)
 
         else:
             raster_options = gdal.RasterizeOptions(format='Gtiff', outputBounds=list(total_bounds),
@@ -413,8 +973,295 @@ def shapefile_to_raster(input_shape, output_dir, raster_name, burnvalue=None, us
     return output_raster
 
 
+def get_accumulate_grid(ref_raster=WestUS_raster, resolution=model_res):
+    """
+    Get the output grid of rasterize_accumulate(), i.e., the reference raster's extent at the given resolution (same
+    as the -te and -tr options of gdal_rasterize).
+
+    :param ref_raster: Reference raster to get minx, miny, maxx, maxy. Defaults to WestUS_raster.
+    :param resolution: Resolution of the output grid. Defaults to model_res of ~0.02.
+
+    :return: Affine transformation matrix and (height, width) of the grid.
+    """
+    minx, miny, maxx, maxy = read_raster_metadata(ref_raster)['bounds']
+
+    width = int((maxx - minx) / resolution + 0.5)
+    height = int((maxy - miny) / resolution + 0.5)
+    transform = rio.transform.from_origin(minx, maxy, resolution, resolution)
+
+    return transform, (height, width)
+
+
+def rasterize_accumulate(input_shape, value_attrs, ref_raster=WestUS_raster, resolution=model_res, group_attr=None,
+                         groups=None, alltouched=False, init_value=0.0):
+    """
+    Rasterize features by summing the values of all features falling in a pixel (accumulate mode). Point features are
+    converted to pixel indices and summed with np.bincount(). Other geometries (polygons, lines, multipoints) are
+    rasterized with rasterio's MergeAlg.add. Multiple value attributes and groups (e.g., years) are rasterized in a
+    single call.
+
+    :param input_shape: Filepath of input shapefile or a geodataframe.
+    :param value_attrs: A list of attributes with the values to sum.
+    :param ref_raster: Reference raster to get minx, miny, maxx, maxy. Defaults to WestUS_raster.
+    :param resolution: Resolution of the output raster. Defaults to model_res of ~0.02.
+    :param group_attr: Attribute to group the features by (e.g., year). Default set to None to rasterize all features
+                       together.
+    :param groups: A list of group values (of group_attr) to rasterize. Default set to None to rasterize all groups.
+    :param alltouched: If True all pixels touched by lines or polygons will be updated.
+    :param init_value: Value of the pixels without any feature. Default set to 0.
+
+    :return: A dictionary with group values as keys (None if group_attr is None) and dictionaries of
+             {value attribute: float32 summed array} as values.
+    """
+    input_gdf = gpd.read_file(input_shape) if isinstance(input_shape, str) else input_shape
+    input_gdf = input_gdf[~(input_gdf.geometry.is_empty | input_gdf.geometry.isna())]
+
+    transform, (height, width) = get_accumulate_grid(ref_raster, resolution)
+
+    if group_attr is None:
+        group_dict = {None: input_gdf}
+    else:
+        if groups is None:
+            groups = sorted(input_gdf[group_attr].unique())
+        group_dict = {group: input_gdf[input_gdf[group_attr] == group] for group in groups}
+
+    accumulated_dict = {}
+    for group, group_gdf in group_dict.items():
+        is_point = (group_gdf.geom_type == 'Point').to_numpy()
+        point_gdf, other_gdf = group_gdf[is_point], group_gdf[~is_point]
+
+        # pixel indices of the points (points outside the grid are dropped)
+        cols = np.floor((point_gdf.geometry.x.to_numpy() - transform.c) / transform.a).astype(np.int64)
+        rows = np.floor((point_gdf.geometry.y.to_numpy() - transform.f) / transform.e).astype(np.int64)
+        inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+        pixel_idx = rows[inside] * width + cols[inside]
+
+        accumulated_dict[group] = {}
+        for attr in value_attrs:
+            point_values = point_gdf[attr].to_numpy(dtype=np.float64)[inside]
+            accumulated_arr = np.bincount(pixel_idx, weights=point_values, minlength=height * width)
+            accumulated_arr = accumulated_arr.reshape(height, width).astype(np.float64, copy=False)
+
+            if len(other_gdf) > 0:
+                accumulated_arr += rasterize(zip(other_gdf.geometry, other_gdf[attr].to_numpy(dtype=np.float64)),
+                                             out_shape=(height, width), transform=transform, fill=0,
+                                             all_touched=alltouched, merge_alg=MergeAlg.add, dtype=np.float64)
+
+            if init_value != 0:
+                accumulated_arr += init_value
+
+            accumulated_dict[group][attr] = accumulated_arr.astype(np.float32)
+
+    return accumulated_dict
+
+
+def rasterize_zone_labels(input_shape, label_attr, ref_raster=WestUS_raster, resolution=model_res, alltouched=False,
+                          output_raster=None, nodata=no_data_value):
+    """
+    Rasterize zone polygons into a single integer label raster (pixel value = label of the zone covering the pixel).
+    Where zones overlap, the zone appearing first in the shapefile is kept.
+
+    :param input_shape: Filepath of input shapefile or a geodataframe.
+    :param label_attr: Attribute with the (integer) zone labels.
+    :param ref_raster: Reference raster to get minx, miny, maxx, maxy. Defaults to WestUS_raster.
+    :param resolution: Resolution of the output raster. Defaults to model_res of ~0.02.
+    :param alltouched: If True all pixels touched by the polygons will be labelled.
+    :param output_raster: Filepath of output label raster. Default set to None to not save the raster.
+    :param nodata: Label of the pixels outside all zones. Default set to -9999.
+
+    :return: Int32 label array and the affine transformation matrix of it.
+    """
+    input_gdf = gpd.read_file(input_shape) if isinstance(input_shape, str) else input_shape
+    input_gdf = input_gdf[~(input_gdf.geometry.is_empty | input_gdf.geometry.isna())]
+
+    transform, (height, width) = get_accumulate_grid(ref_raster, resolution)
+
+    # features are burnt in reverse order so that the first zone is burnt last (kept) in overlapping pixels
+    shapes = zip(input_gdf.geometry[::-1], input_gdf[label_attr].to_numpy(dtype=np.int32)[::-1])
+    label_arr = rasterize(shapes, out_shape=(height, width), transform=transform, fill=nodata,
+                          all_touched=alltouched, dtype=np.int32)
+
+    if output_raster is not None:
+        makedirs([os.path.dirname(output_raster)])
+        close_raster_handles(output_raster)
+
+        with create_raster(output_raster, height=height, width=width, count=1, dtype=np.int32, crs=input_gdf.crs,
+                           transform=transform, nodata=nodata) as dst:
+            dst.write(label_arr, 1)
+
+    return label_arr, transform
+
+
+def _parse_nan_policy(nan_policy):
+    """
+    Parse the nan_policy of reduce_rasters().
+
+    :param nan_policy: 'propagate', 'skip', or 'min_count=k'.
+
+    :return: A tuple of (propagate (bool), minimum valid count (int)).
+    """
+    if nan_policy == 'propagate':
+        return True, 1
+    elif nan_policy == 'skip':
+        return False, 1
+    elif nan_policy.startswith('min_count='):
+        return False, int(nan_policy.split('=')[1])
+    else:
+        raise ValueError("nan_policy must be 'propagate', 'skip', or 'min_count=k'")
+
+
+def init_reduce_accumulator(shape, ops, nan_policy='propagate'):
+    """
+    Initiate the accumulator of a pixel-wise reduction. Multiple reduce operations (e.g., sum and mean) share the same
+    accumulator, so each input array is added only once.
+
+    :param shape: Shape of the arrays to reduce.
+    :param ops: A list of reduce operations. Can be 'sum', 'mean', 'min', 'max', 'count', or 'std'.
+    :param nan_policy: How nan (nodata) values are handled (see reduce_rasters()). Default set to 'propagate'.
+
+    :return: A dictionary of accumulator arrays.
+    """
+    invalid_ops = set(ops) - {'sum', 'mean', 'min', 'max', 'count', 'std'}
+    if len(invalid_ops) > 0:
+        raise ValueError("op must be 'sum', 'mean', 'min', 'max', 'count', or 'std'")
+
+    propagate, min_count = _parse_nan_policy(nan_policy)
+    accumulator = {'propagate': propagate, 'min_count': min_count,
+                   'count': np.zeros(shape, dtype=np.int32), 'invalid': np.zeros(shape, dtype=bool)}
+
+    if {'sum', 'mean', 'std'} & set(ops):
+        accumulator['sum'] = np.zeros(shape, dtype=np.float64)
+    if 'std' in ops:
+        accumulator['sum_sq'] = np.zeros(shape, dtype=np.float64)
+    if 'min' in ops:
+        accumulator['min'] = np.full(shape, np.inf, dtype=np.float32)
+    if 'max' in ops:
+        accumulator['max'] = np.full(shape, -np.inf, dtype=np.float32)
+
+    return accumulator
+
+
+def update_reduce_accumulator(accumulator, arr):
+    """
+    Add an array (nodata as np.nan) to the accumulator of a pixel-wise reduction in place. The array is not modified.
+
+    :param accumulator: Accumulator dictionary from init_reduce_accumulator().
+    :param arr: Array to add.
+
+    :return: None.
+    """
+    valid_arr = ~np.isnan(arr)
+
+    accumulator['count'] += valid_arr
+    if accumulator['propagate']:
+        accumulator['invalid'] |= ~valid_arr
+
+    if 'sum' in accumulator:
+        np.add(accumulator['sum'], arr, out=accumulator['sum'], where=valid_arr)
+    if 'sum_sq' in accumulator:
+        np.add(accumulator['sum_sq'], np.square(arr), out=accumulator['sum_sq'], where=valid_arr)
+    if 'min' in accumulator:
+        np.fmin(accumulator['min'], arr, out=accumulator['min'])
+    if 'max' in accumulator:
+        np.fmax(accumulator['max'], arr, out=accumulator['max'])
+
+
+def finalize_reduce_accumulator(accumulator, op):
+    """
+    Get the reduced array of a reduce operation from the accumulator of a pixel-wise reduction.
+
+    :param accumulator: Accumulator dictionary from init_reduce_accumulator().
+    :param op: Reduce operation ('sum', 'mean', 'min', 'max', 'count', or 'std'). Must be one of the operations the
+               accumulator was initiated with.
+
+    :return: Reduced array (float32, nodata set as np.nan).
+    """
+    count_arr = accumulator['count']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if op == 'sum':
+            result_arr = accumulator['sum']
+        elif op == 'mean':
+            result_arr = accumulator['sum'] / count_arr
+        elif op == 'std':
+            mean_arr = accumulator['sum'] / count_arr
+            result_arr = np.sqrt(np.maximum(accumulator['sum_sq'] / count_arr - mean_arr * mean_arr, 0))
+        elif op == 'count':
+            result_arr = count_arr
+        else:
+            result_arr = accumulator[op]
+        result_arr = result_arr.astype(np.float32)
+
+    if op != 'count':
+        result_arr[accumulator['invalid'] | (count_arr < accumulator['min_count'])] = np.nan
+
+    return result_arr
+
+
+def reduce_rasters(raster_list, op='sum', nan_policy='propagate', output_raster=None, ref_raster=WestUS_raster,
+                   return_count=False, count_raster=None, nodata=no_data_value):
+    """
+    Reduce (sum/mean/min/max/count/std) multiple rasters pixel-wise. The rasters are read one by one and accumulated
+    in place (float64 buffers for sum/mean/std, float32 for min/max) through one reusable read buffer, so memory use
+    doesn't grow with the number of rasters.
+
+    :param raster_list: A list of input raster filepaths.
+    :param op: Reduce operation. Can be 'sum', 'mean', 'min', 'max', 'count' (number of valid values), or 'std'
+               (population standard deviation). Default set to 'sum'.
+    :param nan_policy: How nan (nodata) values are handled. 'propagate' (default) sets the output nan if any of the
+                       input values is nan, 'skip' ignores nan values (output is nan only if all inputs are nan),
+                       'min_count=k' ignores nan values but sets the output nan if there are less than k valid values.
+    :param output_raster: Filepath of output raster. Default set to None to not save the output.
+    :param ref_raster: Reference raster filepath. Pixels that are nan in the reference raster are set to nodata.
+                       Set to None to not mask with a reference raster. Default set to WestUS_raster.
+    :param return_count: Set to True to also return the per-pixel count of valid values.
+    :param count_raster: Filepath of output valid value count raster. Default set to None to not save the count.
+    :param nodata: no_data_value set as -9999.
+
+    :return: Reduced array (float32, nodata set as np.nan). If return_count=True, a tuple of reduced array and valid
+             value count array.
+    """
+    if len(raster_list) == 0:
+        raise ValueError('raster_list is empty. At least one raster is needed to reduce.')
+
+    # the first read allocates the float32 buffer, the following rasters are read into the same buffer
+    arr = None
+    accumulator = None
+    for raster in raster_list:
+        arr = read_raster_into(raster, out=arr)
+
+        if accumulator is None:  # initiating accumulator with the first raster's shape
+            accumulator = init_reduce_accumulator(arr.shape, [op], nan_policy)
+
+        update_reduce_accumulator(accumulator, arr)
+
+    # finalizing
+    result_arr = finalize_reduce_accumulator(accumulator, op)
+    count_arr = accumulator['count']
+
+    if ref_raster is not None:
+        ref_arr = read_raster_arr_object(ref_raster, get_file=False, use_cache=True)
+        result_arr[np.isnan(ref_arr)] = np.nan
+
+    grid_raster = ref_raster if ref_raster is not None else raster_list[0]
+    if output_raster is not None:
+        makedirs([os.path.dirname(output_raster)])
+        write_array_to_raster(raster_arr=np.where(np.isnan(result_arr), nodata, result_arr), raster_file=None,
+                              transform=None, output_path=output_raster, ref_file=grid_raster, nodata=nodata)
+
+    if count_raster is not None:
+        makedirs([os.path.dirname(count_raster)])
+        write_array_to_raster(raster_arr=count_arr, raster_file=None, transform=None, output_path=count_raster,
+                              ref_file=grid_raster, nodata=nodata)
+
+    if return_count:
+        return result_arr, count_arr
+    else:
+        return result_arr
+
+
 def sum_rasters(raster_dir, output_raster, raster_list=None, search_by='*.tif', ref_raster=WestUS_raster,
-                nodata=no_data_value):
+                nodata=no_data_value, nan_policy='propagate'):
     """
     Sum multiple rasters together. Can take raster directory or list of rasters as input.
 
@@ -425,36 +1272,23 @@ def sum_rasters(raster_dir, output_raster, raster_list=None, search_by='*.tif',
     :param search_by: search by criteria to select raster from a directory.
     :param ref_raster: Reference raster filepath. Set default to WestUS_raster.
     :param nodata: no_data_value set as -9999.
+    :param nan_policy: nan handling of reduce_rasters(). Default set to 'propagate' (a nan input pixel makes the sum nan).
 
     :return: Summed array and output raster.
     """
-    makedirs([os.path.dirname(output_raster)])
-
     if raster_dir is not None:
         input_rasters = glob(os.path.join(raster_dir, search_by))
     else:
         input_rasters = raster_list
 
-    sum_arr = None
-    for raster in input_rasters:
-        if raster == input_rasters[0]:
-            arr = read_raster_arr_object(raster, get_file=False)
-            sum_arr = arr
-        else:
-            arr = read_raster_arr_object(raster, get_file=False)
-            sum_arr = np.sum(np.dstack((sum_arr, arr)), axis=2)
-
-    ref_arr, ref_file = read_raster_arr_object(ref_raster)
-    sum_arr[np.isnan(ref_arr)] = nodata  # setting nodata using reference raster
-
-    write_array_to_raster(raster_arr=sum_arr, raster_file=ref_file, transform=ref_file.transform,
-                          output_path=output_raster)
+    sum_arr = reduce_rasters(raster_list=input_rasters, op='sum', nan_policy=nan_policy, output_raster=output_raster,
+                             ref_raster=ref_raster, nodata=nodata)
 
     return sum_arr, output_raster
 
 
 def mean_rasters(raster_dir, output_raster, raster_list=None, search_by='*.tif', ref_raster=WestUS_raster,
-                 nodata=no_data_value):
+                 nodata=no_data_value, nan_policy='propagate'):
     """
     Calculate mean of multiple rasters. Can take raster directory or list of rasters as input.
 
@@ -465,33 +1299,18 @@ def mean_rasters(raster_dir, output_raster, raster_list=None, search_by='*.tif',
     :param search_by: search by criteria to select raster from a directory.
     :param ref_raster: Reference raster filepath. Set default to WestUS_raster.
     :param nodata: no_data_value set as -9999.
+    :param nan_policy: nan handling of reduce_rasters(). Default set to 'propagate' (a nan input pixel makes the mean
+                       nan). Set to 'skip' to average over the valid values only.
 
     :return: Mean raster.
     """
-    makedirs([os.path.dirname(output_raster)])
-
     if raster_dir is not None:
         input_rasters = glob(os.path.join(raster_dir, search_by))
     else:
         input_rasters = raster_list
 
-    mean_arr, file = None, None
-    val = 1
-    for raster in input_rasters:
-        if raster == input_rasters[0]:
-            arr = read_raster_arr_object(raster, get_file=False)
-            mean_arr = arr
-        else:
-            arr = read_raster_arr_object(raster, get_file=False)
-            mean_arr += arr
-            val += 1
-
-    mean_arr = mean_arr / val
-    ref_arr, ref_file = read_raster_arr_object(ref_raster)
-    mean_arr[np.isnan(ref_arr)] = nodata  # setting nodata using reference raster
-
-    write_array_to_raster(raster_arr=mean_arr, raster_file=ref_file, transform=ref_file.transform,
-                          output_path=output_raster)
+    reduce_rasters(raster_list=input_rasters, op='mean', nan_policy=nan_policy, output_raster=output_raster,
+                   ref_raster=ref_raster, nodata=nodata)
 
 
 def filter_raster_on_threshold(input_raster, output_raster, threshold_value1, threshold_value2=None, assign_value=None,
@@ -511,28 +1330,96 @@ def filter_raster_on_threshold(input_raster, output_raster, threshold_value1, th
 
     :return: Output raster filepath.
     """
-    ref_arr, ref_file = read_raster_arr_object(refraster)
-    input_arr = read_raster_arr_object(input_raster, get_file=False)
-
-    mod_arr = None  # new array where the filtered array will be stored
-    if assign_value is None:
-        mod_arr = np.where(input_arr >= threshold_value1, input_arr, 0)
-        mod_arr[np.isnan(ref_arr)] = nodata
-    elif threshold_value2 is not None:
-        mod_arr = np.where((input_arr >= threshold_value2) & (input_arr <= threshold_value1), input_arr, 0)
-        mod_arr[np.isnan(ref_arr)] = nodata
-    elif assign_value is not None:
-        mod_arr = np.where(input_arr >= threshold_value1, assign_value, 0)
-        mod_arr[np.isnan(ref_arr)] = nodata
-    elif (threshold_value2 is not None) & (assign_value is not None):
-        mod_arr = np.where((input_arr >= threshold_value2) & (input_arr <= threshold_value1), assign_value, 0)
-        mod_arr[np.isnan(ref_arr)] = nodata
-
-    write_array_to_raster(raster_arr=mod_arr, raster_file=ref_file, transform=ref_file.transform,
-                          output_path=output_raster)
+    def threshold_filter(input_arr, ref_arr):
+        mod_arr = None  # new array where the filtered array will be stored
+        if assign_value is None:
+            mod_arr = np.where(input_arr >= threshold_value1, input_arr, 0)
+            mod_arr[np.isnan(ref_arr)] = nodata
+        elif threshold_value2 is not None:
+            mod_arr = np.where((input_arr >= threshold_value2) & (input_arr <= threshold_value1), input_arr, 0)
+            mod_arr[np.isnan(ref_arr)] = nodata
+        elif assign_value is not None:
+            mod_arr = np.where(input_arr >= threshold_value1, assign_value, 0)
+            mod_arr[np.isnan(ref_arr)] = nodata
+        elif (threshold_value2 is not None) & (assign_value is not None):
+            mod_arr = np.where((input_arr >= threshold_value2) & (input_arr <= threshold_value1), assign_value, 0)
+            mod_arr[np.isnan(ref_arr)] = nodata
+
+        return mod_arr
+
+    # filtering block by block to bound memory use (pooled handles of the output raster are closed before overwriting)
+    close_raster_handles(output_raster)
+    apply_blockwise(input_rasters=[input_raster, refraster], func=threshold_filter, output_raster=output_raster,
+                    ref_raster=refraster, dtype=None, nodata=nodata)
+
     return output_raster
 
 
+def get_coordinate_vectors(raster_file, offset='center', dtype=np.float32):
+    """
+    Get the x (lon) coordinates of the columns and y (lat) coordinates of the rows of a north-up raster grid. The
+    coordinates are computed from the affine transform (no pixel is read) and cached per grid.
+
+    :param raster_file: Input raster filepath.
+    :param offset: Pixel position of the coordinates. Can be 'center', 'ul', 'ur', 'll', or 'lr' (corners).
+                   Default set to 'center'.
+    :param dtype: Data type of the coordinates. Default set to np.float32.
+
+    :return: Read-only 1D arrays of x (lon) coordinates (size = width) and y (lat) coordinates (size = height).
+    """
+    raster_metadata = read_raster_metadata(raster_file)
+    transform, (height, width) = raster_metadata['transform'], raster_metadata['shape']
+
+    if transform.b != 0 or transform.d != 0:
+        raise ValueError(f'{raster_file} has a rotated grid, use get_lat_lon_grids() instead')
+
+    key = (tuple(transform)[:6], height, width, offset, np.dtype(dtype).str)
+    if key not in _coord_vector_cache:
+        col_offset, row_offset = _pixel_offset_dict[offset]
+
+        # affine broadcast on the column/row indices: x = a * col + c, y = e * row + f
+        lon_vec = (transform.c + transform.a * (np.arange(width, dtype=np.float64) + col_offset)).astype(dtype)
+        lat_vec = (transform.f + transform.e * (np.arange(height, dtype=np.float64) + row_offset)).astype(dtype)
+        lon_vec.flags.writeable = False
+        lat_vec.flags.writeable = False
+
+        _coord_vector_cache[key] = (lon_vec, lat_vec)
+
+    return _coord_vector_cache[key]
+
+
+def get_lat_lon_grids(raster_file, offset='center', dtype=np.float32):
+    """
+    Get the x (lon) and y (lat) coordinates of all pixels of a raster grid. For north-up rasters, the 2D grids are
+    broadcast views of the cached coordinate vectors (see get_coordinate_vectors), so no memory is allocated until
+    they are copied/modified.
+
+    :param raster_file: Input raster filepath.
+    :param offset: Pixel position of the coordinates. Can be 'center', 'ul', 'ur', 'll', or 'lr' (corners).
+                   Default set to 'center'.
+    :param dtype: Data type of the coordinates. Default set to np.float32.
+
+    :return: Read-only 2D arrays of lon and lat (same shape as the raster).
+    """
+    raster_metadata = read_raster_metadata(raster_file)
+    transform, shape = raster_metadata['transform'], raster_metadata['shape']
+
+    if transform.b == 0 and transform.d == 0:
+        lon_vec, lat_vec = get_coordinate_vectors(raster_file, offset=offset, dtype=dtype)
+
+        return np.broadcast_to(lon_vec[np.newaxis, :], shape), np.broadcast_to(lat_vec[:, np.newaxis], shape)
+
+    # rotated grid, full affine broadcast of the row and column indices
+    col_offset, row_offset = _pixel_offset_dict[offset]
+    cols = np.arange(shape[1], dtype=np.float64)[np.newaxis, :] + col_offset
+    rows = np.arange(shape[0], dtype=np.float64)[:, np.newaxis] + row_offset
+
+    lon_arr = (transform.a * cols + transform.b * rows + transform.c).astype(dtype)
+    lat_arr = (transform.d * cols + transform.e * rows + transform.f).astype(dtype)
+
+    return lon_arr, lat_arr
+
+
 def make_lat_lon_array_from_raster(input_raster, nodata=-9999):
     """
     Make lat, lon array for each pixel using the input raster.
@@ -543,24 +1430,15 @@ def make_lat_lon_array_from_raster(input_raster, nodata=-9999):
 
     returns: Lat, lon array with nan value (-9999) applied.
     """
-    raster_file = rio.open(input_raster)
-    raster_arr = raster_file.read(1)
-
-    # calculating lat, lon of each cells centroid
-    height, width = raster_arr.shape
-    cols, rows = np.meshgrid(np.arange(width), np.arange(height))
-    xs, ys = rio.transform.xy(rows=rows, cols=cols, transform=raster_file.transform)
-
-    # flattening and reshaping to the input_raster's array size
-    xs = np.array(xs).flatten()
-    ys = np.array(ys).flatten()
+    with open_raster(input_raster) as raster_file:
+        nodata_mask = raster_file.read(1) == nodata
 
-    lon_arr = xs.reshape(raster_arr.shape)
-    lat_arr = ys.reshape(raster_arr.shape)
+    # lat, lon of each cells centroid (computed from the affine transform)
+    lon_grid, lat_grid = get_lat_lon_grids(input_raster, offset='center', dtype=np.float64)
 
     # assigning no_data_value
-    lon_arr[raster_arr == nodata] = nodata
-    lat_arr[raster_arr == nodata] = nodata
+    lon_arr = np.where(nodata_mask, nodata, lon_grid)
+    lat_arr = np.where(nodata_mask, nodata, lat_grid)
 
     return lon_arr, lat_arr
 
@@ -582,31 +1460,32 @@ def create_ref_raster(input_raster, output_ref_raster):
                           output_path=output_ref_raster)
 
 
-def create_multiband_raster(input_files_list, output_file, nodata=no_data_value):
+def create_multiband_raster(input_files_list, output_file, nodata=no_data_value, write_options=None):
     """
     Create a multi-band image from a list of images.
 
     :param input_files_list: List of image file paths to be included in the multi-band image.
     :param output_file: Filepath of output raster.
     :param nodata: Default set to -9999.
+    :param write_options: A dictionary of GeoTIFF creation options to override the pipeline-wide defaults of
+                          geotiff_ops. Default set to None.
 
     :return: None
     """
-    # reading first dataset to extract essential metadata
-    raster_arr, raster_file = read_raster_arr_object(input_files_list[0])
-    height, width = raster_arr.shape[0], raster_arr.shape[1]
+    # reading first dataset's essential metadata
+    raster_metadata = read_raster_metadata(input_files_list[0])
+    height, width = raster_metadata['shape']
 
-    with rio.open(
+    with create_raster(
             output_file,
-            'w',
-            driver='GTiff',
             height=height,
             width=width,
-            dtype=raster_arr.dtype,
+            dtype=np.float32,
             count=len(input_files_list),
-            crs=raster_file.crs,
-            transform=raster_file.transform,
-            nodata=nodata
+            crs=raster_metadata['crs'],
+            transform=raster_metadata['transform'],
+            nodata=nodata,
+            write_options=write_options
     ) as dst:
         for id, layer in enumerate(input_files_list, start=1):
             with rio.open(layer) as src:
@@ -1,6 +1,11 @@
+import os
 import numpy as np
 import pandas as pd
 from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+from concurrent.futures import ProcessPoolExecutor
+
+from Codes.utils.system_ops import get_process_pool_context
+from Codes.utils.raster_ops import read_raster_into
 
 
 def calculate_rmse(Y_pred, Y_obsv):
@@ -210,3 +215,261 @@ def calculate_pbias(observed, simulated):
     pbias = 100 * np.sum(observed - simulated) / np.sum(observed)
 
     return pbias
+
+
+def calc_mode_along_stack(stack_arr, nodata=None, fill_value=None, block_size=None):
+    """
+    Calculate the per-pixel mode (most frequently occurring value) of a stack of class rasters (vectorized, no
+    per-pixel loop). The values of each pixel are sorted along the stack axis and the length of each run of equal
+    values is counted. Ties are broken by choosing the smallest value.
+
+    :param stack_arr: Stacked array (N x H x W or N x number of pixels) of integer class values.
+    :param nodata: Value to exclude from the counting (e.g., -9999). Default set to None to count all values.
+    :param fill_value: Value of the pixels where all values are nodata. Default set to None to use nodata.
+    :param block_size: Number of pixels to process at once to limit memory use on large grids. Default set to None
+                       to process all pixels at once.
+
+    :return: Mode array (H x W or number of pixels) with the same data type as stack_arr.
+    """
+    stack_arr = np.asarray(stack_arr)
+    out_shape = stack_arr.shape[1:]
+    stack_arr = stack_arr.reshape(stack_arr.shape[0], -1)
+
+    fill_value = nodata if fill_value is None else fill_value
+    n_pixels = stack_arr.shape[1]
+    block_size = n_pixels if block_size is None else int(block_size)
+
+    mode_arr = np.empty(n_pixels, dtype=stack_arr.dtype)
+    for start in range(0, n_pixels, max(block_size, 1)):
+        block_arr = np.sort(stack_arr[:, start: start + block_size], axis=0)
+        n_layers = block_arr.shape[0]
+
+        # a new run starts where the sorted value changes. run_count is the number of equal values up to (and
+        # including) each position, so its maximum along the stack axis is the count of the mode
+        run_start = np.ones(block_arr.shape, dtype=bool)
+        run_start[1:] = block_arr[1:] != block_arr[:-1]
+
+        layer_idx = np.arange(n_layers).reshape(-1, 1)
+        run_start_idx = np.maximum.accumulate(np.where(run_start, layer_idx, 0), axis=0)
+        run_count = layer_idx - run_start_idx + 1
+
+        if nodata is not None:
+            run_count[block_arr == nodata] = 0
+
+        # argmax returns the first maximum, i.e., the smallest value among tied values (values are sorted)
+        mode_idx = np.argmax(run_count, axis=0)
+        block_mode = np.take_along_axis(block_arr, mode_idx[np.newaxis, :], axis=0)[0]
+
+        if nodata is not None:
+            all_nodata = np.take_along_axis(run_count, mode_idx[np.newaxis, :], axis=0)[0] == 0
+            block_mode[all_nodata] = fill_value
+
+        mode_arr[start: start + block_size] = block_mode
+
+    return mode_arr.reshape(out_shape)
+
+
+def init_moment_accumulator(shape, paired=False, skip_nan=False):
+    """
+    Initiate the per-pixel moment accumulator of a streaming (one array at a time) mean/variance/covariance
+    calculation. Moments are updated with Welford's method, so memory use doesn't grow with the number of arrays.
+
+    :param shape: Shape of the arrays.
+    :param paired: Set to True to accumulate paired arrays (x, y) for covariance and correlation. Default set to False.
+    :param skip_nan: Set to True to ignore nan values (pixel-wise). Default set to False to set a pixel's statistics nan
+                     if any of its values is nan (same as np.mean/np.std on a stack).
+
+    :return: A dictionary of accumulator arrays.
+    """
+    accumulator = {'skip_nan': skip_nan, 'n': np.zeros(shape, dtype=np.int64), 'invalid': np.zeros(shape, dtype=bool),
+                   'mean_x': np.zeros(shape, dtype=np.float64), 'm2_x': np.zeros(shape, dtype=np.float64)}
+
+    if paired:
+        accumulator.update({'mean_y': np.zeros(shape, dtype=np.float64), 'm2_y': np.zeros(shape, dtype=np.float64),
+                            'c_xy': np.zeros(shape, dtype=np.float64)})
+
+    return accumulator
+
+
+def update_moment_accumulator(accumulator, x_arr, y_arr=None):
+    """
+    Add an array (or a pair of arrays) to the moment accumulator in place (Welford/co-moment update).
+
+    :param accumulator: Accumulator dictionary from init_moment_accumulator().
+    :param x_arr: Array (nodata as np.nan) to add.
+    :param y_arr: Paired array to add. Only used (and required) for paired accumulators. Default set to None.
+
+    :return: None.
+    """
+    paired = 'c_xy' in accumulator
+    x_arr = np.asarray(x_arr, dtype=np.float64)
+
+    valid_arr = ~np.isnan(x_arr)
+    if paired:
+        y_arr = np.asarray(y_arr, dtype=np.float64)
+        valid_arr &= ~np.isnan(y_arr)
+
+    if not accumulator['skip_nan']:
+        accumulator['invalid'] |= ~valid_arr
+
+    accumulator['n'] += valid_arr
+    n_arr = accumulator['n']
+
+    delta_x = np.where(valid_arr, x_arr - accumulator['mean_x'], 0)
+    np.add(accumulator['mean_x'], np.divide(delta_x, n_arr, where=valid_arr, out=np.zeros_like(delta_x)),
+           out=accumulator['mean_x'])
+    np.add(accumulator['m2_x'], np.where(valid_arr, delta_x * (x_arr - accumulator['mean_x']), 0),
+           out=accumulator['m2_x'])
+
+    if paired:
+        delta_y = np.where(valid_arr, y_arr - accumulator['mean_y'], 0)
+        np.add(accumulator['mean_y'], np.divide(delta_y, n_arr, where=valid_arr, out=np.zeros_like(delta_y)),
+               out=accumulator['mean_y'])
+
+        # co-moment uses the previous x mean and the updated y mean
+        y_resid = np.where(valid_arr, y_arr - accumulator['mean_y'], 0)
+        np.add(accumulator['m2_y'], delta_y * y_resid, out=accumulator['m2_y'])
+        np.add(accumulator['c_xy'], delta_x * y_resid, out=accumulator['c_xy'])
+
+
+def merge_moment_accumulators(accumulator_a, accumulator_b):
+    """
+    Merge two moment accumulators (e.g., partial results of parallel workers over different time steps) with the
+    pairwise update of Chan et al.
+
+    :param accumulator_a: Accumulator dictionary from init_moment_accumulator().
+    :param accumulator_b: Accumulator dictionary of the same shape and type.
+
+    :return: Merged accumulator dictionary (a new dictionary).
+    """
+    n_a, n_b = accumulator_a['n'], accumulator_b['n']
+    n_arr = n_a + n_b
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight_b = np.where(n_arr > 0, n_b / n_arr, 0)  # share of b in the merged count
+        n_ab = np.where(n_arr > 0, n_a * n_b / n_arr, 0)
+
+    merged = {'skip_nan': accumulator_a['skip_nan'], 'n': n_arr,
+              'invalid': accumulator_a['invalid'] | accumulator_b['invalid']}
+
+    delta_x = accumulator_b['mean_x'] - accumulator_a['mean_x']
+    merged['mean_x'] = accumulator_a['mean_x'] + delta_x * weight_b
+    merged['m2_x'] = accumulator_a['m2_x'] + accumulator_b['m2_x'] + delta_x * delta_x * n_ab
+
+    if 'c_xy' in accumulator_a:
+        delta_y = accumulator_b['mean_y'] - accumulator_a['mean_y']
+        merged['mean_y'] = accumulator_a['mean_y'] + delta_y * weight_b
+        merged['m2_y'] = accumulator_a['m2_y'] + accumulator_b['m2_y'] + delta_y * delta_y * n_ab
+        merged['c_xy'] = accumulator_a['c_xy'] + accumulator_b['c_xy'] + delta_x * delta_y * n_ab
+
+    return merged
+
+
+def finalize_moment_accumulator(accumulator, stat, ddof=0):
+    """
+    Get a per-pixel statistic from a moment accumulator.
+
+    :param accumulator: Accumulator dictionary from init_moment_accumulator().
+    :param stat: Statistic to get. Can be 'count', 'mean' (of x), 'var', 'std', 'coef_var' (std / mean), 'mean_y',
+                 'cov', or 'corr' (Pearson correlation). 'mean_y', 'cov' and 'corr' need a paired accumulator.
+    :param ddof: Delta degrees of freedom of var/std/cov (the divisor is count - ddof). Default set to 0 (population
+                 statistics, same as np.std).
+
+    :return: Float32 array of the statistic. Pixels with no valid value (or with nan values if skip_nan=False) are nan.
+    """
+    n_arr = accumulator['n']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if stat == 'count':
+            return n_arr.astype(np.float32)
+        elif stat == 'mean':
+            stat_arr = accumulator['mean_x'].copy()
+        elif stat == 'mean_y':
+            stat_arr = accumulator['mean_y'].copy()
+        elif stat == 'var':
+            stat_arr = accumulator['m2_x'] / (n_arr - ddof)
+        elif stat == 'std':
+            stat_arr = np.sqrt(accumulator['m2_x'] / (n_arr - ddof))
+        elif stat == 'coef_var':
+            stat_arr = np.sqrt(accumulator['m2_x'] / (n_arr - ddof)) / accumulator['mean_x']
+        elif stat == 'cov':
+            stat_arr = accumulator['c_xy'] / (n_arr - ddof)
+        elif stat == 'corr':
+            stat_arr = accumulator['c_xy'] / np.sqrt(accumulator['m2_x'] * accumulator['m2_y'])
+        else:
+            raise ValueError("stat must be 'count', 'mean', 'var', 'std', 'coef_var', 'mean_y', 'cov', or 'corr'")
+
+    stat_arr[(n_arr == 0) | accumulator['invalid']] = np.nan
+
+    return stat_arr.astype(np.float32)
+
+
+def accumulate_raster_moments(x_raster_list, y_raster_list=None, skip_nan=False):
+    """
+    Stream rasters one at a time into a per-pixel moment accumulator.
+
+    :param x_raster_list: A list of raster filepaths.
+    :param y_raster_list: A list of paired raster filepaths (same length and order as x_raster_list) for covariance
+                          and correlation. Default set to None.
+    :param skip_nan: Set to True to ignore nan (nodata) values (pixel-wise). Default set to False.
+
+    :return: Accumulator dictionary (see init_moment_accumulator()).
+    """
+    paired = y_raster_list is not None
+    if paired and len(y_raster_list) != len(x_raster_list):
+        raise ValueError('x_raster_list and y_raster_list must have the same number of rasters')
+
+    accumulator, x_arr, y_arr = None, None, None  # read buffers are reused for all rasters
+    for idx, x_raster in enumerate(x_raster_list):
+        x_arr = read_raster_into(x_raster, out=x_arr)
+        if paired:
+            y_arr = read_raster_into(y_raster_list[idx], out=y_arr)
+
+        if accumulator is None:
+            accumulator = init_moment_accumulator(x_arr.shape, paired=paired, skip_nan=skip_nan)
+
+        update_moment_accumulator(accumulator, x_arr, y_arr)
+
+    return accumulator
+
+
+def calc_raster_moments(x_raster_list, y_raster_list=None, stats=('mean', 'std'), skip_nan=False, ddof=0,
+                        n_workers=1):
+    """
+    Calculate per-pixel moment statistics (mean, variance, std, coefficient of variation, covariance, Pearson
+    correlation) of a series of rasters in one streaming pass. Memory use is constant in the number of rasters. With
+    multiple workers, the series is split into chunks accumulated in parallel and the partial results are merged.
+
+    :param x_raster_list: A list of raster filepaths (e.g., monthly precipitation in time order).
+    :param y_raster_list: A list of paired raster filepaths (same length and order as x_raster_list). Only needed for
+                          'mean_y', 'cov', and 'corr'. Default set to None.
+    :param stats: A list of statistics to calculate (see finalize_moment_accumulator()). Default set to ('mean', 'std').
+    :param skip_nan: Set to True to ignore nan (nodata) values (pixel-wise). Default set to False to set a pixel's
+                     statistics nan if any of its values is nan.
+    :param ddof: Delta degrees of freedom of var/std/coef_var/cov. Default set to 0.
+    :param n_workers: Number of processes. Default set to 1 to accumulate in the current process.
+
+    :return: A dictionary of {stat: float32 array}.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    n_workers = max(1, min(n_workers, len(x_raster_list)))
+
+    if n_workers == 1:
+        accumulator = accumulate_raster_moments(x_raster_list, y_raster_list, skip_nan=skip_nan)
+    else:
+        chunk_size = int(np.ceil(len(x_raster_list) / n_workers))
+        chunks = [(x_raster_list[i: i + chunk_size],
+                   None if y_raster_list is None else y_raster_list[i: i + chunk_size])
+                  for i in range(0, len(x_raster_list), chunk_size)]
+
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_process_pool_context()) as executor:
+            futures = [executor.submit(accumulate_raster_moments, x_chunk, y_chunk, skip_nan)
+                       for x_chunk, y_chunk in chunks]
+
+            accumulator = None
+            for future in futures:
+                partial = future.result()
+                accumulator = partial if accumulator is None else merge_moment_accumulators(accumulator, partial)
+
+    return {stat: finalize_moment_accumulator(accumulator, stat, ddof=ddof) for stat in stats}
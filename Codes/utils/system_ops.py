@@ -1,6 +1,22 @@
 import os
+import time
 import shutil
+import numpy as np
 from glob import glob
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# fraction of the available memory (RAM) that parallel_map() tasks are allowed to use
+parallel_memory_fraction = 0.7
+
+# start method of the worker processes of the process pools. Forking a process with running threads (e.g., pipeline
+# steps running in a thread pool) and GDAL loaded can deadlock, so workers are started from a clean server process
+process_start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# constant arrays (attached to shared memory) and keyword arguments of a parallel_map() worker process
+_worker_shared_dict = {}
+_worker_kwargs = {}
 
 
 def makedirs(directory_list):
@@ -72,3 +88,173 @@ def make_gdal_sys_call(gdal_command, args, verbose=True):
 
     else:
         print('gdal sys call not optimized for linux yet')
+
+
+def get_available_memory():
+    """
+    Get the available memory (RAM) of the machine. Uses psutil if installed, otherwise the system's free memory pages.
+
+    :return: Available memory in bytes. None if it can't be determined.
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_process_pool_context():
+    """
+    Get the multiprocessing context to create the process pools with (see process_start_method).
+
+    :return: Multiprocessing context. Pass it as mp_context of ProcessPoolExecutor.
+    """
+    return multiprocessing.get_context(process_start_method)
+
+
+def get_parallel_workers(n_tasks, task_memory=None, max_workers=None, shared_memory_bytes=0):
+    """
+    Get the number of worker processes for parallel tasks, limited by the number of CPUs, the number of tasks, and the
+    number of tasks that fit in the available memory.
+
+    :param n_tasks: Number of tasks.
+    :param task_memory: Estimated peak memory (bytes) of a task. Default set to None to not limit by memory.
+    :param max_workers: Maximum number of workers. Default set to None to use the number of CPUs.
+    :param shared_memory_bytes: Memory (bytes) held by the arrays shared between the workers. Default set to 0.
+
+    :return: Number of workers (at least 1).
+    """
+    n_workers = os.cpu_count() or 1
+    if max_workers is not None:
+        n_workers = min(n_workers, max_workers)
+
+    if task_memory is not None and task_memory > 0:
+        available_memory = get_available_memory()
+        if available_memory is not None:
+            usable_memory = available_memory * parallel_memory_fraction - shared_memory_bytes
+            n_workers = min(n_workers, int(max(usable_memory, 0) // task_memory))
+
+    return max(1, min(n_workers, n_tasks))
+
+
+def _init_parallel_worker(shared_spec_dict, kwargs):
+    """
+    Initialize a parallel_map() worker process. Attaches the shared constant arrays (no copy) and stores the constant
+    keyword arguments, so they are transferred once per worker instead of once per task.
+
+    :param shared_spec_dict: A dictionary of {argument name: (shared memory name, shape, dtype)}.
+    :param kwargs: A dictionary of constant keyword arguments of the task function.
+
+    :return: None.
+    """
+    _worker_shared_dict.clear()
+    for key, (shm_name, shape, dtype) in shared_spec_dict.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        arr.flags.writeable = False
+        _worker_shared_dict[key] = (shm, arr)  # shm is kept referenced for the lifetime of the worker
+
+    _worker_kwargs.clear()
+    _worker_kwargs.update(kwargs)
+
+
+def _run_parallel_task(func, task):
+    """
+    Run a parallel_map() task in a worker process.
+
+    :param func: Task function.
+    :param task: Task (e.g., year or (year, month)).
+
+    :return: Output of the task function.
+    """
+    shared_arrays = {key: arr for key, (shm, arr) in _worker_shared_dict.items()}
+
+    return func(task, **_worker_kwargs, **shared_arrays)
+
+
+def parallel_map(func, task_list, kwargs=None, shared_arrays=None, task_memory=None, max_workers=None,
+                 progress=True, desc='tasks'):
+    """
+    Run a function over independent tasks (e.g., years or (year, month) pairs) in a process pool. The number of
+    workers is picked from the number of CPUs and the per task memory estimate vs the available memory. Constant
+    arrays are passed to the workers through shared memory (read-only, no pickling) and constant keyword arguments are
+    sent once per worker.
+
+    ** func must be importable from a module (not a nested function or lambda) to be sent to the workers. **
+
+    :param func: Task function. Called as func(task, **kwargs, **shared_arrays).
+    :param task_list: A list of tasks.
+    :param kwargs: A dictionary of constant keyword arguments of func. Default set to None.
+    :param shared_arrays: A dictionary of {argument name: numpy array} of constant arrays to share with the workers.
+                          The arrays are read-only in func. Default set to None.
+    :param task_memory: Estimated peak memory (bytes) of a task. Default set to None to not limit workers by memory.
+    :param max_workers: Maximum number of workers. Default set to None to use the number of CPUs.
+    :param progress: Set to False to not print progress. Default set to True.
+    :param desc: Description of the tasks for progress report. Default set to 'tasks'.
+
+    :return: A list of func outputs (same order as task_list).
+    """
+    task_list = list(task_list)
+    kwargs = {} if kwargs is None else kwargs
+    shared_arrays = {} if shared_arrays is None else {key: np.ascontiguousarray(arr)
+                                                      for key, arr in shared_arrays.items()}
+
+    if len(task_list) == 0:
+        return []
+
+    n_workers = get_parallel_workers(len(task_list), task_memory, max_workers,
+                                     shared_memory_bytes=sum(arr.nbytes for arr in shared_arrays.values()))
+    results = [None] * len(task_list)
+    start_time = time.time()
+
+    def _report(n_done, task):
+        if progress:
+            print(f'{desc}: {n_done}/{len(task_list)} done (last: {task}, {n_workers} workers, '
+                  f'{round((time.time() - start_time) / 60, 2)} mins)')
+
+    # single worker runs in this process (no pool overhead)
+    if n_workers == 1:
+        for key, arr in shared_arrays.items():
+            arr = arr.view()
+            arr.flags.writeable = False
+            shared_arrays[key] = arr
+
+        for idx, task in enumerate(task_list):
+            results[idx] = func(task, **kwargs, **shared_arrays)
+            _report(idx + 1, task)
+
+        return results
+
+    shm_list, shared_spec_dict = [], {}
+    try:
+        for key, arr in shared_arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            shm_list.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            shared_spec_dict[key] = (shm.name, arr.shape, arr.dtype.str)
+
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_process_pool_context(),
+                                 initializer=_init_parallel_worker, initargs=(shared_spec_dict, kwargs)) as executor:
+            future_dict = {executor.submit(_run_parallel_task, func, task): idx for idx, task in enumerate(task_list)}
+
+            try:
+                for n_done, future in enumerate(as_completed(future_dict), start=1):
+                    idx = future_dict[future]
+                    results[idx] = future.result()
+                    _report(n_done, task_list[idx])
+            except BaseException:
+                for future in future_dict:  # not starting the remaining tasks if one fails
+                    future.cancel()
+                raise
+
+    finally:
+        for shm in shm_list:
+            shm.close()
+            shm.unlink()
+
+    return results
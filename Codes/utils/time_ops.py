@@ -0,0 +1,432 @@
+import os
+import datetime
+import calendar
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from Codes.utils.system_ops import makedirs, get_process_pool_context
+from Codes.utils.catalog_ops import get_raster_catalog
+from Codes.utils.raster_ops import read_raster_into, read_raster_arr_object, write_array_to_raster, \
+    init_reduce_accumulator, update_reduce_accumulator, finalize_reduce_accumulator
+
+no_data_value = -9999
+
+# day of year (DOY) to month lookup tables, {is leap year: table}
+_doy_month_lut_dict = {}
+
+
+def get_doy_to_month_lut(year):
+    """
+    Get the day of year (DOY) to month lookup table of a year. The table is leap-year aware and built only once for
+    leap and non-leap years.
+
+    :param year: Year of the DOYs.
+
+    :return: A read-only float32 array of 367 months, indexed by DOY (0-366). DOY 0 is the last day of the previous
+             year (month 12) and DOY 366 of a non-leap year is the first day of the next year (month 1).
+    """
+    is_leap = calendar.isleap(year)
+
+    if is_leap not in _doy_month_lut_dict:
+        lut_year = 2000 if is_leap else 2001
+        lut = np.array([(datetime.date(lut_year, 1, 1) + datetime.timedelta(doy - 1)).month for doy in range(367)],
+                       dtype=np.float32)
+        lut.flags.writeable = False
+
+        _doy_month_lut_dict[is_leap] = lut
+
+    return _doy_month_lut_dict[is_leap]
+
+
+def doy_to_month(doy_arr, year, nodata=no_data_value):
+    """
+    Convert day of year (DOY) array to month array using the DOY to month lookup table (integer indexing, no per
+    pixel call). Any number of bands can be converted in one pass, e.g., stacked growing season start and end DOYs.
+
+    :param doy_arr: DOY array (any shape). Fractional DOYs are truncated to the day (same as int()).
+    :param year: Year of the DOYs.
+    :param nodata: No data value of the DOY array. Default set to -9999.
+
+    :return: Float32 month array (same shape as doy_arr) with np.nan for nan/nodata/out-of-range (not in 0-366) DOYs.
+    """
+    lut = get_doy_to_month_lut(year)
+
+    doy_arr = np.asarray(doy_arr, dtype=np.float64)
+    valid = ~np.isnan(doy_arr) & (doy_arr >= 0) & (doy_arr < 367)
+    if nodata is not None:
+        valid &= doy_arr != nodata
+
+    doy_idx = np.where(valid, np.trunc(np.where(valid, doy_arr, 0)), 0).astype(np.int16)
+    month_arr = lut[doy_idx]
+    month_arr[~valid] = np.nan
+
+    return month_arr
+
+
+def get_period_months(period, years, months=None, window=None):
+    """
+    Get the (year, month) members of the periods to aggregate monthly data to.
+
+    :param period: Period definition. Can be 'water_year' (previous year's October to current year's September),
+                   'calendar_year', 'months' (a custom set of months of each year, e.g., growing season April-October),
+                   or 'rolling' (window of N months ending at each month of the years).
+    :param years: A list of years to get the periods for. For water years, the year is the ending year.
+    :param months: A list of months for period='months', e.g., range(4, 11). For period='rolling', the ending months of
+                   the windows (default all months). Default set to None.
+    :param window: Number of months in the window for period='rolling'. Default set to None.
+
+    :return: A dictionary of {period label: list of (year, month)}. The label is the year for yearly periods and
+             (year, month) of the last month for rolling windows.
+    """
+    if period == 'water_year':
+        return {yr: [(yr - 1, mn) for mn in range(10, 13)] + [(yr, mn) for mn in range(1, 10)] for yr in years}
+
+    elif period == 'calendar_year':
+        return {yr: [(yr, mn) for mn in range(1, 13)] for yr in years}
+
+    elif period == 'months':
+        if months is None:
+            raise ValueError("months must be provided for period='months'")
+        return {yr: [(yr, int(mn)) for mn in months] for yr in years}
+
+    elif period == 'rolling':
+        if window is None or window < 1:
+            raise ValueError("window (>= 1) must be provided for period='rolling'")
+
+        end_months = range(1, 13) if months is None else months
+        period_dict = {}
+        for yr in years:
+            for mn in end_months:
+                month_idx = yr * 12 + int(mn) - 1  # months counted from January of year 0
+                period_dict[(yr, int(mn))] = [(idx // 12, idx % 12 + 1)
+                                              for idx in range(month_idx - window + 1, month_idx + 1)]
+
+        return period_dict
+
+    else:
+        raise ValueError("period must be 'water_year', 'calendar_year', 'months', or 'rolling'")
+
+
+def get_month_raster_dict(input_dir, name=None):
+    """
+    Get the monthly rasters of a variable in a directory from the raster catalog.
+
+    :param input_dir: Directory path of the monthly rasters (named as <name>_<year>_<month>.tif).
+    :param name: Name of the raster variable (filename without the date part). Only needed if input_dir holds
+                 multiple variables. Default set to None.
+
+    :return: A dictionary of {(year, month): (name, filename)}.
+    """
+    catalog = get_raster_catalog(input_dir)
+
+    month_raster_dict = {}
+    for key, matches in catalog.items():
+        matches = [match for match in matches if name is None or match[0] == name]
+        if key[0] is not None and key[1] is not None and len(matches) > 0:
+            if len(matches) > 1:
+                raise ValueError(f'Multiple rasters found for year={key[0]}, month={key[1]} in {input_dir}. '
+                                 f'Set the name to select one.')
+            month_raster_dict[key] = matches[0]
+
+    return month_raster_dict
+
+
+def aggregate_monthly_rasters(input_dir, period_dict, output_dir_dict, output_name=None, name=None,
+                              nan_policy='propagate', ref_raster=None, nodata=no_data_value):
+    """
+    Aggregate monthly rasters of a variable to multiple periods (water year, calendar year, growing season, rolling
+    windows) with multiple reducers (sum, mean, min, max, count, std) in a single pass. Each monthly raster is read only
+    once and added to the accumulators of all periods it belongs to. A period is written (and its accumulator freed) as
+    soon as its last month has been read.
+
+    :param input_dir: Directory path of the monthly rasters (named as <name>_<year>_<month>.tif).
+    :param period_dict: A dictionary of {period name: {period label: list of (year, month)}}, e.g.,
+                        {'water_year': get_period_months('water_year', years)}. Missing months are skipped and periods
+                        with no available month are not processed.
+    :param output_dir_dict: A dictionary of {(period name, reducer): output directory} setting the reducers to apply on
+                            each period and where to save the outputs, e.g., {('water_year', 'sum'): sum_dir,
+                            ('water_year', 'mean'): mean_dir}.
+    :param output_name: Name of the output rasters (without the date part). Outputs are saved as
+                        <output_name>_<year>.tif (yearly periods) or <output_name>_<year>_<month>.tif (rolling windows).
+                        Default set to None to use the name of the input rasters.
+    :param name: Name of the input raster variable (filename without the date part). Only needed if input_dir holds
+                 multiple variables. Default set to None.
+    :param nan_policy: nan handling of reduce_rasters(). Default set to 'propagate' (a nan input pixel makes the output
+                       nan).
+    :param ref_raster: Reference raster filepath. Pixels that are nan in the reference raster are set to nodata. Default
+                       set to None to use the first monthly raster of each period (same as sum_rasters() with
+                       ref_raster=raster_list[0]).
+    :param nodata: no_data_value set as -9999.
+
+    :return: A dictionary of {(period name, reducer): {period label: output raster filepath}}.
+    """
+    month_raster_dict = get_month_raster_dict(input_dir, name)
+
+    # available members of each period and the reducers applied on each period
+    reducer_dict = {}
+    for period_name, reducer in output_dir_dict:
+        reducer_dict.setdefault(period_name, []).append(reducer)
+
+    period_member_dict = {}
+    for period_name, labels in period_dict.items():
+        if period_name not in reducer_dict:
+            continue
+
+        for label, keys in labels.items():
+            members = sorted({(int(yr), int(mn)) for yr, mn in keys} & set(month_raster_dict))
+            if len(members) > 0:
+                period_member_dict[(period_name, label)] = members
+
+    # periods each month belongs to, and the periods that are complete after reading a month
+    month_period_dict, last_month_dict = {}, {}
+    for period, members in period_member_dict.items():
+        for key in members:
+            month_period_dict.setdefault(key, []).append(period)
+        last_month_dict.setdefault(members[-1], []).append(period)
+
+    for output_dir in output_dir_dict.values():
+        makedirs([output_dir])
+
+    output_dict = {period_reducer: {} for period_reducer in output_dir_dict}
+    accumulator_dict, grid_raster_dict = {}, {}
+    arr = None  # read buffer reused for all months
+
+    for key in sorted(month_period_dict):
+        raster_name, filename = month_raster_dict[key]
+        raster = os.path.join(input_dir, filename)
+        arr = read_raster_into(raster, out=arr)
+
+        for period in month_period_dict[key]:
+            if period not in accumulator_dict:
+                accumulator_dict[period] = init_reduce_accumulator(arr.shape, reducer_dict[period[0]], nan_policy)
+                grid_raster_dict[period] = ref_raster if ref_raster is not None else raster
+
+            update_reduce_accumulator(accumulator_dict[period], arr)
+
+        for period in last_month_dict.get(key, []):
+            period_name, label = period
+            accumulator = accumulator_dict.pop(period)
+            grid_raster = grid_raster_dict.pop(period)
+            grid_nan_arr = np.isnan(read_raster_arr_object(grid_raster, get_file=False, use_cache=True))
+
+            date_part = f'{label[0]}_{label[1]}' if isinstance(label, tuple) else f'{label}'
+            output_raster_name = f'{raster_name if output_name is None else output_name}_{date_part}.tif'
+
+            for reducer in reducer_dict[period_name]:
+                result_arr = finalize_reduce_accumulator(accumulator, reducer)
+                result_arr[grid_nan_arr] = np.nan
+
+                output_raster = os.path.join(output_dir_dict[(period_name, reducer)], output_raster_name)
+                write_array_to_raster(raster_arr=np.where(np.isnan(result_arr), nodata, result_arr),
+                                      raster_file=None, transform=None, output_path=output_raster,
+                                      ref_file=grid_raster, nodata=nodata)
+                output_dict[(period_name, reducer)][label] = output_raster
+
+    return output_dict
+
+
+def aggregate_monthly_rasters_batch(aggregate_job_list, max_workers=None):
+    """
+    Aggregate monthly rasters of multiple variables with aggregate_monthly_rasters() in a process pool (one variable
+    per process).
+
+    :param aggregate_job_list: A list of dictionaries of aggregate_monthly_rasters() arguments, one for each variable.
+    :param max_workers: Number of processes. Default set to None to use the number of CPUs.
+
+    :return: A list of aggregate_monthly_rasters() outputs (same order as aggregate_job_list).
+    """
+    if len(aggregate_job_list) == 0:
+        return []
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(aggregate_job_list)),
+                             mp_context=get_process_pool_context()) as executor:
+        futures = [executor.submit(aggregate_monthly_rasters, **job) for job in aggregate_job_list]
+
+        return [future.result() for future in futures]
+
+
+def find_missing_months(input_dir, years, months=None, name=None):
+    """
+    Find the missing (year, month) slots of a monthly raster variable from the raster catalog.
+
+    :param input_dir: Directory path of the monthly rasters (named as <name>_<year>_<month>.tif).
+    :param years: A list of years to check.
+    :param months: A list of months to check. Default set to None to check all months.
+    :param name: Name of the raster variable. Only needed if input_dir holds multiple variables. Default set to None.
+
+    :return: A sorted list of missing (year, month).
+    """
+    month_raster_dict = get_month_raster_dict(input_dir, name)
+    months = range(1, 13) if months is None else months
+
+    return sorted({(int(yr), int(mn)) for yr in years for mn in months} - set(month_raster_dict))
+
+
+def gap_fill_monthly_rasters(input_dir, years, months=None, strategy='previous_n', n_years=2, reference_years=None,
+                             name=None, output_name=None, output_dir=None, nodata=no_data_value):
+    """
+    Fill the missing (year, month) slots of a monthly raster variable. Missing slots are detected from the raster
+    catalog and the slots are computed in groups (slots sharing the same source slices, or the slots of the same month
+    for strategy='previous_n') in one pass per group, as a nan-aware weighted mean over the time slices. Source slices
+    are kept in memory only until the last group using them. Filled rasters are tagged with their provenance
+    (GAP_FILLED, GAP_FILL_STRATEGY, GAP_FILL_SOURCES).
+
+    :param input_dir: Directory path of the monthly rasters (named as <name>_<year>_<month>.tif).
+    :param years: A list of years to fill the missing months of.
+    :param months: A list of months to fill. Default set to None to fill all months.
+    :param strategy: Gap fill strategy. Can be -
+                     'previous_n': mean of the same month of the previous n_years years. Slots are filled in
+                                   chronological order, so a filled slot can be a source of a later one.
+                     'linear': linear temporal interpolation between the nearest available months before and after
+                               the slot (slots without an available month on both sides are not filled).
+                     'same_month_climatology': mean of the same month of all available reference years.
+                     Default set to 'previous_n'.
+    :param n_years: Number of previous years used by strategy='previous_n'. Default set to 2.
+    :param reference_years: A list of years used by strategy='same_month_climatology'. Default set to None to use all
+                            available years.
+    :param name: Name of the raster variable. Only needed if input_dir holds multiple variables. Default set to None.
+    :param output_name: Name of the filled rasters (without the date part). Default set to None to use the name of the
+                        input rasters.
+    :param output_dir: Directory to save the filled rasters in. Default set to None to save in input_dir (so the
+                       variable becomes complete).
+    :param nodata: no_data_value set as -9999.
+
+    :return: A dictionary of {(year, month): filled raster filepath}.
+    """
+    month_raster_dict = get_month_raster_dict(input_dir, name)
+    missing_slots = find_missing_months(input_dir, years, months, name)
+
+    if len(missing_slots) == 0 or len(month_raster_dict) == 0:
+        return {}
+
+    output_dir = input_dir if output_dir is None else output_dir
+    output_name = next(iter(month_raster_dict.values()))[0] if output_name is None else output_name
+    makedirs([output_dir])
+
+    # sources of each missing slot, {slot: (list of source slots, list of weights)}
+    source_dict = {}
+
+    if strategy == 'previous_n':
+        # sources can be slots filled earlier, so they're resolved after filling the earlier slots (see below)
+        for yr, mn in missing_slots:
+            source_dict[(yr, mn)] = ([(yr - i, mn) for i in range(n_years, 0, -1)], [1] * n_years)
+
+    elif strategy == 'linear':
+        # months counted from January of year 0
+        available_idx = np.array(sorted(yr * 12 + mn - 1 for yr, mn in month_raster_dict))
+        for yr, mn in missing_slots:
+            slot_idx = yr * 12 + mn - 1
+            pos = int(np.searchsorted(available_idx, slot_idx))
+            if 0 < pos < len(available_idx):
+                before_idx, after_idx = int(available_idx[pos - 1]), int(available_idx[pos])
+                frac = (slot_idx - before_idx) / (after_idx - before_idx)
+                source_dict[(yr, mn)] = ([(before_idx // 12, before_idx % 12 + 1),
+                                          (after_idx // 12, after_idx % 12 + 1)], [1 - frac, frac])
+
+    elif strategy == 'same_month_climatology':
+        for yr, mn in missing_slots:
+            sources = sorted(key for key in month_raster_dict
+                             if key[1] == mn and (reference_years is None or key[0] in reference_years))
+            if len(sources) > 0:
+                source_dict[(yr, mn)] = (sources, [1] * len(sources))
+
+    else:
+        raise ValueError("strategy must be 'previous_n', 'linear', or 'same_month_climatology'")
+
+    # groups of slots computed together in one vectorized pass, [(sources, [(slot, weights of the sources)])], in
+    # processing order
+    group_list = []
+
+    if strategy == 'previous_n':
+        # slots of the same month are grouped. A slot whose previous years include a missing slot of the month that
+        # is yet to be filled goes to a later pass (wave) of the month, so filled slots are ready before being used
+        for month in sorted({mn for _, mn in source_dict}):
+            pending_years = sorted(yr for yr, mn in source_dict if mn == month)
+
+            while len(pending_years) > 0:
+                wave_years = [yr for yr in pending_years
+                              if not any(yr - i in pending_years for i in range(1, n_years + 1))]
+                pending_years = [yr for yr in pending_years if yr not in wave_years]
+
+                sources = sorted({src for yr in wave_years for src in source_dict[(yr, month)][0]})
+                group_list.append((tuple(sources),
+                                   [((yr, month), [1 if yr - n_years <= src_yr < yr else 0 for src_yr, _ in sources])
+                                    for yr in wave_years]))
+    else:
+        # grouping the slots sharing the same sources, processed in chronological order of their first slot
+        group_dict = {}
+        for slot in missing_slots:
+            if slot in source_dict:
+                sources, weights = source_dict[slot]
+                group_dict.setdefault(tuple(sources), []).append((slot, weights))
+
+        group_list = [(sources, group_dict[sources])
+                      for sources in sorted(group_dict, key=lambda srcs: group_dict[srcs][0][0])]
+
+    # source slices (read or filled) are kept in memory only until the last group using them
+    last_use_dict = {src: group_idx for group_idx, (sources, _) in enumerate(group_list) for src in sources}
+    slice_arr_dict, output_dict = {}, {}
+
+    for group_idx, (sources, slot_weight_list) in enumerate(group_list):
+        available = [src in month_raster_dict or src in output_dict for src in sources]
+
+        source_arr_list, source_rasters = [], []
+        for src, is_available in zip(sources, available):
+            if is_available:
+                src_raster = output_dict[src] if src in output_dict else \
+                    os.path.join(input_dir, month_raster_dict[src][1])
+                src_arr = slice_arr_dict[src] if src in slice_arr_dict else \
+                    read_raster_arr_object(src_raster, get_file=False)
+
+                if last_use_dict[src] > group_idx:
+                    slice_arr_dict[src] = src_arr
+
+                source_arr_list.append(src_arr)
+                source_rasters.append(src_raster)
+
+        # slots without any available source are left unfilled
+        slots, weight_list = zip(*slot_weight_list)
+        weight_stack = np.array(weight_list, dtype=np.float64)[:, available]
+        has_source = weight_stack.sum(axis=1) > 0
+
+        if has_source.any():
+            source_stack = np.stack(source_arr_list)
+            slots = [slot for slot, is_filled in zip(slots, has_source) if is_filled]
+            weight_stack = weight_stack[has_source]
+
+            # all slots of the group at once, (slots, sources) weights x (sources, rows, cols) slices. The weights of
+            # the non-nan sources of each pixel are renormalized, so a pixel is nan only if it's nan in all sources.
+            weighted_sum = np.tensordot(weight_stack, np.nan_to_num(source_stack, nan=0), axes=1)
+            weight_sum = np.tensordot(weight_stack, (~np.isnan(source_stack)).astype(np.float64), axes=1)
+            filled_stack = np.full(weighted_sum.shape, np.nan, dtype=np.float32)
+            np.divide(weighted_sum, weight_sum, out=filled_stack, where=weight_sum > 0, casting='unsafe')
+
+            available_sources = [src for src, is_available in zip(sources, available) if is_available]
+
+            for (yr, mn), weights, filled_arr in zip(slots, weight_stack, filled_stack):
+                source_tag = ','.join(f'{src_yr}_{src_mn}'
+                                      for (src_yr, src_mn), weight in zip(available_sources, weights) if weight > 0)
+
+                output_raster = os.path.join(output_dir, f'{output_name}_{yr}_{mn}.tif')
+                write_array_to_raster(raster_arr=np.where(np.isnan(filled_arr), nodata, filled_arr),
+                                      raster_file=None, transform=None, output_path=output_raster,
+                                      ref_file=source_rasters[0], nodata=nodata,
+                                      tags={'GAP_FILLED': 'True', 'GAP_FILL_STRATEGY': strategy,
+                                            'GAP_FILL_SOURCES': source_tag})
+
+                if last_use_dict.get((yr, mn), -1) > group_idx:
+                    slice_arr_dict[(yr, mn)] = filled_arr
+                output_dict[(yr, mn)] = output_raster
+
+        # evicting the slices no later group uses
+        for src in [src for src in slice_arr_dict if last_use_dict[src] <= group_idx]:
+            del slice_arr_dict[src]
+
+    unfilled_slots = [slot for slot in missing_slots if slot not in output_dict]
+    if len(unfilled_slots) > 0:
+        print(f'Gap fill ({strategy}) could not fill {unfilled_slots} of {input_dir} (no source data)')
+
+    return output_dict